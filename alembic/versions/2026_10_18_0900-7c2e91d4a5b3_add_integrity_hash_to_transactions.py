@@ -0,0 +1,29 @@
+"""add_integrity_hash_to_transactions
+
+Revision ID: 7c2e91d4a5b3
+Revises: db108145b492
+Create Date: 2026-10-18 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e91d4a5b3'
+down_revision: Union[str, Sequence[str], None] = 'db108145b492'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Persist the HMAC generated by TransactionService so reconciliation can verify it
+    op.add_column('transactions', sa.Column('integrity_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transactions', 'integrity_hash')
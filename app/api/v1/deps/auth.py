@@ -19,7 +19,9 @@ from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorization
 from app.core.auth import auth_service
 from app.schemas.user import UserRead
 from app.core.redis import get_redis_sessions
+from app.core.config import settings
 from app.core.security import decode_access_token
+from app.core.token_cache import verified_token_cache
 from app.models.user import User, UserType
 
 
@@ -30,6 +32,22 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 security = HTTPBearer()
 
 
+def _user_from_payload(user_id: str, payload: dict) -> UserRead:
+    """Construir objeto UserRead desde payload JWT"""
+    return UserRead(
+        id=user_id,  # Usar el ID real del token
+        email=payload.get("email", "user@example.com"),
+        nombre=payload.get("nombre", "Usuario"),
+        apellido=payload.get("apellido", "Anónimo"),
+        user_type=payload.get("user_type", "BUYER"),
+        is_active=payload.get("is_active", True),
+        is_verified=payload.get("is_verified", False),
+        last_login=payload.get("last_login", None),
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     redis_sessions = Depends(get_redis_sessions)
@@ -39,7 +57,8 @@ async def get_current_user(
 
     Esta función:
     1. Extrae el JWT del header Authorization usando OAuth2PasswordBearer
-    2. Verifica el token usando auth_service.verify_token()
+    2. Reutiliza los claims verificados del cache por proceso (hasta "exp")
+       o verifica el token con decode_access_token()
     3. Valida la sesión en Redis (opcional para logout global)
     4. Retorna el usuario como objeto UserRead
 
@@ -59,23 +78,33 @@ async def get_current_user(
             return {"user": current_user.email}
     """
     try:
-        # Verificar token JWT usando las funciones centralizadas de seguridad
-        payload = decode_access_token(token)
-        if payload is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido o expirado",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        cached = verified_token_cache.get(token) if settings.AUTH_TOKEN_CACHE_ENABLED else None
+        if cached is not None:
+            # Token ya verificado por este proceso: sin firma, descifrado ni log
+            payload, user_data = cached
+            user_id = str(user_data.id)
+        else:
+            # Verificar token JWT usando las funciones centralizadas de seguridad
+            payload = decode_access_token(token)
+            if payload is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token inválido o expirado",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
 
-        # Extraer user_id del payload - puede estar en "user_id" o "sub"
-        user_id: str = payload.get("user_id") or payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token payload inválido - missing user ID",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            # Extraer user_id del payload - puede estar en "user_id" o "sub"
+            user_id: str = payload.get("user_id") or payload.get("sub")
+            if user_id is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token payload inválido - missing user ID",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+            user_data = _user_from_payload(user_id, payload)
+            if settings.AUTH_TOKEN_CACHE_ENABLED:
+                verified_token_cache.put(token, payload, user_data)
 
         # Verificar sesión activa en Redis (opcional para logout global)
         # Skip Redis session check during testing and development (disabled by default)
@@ -90,21 +119,8 @@ async def get_current_user(
                     headers={"WWW-Authenticate": "Bearer"},
                 )
 
-        # Construir objeto UserRead desde payload JWT
-        user_data = UserRead(
-            id=user_id,  # Usar el ID real del token
-            email=payload.get("email", "user@example.com"),
-            nombre=payload.get("nombre", "Usuario"),
-            apellido=payload.get("apellido", "Anónimo"),
-            user_type=payload.get("user_type", "BUYER"),
-            is_active=payload.get("is_active", True),
-            is_verified=payload.get("is_verified", False),
-            last_login=payload.get("last_login", None),
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-
-        return user_data
+        # Copia superficial: el objeto cacheado no se comparte entre requests
+        return user_data.model_copy()
 
     except HTTPException:
         # Re-lanzar HTTPExceptions tal como están
@@ -166,14 +182,23 @@ async def get_current_user_optional(
 
         token = auth_header.replace("Bearer ", "")
 
-        # Verificar token JWT usando las funciones centralizadas de seguridad
-        payload = decode_access_token(token)
-        if payload is None:
-            return None
+        cached = verified_token_cache.get(token) if settings.AUTH_TOKEN_CACHE_ENABLED else None
+        if cached is not None:
+            payload, user_data = cached
+            user_id = str(user_data.id)
+        else:
+            # Verificar token JWT usando las funciones centralizadas de seguridad
+            payload = decode_access_token(token)
+            if payload is None:
+                return None
 
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
+            user_id: str = payload.get("sub")
+            if user_id is None:
+                return None
+
+            user_data = _user_from_payload(user_id, payload)
+            if settings.AUTH_TOKEN_CACHE_ENABLED:
+                verified_token_cache.put(token, payload, user_data)
 
         # Verificar sesión activa en Redis (opcional para logout global)
         # Skip Redis session check during testing and development (disabled by default)
@@ -184,21 +209,7 @@ async def get_current_user_optional(
             if not session_data:
                 return None
 
-        # Construir objeto UserRead desde payload JWT
-        user_data = UserRead(
-            id=user_id,  # Usar el ID real del token
-            email=payload.get("email", "user@example.com"),
-            nombre=payload.get("nombre", "Usuario"),
-            apellido=payload.get("apellido", "Anónimo"),
-            user_type=payload.get("user_type", "BUYER"),
-            is_active=payload.get("is_active", True),
-            is_verified=payload.get("is_verified", False),
-            last_login=payload.get("last_login", None),
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
-
-        return user_data
+        return user_data.model_copy()
 
     except Exception:
         return None
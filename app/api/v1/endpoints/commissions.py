@@ -42,17 +42,20 @@ from app.api.v1.deps.database import get_commission_or_404
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Path, Body, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field, field_validator
 
 from app.api.v1.deps.database import get_db
 from app.api.v1.deps.auth import get_current_user
+from app.core.database import AsyncSessionLocal
 from app.models.user import User, UserType
 from app.models.commission import Commission, CommissionStatus, CommissionType
 from app.models.order import Order
-from app.services.commission_service import CommissionService, CommissionCalculationError
-from app.services.transaction_service import TransactionService
+from app.services.commission_service import CommissionService, AsyncCommissionService, CommissionCalculationError
+from app.services.transaction_service import AsyncTransactionService, TransactionError
 from app.schemas.commission import (
     VendorEarnings,
     CommissionReport,
@@ -194,7 +197,7 @@ async def list_commissions(
     limit: int = Query(20, ge=1, le=100, description="Number of results per page"),
     offset: int = Query(0, ge=0, description="Number of results to skip"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> CommissionListResponse:
     """
     Lista comisiones con filtros y paginación
@@ -205,7 +208,7 @@ async def list_commissions(
     - Paginación automática con límites por ambiente
     """
     try:
-        service = CommissionService(db)
+        service = AsyncCommissionService(db)
 
         # Determine vendor filter based on user role
         vendor_id = None
@@ -215,7 +218,7 @@ async def list_commissions(
         # Use service method with proper parameters
         status_filter = [status] if status else None
 
-        result = service.list_commissions(
+        result = await service.list_commissions(
             vendor_id=vendor_id,
             status_filter=status_filter,
             start_date=date_from,
@@ -275,7 +278,7 @@ async def list_commissions(
 async def get_commission(
     commission_id: str = Depends(validate_commission_id),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> CommissionResponse:
     """
     Obtiene detalles de una comisión específica
@@ -285,7 +288,7 @@ async def get_commission(
     - Incluye información completa de cálculos y estados
     """
     try:
-        commission = db.query(Commission).filter(Commission.id == commission_id).first()
+        commission = await db.get(Commission, commission_id)
         
         if not commission:
             raise HTTPException(
@@ -338,7 +341,7 @@ async def get_earnings(
     start_date: Optional[datetime] = Query(None, description="Start date for report"),
     end_date: Optional[datetime] = Query(None, description="End date for report"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> EarningsResponse:
     """
     Obtiene reporte de earnings para un vendor
@@ -349,7 +352,7 @@ async def get_earnings(
     - Breakdown por status de comisión
     """
     try:
-        service = CommissionService(db)
+        service = AsyncCommissionService(db)
         
         # Determine target vendor
         target_vendor_id = vendor_id
@@ -367,7 +370,7 @@ async def get_earnings(
                 )
         
         # Get earnings report
-        earnings_data = service.get_vendor_earnings(
+        earnings_data = await service.get_vendor_earnings(
             vendor_id=target_vendor_id,
             start_date=start_date,
             end_date=end_date,
@@ -395,7 +398,7 @@ async def get_earnings(
 async def calculate_commission(
     request: CalculateCommissionRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> CommissionResponse:
     """
     Calcula manualmente comisión para una orden
@@ -407,10 +410,10 @@ async def calculate_commission(
     try:
         check_admin_permission(current_user)
         
-        service = CommissionService(db)
+        service = AsyncCommissionService(db)
         
         # Get the order
-        order = db.query(Order).filter(Order.id == request.order_id).first()
+        order = await db.get(Order, request.order_id)
         if not order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -421,7 +424,7 @@ async def calculate_commission(
         from decimal import Decimal
         custom_rate = Decimal(str(request.custom_rate)) if request.custom_rate else None
         
-        commission = service.calculate_commission_for_order(
+        commission = await service.calculate_commission_for_order(
             order=order,
             commission_type=request.commission_type,
             custom_rate=custom_rate,
@@ -474,7 +477,7 @@ async def approve_commission(
     commission_id: str = Depends(validate_commission_id),
     request: ApproveCommissionRequest = Body(...),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> CommissionResponse:
     """
     Aprueba una comisión para pago
@@ -487,9 +490,9 @@ async def approve_commission(
     try:
         check_admin_permission(current_user)
         
-        service = CommissionService(db)
+        service = AsyncCommissionService(db)
         
-        commission = service.approve_commission(
+        commission = await service.approve_commission(
             commission_id=commission_id,
             approver_user_id=current_user.id,
             notes=request.notes,
@@ -540,10 +543,11 @@ async def approve_commission(
 async def get_transaction_history(
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor keyset devuelto en pagination.next_cursor"),
     start_date: Optional[datetime] = Query(None),
     end_date: Optional[datetime] = Query(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Obtiene historial de transacciones de comisiones
@@ -551,24 +555,30 @@ async def get_transaction_history(
     - **Vendors**: Solo ven sus transacciones
     - **Admins**: Ven todas las transacciones
     - Filtros por fechas opcionales
+    - Paginación keyset con `cursor` para recorrer periodos largos
     """
     try:
-        service = TransactionService(db)
+        service = AsyncTransactionService(db)
         
         # Determine user filter
         user_filter = None if current_user.user_type in [UserType.ADMIN, UserType.SUPERUSER] else current_user.id
         
-        history = service.get_transaction_history(
+        history = await service.get_transaction_history(
             user_id=user_filter,
             start_date=start_date,
             end_date=end_date,
             limit=limit,
             offset=offset,
-            db=db
+            cursor=cursor
         )
         
         return history
         
+    except TransactionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -576,6 +586,50 @@ async def get_transaction_history(
         )
 
 
+@router.get(
+    "/transactions/history/export",
+    summary="Export transaction history",
+    description="Stream the full transaction history as NDJSON or CSV",
+    response_description="Streamed transaction rows"
+)
+async def export_transaction_history(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Exporta el historial de transacciones en streaming
+
+    - Usa un cursor del servidor: memoria constante aunque se exporte un año
+    - **Vendors**: Solo exportan sus transacciones
+    - **Admins**: Exportan todas las transacciones
+    """
+    user_filter = None if current_user.user_type in [UserType.ADMIN, UserType.SUPERUSER] else current_user.id
+
+    async def row_stream():
+        # La sesión vive dentro del generador: las dependencias con yield
+        # se cierran antes de que termine de enviarse la respuesta.
+        async with AsyncSessionLocal() as session:
+            async for chunk in AsyncTransactionService().export_transaction_history_async(
+                session,
+                export_format=export_format,
+                user_id=user_filter,
+                start_date=start_date,
+                end_date=end_date
+            ):
+                yield chunk
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"transactions_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{export_format}"
+
+    return StreamingResponse(
+        row_stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 # ===================================================================
 # ENDPOINTS CRÍTICOS REQUERIDOS POR EL MANAGER - MVP MESTORE
 # ===================================================================
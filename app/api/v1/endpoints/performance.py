@@ -428,6 +428,7 @@ async def get_sla_compliance():
                 "sla_violations_24h": len(sla_violations),
                 "recent_violations": sla_violations[:10],  # Last 10 violations
                 "system_health": system_metrics.get("sla_compliance", {}),
+                "latency": performance_monitoring_service.get_latency_sla_compliance(),
                 "recommendations": _generate_sla_recommendations(sla_violations)
             }
         }
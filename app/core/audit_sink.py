@@ -0,0 +1,259 @@
+# ~/app/core/audit_sink.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Batched Audit Sink
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: audit_sink.py
+# Ruta: ~/app/core/audit_sink.py
+# Propósito: Sacar la escritura de auditoría/seguridad del camino de la petición
+#
+# Características:
+# - Buffer acotado en memoria, vaciado por una tarea en segundo plano en lotes
+# - Política de contrapresión configurable (drop_oldest, drop_newest, block)
+# - Escritura durable inmediata para eventos de cumplimiento
+# - QueueHandler/QueueListener para loggers con handlers de archivo
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Batched audit sink.
+
+Audit writers used to run inside the request: a Redis round trip per key,
+or a JSON dump plus a handler write per log line. ``AuditSink`` takes the
+event, appends it to a bounded buffer and returns; a background task drains
+the buffer every ``AUDIT_SINK_FLUSH_INTERVAL_SECONDS`` (or as soon as a
+batch is full) and hands whole batches to the writer, e.g. one Redis
+pipeline per batch.
+
+When the buffer is full the overflow policy decides:
+
+- ``drop_oldest``: evict the oldest buffered event (default)
+- ``drop_newest``: reject the new event
+- ``block``: write the new event inline, pushing the latency back onto
+  the caller instead of losing it
+
+Events submitted with ``durable=True`` (compliance) bypass the buffer and are
+written before ``put`` returns, as they were before.
+
+``queue_log_handlers`` does the same for plain loggers: the logger's own
+handlers move behind a bounded queue served by a ``QueueListener`` thread.
+"""
+
+import asyncio
+import logging
+import logging.handlers
+import queue
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+_sinks: "weakref.WeakSet[AuditSink]" = weakref.WeakSet()
+_listeners: List[logging.handlers.QueueListener] = []
+
+
+class AuditSink:
+    """
+    Bounded buffer flushed in batches by a background task.
+
+    ``writer`` receives a list of events and is awaited once per batch.
+    Used from the event loop only; the task starts on the first event.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        writer: Callable[[List[Any]], Awaitable[None]],
+        max_events: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        overflow_policy: Optional[str] = None
+    ):
+        self.name = name
+        self.writer = writer
+        self.max_events = max_events or settings.AUDIT_SINK_MAX_EVENTS
+        self.batch_size = batch_size or settings.AUDIT_SINK_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_SINK_FLUSH_INTERVAL_SECONDS
+        self.overflow_policy = overflow_policy or settings.AUDIT_SINK_OVERFLOW_POLICY
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit sink overflow policy: {self.overflow_policy}")
+
+        self._buffer: Deque[Any] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats: Dict[str, int] = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "inline_writes": 0,
+            "errors": 0,
+        }
+        _sinks.add(self)
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def put(self, event: Any, durable: bool = False) -> bool:
+        """
+        Submit an event; returns False if the overflow policy dropped it.
+
+        ``durable`` events are written before returning.
+        """
+        if durable:
+            self.stats["submitted"] += 1
+            self.stats["inline_writes"] += 1
+            return await self._write([event])
+
+        if len(self._buffer) >= self.max_events and self.overflow_policy == "block":
+            self.stats["submitted"] += 1
+            self.stats["inline_writes"] += 1
+            return await self._write([event])
+
+        return self.put_nowait(event)
+
+    def put_nowait(self, event: Any) -> bool:
+        """
+        Submit an event without awaiting (for sync callers).
+
+        With the ``block`` policy a full buffer degrades to ``drop_oldest``:
+        there is nothing to await here.
+        """
+        self.stats["submitted"] += 1
+        if len(self._buffer) >= self.max_events:
+            self.stats["dropped"] += 1
+            if self.overflow_policy == "drop_newest":
+                return False
+            self._buffer.popleft()
+
+        self._buffer.append(event)
+        self._ensure_task()
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> None:
+        """Write everything buffered now"""
+        while self._buffer:
+            await self._write(self._drain())
+
+    async def close(self) -> None:
+        """Stop the background task and flush what is left"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def _drain(self) -> List[Any]:
+        count = min(self.batch_size, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(count)]
+
+    async def _write(self, batch: List[Any]) -> bool:
+        try:
+            await self.writer(batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+            return True
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["dropped"] += len(batch)
+            logger.error(f"Audit sink '{self.name}' failed to write {len(batch)} events: {e}")
+            return False
+
+    def _ensure_task(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin loop: queda en el buffer hasta flush()/close()
+
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                await self._write(self._drain())
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking QueueHandler.
+
+    Records are enqueued as-is (formatting happens in the listener thread).
+    When the queue is full, ERROR and above are handled inline by the target
+    handlers so they are never lost; lower levels are dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler]):
+        super().__init__(log_queue)
+        self.handlers = handlers
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mismo proceso: no hace falta formatear ni copiar el record aquí
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.ERROR:
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            else:
+                self.dropped += 1
+
+
+def queue_log_handlers(target: logging.Logger, max_size: Optional[int] = None) -> Optional[logging.handlers.QueueListener]:
+    """
+    Move ``target``'s handlers behind a bounded queue and a listener thread.
+
+    Returns the started listener (None if the logger has no handlers of its own).
+    """
+    handlers = [h for h in target.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    if not handlers:
+        return None
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max_size or settings.AUDIT_SINK_MAX_EVENTS)
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(_BoundedQueueHandler(log_queue, handlers))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return listener
+
+
+async def close_audit_sinks() -> None:
+    """Flush every sink and stop the log listeners (application shutdown)"""
+    for sink in list(_sinks):
+        await sink.close()
+    for listener in list(_listeners):
+        listener.stop()
+    _listeners.clear()
+
+
+def get_audit_sink_stats() -> Dict[str, Dict[str, int]]:
+    """Per-sink counters plus the current buffer depth"""
+    return {sink.name: {**sink.stats, "buffered": len(sink)} for sink in _sinks}
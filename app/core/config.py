@@ -57,12 +57,61 @@ class Settings(BaseSettings):
     REDIS_TEMP_CACHE_TTL: int = 300  # 5 minutos para cache temporal
     REDIS_LONG_CACHE_TTL: int = 604800  # 7 días para cache de larga duración
 
+    # Enterprise sessions (app.services.session_service)
+    SESSION_ABSOLUTE_TIMEOUT_HOURS: int = 24
+    SESSION_IDLE_TIMEOUT_MINUTES: int = 30
+    SESSION_MAX_CONCURRENT_SESSIONS: int = 5
+    SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS: int = 60  # last_activity se escribe como máximo una vez por intervalo
+    SESSION_ACTIVITY_CACHE_SIZE: int = 10000  # Sesiones recordadas localmente para coalescer escrituras
+    DEVICE_FINGERPRINT_REQUIRED_HEADERS: list[str] = ["User-Agent"]
+
+    # Admin permissions (app.services.admin_permission_service)
+    ADMIN_PERMISSION_CACHE_SIZE: int = 1000  # Conjuntos compilados en memoria por proceso
+    ADMIN_PERMISSION_LOCAL_TTL_SECONDS: int = 5  # Cada cuánto se revalida la versión contra Redis
+
+    # Audit sink (app.core.audit_sink): auditoría fuera del camino de la petición
+    AUDIT_SINK_MAX_EVENTS: int = 10000  # Capacidad del buffer en memoria por sink
+    AUDIT_SINK_BATCH_SIZE: int = 200
+    AUDIT_SINK_FLUSH_INTERVAL_SECONDS: float = 0.5
+    AUDIT_SINK_OVERFLOW_POLICY: str = "drop_oldest"  # drop_oldest | drop_newest | block
+
+    # Request logging (app.middleware.logging)
+    REQUEST_LOG_SAMPLE_RATE: float = 1.0  # Fracción de requests logueadas (errores siempre)
+    REQUEST_LOG_ROUTE_SAMPLE_RATES: dict[str, float] = {}  # Por prefijo de path, p.ej. {"/api/v1/products": 0.1}
+    REQUEST_LOG_MAX_BODY_BYTES: int = 10 * 1024  # Bytes de body capturados como máximo
+
+    # Metrics core (app.core.metrics): agregación en proceso, expuesta en /metrics
+    METRICS_ENABLED: bool = True
+    METRICS_MULTIPROC_DIR: str = ""  # Directorio compartido entre workers; vacío = solo este proceso
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 10.0  # Snapshot por worker y evaluación de SLAs
+    METRICS_HISTOGRAM_BUCKETS: list[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    METRICS_SLA_MIN_SAMPLES: int = 20  # Muestras mínimas en la ventana para evaluar p95/p99
+
+    # Search analytics (app.services.search_analytics_service): eventos pre-agregados por flush
+    SEARCH_ANALYTICS_MAX_EVENTS: int = 20000  # Eventos en memoria antes de descartar los más antiguos
+    SEARCH_ANALYTICS_BATCH_SIZE: int = 1000  # Eventos agregados en un solo MULTI
+    SEARCH_ANALYTICS_FLUSH_INTERVAL_SECONDS: float = 2.0
+
+    # ASGI middleware stack (app.core.middleware_integration_simple)
+    MIDDLEWARE_STACK_ENABLED: Optional[bool] = None  # None: solo en production
+    MIDDLEWARE_STACK: list[str] = [  # Orden de fuera hacia dentro
+        "performance_monitor",
+        "comprehensive_security",
+        "enterprise_security",
+        "rate_limiting",
+        "performance_optimization",
+        "response_standardization",
+    ]
+
     # ChromaDB Configuration
     CHROMA_PERSIST_DIR: str = "./data/chroma"
 
     # Rate Limiting Configuration
     RATE_LIMIT_AUTHENTICATED_PER_MINUTE: int = 100
     RATE_LIMIT_ANONYMOUS_PER_MINUTE: int = 30
+    RATE_LIMIT_LOGIN_ATTEMPTS_PER_HOUR: int = 10
+    RATE_LIMIT_PASSWORD_RESET_PER_DAY: int = 3
+    RATE_LIMIT_OTP_REQUESTS_PER_HOUR: int = 5
 
     # Suspicious IP Detection Configuration
     SUSPICIOUS_IPS: str = ""  # Se parsea a list en el validator
@@ -109,6 +158,26 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 días
 
+    # Verified token cache (get_current_user)
+    AUTH_TOKEN_CACHE_ENABLED: bool = True
+    AUTH_TOKEN_CACHE_MAX_SIZE: int = 10000
+    AUTH_REVOCATION_BLOOM_CAPACITY: int = 10000  # Capacidad inicial; el filtro crece por generaciones
+    AUTH_REVOCATION_CHANNEL: str = "auth:revoked_jti"
+    AUTH_TOKEN_LOG_SAMPLE_RATE: float = 0.01  # Fracción de decodificaciones exitosas que se loguean
+
+    # Password hashing pool (bcrypt)
+    PASSWORD_HASH_WORKERS: int = 0  # 0 = os.cpu_count()
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # Operaciones en espera antes de responder 429
+    PASSWORD_HASH_USE_PROCESSES: bool = True  # False = hilos dedicados (tests, entornos sin fork/spawn)
+    PASSWORD_HASH_ROUNDS: int = 0  # 0 = coste según entorno (app.utils.password._get_bcrypt_rounds)
+
+    # Transaction integrity (HMAC persisted in transactions.integrity_hash)
+    # Debe ser el mismo en todos los workers; sin valor la verificación se omite
+    # (obligatorio en producción, ver validate_transaction_integrity_secret)
+    TRANSACTION_INTEGRITY_SECRET: str = Field(
+        default="", description="Shared HMAC key for transaction integrity hashes"
+    )
+
     # Twilio/SMS Configuration - Tarea 1.3.1.5
     TWILIO_ACCOUNT_SID: str = Field(
         default="", description="Twilio Account SID for SMS services"
@@ -296,6 +365,17 @@ class Settings(BaseSettings):
         import base64
         return base64.b64encode(secure_bytes).decode('utf-8')
 
+    @field_validator("TRANSACTION_INTEGRITY_SECRET")
+    @classmethod
+    def validate_transaction_integrity_secret(cls, v: str, info) -> str:
+        """Production must share one integrity key across workers (no per-process fallback)."""
+        if info.data.get("ENVIRONMENT") == "production" and not v:
+            raise ValueError(
+                "TRANSACTION_INTEGRITY_SECRET MUST be set in production. "
+                "Generate with: python -c 'import secrets; print(secrets.token_urlsafe(32))'"
+            )
+        return v
+
     @field_validator("SECRET_KEY")
     @classmethod
     def validate_secret_key(cls, v: str) -> str:
@@ -593,6 +673,8 @@ class Settings(BaseSettings):
     PAYMENT_FALLBACK_ENABLED: bool = Field(default=True, description="Enable automatic fallback to secondary gateway")
     PAYMENT_RETRY_ATTEMPTS: int = Field(default=3, description="Maximum payment retry attempts")
     PAYMENT_RETRY_DELAY_SECONDS: int = Field(default=2, description="Delay between payment retries in seconds")
+    PAYMENT_CHECKOUT_BUDGET_SECONDS: float = Field(default=25.0, description="Total time budget for a checkout across all gateway attempts")
+    PAYMENT_GATEWAY_MIN_ATTEMPT_SECONDS: float = Field(default=3.0, description="Minimum time reserved for each gateway attempt")
 
     def get_wompi_keys(self) -> dict:
         """
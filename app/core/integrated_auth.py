@@ -26,6 +26,7 @@ from app.services.secure_auth_service import SecureAuthService, SecurityAuditLog
 from app.core.auth import AuthService  # Legacy auth service
 from app.models.user import User
 from app.core.security import create_access_token, decode_access_token
+from app.core.password_hashing import get_password_hasher
 import sqlite3
 from passlib.context import CryptContext
 
@@ -83,11 +84,18 @@ class IntegratedAuthService:
 
             user_id, user_email, password_hash, user_type, nombre, is_active = row
 
-            # Verify password with passlib
-            if not self.pwd_context.verify(password, password_hash):
+            # Verify password in the dedicated hashing pool (429 when saturated)
+            is_valid, new_hash = await get_password_hasher().verify(password, password_hash)
+            if not is_valid:
                 logger.warning(f"Password verification failed for: {email}")
                 return None
 
+            if new_hash:
+                # bcrypt cost changed: persist the rehash transparently
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user_id))
+                password_hash = new_hash
+
             # Create a simple User object with proper enum conversion
             from app.models.user import UserType
 
@@ -111,6 +119,8 @@ class IntegratedAuthService:
             logger.info(f"Simple authentication successful for: {email}, user_type: {user.user_type}")
             return user
 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Simple authentication error for {email}: {str(e)}")
             return None
@@ -36,6 +36,7 @@ from fastapi import Request
 
 # Import services for integration
 from app.services.audit_logging_service import AuditLoggingService
+from app.core.audit_sink import queue_log_handlers
 from app.core.config import settings
 
 # Configure structured logging
@@ -144,6 +145,9 @@ class IntegratedLoggingSystem:
             file_handler.setFormatter(formatter)
             logger.addHandler(file_handler)
 
+            # Formateo JSON y escritura a disco en el hilo del QueueListener
+            queue_log_handlers(logger)
+
             self.loggers[category] = logger
 
     def _setup_log_aggregation(self):
@@ -242,17 +246,20 @@ class IntegratedLoggingSystem:
             if entry.business_impact:
                 log_data["business_impact"] = entry.business_impact
 
+            # "message" is reserved on LogRecord; it is the log message itself
+            extra = {key: value for key, value in log_data.items() if key != "message"}
+
             # Log with appropriate level
             if entry.level == LogLevel.DEBUG:
-                logger.debug(entry.message, extra=log_data)
+                logger.debug(entry.message, extra=extra)
             elif entry.level == LogLevel.INFO:
-                logger.info(entry.message, extra=log_data)
+                logger.info(entry.message, extra=extra)
             elif entry.level == LogLevel.WARNING:
-                logger.warning(entry.message, extra=log_data)
+                logger.warning(entry.message, extra=extra)
             elif entry.level == LogLevel.ERROR:
-                logger.error(entry.message, extra=log_data)
+                logger.error(entry.message, extra=extra)
             elif entry.level == LogLevel.CRITICAL:
-                logger.critical(entry.message, extra=log_data)
+                logger.critical(entry.message, extra=extra)
 
             # Add to correlation events
             self.add_correlation_event(
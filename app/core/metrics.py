@@ -0,0 +1,463 @@
+# ~/app/core/metrics.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - In-process Metrics Core
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: metrics.py
+# Ruta: ~/app/core/metrics.py
+# Propósito: Un único núcleo de métricas por proceso, agregado entre workers y expuesto
+#            en formato Prometheus
+#
+# Características:
+# - Contadores, gauges e histogramas log-lineales (estilo HDR) en memoria, sin Redis
+# - Percentiles p50/p95/p99 reales con error relativo < 1%
+# - Snapshots por worker en un directorio compartido, fusionados al exponer
+# - Exposición en texto Prometheus 0.0.4 (/metrics)
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+In-process metrics core.
+
+Recording a value is a dict update in the worker's own memory: no lock (the
+event loop is single-threaded) and no Redis round trip. Latencies go into
+log-linear histograms (HDR style: 128 linear sub-buckets per power of two,
+in microseconds), so p95/p99 can be answered at any time with < 1% error.
+
+With ``METRICS_MULTIPROC_DIR`` set, every worker writes its snapshot to
+``metrics_<pid>.json`` in that directory every
+``METRICS_FLUSH_INTERVAL_SECONDS`` (atomic rename) and ``collect()`` merges
+all of them: counters and histograms are summed, gauges keep the most recent
+value. Files of workers that exited are kept so counters never go back; the
+directory should be emptied when the whole deployment restarts.
+
+Periodic hooks (e.g. SLA evaluation) registered with ``add_periodic_hook``
+run on the same background task as the flush.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+LINEAR_LIMIT = SUB_BUCKETS << 1  # Por debajo de 256 µs cada valor tiene su bucket
+
+METRIC_PREFIX = "mestore_"
+
+# HELP de las métricas conocidas (las demás usan su nombre)
+METRIC_HELP: Dict[str, str] = {
+    "http_requests_total": "HTTP requests by route template, method and status",
+    "http_request_duration_seconds": "HTTP request latency by route template and method",
+    "db_query_duration_seconds": "Database query latency by query type",
+    "cache_operation_duration_seconds": "Cache operation latency by cache and operation",
+    "operation_duration_seconds": "Monitored operation latency",
+    "operation_errors_total": "Monitored operations that raised",
+    "cache_requests_total": "Cache lookups by namespace and result",
+    "cache_invalidations_total": "Cache pattern invalidations by namespace",
+}
+
+
+def labels_of(**labels: Any) -> Labels:
+    """Canonical (sorted) label tuple"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """
+    Route template of a request (``/api/v1/products/{product_id}``).
+
+    Requests that did not match a route share one label so the raw path never
+    becomes a label value.
+    """
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+def record_http_request(request: Any, status_code: int, seconds: float,
+                        registry: Optional["MetricsRegistry"] = None) -> None:
+    """Record a request once, even with several monitoring layers in the stack"""
+    if getattr(request.state, "metrics_recorded", False):
+        return
+    request.state.metrics_recorded = True
+    (registry or metrics).record_request(route_template(request.scope), request.method, status_code, seconds)
+
+
+class Histogram:
+    """
+    Log-linear histogram over non-negative values.
+
+    Values are scaled to integers (``scale``, default seconds -> µs) and
+    bucketed with ``SUB_BUCKETS`` linear buckets per power of two.
+    """
+
+    __slots__ = ("scale", "counts", "count", "sum", "min", "max", "updated_at")
+
+    def __init__(self, scale: float = 1e6):
+        self.scale = scale
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.updated_at = 0.0
+
+    @staticmethod
+    def _index(units: int) -> int:
+        if units < LINEAR_LIMIT:
+            return units
+        shift = units.bit_length() - (SUB_BUCKET_BITS + 1)
+        return shift * SUB_BUCKETS + (units >> shift)
+
+    @staticmethod
+    def _bounds(index: int) -> Tuple[int, int]:
+        """Inclusive [lowest, highest] integer value of a bucket"""
+        if index < LINEAR_LIMIT:
+            return index, index
+        shift = (index - SUB_BUCKETS) // SUB_BUCKETS
+        mantissa = index - shift * SUB_BUCKETS
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, value: float) -> None:
+        if value < 0:
+            value = 0.0
+        index = self._index(int(value * self.scale))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.updated_at = time.time()
+
+    def percentile(self, q: float) -> float:
+        """Value at quantile ``q`` (0-1): highest value of its bucket, capped to max"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._bounds(index)[1] / self.scale, self.max)
+        return self.max
+
+    def count_above(self, threshold: float) -> int:
+        """Values recorded in buckets that lie entirely above ``threshold``"""
+        limit = threshold * self.scale
+        return sum(n for index, n in self.counts.items() if self._bounds(index)[0] > limit)
+
+    def cumulative(self, upper_bounds: Iterable[float]) -> List[int]:
+        """Cumulative counts for Prometheus ``le`` buckets"""
+        ordered = sorted(self.counts.items())
+        result, seen, position = [], 0, 0
+        for bound in upper_bounds:
+            limit = bound * self.scale
+            while position < len(ordered) and self._bounds(ordered[position][0])[0] <= limit:
+                seen += ordered[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.updated_at = max(self.updated_at, other.updated_at)
+        return self
+
+    def copy(self) -> "Histogram":
+        return Histogram(self.scale).merge(self)
+
+    def since(self, earlier: Optional["Histogram"]) -> "Histogram":
+        """Values recorded after the ``earlier`` copy was taken (min/max are cumulative)"""
+        delta = self.copy()
+        if earlier is None:
+            return delta
+        for index, n in earlier.counts.items():
+            remaining = delta.counts.get(index, 0) - n
+            if remaining > 0:
+                delta.counts[index] = remaining
+            else:
+                delta.counts.pop(index, None)
+        delta.count -= earlier.count
+        delta.sum -= earlier.sum
+        return delta
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scale": self.scale, "counts": self.counts, "count": self.count, "sum": self.sum,
+            "min": None if self.min == math.inf else self.min, "max": self.max,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Histogram":
+        histogram = cls(data["scale"])
+        histogram.counts = {int(index): n for index, n in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = math.inf if data["min"] is None else data["min"]
+        histogram.max = data["max"]
+        histogram.updated_at = data.get("updated_at", 0.0)
+        return histogram
+
+
+class MetricsSnapshot:
+    """Counters, gauges and histograms of one process (or several, merged)"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], Tuple[float, float]] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def merge(self, other: "MetricsSnapshot") -> "MetricsSnapshot":
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, (value, ts) in other.gauges.items():
+            if key not in self.gauges or self.gauges[key][1] <= ts:
+                self.gauges[key] = (value, ts)
+        for key, histogram in other.histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = histogram.copy()
+        return self
+
+    def histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        return self.histograms.get((name, labels_of(**labels)))
+
+    def select(self, name: str, kind: str = "histograms") -> Dict[Labels, Any]:
+        """All series of one metric, keyed by labels"""
+        return {labels: value for (metric, labels), value in getattr(self, kind).items() if metric == name}
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+            "gauges": [[name, labels, value, ts] for (name, labels), (value, ts) in self.gauges.items()],
+            "histograms": [[name, labels, h.to_dict()] for (name, labels), h in self.histograms.items()],
+        })
+
+    @classmethod
+    def from_json(cls, raw: str) -> "MetricsSnapshot":
+        data = json.loads(raw)
+        snapshot = cls()
+        key = lambda name, labels: (name, tuple(tuple(pair) for pair in labels))
+        for name, labels, value in data["counters"]:
+            snapshot.counters[key(name, labels)] = value
+        for name, labels, value, ts in data["gauges"]:
+            snapshot.gauges[key(name, labels)] = (value, ts)
+        for name, labels, histogram in data["histograms"]:
+            snapshot.histograms[key(name, labels)] = Histogram.from_dict(histogram)
+        return snapshot
+
+
+class MetricsRegistry(MetricsSnapshot):
+    """
+    Live metrics of this process.
+
+    Recording never awaits; a background task (started with the first value
+    recorded inside an event loop) writes the multiprocess snapshot and runs
+    the periodic hooks.
+    """
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: Optional[float] = None):
+        super().__init__()
+        self.multiproc_dir = settings.METRICS_MULTIPROC_DIR if multiproc_dir is None else multiproc_dir
+        self.flush_interval = flush_interval or settings.METRICS_FLUSH_INTERVAL_SECONDS
+        self._hooks: List[Callable[[], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # Recording
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+        if self._task is None:
+            self._ensure_task()
+
+    def set_gauge(self, name: str, labels: Labels = (), value: float = 0.0) -> None:
+        self.gauges[(name, labels)] = (value, time.time())
+        if self._task is None:
+            self._ensure_task()
+
+    def observe(self, name: str, labels: Labels = (), value: float = 0.0) -> None:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.record(value)
+        if self._task is None:
+            self._ensure_task()
+
+    def record_request(self, route: str, method: str, status_code: int, seconds: float) -> None:
+        """One HTTP request: counter by status, latency by route template and method"""
+        self.inc("http_requests_total", (("method", method), ("route", route), ("status", str(status_code))))
+        self.observe("http_request_duration_seconds", (("method", method), ("route", route)), seconds)
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    # Collection across workers
+
+    def snapshot(self) -> MetricsSnapshot:
+        """Copy of this process' metrics"""
+        return MetricsSnapshot().merge(self)
+
+    def collect(self) -> MetricsSnapshot:
+        """This process' metrics merged with the other workers' last snapshots"""
+        merged = self.snapshot()
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return merged
+
+        own = self._snapshot_path()
+        for file_name in os.listdir(self.multiproc_dir):
+            path = os.path.join(self.multiproc_dir, file_name)
+            if not (file_name.startswith("metrics_") and file_name.endswith(".json")) or path == own:
+                continue
+            try:
+                with open(path, encoding="utf-8") as snapshot_file:
+                    merged.merge(MetricsSnapshot.from_json(snapshot_file.read()))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {file_name}: {e}")
+        return merged
+
+    def write_snapshot(self) -> None:
+        """Write this process' snapshot for the other workers (atomic replace)"""
+        if not self.multiproc_dir:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot_file:
+            snapshot_file.write(self.to_json())
+        os.replace(tmp_path, path)
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.multiproc_dir, f"metrics_{os.getpid()}.json")
+
+    # Background task
+
+    def add_periodic_hook(self, hook: Callable[[], Awaitable[None]]) -> None:
+        """Run ``hook`` every flush interval on the metrics task"""
+        self._hooks.append(hook)
+
+    async def flush(self) -> None:
+        """Run the periodic hooks and write the snapshot now"""
+        for hook in self._hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Metrics hook {getattr(hook, '__qualname__', hook)} failed: {e}")
+        if self.multiproc_dir:
+            try:
+                await asyncio.to_thread(self.write_snapshot)
+            except OSError as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+
+    async def close(self) -> None:
+        """Stop the background task and write a final snapshot"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+    def _ensure_task(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin loop: se vuelve a intentar con el siguiente valor
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Prometheus exposition
+
+    def render_prometheus(self, snapshot: Optional[MetricsSnapshot] = None) -> str:
+        """Prometheus text format (0.0.4) of the merged metrics"""
+        snapshot = snapshot or self.collect()
+        buckets = sorted(settings.METRICS_HISTOGRAM_BUCKETS)
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> None:
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for name in sorted({name for name, _ in snapshot.counters}):
+            header(name, "counter")
+            for labels, value in sorted(snapshot.select(name, "counters").items()):
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name in sorted({name for name, _ in snapshot.gauges}):
+            header(name, "gauge")
+            for labels, (value, _) in sorted(snapshot.select(name, "gauges").items()):
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name in sorted({name for name, _ in snapshot.histograms}):
+            header(name, "histogram")
+            for labels, histogram in sorted(snapshot.select(name).items()):
+                for bound, seen in zip(buckets, histogram.cumulative(buckets)):
+                    le = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(le)} {seen}")
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# Registro global del proceso
+metrics = MetricsRegistry()
+
+
+async def close_metrics() -> None:
+    """Final snapshot and task shutdown (application shutdown)"""
+    await metrics.close()
@@ -4,9 +4,15 @@ Simplified Middleware Integration
 
 Lightweight middleware setup that replaces the complex middleware chain.
 This focuses on essential middleware only to get the application running.
+
+The security/performance layers (pure ASGI, see app.middleware.asgi) are
+added as an ordered stack configured by MIDDLEWARE_STACK (outermost first)
+and MIDDLEWARE_STACK_ENABLED (production only by default).
 """
 
+import importlib
 import logging
+from typing import List
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
@@ -16,6 +22,42 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Capas disponibles para MIDDLEWARE_STACK: nombre -> (módulo, clase)
+ASGI_MIDDLEWARE_LAYERS = {
+    "performance_monitor": ("app.middleware.performance_monitor", "PerformanceMonitorMiddleware"),
+    "comprehensive_security": ("app.middleware.comprehensive_security", "ComprehensiveSecurityMiddleware"),
+    "enterprise_security": ("app.middleware.enterprise_security", "EnterpriseSecurityMiddleware"),
+    "rate_limiting": ("app.middleware.rate_limiting", "RateLimitingMiddleware"),
+    "performance_optimization": ("app.middleware.performance_optimization", "PerformanceOptimizationMiddleware"),
+    "response_standardization": ("app.middleware.response_standardization", "ResponseStandardizationMiddleware"),
+}
+
+
+def middleware_stack_enabled() -> bool:
+    """MIDDLEWARE_STACK_ENABLED, defaulting to production only"""
+    if settings.MIDDLEWARE_STACK_ENABLED is not None:
+        return settings.MIDDLEWARE_STACK_ENABLED
+    return settings.ENVIRONMENT == "production"
+
+
+def add_middleware_stack(app: FastAPI, layers: List[str]) -> None:
+    """
+    Add the named ASGI layers to the app, ``layers[0]`` outermost.
+
+    Raises:
+        ValueError: Unknown layer name
+    """
+    unknown = [name for name in layers if name not in ASGI_MIDDLEWARE_LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown middleware in MIDDLEWARE_STACK: {unknown}")
+
+    # add_middleware antepone: se añade de dentro hacia fuera
+    for name in reversed(layers):
+        module_name, class_name = ASGI_MIDDLEWARE_LAYERS[name]
+        app.add_middleware(getattr(importlib.import_module(module_name), class_name))
+        logger.info(f"✅ {class_name} added")
+
+
 def setup_application_middleware(app: FastAPI):
     """Setup essential middleware with enhanced secure CORS configuration"""
     logger.info("Setting up enhanced secure middleware...")
@@ -66,6 +108,11 @@ def setup_application_middleware(app: FastAPI):
             logger.info(f"Sensitive header allowed (verify this is intentional): {header}")
 
     # MIDDLEWARE CHAIN SETUP (Optimal Security Order)
+    # 0. Security/performance stack, innermost: runs inside HTTPS redirect, GZip and CORS
+    #    (CORS headers also on 429/403 responses; GZip skips already-encoded bodies)
+    if middleware_stack_enabled():
+        add_middleware_stack(app, settings.MIDDLEWARE_STACK)
+
     # 1. HTTPS redirect first (highest priority)
     if settings.ENVIRONMENT == "production":
         app.add_middleware(HTTPSRedirectMiddleware)
@@ -0,0 +1,249 @@
+# ~/app/core/password_hashing.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Pool dedicado de hashing de contraseñas
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: password_hashing.py
+# Ruta: ~/app/core/password_hashing.py
+# Propósito: Subsistema acotado para bcrypt, aislado del resto de run_in_executor
+#
+# Características:
+# - ProcessPoolExecutor dimensionado a los núcleos (bcrypt es CPU puro)
+# - Control de admisión: cola llena -> 429 inmediato en lugar de latencia creciente
+# - Métricas de tiempo de hash, espera en cola y profundidad de cola
+# - Rehash transparente con passlib needs_update cuando cambia el coste configurado
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Dedicated password hashing pool.
+
+bcrypt used to share the default executors with embeddings, image
+processing and every other ``run_in_executor`` caller, so a login storm
+could starve them (and be starved by them). All hashing now goes through
+one bounded pool:
+
+- ``workers`` processes (or threads when processes are disabled)
+- at most ``workers + max_queue`` operations in flight; beyond that
+  ``PasswordHashingOverloaded`` (HTTP 429) is raised immediately
+- ``verify`` returns a new hash when the stored one was produced with a
+  different cost, so callers can persist it on successful login
+
+Worker functions are module-level so they pickle into spawned workers; each
+worker builds its CryptContext once per cost.
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import structlog
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+logger = structlog.get_logger(__name__)
+
+
+class PasswordHashingOverloaded(HTTPException):
+    """Cola de hashing llena: el cliente debe reintentar más tarde"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Servicio de autenticación saturado. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+# ===== WORKERS (se ejecutan en el proceso hijo) =====
+
+@lru_cache(maxsize=4)
+def _context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def _hash_worker(password: str, rounds: int) -> Tuple[str, float]:
+    started = time.perf_counter()
+    hashed = _context(rounds).hash(password)
+    return hashed, time.perf_counter() - started
+
+
+def _verify_worker(password: str, hashed_password: str, rounds: int) -> Tuple[bool, Optional[str], float]:
+    started = time.perf_counter()
+    is_valid, new_hash = _context(rounds).verify_and_update(password, hashed_password)
+    return is_valid, new_hash, time.perf_counter() - started
+
+
+# ===== POOL =====
+
+class PasswordHasherPool:
+    """
+    Bounded bcrypt executor with admission control and latency metrics.
+
+    Used from the event loop only, so the in-flight counter needs no lock.
+    """
+
+    def __init__(
+        self,
+        rounds: int,
+        workers: int = 0,
+        max_queue: int = 64,
+        use_processes: bool = True,
+        sample_size: int = 1024
+    ):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self._hash_times: Deque[float] = deque(maxlen=sample_size)
+        self._wait_times: Deque[float] = deque(maxlen=sample_size)
+        self.counters = {
+            "hashes": 0,
+            "verifications": 0,
+            "rehashes": 0,
+            "rejected": 0,
+            "max_queue_depth": 0,
+        }
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                # spawn: no heredar hilos ni el event loop del proceso padre
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    def _retry_after(self) -> int:
+        """Estimated seconds until a slot frees up"""
+        typical = self._percentile(self._hash_times, 0.5) or 0.1
+        return max(1, math.ceil(typical * self.capacity / self.workers))
+
+    async def _submit(self, fn, *args) -> Any:
+        if self._in_flight >= self.capacity:
+            self.counters["rejected"] += 1
+            logger.warning("Password hashing queue full", in_flight=self._in_flight, capacity=self.capacity)
+            raise PasswordHashingOverloaded(self._retry_after())
+
+        self._in_flight += 1
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue_depth)
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        try:
+            try:
+                result = await loop.run_in_executor(self._get_executor(), fn, *args)
+            except BrokenProcessPool:
+                # Un worker murió (OOM, kill): recrear el pool y reintentar una vez
+                logger.error("Password hashing pool broken, restarting")
+                self._executor = None
+                result = await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._in_flight -= 1
+
+        hash_time = result[-1]
+        self._hash_times.append(hash_time)
+        self._wait_times.append(max(0.0, time.perf_counter() - submitted - hash_time))
+        return result[:-1]
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured cost"""
+        hashed, = await self._submit(_hash_worker, password, self.rounds)
+        self.counters["hashes"] += 1
+        return hashed
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password.
+
+        Returns ``(is_valid, new_hash)``; ``new_hash`` is set only when the
+        password is valid and the stored hash uses a different cost.
+        """
+        is_valid, new_hash = await self._submit(_verify_worker, password, hashed_password, self.rounds)
+        self.counters["verifications"] += 1
+        if new_hash:
+            self.counters["rehashes"] += 1
+        return is_valid, new_hash
+
+    def needs_update(self, hashed_password: str) -> bool:
+        """True when ``hashed_password`` was produced with a different cost (no bcrypt work)"""
+        try:
+            return _context(self.rounds).needs_update(hashed_password)
+        except ValueError:
+            return False
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def _percentile(samples: Deque[float], q: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "process" if self.use_processes else "thread",
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "hash_time_p50_ms": round(self._percentile(self._hash_times, 0.5) * 1000, 2),
+            "hash_time_p99_ms": round(self._percentile(self._hash_times, 0.99) * 1000, 2),
+            "queue_wait_p99_ms": round(self._percentile(self._wait_times, 0.99) * 1000, 2),
+            **self.counters,
+        }
+
+
+_password_hasher: Optional[PasswordHasherPool] = None
+
+
+def get_password_hasher() -> PasswordHasherPool:
+    """Shared pool configured from settings (created on first use)"""
+    global _password_hasher
+    if _password_hasher is None:
+        from app.core.config import settings
+        from app.utils.password import _get_bcrypt_rounds
+
+        _password_hasher = PasswordHasherPool(
+            rounds=settings.PASSWORD_HASH_ROUNDS or _get_bcrypt_rounds(),
+            workers=settings.PASSWORD_HASH_WORKERS,
+            max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+            use_processes=settings.PASSWORD_HASH_USE_PROCESSES and not settings.TESTING
+        )
+    return _password_hasher
+
+
+def shutdown_password_hasher() -> None:
+    global _password_hasher
+    if _password_hasher is not None:
+        _password_hasher.shutdown()
+        _password_hasher = None
@@ -0,0 +1,530 @@
+# ~/app/core/rate_limit_engine.py
+# ---------------------------------------------------------------------------------------------
+# MESTORE - Unified GCRA Rate Limiting Engine
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Archivo: rate_limit_engine.py
+# Ruta: ~/app/core/rate_limit_engine.py
+# Propósito: Motor único de rate limiting (GCRA) compartido por middlewares y servicios
+#
+# Características:
+# - Generic Cell Rate Algorithm: un solo valor (TAT) por clave, sin sorted sets
+# - Script Lua registrado una vez (SCRIPT LOAD) e invocado con EVALSHA
+# - Todas las dimensiones (IP, usuario, endpoint, ventanas) en un solo round-trip
+# - Allow/deny lists (bloqueos con TTL) evaluadas dentro del mismo script
+# - Pre-admisión local: leases de tokens pre-debitados en Redis para clientes
+#   claramente bajo el límite, consumidos sin llamar a Redis (TTL acotado a 1s)
+# - Consultas sin cargo (charge=False) para presupuestos que solo se debitan
+#   al fallar, p. ej. intentos de autenticación
+# - Caché local acotada de deny keys: un atacante bloqueado no vuelve a llegar
+#   a Redis mientras dure su bloqueo (como máximo local_deny_ttl sin revalidar)
+# - Backend en memoria con la misma matemática cuando no hay Redis, con
+#   desalojo de claves cuyo TAT ya pasó y tope LRU
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Unified GCRA rate-limiting engine.
+
+GCRA stores a single "theoretical arrival time" (TAT) per key. A rule of
+``limit`` requests per ``period_seconds`` has an emission interval
+``T = period / limit`` and a burst tolerance ``tau = T * limit``; a request is
+admitted while ``max(TAT, now) + T - now <= tau``. This gives the same
+steady-state limit as a sliding window with O(1) memory and one key per rule.
+
+All rules for a request are evaluated atomically in one script call and are
+only charged when every rule admits the request.
+
+Local leases skip Redis entirely, including the deny-list lookup, so a key
+deny-listed by another process is honoured here after at most
+``MAX_LEASE_TTL`` seconds (the local ``invalidate`` makes it immediate in
+the process that set it).
+
+Deny keys found set in Redis are remembered locally (bounded LRU) for up to
+``local_deny_ttl`` seconds, so a locked-out client keeps being rejected
+without Redis calls; lifting a block early elsewhere takes effect here
+within that bound.
+"""
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from redis.exceptions import NoScriptError
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# KEYS: [allow_key?] deny_key_1 .. deny_key_d rule_key_1 .. rule_key_n
+# ARGV: has_allow, deny_count, lease_tokens, lease_threshold, charge, (interval_ms, burst) * n
+# Returns: {status, granted_lease, violated_index, (remaining, reset_after_ms, retry_after_ms) * n}
+#   status: 0 = denied, 1 = allowed, 2 = allow-listed, 3 = deny-listed
+#   deny-listed: {3, 0, deny_index, deny_ttl_ms}
+GCRA_LUA_SCRIPT = """
+local has_allow = tonumber(ARGV[1])
+local deny_count = tonumber(ARGV[2])
+local lease = tonumber(ARGV[3])
+local threshold = tonumber(ARGV[4])
+local charge = tonumber(ARGV[5])
+local offset = 0
+
+if has_allow == 1 then
+    offset = offset + 1
+    if redis.call('EXISTS', KEYS[offset]) == 1 then
+        return {2, 0, 0}
+    end
+end
+for d = 1, deny_count do
+    offset = offset + 1
+    if redis.call('EXISTS', KEYS[offset]) == 1 then
+        return {3, 0, d, redis.call('PTTL', KEYS[offset])}
+    end
+end
+if charge == 0 then
+    lease = 0
+end
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local n = #KEYS - offset
+local tats = {}
+local result = {1, 0, 0}
+local grant = lease
+
+for i = 1, n do
+    local interval = tonumber(ARGV[4 + 2 * i])
+    local burst = tonumber(ARGV[5 + 2 * i])
+    local tolerance = interval * burst
+    local tat = tonumber(redis.call('GET', KEYS[offset + i])) or now
+    if tat < now then
+        tat = now
+    end
+    tats[i] = tat
+
+    local diff = tat + interval - now
+    if diff > tolerance then
+        result[1] = 0
+        if result[3] == 0 then
+            result[3] = i
+        end
+        table.insert(result, math.max(0, math.floor((tolerance - (tat - now)) / interval)))
+        table.insert(result, tat - now)
+        table.insert(result, diff - tolerance)
+    else
+        local remaining = math.floor((tolerance - diff) / interval)
+        local spare = remaining - math.ceil(burst * threshold)
+        if spare < grant then
+            grant = math.max(0, spare)
+        end
+        table.insert(result, remaining)
+        table.insert(result, diff)
+        table.insert(result, 0)
+    end
+end
+
+if result[1] == 0 or charge == 0 then
+    return result
+end
+
+result[2] = grant
+for i = 1, n do
+    local interval = tonumber(ARGV[4 + 2 * i])
+    local new_tat = tats[i] + interval * (1 + grant)
+    redis.call('SET', KEYS[offset + i], new_tat, 'PX', math.max(1, math.ceil(new_tat - now)))
+    result[1 + 3 * i] = result[1 + 3 * i] - grant
+    result[2 + 3 * i] = new_tat - now
+end
+return result
+"""
+
+GCRA_SCRIPT_SHA = hashlib.sha1(GCRA_LUA_SCRIPT.encode("utf-8")).hexdigest()
+
+# Cota del retraso con que un deny-list de otro proceso alcanza a una lease local
+MAX_LEASE_TTL = 1.0
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """One limit: ``limit`` requests per ``period_seconds`` on ``key``"""
+    key: str
+    limit: int
+    period_seconds: float
+    scope: str = "global"
+
+    @property
+    def emission_interval_ms(self) -> float:
+        return self.period_seconds * 1000.0 / self.limit
+
+
+@dataclass
+class RuleState:
+    """State of a rule after a check"""
+    rule: RateLimitRule
+    remaining: int
+    reset_after: float
+    retry_after: float = 0.0
+
+
+@dataclass
+class RateLimitDecision:
+    """Result of checking a set of rules"""
+    allowed: bool
+    states: List[RuleState] = field(default_factory=list)
+    violated: Optional[RateLimitRule] = None
+    source: str = "redis"
+    denied_key: Optional[str] = None
+    denied_for: float = 0.0
+
+    @property
+    def most_restrictive(self) -> Optional[RuleState]:
+        if not self.states:
+            return None
+        if self.violated is not None:
+            return next(state for state in self.states if state.rule == self.violated)
+        return min(self.states, key=lambda state: state.remaining)
+
+    @property
+    def remaining(self) -> int:
+        state = self.most_restrictive
+        return state.remaining if state else 0
+
+    @property
+    def retry_after(self) -> float:
+        return max([state.retry_after for state in self.states] + [self.denied_for])
+
+    @property
+    def reset_after(self) -> float:
+        state = self.most_restrictive
+        return state.reset_after if state else 0.0
+
+
+@dataclass
+class _Lease:
+    tokens: int
+    expires_at: float
+    states: List[RuleState]
+
+
+class RateLimitEngine:
+    """
+    Rate limiter shared by every limiter in the application.
+
+    Args:
+        redis_client: async Redis client, or None for the in-memory backend
+        lease_tokens: extra tokens requested per Redis call for local admission
+            (0 disables the local cache)
+        lease_threshold: fraction of each rule's burst that must remain after
+            the lease is taken; callers close to a limit always go to Redis
+        lease_ttl: seconds a local lease stays valid (capped at ``MAX_LEASE_TTL``)
+        max_leases: maximum number of cached leases per process
+        max_memory_keys: maximum number of TATs kept by the memory backend
+        local_deny_ttl: seconds a deny key seen in Redis is answered locally
+        max_local_denies: maximum number of deny keys remembered locally
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        lease_tokens: int = 5,
+        lease_threshold: float = 0.5,
+        lease_ttl: float = 1.0,
+        max_leases: int = 10000,
+        max_memory_keys: int = 100000,
+        local_deny_ttl: float = 30.0,
+        max_local_denies: int = 10000
+    ):
+        self.redis = redis_client
+        self.lease_tokens = lease_tokens
+        self.lease_threshold = lease_threshold
+        self.lease_ttl = min(lease_ttl, MAX_LEASE_TTL)
+        self.max_leases = max_leases
+        self.max_memory_keys = max_memory_keys
+        self._leases: "OrderedDict[Tuple[str, ...], _Lease]" = OrderedDict()
+        self._memory_tats: "OrderedDict[str, float]" = OrderedDict()
+        self._memory_denies: Dict[str, float] = {}
+        self._memory_swept_at = 0.0
+        self._memory_lock = asyncio.Lock()
+        self.local_deny_ttl = local_deny_ttl
+        self.max_local_denies = max_local_denies
+        # deny key -> (revalidar en, expira en), relojes monotónicos
+        self._local_denies: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.stats = {"redis_calls": 0, "local_hits": 0, "local_denies": 0, "script_loads": 0}
+
+    async def check(
+        self,
+        rules: Sequence[RateLimitRule],
+        allow_key: Optional[str] = None,
+        deny_key: Optional[str] = None,
+        deny_keys: Sequence[str] = (),
+        charge: bool = True
+    ) -> RateLimitDecision:
+        """
+        Admit or reject one request against all ``rules`` at once.
+
+        Uses at most one Redis call; none when a local lease covers the request.
+
+        Args:
+            rules: limits to evaluate (all charged together, or none)
+            allow_key: key whose existence admits the request unconditionally
+            deny_key, deny_keys: keys whose existence rejects the request;
+                the first one found is reported in ``denied_key``/``denied_for``
+            charge: False to only ask whether one more request would be
+                admitted, without consuming it (no lease is granted either)
+        """
+        rules = [rule for rule in rules if rule.limit > 0]
+        denies = ([deny_key] if deny_key else []) + list(deny_keys)
+        lease_key = (allow_key or "",) + tuple(denies) + tuple(rule.key for rule in rules)
+
+        if charge:
+            local = self._take_local(lease_key)
+            if local is not None:
+                return local
+
+        if self.redis is None:
+            decision, granted = await self._check_memory(rules, denies, charge)
+        else:
+            # El allow-list tiene prioridad: sin allow_key se puede rechazar localmente
+            if denies and allow_key is None:
+                local = self._take_local_deny(denies)
+                if local is not None:
+                    return local
+            decision, granted = await self._check_redis(rules, allow_key, denies, charge)
+            if decision.denied_key and decision.denied_for > 0:
+                self._remember_deny(decision.denied_key, decision.denied_for)
+
+        if decision.allowed and granted > 0:
+            self._store_lease(lease_key, granted, decision.states)
+        return decision
+
+    async def deny(self, key: str, seconds: float, value: Union[str, bytes] = "1") -> None:
+        """
+        Deny-list ``key`` for ``seconds`` (lockouts, IP blacklists).
+
+        Checks passing ``key`` in ``deny_key``/``deny_keys`` are rejected
+        until it expires; local leases covering it are dropped.
+        """
+        ttl_ms = max(1, int(seconds * 1000))
+        if self.redis is None:
+            self._memory_denies[key] = time.monotonic() + ttl_ms / 1000.0
+        else:
+            await self.redis.set(key, value, px=ttl_ms)
+        self.invalidate(key)
+        if self.redis is not None:
+            self._remember_deny(key, ttl_ms / 1000.0)
+
+    async def reset(self, *keys: str) -> None:
+        """Delete rule TATs and/or deny keys (e.g. after a successful login)"""
+        if not keys:
+            return
+        if self.redis is None:
+            async with self._memory_lock:
+                for key in keys:
+                    self._memory_tats.pop(key, None)
+                    self._memory_denies.pop(key, None)
+        else:
+            await self.redis.delete(*keys)
+        for key in keys:
+            self.invalidate(key)
+
+    # ===== LOCAL PRE-ADMISSION =====
+
+    def _take_local(self, lease_key: Tuple[str, ...]) -> Optional[RateLimitDecision]:
+        lease = self._leases.get(lease_key)
+        if lease is None:
+            return None
+        if lease.expires_at <= time.monotonic() or lease.tokens <= 0:
+            del self._leases[lease_key]
+            return None
+
+        lease.tokens -= 1
+        self._leases.move_to_end(lease_key)
+        self.stats["local_hits"] += 1
+        return RateLimitDecision(
+            allowed=True,
+            states=[
+                RuleState(state.rule, state.remaining + lease.tokens, state.reset_after)
+                for state in lease.states
+            ],
+            source="local"
+        )
+
+    def _store_lease(self, lease_key: Tuple[str, ...], tokens: int, states: List[RuleState]) -> None:
+        self._leases[lease_key] = _Lease(tokens, time.monotonic() + self.lease_ttl, states)
+        self._leases.move_to_end(lease_key)
+        while len(self._leases) > self.max_leases:
+            self._leases.popitem(last=False)
+
+    def invalidate(self, rule_key: Optional[str] = None) -> None:
+        """Drop local leases and cached denies (all, or those covering ``rule_key``)"""
+        if rule_key is None:
+            self._leases.clear()
+            self._local_denies.clear()
+            return
+        self._local_denies.pop(rule_key, None)
+        for lease_key in [key for key in self._leases if rule_key in key]:
+            del self._leases[lease_key]
+
+    def _take_local_deny(self, denies: Sequence[str]) -> Optional[RateLimitDecision]:
+        now = time.monotonic()
+        for key in denies:
+            cached = self._local_denies.get(key)
+            if cached is None:
+                continue
+            revalidate_at, expires_at = cached
+            if revalidate_at <= now:
+                del self._local_denies[key]
+                continue
+            self.stats["local_denies"] += 1
+            return RateLimitDecision(
+                allowed=False, source="denylist", denied_key=key, denied_for=expires_at - now
+            )
+        return None
+
+    def _remember_deny(self, key: str, seconds: float) -> None:
+        if self.local_deny_ttl <= 0:
+            return
+        now = time.monotonic()
+        self._local_denies[key] = (now + min(seconds, self.local_deny_ttl), now + seconds)
+        self._local_denies.move_to_end(key)
+        while len(self._local_denies) > self.max_local_denies:
+            self._local_denies.popitem(last=False)
+
+    # ===== REDIS BACKEND =====
+
+    async def _check_redis(
+        self,
+        rules: Sequence[RateLimitRule],
+        allow_key: Optional[str],
+        denies: List[str],
+        charge: bool = True
+    ) -> Tuple[RateLimitDecision, int]:
+        keys = ([allow_key] if allow_key else []) + denies + [rule.key for rule in rules]
+        args: List = [
+            1 if allow_key else 0, len(denies), self.lease_tokens, self.lease_threshold, 1 if charge else 0
+        ]
+        for rule in rules:
+            args.extend((rule.emission_interval_ms, rule.limit))
+
+        self.stats["redis_calls"] += 1
+        try:
+            raw = await self.redis.evalsha(GCRA_SCRIPT_SHA, len(keys), *keys, *args)
+        except NoScriptError:
+            # Primer uso en este servidor Redis (o tras SCRIPT FLUSH / failover)
+            await self.redis.script_load(GCRA_LUA_SCRIPT)
+            self.stats["script_loads"] += 1
+            raw = await self.redis.evalsha(GCRA_SCRIPT_SHA, len(keys), *keys, *args)
+
+        return self._decode(rules, [int(value) for value in raw], denies)
+
+    @staticmethod
+    def _decode(
+        rules: Sequence[RateLimitRule],
+        raw: List[int],
+        denies: Sequence[str] = ()
+    ) -> Tuple[RateLimitDecision, int]:
+        status, granted, violated_index = raw[0], raw[1], raw[2]
+        if status == 2:
+            return RateLimitDecision(allowed=True, source="allowlist"), 0
+        if status == 3:
+            return RateLimitDecision(
+                allowed=False,
+                source="denylist",
+                denied_key=denies[violated_index - 1] if 0 < violated_index <= len(denies) else None,
+                # PTTL -1: bloqueo sin expiración
+                denied_for=max(0, raw[3]) / 1000.0 if len(raw) > 3 else 0.0
+            ), 0
+
+        states = [
+            RuleState(
+                rule=rule,
+                remaining=max(0, raw[3 + 3 * i]),
+                reset_after=raw[4 + 3 * i] / 1000.0,
+                retry_after=raw[5 + 3 * i] / 1000.0
+            )
+            for i, rule in enumerate(rules)
+        ]
+        violated = rules[violated_index - 1] if violated_index else None
+        return RateLimitDecision(allowed=status == 1, states=states, violated=violated), granted
+
+    # ===== MEMORY BACKEND =====
+
+    async def _check_memory(
+        self,
+        rules: Sequence[RateLimitRule],
+        denies: Sequence[str] = (),
+        charge: bool = True
+    ) -> Tuple[RateLimitDecision, int]:
+        """Same algorithm as the Lua script, for development and tests"""
+        async with self._memory_lock:
+            now = time.monotonic() * 1000.0
+            self._evict_memory(now)
+
+            for key in denies:
+                expires_at = self._memory_denies.get(key, 0.0) * 1000.0
+                if expires_at > now:
+                    return RateLimitDecision(
+                        allowed=False, source="denylist", denied_key=key,
+                        denied_for=(expires_at - now) / 1000.0
+                    ), 0
+
+            states: List[RuleState] = []
+            tats: List[float] = []
+            violated = None
+            grant = self.lease_tokens if charge else 0
+
+            for rule in rules:
+                interval = rule.emission_interval_ms
+                tolerance = interval * rule.limit
+                tat = max(self._memory_tats.get(rule.key, now), now)
+                tats.append(tat)
+                diff = tat + interval - now
+
+                if diff > tolerance:
+                    violated = violated or rule
+                    states.append(RuleState(
+                        rule, max(0, math.floor((tolerance - (tat - now)) / interval)),
+                        (tat - now) / 1000.0, (diff - tolerance) / 1000.0
+                    ))
+                else:
+                    remaining = math.floor((tolerance - diff) / interval)
+                    grant = min(grant, max(0, remaining - math.ceil(rule.limit * self.lease_threshold)))
+                    states.append(RuleState(rule, remaining, diff / 1000.0))
+
+            if violated is not None:
+                return RateLimitDecision(allowed=False, states=states, violated=violated, source="memory"), 0
+            if not charge:
+                return RateLimitDecision(allowed=True, states=states, source="memory"), 0
+
+            for rule, tat, state in zip(rules, tats, states):
+                new_tat = tat + rule.emission_interval_ms * (1 + grant)
+                self._memory_tats[rule.key] = new_tat
+                self._memory_tats.move_to_end(rule.key)
+                state.remaining -= grant
+                state.reset_after = (new_tat - now) / 1000.0
+
+            while len(self._memory_tats) > self.max_memory_keys:
+                self._memory_tats.popitem(last=False)
+
+            return RateLimitDecision(allowed=True, states=states, source="memory"), grant
+
+    def _evict_memory(self, now: float, interval_ms: float = 1000.0) -> None:
+        """
+        Drop TATs already in the past (equivalent to an absent key) and
+        expired denies; runs at most once per ``interval_ms``.
+        """
+        if now - self._memory_swept_at < interval_ms:
+            return
+        self._memory_swept_at = now
+        for key in [key for key, tat in self._memory_tats.items() if tat <= now]:
+            del self._memory_tats[key]
+        for key in [key for key, expires_at in self._memory_denies.items() if expires_at * 1000.0 <= now]:
+            del self._memory_denies[key]
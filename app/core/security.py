@@ -44,6 +44,7 @@ import secrets
 import base64
 import json
 import os
+import random
 import sys
 from enum import Enum
 
@@ -62,6 +63,7 @@ from app.utils.password import hash_password, verify_password, pwd_context
 get_password_hash = hash_password
 
 from .config import settings
+from .token_revocation import TokenRevocationStore, token_blacklist
 
 # Configure structured logging for security events
 logger = structlog.get_logger(__name__)
@@ -334,44 +336,9 @@ class SecureTokenManager:
 token_manager = SecureTokenManager()
 
 
-class TokenBlacklist:
-    """Token blacklist for logout and security."""
-
-    def __init__(self):
-        self._blacklisted_tokens = set()
-        self._blacklist_cleanup_threshold = 1000
-
-    def blacklist_token(self, jti: str) -> None:
-        """Add a token JTI to the blacklist."""
-        self._blacklisted_tokens.add(jti)
-
-        # Cleanup if too many tokens
-        if len(self._blacklisted_tokens) > self._blacklist_cleanup_threshold:
-            self._cleanup_expired_tokens()
-
-        logger.info("Token blacklisted", jti=jti[:8])
-
-    def is_token_blacklisted(self, jti: str) -> bool:
-        """Check if a token JTI is blacklisted."""
-        return jti in self._blacklisted_tokens
-
-    def _cleanup_expired_tokens(self) -> None:
-        """Remove expired tokens from blacklist."""
-        # In production, implement proper cleanup based on token expiration
-        # For now, remove oldest half of tokens
-        tokens_list = list(self._blacklisted_tokens)
-        keep_count = len(tokens_list) // 2
-        self._blacklisted_tokens = set(tokens_list[-keep_count:])
-
-        logger.info(
-            "Token blacklist cleanup completed",
-            removed_count=len(tokens_list) - keep_count,
-            remaining_count=len(self._blacklisted_tokens)
-        )
-
-
-# Global token blacklist instance
-token_blacklist = TokenBlacklist()
+# Revocación compartida por todos los workers (Redis + bloom filter local + pub/sub).
+# TokenBlacklist / token_blacklist se mantienen como nombres públicos de este módulo.
+TokenBlacklist = TokenRevocationStore
 
 
 def generate_device_fingerprint(request: Request) -> str:
@@ -623,20 +590,10 @@ def decode_access_token(
                 payload["sub"] = encryption_manager.decrypt_sensitive_data(payload["sub_enc"])
                 del payload["sub_enc"]
                 del payload["encrypted"]
-                logger.info("Token payload decrypted successfully")
             except Exception as e:
                 logger.error("Failed to decrypt token payload", error=str(e))
                 return None
 
-        logger.info(
-            "Token decoded successfully",
-            token_type=payload.get("typ"),
-            jti=payload.get("jti", "")[:8],
-            device_bound=bool(payload.get("device_fp"))
-        )
-
-        return payload
-
     except JWTError as e:
         logger.warning("JWT validation failed", error=str(e))
         return None
@@ -644,6 +601,27 @@ def decode_access_token(
         logger.error("Unexpected error during token decoding", error=str(e))
         return None
 
+    # Fuera del try: el muestreo de logs nunca debe invalidar un token válido
+    _log_decoded_token(payload)
+    return payload
+
+
+def _log_decoded_token(payload: dict) -> None:
+    """Sampled success log: one INFO line per request dominates the hot path cost"""
+    try:
+        sample_rate = float(getattr(settings, "AUTH_TOKEN_LOG_SAMPLE_RATE", 0.0))
+    except (TypeError, ValueError):
+        sample_rate = 0.0
+
+    if random.random() < sample_rate:
+        logger.info(
+            "Token decoded successfully",
+            token_type=payload.get("typ"),
+            jti=payload.get("jti", "")[:8],
+            device_bound=bool(payload.get("device_fp")),
+            sample_rate=sample_rate
+        )
+
 
 def create_refresh_token(
     data: dict,
@@ -717,7 +695,7 @@ def revoke_token(token: str) -> bool:
     try:
         payload = decode_access_token(token)
         if payload and "jti" in payload:
-            token_blacklist.blacklist_token(payload["jti"])
+            token_blacklist.blacklist_token(payload["jti"], expires_at=payload.get("exp"))
             logger.info("Token revoked successfully", jti=payload["jti"][:8])
             return True
         return False
@@ -726,6 +704,31 @@ def revoke_token(token: str) -> bool:
         return False
 
 
+def get_token_revocation_id(token: str) -> tuple:
+    """
+    Identify a token for revocation, whatever its type or expiry.
+
+    Args:
+        token: JWT token (access or refresh)
+
+    Returns:
+        tuple: ``(jti, exp)`` for tokens signed by us. Tokens that do not
+        verify are identified by their SHA-256 digest, with ``exp`` None.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            token_manager.get_verification_key(),
+            algorithms=[token_manager.algorithm],
+            options={"verify_exp": False, "verify_aud": False}
+        )
+        if payload.get("jti"):
+            return payload["jti"], payload.get("exp")
+    except JWTError:
+        pass
+    return f"sha256:{hashlib.sha256(token.encode()).hexdigest()}", None
+
+
 def is_token_revoked(token: str) -> bool:
     """
     Check if a token has been revoked.
@@ -0,0 +1,119 @@
+# ~/app/core/token_cache.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Verified Token Cache
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: token_cache.py
+# Ruta: ~/app/core/token_cache.py
+# Propósito: Cache por proceso de claims JWT ya verificados para get_current_user
+#
+# Características:
+# - Clave: SHA-256 del token (el token nunca se guarda en memoria)
+# - Cada entrada expira en el "exp" del token
+# - Tamaño acotado con expulsión LRU
+# - Revocación consultada en el store compartido (bloom + pub/sub) en cada hit
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Verified token cache.
+
+``decode_access_token`` verifies the signature, decrypts ``sub_enc`` and
+checks the blacklist on every call. Access tokens are immutable until they
+expire, so the verified claims can be reused for repeated requests with the
+same token.
+
+Every hit is checked against the cluster-wide revocation store
+(``app.core.token_revocation``), whose bloom filter answers the common
+"not revoked" case from memory.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.token_revocation import TokenRevocationStore, token_blacklist
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified token claims.
+
+    Thread-safe: FastAPI runs sync dependencies in a thread pool, so the
+    cache may be touched outside the event loop thread.
+    """
+
+    def __init__(self, max_size: int = 10_000, revocations: Optional[TokenRevocationStore] = None):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any], Any]]" = OrderedDict()
+        self._revocations = revocations or token_blacklist
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """Return ``(claims, user)`` for a cached, unexpired, unrevoked token"""
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, claims, user = entry
+            if expires_at <= time.time() or self._revocations.is_token_blacklisted(claims["jti"]):
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims, user
+
+    def put(self, token: str, claims: Dict[str, Any], user: Any = None) -> None:
+        """
+        Cache verified claims until the token's ``exp``.
+
+        Claims without a numeric ``exp`` or a ``jti`` are never cached: they
+        cannot be expired or revoked precisely.
+        """
+        expires_at = claims.get("exp")
+        jti = claims.get("jti")
+        if not isinstance(expires_at, (int, float)) or not jti:
+            return
+
+        with self._lock:
+            key = self._digest(token)
+            self._entries[key] = (float(expires_at), claims, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+verified_token_cache = VerifiedTokenCache(max_size=settings.AUTH_TOKEN_CACHE_MAX_SIZE)
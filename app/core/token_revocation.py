@@ -0,0 +1,427 @@
+# ~/app/core/token_revocation.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Cluster-wide Token Revocation
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: token_revocation.py
+# Ruta: ~/app/core/token_revocation.py
+# Propósito: Subsistema único de revocación de JWT compartido por todos los workers
+#
+# Características:
+# - Redis como fuente de verdad: jwt_blacklist:<jti> con TTL = vida restante del token
+# - Bloom filter escalable por proceso: "no revocado" sin round-trip a Redis
+# - Mapa local exacto jti -> exp para confirmar positivos del bloom
+# - Pub/sub entre workers para que una revocación sea visible en todo el cluster
+# - Listener con reconexión (backoff exponencial) y resincronización completa
+# - Memoria acotada: entradas y generaciones del bloom se descartan al expirar
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Cluster-wide token revocation.
+
+Every revocation is written to Redis (``jwt_blacklist:<jti>`` expiring with
+the token) and published on ``settings.AUTH_REVOCATION_CHANNEL``. Each
+worker loads the current set at startup and then follows the channel, so
+``is_token_blacklisted`` answers from memory:
+
+- bloom filter negative -> not revoked (the common case, no lookup at all)
+- bloom filter positive -> confirmed against the exact local map
+
+A revoked token stops mattering once it expires, so local entries and whole
+bloom generations are dropped after their latest ``exp``.
+
+If the pub/sub connection drops, the listener reconnects with exponential
+backoff and reloads the full set before following the channel again (the
+worker counts as not synchronized in between). Revocations that could not
+be written to Redis are retried on every resync.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Union
+
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger(__name__)
+
+REVOCATION_KEY_PREFIX = "jwt_blacklist"
+
+
+class JTIBloomFilter:
+    """Fixed-size bloom filter over JTIs (double hashing on a BLAKE2b digest)"""
+
+    def __init__(self, capacity: int = 10_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.max_exp = 0.0
+
+    def _positions(self, jti: str):
+        digest = hashlib.blake2b(jti.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, jti: str, exp: float = 0.0) -> None:
+        for position in self._positions(jti):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        self.max_exp = max(self.max_exp, exp)
+
+    def __contains__(self, jti: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(jti))
+
+    @property
+    def saturated(self) -> bool:
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows by adding generations.
+
+    A full generation is frozen and a new one, ``growth`` times larger, takes
+    new entries. Generations whose newest entry has expired are discarded,
+    so memory tracks the number of revocations still inside a token lifetime.
+    """
+
+    def __init__(self, initial_capacity: int = 10_000, error_rate: float = 0.001, growth: int = 2):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self._generations: List[JTIBloomFilter] = [JTIBloomFilter(initial_capacity, error_rate)]
+
+    def add(self, jti: str, exp: float) -> None:
+        current = self._generations[-1]
+        if current.saturated:
+            current = JTIBloomFilter(current.capacity * self.growth, self.error_rate)
+            self._generations.append(current)
+        current.add(jti, exp)
+
+    def __contains__(self, jti: str) -> bool:
+        return any(jti in generation for generation in self._generations)
+
+    def expire(self, now: float) -> None:
+        alive = [g for g in self._generations if g.count and g.max_exp > now]
+        self._generations = alive or [JTIBloomFilter(self.initial_capacity, self.error_rate)]
+
+    @property
+    def count(self) -> int:
+        return sum(generation.count for generation in self._generations)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(generation.nbytes for generation in self._generations)
+
+    @property
+    def generations(self) -> int:
+        return len(self._generations)
+
+
+class TokenRevocationStore:
+    """
+    Revoked JTIs for this worker, kept in sync with Redis.
+
+    ``is_token_blacklisted`` never touches Redis. ``blacklist_token`` persists
+    and publishes in the background when called on the event loop; called
+    from another thread it hands the write to the loop that owns the Redis
+    client and waits for it (at most ``persist_timeout`` seconds).
+    """
+
+    persist_timeout = 2.0
+
+    def __init__(self, redis_client=None, cleanup_threshold: int = 1000):
+        self.redis = redis_client
+        self._blacklisted_tokens: Dict[str, float] = {}
+        self._bloom = ScalableBloomFilter(settings.AUTH_REVOCATION_BLOOM_CAPACITY)
+        self._blacklist_cleanup_threshold = cleanup_threshold
+        self._writes_since_cleanup = 0
+        self._lock = threading.Lock()
+        self._pending: Set[asyncio.Task] = set()
+        # Revocaciones registradas localmente que Redis aún no tiene: jti -> exp
+        self._unpersisted: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # True mientras el listener pub/sub está activo: el estado local es completo
+        self.synchronized = False
+
+    @staticmethod
+    def _default_exp() -> float:
+        """Unknown expiry: keep the entry for the longest token lifetime"""
+        lifetime = max(settings.ACCESS_TOKEN_EXPIRE_MINUTES, settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+        return time.time() + lifetime * 60
+
+    def _record(self, jti: str, exp: Optional[float]) -> float:
+        exp = float(exp) if exp else self._default_exp()
+        with self._lock:
+            self._blacklisted_tokens[jti] = max(exp, self._blacklisted_tokens.get(jti, 0.0))
+            self._bloom.add(jti, exp)
+            self._writes_since_cleanup += 1
+            cleanup = self._writes_since_cleanup >= self._blacklist_cleanup_threshold
+        if cleanup:
+            self._cleanup_expired_tokens()
+        return exp
+
+    # ===== SYNC API (decode_access_token / revoke_token) =====
+
+    def blacklist_token(self, jti: str, expires_at: Optional[Union[int, float]] = None) -> None:
+        """Revoke a JTI until ``expires_at`` (epoch seconds, normally the token's exp)"""
+        exp = self._record(jti, expires_at)
+        self._schedule_persist(jti, exp)
+        logger.info("Token blacklisted", jti=jti[:8])
+
+    def is_token_blacklisted(self, jti: str) -> bool:
+        """Check if a token JTI is revoked (memory only)"""
+        if jti not in self._bloom:
+            return False
+        exp = self._blacklisted_tokens.get(jti)
+        return exp is not None and exp > time.time()
+
+    async def is_revoked(self, jti: str) -> bool:
+        """Memory answer; asks Redis only while this worker is not synchronized"""
+        if self.is_token_blacklisted(jti):
+            return True
+        if self.synchronized or self.redis is None:
+            return False
+        return bool(await self.redis.exists(f"{REVOCATION_KEY_PREFIX}:{jti}"))
+
+    def might_be_revoked(self, jti: str) -> bool:
+        """Bloom filter answer: False means certainly not revoked"""
+        return jti in self._bloom
+
+    def _cleanup_expired_tokens(self) -> None:
+        """Drop revocations whose token has already expired"""
+        now = time.time()
+        with self._lock:
+            before = len(self._blacklisted_tokens)
+            self._blacklisted_tokens = {
+                jti: exp for jti, exp in self._blacklisted_tokens.items() if exp > now
+            }
+            self._bloom.expire(now)
+            self._writes_since_cleanup = 0
+            removed = before - len(self._blacklisted_tokens)
+
+        if removed:
+            logger.info(
+                "Token blacklist cleanup completed",
+                removed_count=removed,
+                remaining_count=len(self._blacklisted_tokens)
+            )
+
+    # ===== REDIS =====
+
+    def attach(self, redis_client, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Use ``redis_client`` (bound to ``loop``) for persistence"""
+        self.redis = redis_client
+        self._loop = loop or asyncio.get_running_loop()
+
+    def _schedule_persist(self, jti: str, exp: float) -> None:
+        if self.redis is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is not None and (self._loop is None or running is self._loop):
+            task = running.create_task(self._persist(jti, exp))
+            self._pending.add(task)
+            task.add_done_callback(self._consume_persist_result)
+            return
+
+        # Hilo sin loop (executor, código sync): el cliente async pertenece a self._loop
+        if self._loop is None or self._loop.is_closed() or not self._loop.is_running():
+            self._unpersisted[jti] = exp
+            logger.warning("Token revoked without a running Redis loop, queued for resync", jti=jti[:8])
+            return
+        future = asyncio.run_coroutine_threadsafe(self._persist(jti, exp), self._loop)
+        try:
+            future.result(timeout=self.persist_timeout)
+        except Exception:
+            # _persist ya lo dejó en cola para el próximo resync
+            future.cancel()
+
+    def _consume_persist_result(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled():
+            # Ya registrado y en cola por _persist; evitar "exception never retrieved"
+            task.exception()
+
+    async def _persist(self, jti: str, exp: float, value: Optional[str] = None, redis_client=None) -> None:
+        """SET with TTL and PUBLISH in a single round-trip"""
+        redis_client = redis_client or self.redis
+        if value is None:
+            value = json.dumps({
+                "token_jti": jti,
+                "blacklisted_at": datetime.now(timezone.utc).isoformat(),
+                "expires_at": datetime.fromtimestamp(exp, timezone.utc).isoformat(),
+            })
+        ttl_ms = max(1000, int((exp - time.time()) * 1000))
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(f"{REVOCATION_KEY_PREFIX}:{jti}", value, px=ttl_ms)
+            pipe.publish(settings.AUTH_REVOCATION_CHANNEL, f"{jti}|{exp}")
+            await pipe.execute()
+        except Exception as e:
+            self._unpersisted[jti] = exp
+            logger.error("Failed to propagate token revocation", error=str(e), jti=jti[:8])
+            raise
+        self._unpersisted.pop(jti, None)
+
+    async def flush_unpersisted(self, redis_client=None) -> int:
+        """Write revocations that previously failed to reach Redis"""
+        flushed = 0
+        now = time.time()
+        for jti, exp in list(self._unpersisted.items()):
+            if exp <= now:
+                self._unpersisted.pop(jti, None)
+                continue
+            await self._persist(jti, exp, redis_client=redis_client)
+            flushed += 1
+        return flushed
+
+    async def revoke(
+        self,
+        jti: str,
+        expires_at: Optional[Union[int, float]] = None,
+        value: Optional[str] = None,
+        redis_client=None
+    ) -> None:
+        """Revoke a JTI locally and cluster-wide, waiting for Redis"""
+        exp = self._record(jti, expires_at)
+        if redis_client is not None or self.redis is not None:
+            await self._persist(jti, exp, value, redis_client)
+
+    async def load(self, redis_client) -> int:
+        """Load the revocations currently stored in Redis"""
+        loaded = 0
+        now = time.time()
+        async for batch in _scan_batches(redis_client, f"{REVOCATION_KEY_PREFIX}:*"):
+            pipe = redis_client.pipeline(transaction=False)
+            for key in batch:
+                pipe.pttl(key)
+            for key, ttl_ms in zip(batch, await pipe.execute()):
+                if ttl_ms and ttl_ms > 0:
+                    key = key.decode("utf-8") if isinstance(key, bytes) else key
+                    self._record(key.split(":", 1)[1], now + ttl_ms / 1000.0)
+                    loaded += 1
+        return loaded
+
+    async def subscribe(self, redis_client):
+        """Subscribe to the revocation channel (before ``load`` so nothing is missed)"""
+        pubsub = redis_client.pubsub()
+        await pubsub.subscribe(settings.AUTH_REVOCATION_CHANNEL)
+        return pubsub
+
+    async def listen(self, pubsub) -> None:
+        """Apply revocations published by any worker"""
+        self.synchronized = True
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message.get("data")
+                data = data.decode("utf-8") if isinstance(data, bytes) else str(data)
+                jti, _, exp = data.rpartition("|")
+                if jti:
+                    self._record(jti, float(exp or 0) or None)
+        finally:
+            self.synchronized = False
+            try:
+                await pubsub.unsubscribe(settings.AUTH_REVOCATION_CHANNEL)
+                await pubsub.close()
+            except Exception as e:
+                # La conexión ya puede estar caída
+                logger.debug("Error closing revocation pubsub", error=str(e))
+
+    async def sync_forever(
+        self,
+        redis_client,
+        initial_backoff: float = 0.5,
+        max_backoff: float = 30.0
+    ) -> None:
+        """
+        Subscribe, resync and follow the channel; reconnect when it drops.
+
+        Each (re)connection subscribes first, then reloads every revocation in
+        Redis and retries queued writes, so nothing published while the
+        listener was down is missed.
+        """
+        backoff = initial_backoff
+        while True:
+            try:
+                pubsub = await self.subscribe(redis_client)
+                loaded = await self.load(redis_client)
+                flushed = await self.flush_unpersisted(redis_client)
+                logger.info("Token revocations loaded", count=loaded, flushed=flushed)
+                backoff = initial_backoff
+                await self.listen(pubsub)
+                logger.warning("Token revocation channel closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "Token revocation listener disconnected, reconnecting",
+                    error=str(e),
+                    retry_in=backoff
+                )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+    def stats(self) -> Dict[str, Union[int, bool]]:
+        return {
+            "revoked": len(self._blacklisted_tokens),
+            "bloom_entries": self._bloom.count,
+            "bloom_generations": self._bloom.generations,
+            "bloom_bytes": self._bloom.nbytes,
+            "unpersisted": len(self._unpersisted),
+            "synchronized": self.synchronized,
+        }
+
+
+async def _scan_batches(redis_client, pattern: str, count: int = 500):
+    cursor = 0
+    while True:
+        cursor, keys = await redis_client.scan(cursor=cursor, match=pattern, count=count)
+        if keys:
+            yield keys
+        if not cursor:
+            break
+
+
+# Global token blacklist instance
+token_blacklist = TokenRevocationStore()
+
+
+async def start_revocation_sync() -> Optional[asyncio.Task]:
+    """
+    Attach Redis and start the listener task (load + follow, reconnecting).
+
+    Without Redis revocations stay local to this process and
+    ``synchronized`` stays False.
+    """
+    try:
+        from app.core.redis import get_redis
+        redis_client = await get_redis()
+        await redis_client.ping()
+    except Exception as e:
+        logger.warning("Token revocation sync unavailable, revocations are process-local", error=str(e))
+        return None
+
+    token_blacklist.attach(redis_client)
+    return asyncio.create_task(token_blacklist.sync_forever(redis_client), name="token-revocation-listener")
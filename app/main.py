@@ -6,7 +6,8 @@
 # ---------------------------------------------------------------------------------------------
 
 from contextlib import asynccontextmanager
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 from sqlalchemy import select, text
@@ -15,7 +16,11 @@ import redis
 
 from app.api.v1 import api_router
 from app.api.v1.handlers.exceptions import register_exception_handlers
+from app.core.audit_sink import close_audit_sinks
 from app.core.config import settings
+from app.core.metrics import close_metrics, metrics
+from app.core.password_hashing import shutdown_password_hasher
+from app.core.token_revocation import start_revocation_sync
 
 # Simplified dependencies and middleware
 from app.core.dependencies_simple import (
@@ -51,6 +56,7 @@ async def lifespan(app: FastAPI):
     """Application lifespan management with service initialization"""
     logger = get_logger()
     logger.info("🚀 Starting MeStore application...")
+    revocation_listener = None
 
     try:
         # Initialize service container
@@ -63,6 +69,9 @@ async def lifespan(app: FastAPI):
         # Setup log rotation
         setup_log_rotation()
 
+        # Revocaciones de tokens compartidas entre workers (Redis + pub/sub)
+        revocation_listener = await start_revocation_sync()
+
         # Warm up cache if needed
         # await warm_up_application_cache()
 
@@ -75,6 +84,19 @@ async def lifespan(app: FastAPI):
     finally:
         # Cleanup during shutdown
         logger.info("🔄 Starting application shutdown...")
+        if revocation_listener is not None:
+            revocation_listener.cancel()
+        shutdown_password_hasher()
+        try:
+            # Vaciar los eventos de auditoría pendientes antes de salir
+            await close_audit_sinks()
+        except Exception as e:
+            logger.error(f"❌ Error flushing audit sinks: {e}")
+        try:
+            # Último snapshot de métricas para el resto de workers
+            await close_metrics()
+        except Exception as e:
+            logger.error(f"❌ Error flushing metrics: {e}")
         try:
             container = await get_service_container()
             await container.cleanup()
@@ -249,6 +271,17 @@ async def health():
     )
 
 
+@app.get("/metrics", include_in_schema=False, tags=["health"])
+async def prometheus_metrics():
+    """Métricas de todos los workers en formato Prometheus."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/health/services", response_model=HealthResponse)
 async def health_services(health_data = Depends(get_health_check_services)):
     """Comprehensive health check for all integrated services."""
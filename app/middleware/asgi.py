@@ -0,0 +1,167 @@
+# ~/app/middleware/asgi.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Base para middlewares ASGI puros
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: asgi.py
+# Ruta: ~/app/middleware/asgi.py
+# Propósito: Middlewares sin BaseHTTPMiddleware (sin tarea ni stream extra por capa)
+#
+# Características:
+# - Hooks antes de la petición, al iniciar la respuesta y al terminarla
+# - Headers modificados sobre el mensaje http.response.start, sin copiar el body
+# - Buffer opcional y acotado solo para las respuestas que se reescriben
+# - Streaming y background tasks intactos aunque se apilen varias capas
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+Pure ASGI middleware base.
+
+``BaseHTTPMiddleware`` runs ``call_next`` in a separate task and pipes the
+response through an in-memory stream, per layer. ``ASGIMiddleware`` calls
+the wrapped app directly and only intercepts the ``send`` channel:
+
+- ``before_request(request)``: return a Response to short-circuit
+- ``on_response_start(request, status_code, headers, elapsed)``: edit headers
+- ``should_buffer(request, status_code, headers)`` /
+  ``rewrite_response(request, status_code, headers, body)``: rewrite a body;
+  only responses that opt in are buffered, up to ``max_buffer_size``
+- ``after_response(request, status_code, elapsed)``: runs once the last body
+  chunk went out
+- ``on_exception(request, exc, elapsed)``: return a Response to send
+  instead (only if nothing was sent yet); returning None re-raises
+
+Per-request values are shared through ``request.state`` as before.
+"""
+
+import time
+from typing import List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class ASGIMiddleware:
+    """Base class for the pure ASGI middlewares in app.middleware."""
+
+    max_buffer_size = 1024 * 1024  # Respuestas mayores pasan en streaming sin reescribir
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def before_request(self, request: Request) -> Optional[Response]:
+        return None
+
+    def on_response_start(
+        self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float
+    ) -> None:
+        pass
+
+    def should_buffer(self, request: Request, status_code: int, headers: MutableHeaders) -> bool:
+        return False
+
+    async def rewrite_response(
+        self, request: Request, status_code: int, headers: MutableHeaders, body: bytes
+    ) -> Optional[Response]:
+        return None
+
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        pass
+
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        request = Request(scope, receive)
+
+        early_response = await self.before_request(request)
+        if early_response is not None:
+            await early_response(scope, receive, send)
+            return
+
+        status_code = 500
+        response_started = False
+        pending_start: Optional[Message] = None
+        buffered: List[bytes] = []
+        buffered_size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_started, pending_start, buffered_size
+
+            if message["type"] == "http.response.start":
+                response_started = True
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                self.on_response_start(request, status_code, headers, time.perf_counter() - start_time)
+                if self.should_buffer(request, status_code, headers):
+                    pending_start = message
+                    return
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body" or pending_start is None:
+                await send(message)
+                return
+
+            buffered.append(message.get("body", b""))
+            buffered_size += len(buffered[-1])
+
+            if message.get("more_body", False):
+                if buffered_size > self.max_buffer_size:
+                    # Demasiado grande para reescribir: seguir en streaming
+                    start, pending_start = pending_start, None
+                    await send(start)
+                    await send({"type": "http.response.body", "body": b"".join(buffered), "more_body": True})
+                    buffered.clear()
+                return
+
+            start, pending_start = pending_start, None
+            body = b"".join(buffered)
+            buffered.clear()
+            replacement = await self.rewrite_response(
+                request, start["status"], MutableHeaders(scope=start), body
+            )
+            if replacement is None:
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+            else:
+                status_code = replacement.status_code
+                await replacement(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            if response_started:
+                raise
+            error_response = await self.on_exception(request, exc, time.perf_counter() - start_time)
+            if error_response is None:
+                raise
+            status_code = error_response.status_code
+            await error_response(scope, receive, send)
+
+        await self.after_response(request, status_code, time.perf_counter() - start_time)
+
+
+def carry_headers(
+    response: Response,
+    headers: MutableHeaders,
+    replaced=(b"content-length", b"content-type")
+) -> Response:
+    """
+    Put the original response headers (Set-Cookie duplicates included) on a
+    rebuilt response, keeping the rebuilt body's own length and type.
+    """
+    kept = [(key, value) for key, value in headers.raw if key.lower() not in replaced]
+    own = [(key, value) for key, value in response.raw_headers if key.lower() in replaced]
+    response.raw_headers = kept + own
+    return response
@@ -17,7 +17,8 @@
 # - Adaptive rate limiting based on failed attempts
 # - IP-based and user-based rate limiting
 # - Progressive penalties for repeated failures
-# - Integration with existing Redis infrastructure
+# - Presupuestos de fallos, bloqueos y blacklist sobre el motor GCRA compartido
+#   (app.core.rate_limit_engine): una llamada a Redis por petición
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -30,13 +31,23 @@ This module provides specialized rate limiting for authentication endpoints:
 - IP-based and credential-based rate limiting
 - Integration with audit logging system
 - Automatic blacklisting for suspicious activity
+
+Failure budgets are GCRA rules on the shared rate limit engine, checked
+without charge before the request and charged only when authentication
+fails (401/403). Lockouts and the IP blacklist are engine deny keys, so the
+pre-request check is a single script call. A budget of N attempts per hour
+refills continuously (one attempt every 3600/N seconds) instead of in a
+sliding-window burst.
+
+The failure that exhausts a budget starts the lockout right away, and the
+engine remembers deny keys locally, so a client hammering the endpoint
+while locked out is rejected without touching Redis.
 """
 
-import asyncio
 import json
-import time
+import math
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
 import redis.asyncio as redis
@@ -45,6 +56,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.rate_limit_engine import RateLimitDecision, RateLimitEngine, RateLimitRule
 from app.services.audit_logging_service import EnterpriseAuditLoggingService
 
 logger = get_logger(__name__)
@@ -79,9 +91,16 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
     - Configurable limits per endpoint type
     """
 
-    def __init__(self, app, redis_client: Optional[redis.Redis] = None):
+    def __init__(
+        self,
+        app,
+        redis_client: Optional[redis.Redis] = None,
+        engine: Optional[RateLimitEngine] = None
+    ):
         super().__init__(app)
         self.redis_client = redis_client
+        # Sin leases: los presupuestos de fallos son pequeños y deben ser exactos
+        self.engine = engine or RateLimitEngine(redis_client, lease_tokens=0)
         self.audit_service = EnterpriseAuditLoggingService()
 
         # Authentication endpoint rate limits (per hour unless specified)
@@ -150,15 +169,14 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
             client_ip = self._get_client_ip(request)
             user_identifier = await self._extract_user_identifier(request)
 
-            # Check for existing blacklist
-            if await self._is_blacklisted(client_ip):
-                return self._create_blacklist_response(client_ip)
-
-            # Check rate limits
+            # Blacklist, lockouts and failure budgets in one engine check
             is_allowed, rate_limit_info = await self._check_auth_rate_limits(
                 client_ip, user_identifier, auth_type
             )
 
+            if rate_limit_info.get("type") == "ip_blacklisted":
+                return self._create_blacklist_response(client_ip)
+
             if not is_allowed:
                 await self._log_rate_limit_violation(
                     client_ip, user_identifier, auth_type, rate_limit_info
@@ -230,36 +248,46 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
         except Exception:
             return None
 
+    @staticmethod
+    def _auth_key(prefix: str, scope: str, identifier: str, auth_type: AuthRateLimitType) -> str:
+        return f"{prefix}:{scope}:{identifier}:{auth_type.value}"
+
+    @staticmethod
+    def _blacklist_key(client_ip: str) -> str:
+        return f"auth_blacklist:ip:{client_ip}"
+
+    def _failure_rule(
+        self,
+        scope: str,
+        identifier: str,
+        auth_type: AuthRateLimitType,
+        limits: Dict
+    ) -> RateLimitRule:
+        """Failure budget for one scope ("ip" or "user")"""
+        return RateLimitRule(
+            key=self._auth_key("auth_failures", scope, identifier, auth_type),
+            limit=limits[f"attempts_per_{scope}_per_hour"],
+            period_seconds=3600
+        )
+
     async def _check_auth_rate_limits(
         self,
         client_ip: str,
         user_identifier: Optional[str],
         auth_type: AuthRateLimitType
     ) -> Tuple[bool, Dict]:
-        """Check authentication rate limits for both IP and user."""
-        limits = self.auth_limits[auth_type]
-        current_time = datetime.now(timezone.utc)
-
-        # Check IP-based rate limits
-        ip_allowed, ip_info = await self._check_ip_auth_limits(
-            client_ip, auth_type, limits, current_time
-        )
-
-        # Check user-based rate limits if user identifier is available
-        user_allowed, user_info = True, {}
+        """Check blacklist, lockouts and failure budgets for both IP and user."""
+        scopes = [("ip", client_ip)]
         if user_identifier:
-            user_allowed, user_info = await self._check_user_auth_limits(
-                user_identifier, auth_type, limits, current_time
-            )
-
-        # Return the most restrictive result
-        if not ip_allowed:
-            return False, ip_info
-        elif not user_allowed:
-            return False, user_info
-        else:
-            # Both allowed, return the more restrictive info
-            return True, ip_info if ip_info.get("remaining", 999) < user_info.get("remaining", 999) else user_info
+            scopes.append(("user", user_identifier))
+
+        return await self._check_scope_limits(
+            scopes,
+            auth_type,
+            self.auth_limits[auth_type],
+            datetime.now(timezone.utc),
+            blacklist_key=self._blacklist_key(client_ip)
+        )
 
     async def _check_ip_auth_limits(
         self,
@@ -269,65 +297,7 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
         current_time: datetime
     ) -> Tuple[bool, Dict]:
         """Check IP-based authentication rate limits."""
-        try:
-            # Get current failure count and violation history
-            failure_key = f"auth_failures:ip:{client_ip}:{auth_type.value}"
-            violation_key = f"auth_violations:ip:{client_ip}:{auth_type.value}"
-
-            current_failures = await self._get_current_failures(failure_key, current_time)
-            violation_count = await self._get_violation_count(violation_key)
-
-            # Calculate progressive penalty
-            base_lockout = limits["lockout_duration_minutes"]
-            if limits["progressive_lockout"]:
-                penalty_multiplier = self.penalty_multipliers.get(min(violation_count, 5), 24)
-                actual_lockout = base_lockout * penalty_multiplier
-            else:
-                actual_lockout = base_lockout
-
-            # Check if currently in lockout period
-            lockout_key = f"auth_lockout:ip:{client_ip}:{auth_type.value}"
-            lockout_until = await self._get_lockout_expiry(lockout_key)
-
-            if lockout_until and current_time < lockout_until:
-                return False, {
-                    "type": "ip_lockout",
-                    "ip": client_ip,
-                    "lockout_until": lockout_until.isoformat(),
-                    "retry_after": int((lockout_until - current_time).total_seconds()),
-                    "violation_count": violation_count
-                }
-
-            # Check if current failures exceed limit
-            max_failures = limits["attempts_per_ip_per_hour"]
-            if current_failures >= max_failures:
-                # Trigger lockout
-                lockout_until = current_time + timedelta(minutes=actual_lockout)
-                await self._set_lockout(lockout_key, lockout_until)
-                await self._increment_violation_count(violation_key)
-
-                return False, {
-                    "type": "ip_rate_limit",
-                    "ip": client_ip,
-                    "failures": current_failures,
-                    "max_failures": max_failures,
-                    "lockout_until": lockout_until.isoformat(),
-                    "retry_after": int(actual_lockout * 60),
-                    "violation_count": violation_count + 1
-                }
-
-            return True, {
-                "type": "ip_allowed",
-                "ip": client_ip,
-                "failures": current_failures,
-                "remaining": max_failures - current_failures,
-                "reset_time": (current_time + timedelta(hours=1)).isoformat()
-            }
-
-        except Exception as e:
-            logger.error(f"Error checking IP auth limits: {e}")
-            # Fail safe - allow with conservative limits
-            return True, {"type": "error_fallback", "remaining": 1}
+        return await self._check_scope_limits([("ip", client_ip)], auth_type, limits, current_time)
 
     async def _check_user_auth_limits(
         self,
@@ -337,140 +307,138 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
         current_time: datetime
     ) -> Tuple[bool, Dict]:
         """Check user-based authentication rate limits."""
-        try:
-            # Similar to IP checking but for user identifier
-            failure_key = f"auth_failures:user:{user_identifier}:{auth_type.value}"
-            violation_key = f"auth_violations:user:{user_identifier}:{auth_type.value}"
-
-            current_failures = await self._get_current_failures(failure_key, current_time)
-            violation_count = await self._get_violation_count(violation_key)
-
-            # Calculate progressive penalty
-            base_lockout = limits["lockout_duration_minutes"]
-            if limits["progressive_lockout"]:
-                penalty_multiplier = self.penalty_multipliers.get(min(violation_count, 5), 24)
-                actual_lockout = base_lockout * penalty_multiplier
-            else:
-                actual_lockout = base_lockout
-
-            # Check if currently in lockout period
-            lockout_key = f"auth_lockout:user:{user_identifier}:{auth_type.value}"
-            lockout_until = await self._get_lockout_expiry(lockout_key)
-
-            if lockout_until and current_time < lockout_until:
-                return False, {
-                    "type": "user_lockout",
-                    "user": user_identifier,
-                    "lockout_until": lockout_until.isoformat(),
-                    "retry_after": int((lockout_until - current_time).total_seconds()),
-                    "violation_count": violation_count
-                }
+        return await self._check_scope_limits([("user", user_identifier)], auth_type, limits, current_time)
 
-            # Check if current failures exceed limit
-            max_failures = limits["attempts_per_user_per_hour"]
-            if current_failures >= max_failures:
-                # Trigger lockout
-                lockout_until = current_time + timedelta(minutes=actual_lockout)
-                await self._set_lockout(lockout_key, lockout_until)
-                await self._increment_violation_count(violation_key)
-
-                return False, {
-                    "type": "user_rate_limit",
-                    "user": user_identifier,
-                    "failures": current_failures,
-                    "max_failures": max_failures,
-                    "lockout_until": lockout_until.isoformat(),
-                    "retry_after": int(actual_lockout * 60),
-                    "violation_count": violation_count + 1
-                }
+    async def _check_scope_limits(
+        self,
+        scopes: List[Tuple[str, str]],
+        auth_type: AuthRateLimitType,
+        limits: Dict,
+        current_time: datetime,
+        blacklist_key: Optional[str] = None
+    ) -> Tuple[bool, Dict]:
+        """
+        Check the failure budgets of ``scopes`` without charging them.
+
+        Returns the most restrictive result; exhausting a budget starts a
+        (progressive) lockout for that scope.
+        """
+        rules = [self._failure_rule(scope, identifier, auth_type, limits) for scope, identifier in scopes]
+        lockout_keys = [
+            self._auth_key("auth_lockout", scope, identifier, auth_type) for scope, identifier in scopes
+        ]
+        deny_keys = ([blacklist_key] if blacklist_key else []) + lockout_keys
 
+        try:
+            decision = await self.engine.check(rules, deny_keys=deny_keys, charge=False)
+        except Exception as e:
+            logger.error(f"Error checking auth limits: {e}")
+            # Fail open con el presupuesto completo: no bloquear logins legítimos
+            scope, identifier = scopes[0]
             return True, {
-                "type": "user_allowed",
-                "user": user_identifier,
-                "failures": current_failures,
-                "remaining": max_failures - current_failures,
+                "type": f"{scope}_allowed",
+                scope: identifier,
+                "failures": 0,
+                "remaining": rules[0].limit,
                 "reset_time": (current_time + timedelta(hours=1)).isoformat()
             }
 
-        except Exception as e:
-            logger.error(f"Error checking user auth limits: {e}")
-            # Fail safe - allow with conservative limits
-            return True, {"type": "error_fallback", "remaining": 1}
-
-    async def _get_current_failures(self, key: str, current_time: datetime) -> int:
-        """Get current failure count within the time window."""
-        if not self.redis_client:
-            return 0
+        if decision.source == "denylist":
+            if decision.denied_key == blacklist_key:
+                return False, {"type": "ip_blacklisted", "ip": scopes[0][1]}
+            # Sin lecturas extra: los bloqueos activos se responden desde la caché local
+            scope, identifier = scopes[lockout_keys.index(decision.denied_key)]
+            return False, {
+                "type": f"{scope}_lockout",
+                scope: identifier,
+                "lockout_until": (current_time + timedelta(seconds=decision.denied_for)).isoformat(),
+                "retry_after": max(1, math.ceil(decision.denied_for))
+            }
 
-        try:
-            # Use sliding window of 1 hour
-            window_start = current_time - timedelta(hours=1)
-
-            # Remove expired entries
-            await self.redis_client.zremrangebyscore(
-                key,
-                0,
-                window_start.timestamp()
+        if not decision.allowed:
+            index = rules.index(decision.violated)
+            scope, identifier = scopes[index]
+            return False, await self._start_lockout(
+                scope, identifier, auth_type, limits, rules[index].limit, current_time
             )
 
-            # Count current entries
-            return await self.redis_client.zcard(key)
-
-        except Exception as e:
-            logger.error(f"Error getting current failures: {e}")
-            return 0
+        return True, self._most_restrictive_allowance(scopes, decision, current_time)
 
-    async def _get_violation_count(self, key: str) -> int:
-        """Get total violation count for progressive penalties."""
-        if not self.redis_client:
-            return 0
-
-        try:
-            count = await self.redis_client.get(key)
-            return int(count) if count else 0
-        except Exception:
-            return 0
-
-    async def _get_lockout_expiry(self, key: str) -> Optional[datetime]:
-        """Get lockout expiry time."""
-        if not self.redis_client:
-            return None
-
-        try:
-            timestamp = await self.redis_client.get(key)
-            if timestamp:
-                return datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
-            return None
-        except Exception:
-            return None
-
-    async def _set_lockout(self, key: str, until: datetime):
-        """Set lockout period."""
-        if not self.redis_client:
-            return
+    async def _start_lockout(
+        self,
+        scope: str,
+        identifier: str,
+        auth_type: AuthRateLimitType,
+        limits: Dict,
+        max_failures: int,
+        current_time: datetime
+    ) -> Dict:
+        """Lock ``scope`` out after exhausting its failure budget."""
+        violation_key = self._auth_key("auth_violations", scope, identifier, auth_type)
+        violation_count = await self._increment_violation_count(violation_key)
+
+        # Calculate progressive penalty (violation_count includes this violation)
+        base_lockout = limits["lockout_duration_minutes"]
+        if limits["progressive_lockout"]:
+            penalty_multiplier = self.penalty_multipliers.get(min(max(violation_count, 1), 5), 24)
+            actual_lockout = base_lockout * penalty_multiplier
+        else:
+            actual_lockout = base_lockout
 
+        lockout_until = current_time + timedelta(minutes=actual_lockout)
         try:
-            # Set lockout with expiry
-            duration_seconds = int((until - datetime.now(timezone.utc)).total_seconds())
-            await self.redis_client.setex(
-                key,
-                duration_seconds,
-                until.timestamp()
+            await self.engine.deny(
+                self._auth_key("auth_lockout", scope, identifier, auth_type),
+                actual_lockout * 60,
+                value=str(lockout_until.timestamp())
             )
         except Exception as e:
             logger.error(f"Error setting lockout: {e}")
 
-    async def _increment_violation_count(self, key: str):
-        """Increment violation count for progressive penalties."""
+        return {
+            "type": f"{scope}_rate_limit",
+            scope: identifier,
+            "failures": max_failures,
+            "max_failures": max_failures,
+            "lockout_until": lockout_until.isoformat(),
+            "retry_after": int(actual_lockout * 60),
+            "violation_count": violation_count
+        }
+
+    @staticmethod
+    def _most_restrictive_allowance(
+        scopes: List[Tuple[str, str]],
+        decision: RateLimitDecision,
+        current_time: datetime
+    ) -> Dict:
+        infos = []
+        for (scope, identifier), state in zip(scopes, decision.states):
+            # Consulta sin cargo: remaining ya descuenta el intento actual
+            failures = max(0, state.rule.limit - 1 - state.remaining)
+            infos.append({
+                "type": f"{scope}_allowed",
+                scope: identifier,
+                "failures": failures,
+                "remaining": state.rule.limit - failures,
+                "reset_time": (current_time + timedelta(seconds=state.reset_after)).isoformat()
+            })
+        return min(infos, key=lambda info: info["remaining"])
+
+    async def _increment_violation_count(self, key: str) -> int:
+        """Increment violation count for progressive penalties; returns the new count."""
         if not self.redis_client:
-            return
+            return 0
 
         try:
-            # Increment and set expiry of 24 hours
-            await self.redis_client.incr(key)
-            await self.redis_client.expire(key, 86400)
+            # Increment and set expiry of 24 hours, one round trip
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.incr(key)
+            pipe.expire(key, 86400)
+            count, _ = await pipe.execute()
+            return int(count)
         except Exception as e:
             logger.error(f"Error incrementing violation count: {e}")
+            return 0
 
     async def _track_authentication_failure(
         self,
@@ -478,24 +446,22 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
         user_identifier: Optional[str],
         auth_type: AuthRateLimitType
     ):
-        """Track authentication failure for rate limiting."""
-        if not self.redis_client:
-            return
-
+        """Charge the IP (and user) failure budgets."""
         try:
             current_time = datetime.now(timezone.utc)
-            timestamp = current_time.timestamp()
-
-            # Track IP-based failure
-            ip_key = f"auth_failures:ip:{client_ip}:{auth_type.value}"
-            await self.redis_client.zadd(ip_key, {str(timestamp): timestamp})
-            await self.redis_client.expire(ip_key, 3600)  # 1 hour expiry
+            limits = self.auth_limits[auth_type]
 
-            # Track user-based failure if available
+            scopes = [("ip", client_ip)]
             if user_identifier:
-                user_key = f"auth_failures:user:{user_identifier}:{auth_type.value}"
-                await self.redis_client.zadd(user_key, {str(timestamp): timestamp})
-                await self.redis_client.expire(user_key, 3600)  # 1 hour expiry
+                scopes.append(("user", user_identifier))
+            rules = [self._failure_rule(scope, identifier, auth_type, limits) for scope, identifier in scopes]
+            decision = await self.engine.check(rules)
+
+            # Bloquear ya el scope cuyo presupuesto se agotó con este fallo
+            for (scope, identifier), rule, state in zip(scopes, rules, decision.states):
+                exhausted = state.remaining <= 0 if decision.allowed else decision.violated == rule
+                if exhausted:
+                    await self._start_lockout(scope, identifier, auth_type, limits, rule.limit, current_time)
 
             # Log security event
             await self.audit_service.log_security_event(
@@ -516,12 +482,9 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
 
     async def _is_blacklisted(self, client_ip: str) -> bool:
         """Check if IP is in the blacklist."""
-        if not self.redis_client:
-            return False
-
         try:
-            blacklist_key = f"auth_blacklist:ip:{client_ip}"
-            return await self.redis_client.exists(blacklist_key)
+            decision = await self.engine.check([], deny_keys=[self._blacklist_key(client_ip)], charge=False)
+            return decision.source == "denylist"
         except Exception:
             return False
 
@@ -557,17 +520,13 @@ class AuthRateLimitingMiddleware(BaseHTTPMiddleware):
 
     async def _auto_blacklist_ip(self, client_ip: str, violation_count: int):
         """Automatically blacklist IP for severe violations."""
-        if not self.redis_client:
-            return
-
         try:
-            blacklist_key = f"auth_blacklist:ip:{client_ip}"
             blacklist_duration = 86400 * min(violation_count, 7)  # 1-7 days based on violations
 
-            await self.redis_client.setex(
-                blacklist_key,
+            await self.engine.deny(
+                self._blacklist_key(client_ip),
                 blacklist_duration,
-                json.dumps({
+                value=json.dumps({
                     "blacklisted_at": datetime.now(timezone.utc).isoformat(),
                     "violation_count": violation_count,
                     "duration_seconds": blacklist_duration,
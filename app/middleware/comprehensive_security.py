@@ -20,27 +20,37 @@ import asyncio
 import json
 import logging
 import hashlib
+import math
 import time
-import redis
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Set, Callable
 from urllib.parse import urlparse
 from ipaddress import ip_address, ip_network
 import re
 
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from fastapi import HTTPException, status
 
+from app.core.audit_sink import AuditSink
 from app.core.config import settings
+from app.core.rate_limit_engine import RateLimitEngine, RateLimitRule
+from app.core.redis.base import get_redis_client
+from app.middleware.asgi import ASGIMiddleware
 
 
 # Configure security logger
 security_logger = logging.getLogger("security_middleware")
 security_logger.setLevel(logging.INFO)
 
+# Suspicious patterns in URLs (directory traversal, XSS, JS/data URL injection)
+SUSPICIOUS_URL_PATTERN = re.compile(
+    r"\.\.\/|<script|javascript:|data:text\/html",
+    re.IGNORECASE
+)
+
 
 class SecurityHeaders:
     """
@@ -120,12 +130,16 @@ class SecurityHeaders:
 
 class RateLimiter:
     """
-    Redis-based rate limiting with multiple strategies.
+    Rate limiting on the shared GCRA engine.
+
+    All the limits that apply to a request are checked in one engine call
+    (one Redis script call, or the in-process backend without Redis).
     """
 
     def __init__(self, redis_client=None):
-        """Initialize rate limiter with Redis client."""
-        self.redis_client = redis_client or self._get_redis_client()
+        """Initialize rate limiter with an optional async Redis client."""
+        self.redis_client = redis_client
+        self._engine: Optional[RateLimitEngine] = RateLimitEngine(redis_client) if redis_client else None
         self.rate_limits = {
             # General API limits
             "api_general": {"requests": 1000, "window": 3600},  # 1000/hour
@@ -141,73 +155,80 @@ class RateLimiter:
             "user_api": {"requests": 500, "window": 600},       # 500/10min per user
         }
 
-    def _get_redis_client(self):
-        """Get Redis client for rate limiting."""
-        try:
-            return redis.Redis(
-                host=getattr(settings, 'REDIS_HOST', 'localhost'),
-                port=getattr(settings, 'REDIS_PORT', 6379),
-                decode_responses=True
-            )
-        except Exception:
-            return None
+    async def _get_engine(self) -> RateLimitEngine:
+        """Engine over the async Redis client (in-process backend in tests or without Redis)."""
+        if self._engine is None:
+            redis_client = None
+            if not settings.TESTING:
+                try:
+                    redis_client = await get_redis_client()
+                except Exception as e:
+                    security_logger.warning(f"Redis unavailable for rate limiting, using in-process limits: {e}")
+            self._engine = RateLimitEngine(redis_client)
+        return self._engine
 
     def _get_rate_limit_key(self, identifier: str, limit_type: str) -> str:
         """Generate Redis key for rate limiting."""
         identifier_hash = hashlib.sha256(identifier.encode()).hexdigest()[:16]
         return f"rate_limit:{limit_type}:{identifier_hash}"
 
-    async def is_rate_limited(self, identifier: str, limit_type: str) -> tuple[bool, Dict[str, int]]:
+    async def check(self, limit_checks: List[tuple]) -> tuple[bool, Dict[str, int]]:
         """
-        Check if identifier is rate limited.
-
-        Args:
-            identifier: IP address, user ID, or other identifier
-            limit_type: Type of rate limit to check
+        Check several (identifier, limit_type) limits at once.
 
         Returns:
-            Tuple[bool, Dict]: (is_limited, rate_limit_info)
+            Tuple[bool, Dict]: (is_limited, rate_limit_info of the violated or tightest limit)
         """
-        if not self.redis_client or limit_type not in self.rate_limits:
+        rules = [
+            RateLimitRule(
+                key=self._get_rate_limit_key(identifier, limit_type),
+                limit=self.rate_limits[limit_type]["requests"],
+                period_seconds=self.rate_limits[limit_type]["window"],
+                scope=limit_type
+            )
+            for identifier, limit_type in limit_checks
+            if limit_type in self.rate_limits
+        ]
+        if not rules:
             return False, {}
 
-        limit_config = self.rate_limits[limit_type]
-        key = self._get_rate_limit_key(identifier, limit_type)
-
-        # Sliding window rate limiting
-        now = int(time.time())
-        window_start = now - limit_config["window"]
-
-        # Remove old entries
-        self.redis_client.zremrangebyscore(key, 0, window_start)
+        engine = await self._get_engine()
+        decision = await engine.check(rules)
+        state = decision.most_restrictive
+        rule = state.rule if state else rules[0]
 
-        # Count current requests
-        current_count = self.redis_client.zcard(key)
-
-        # Check if rate limited
-        is_limited = current_count >= limit_config["requests"]
+        rate_info = {
+            "limit_type": rule.scope,
+            "limit": rule.limit,
+            "remaining": decision.remaining,
+            "reset": int(time.time() + decision.reset_after),
+            "window": int(rule.period_seconds),
+            "retry_after": max(1, math.ceil(decision.retry_after))
+        }
 
-        # Add current request if not limited
-        if not is_limited:
-            self.redis_client.zadd(key, {str(now): now})
-            self.redis_client.expire(key, limit_config["window"])
+        return not decision.allowed, rate_info
 
-        # Calculate reset time
-        reset_time = window_start + limit_config["window"]
+    async def is_rate_limited(self, identifier: str, limit_type: str) -> tuple[bool, Dict[str, int]]:
+        """
+        Check if identifier is rate limited.
 
-        rate_info = {
-            "limit": limit_config["requests"],
-            "remaining": max(0, limit_config["requests"] - current_count - (0 if is_limited else 1)),
-            "reset": reset_time,
-            "window": limit_config["window"]
-        }
+        Args:
+            identifier: IP address, user ID, or other identifier
+            limit_type: Type of rate limit to check
 
-        return is_limited, rate_info
+        Returns:
+            Tuple[bool, Dict]: (is_limited, rate_limit_info)
+        """
+        return await self.check([(identifier, limit_type)])
 
 
 class AuditLogger:
     """
     Comprehensive audit logging for security events.
+
+    The request path only captures raw fields into an AuditSink; sanitizing,
+    json.dumps and the handler writes happen in the sink's batch writer,
+    off the event loop.
     """
 
     def __init__(self):
@@ -218,6 +239,7 @@ class AuditLogger:
         self.sensitive_fields = {
             "password", "token", "secret", "key", "credential"
         }
+        self.sink = AuditSink("security_middleware", self._write_batch)
 
     def log_request(
         self,
@@ -235,70 +257,58 @@ class AuditLogger:
             user_id: Authenticated user ID (if any)
             processing_time: Request processing time in seconds
         """
-        # Sanitize headers
-        headers = dict(request.headers)
-        sanitized_headers = {}
-        for key, value in headers.items():
-            if key.lower() in self.sensitive_headers:
-                sanitized_headers[key] = "[REDACTED]"
-            else:
-                sanitized_headers[key] = value
-
-        # Log entry
-        log_entry = {
+        self.sink.put_nowait((logging.INFO, "REQUEST_AUDIT", {
             "timestamp": datetime.utcnow().isoformat(),
             "event_type": "HTTP_REQUEST",
             "method": request.method,
             "url": str(request.url),
             "path": request.url.path,
-            "query_params": dict(request.query_params),
-            "headers": sanitized_headers,
+            "query_params": list(request.query_params.multi_items()),
+            "headers": list(request.headers.items()),
             "ip_address": ip_address,
-            "user_agent": headers.get("user-agent", ""),
             "user_id": user_id,
-            "processing_time": processing_time,
-            "request_size": headers.get("content-length", 0)
-        }
-
-        security_logger.info(f"REQUEST_AUDIT: {json.dumps(log_entry)}")
+            "processing_time": processing_time
+        }))
 
     def log_response(
         self,
         request: Request,
-        response: Response,
+        status_code: int,
         ip_address: str,
         user_id: Optional[str] = None,
-        processing_time: Optional[float] = None
+        processing_time: Optional[float] = None,
+        response_size: int = 0
     ):
         """
         Log HTTP response for audit trail.
 
         Args:
             request: FastAPI request object
-            response: FastAPI response object
+            status_code: Response status code
             ip_address: Client IP address
             user_id: Authenticated user ID (if any)
             processing_time: Request processing time in seconds
+            response_size: Response Content-Length (if known)
         """
-        log_entry = {
+        # Log level based on status code
+        if status_code >= 500:
+            level = logging.ERROR
+        elif status_code >= 400:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+
+        self.sink.put_nowait((level, "RESPONSE_AUDIT", {
             "timestamp": datetime.utcnow().isoformat(),
             "event_type": "HTTP_RESPONSE",
             "method": request.method,
             "path": request.url.path,
-            "status_code": response.status_code,
-            "response_size": response.headers.get("content-length", 0),
+            "status_code": status_code,
+            "response_size": response_size,
             "ip_address": ip_address,
             "user_id": user_id,
             "processing_time": processing_time
-        }
-
-        # Log level based on status code
-        if response.status_code >= 500:
-            security_logger.error(f"RESPONSE_AUDIT: {json.dumps(log_entry)}")
-        elif response.status_code >= 400:
-            security_logger.warning(f"RESPONSE_AUDIT: {json.dumps(log_entry)}")
-        else:
-            security_logger.info(f"RESPONSE_AUDIT: {json.dumps(log_entry)}")
+        }))
 
     def log_security_event(
         self,
@@ -316,15 +326,33 @@ class AuditLogger:
             ip_address: Client IP address
             user_id: User ID (if applicable)
         """
-        log_entry = {
+        self.sink.put_nowait((logging.WARNING, "SECURITY_EVENT", {
             "timestamp": datetime.utcnow().isoformat(),
             "event_type": f"SECURITY_{event_type}",
             "details": details,
             "ip_address": ip_address,
             "user_id": user_id
-        }
+        }))
+
+    def _format_entry(self, entry: Dict) -> Dict:
+        """Sanitize the raw captured fields into the audit log entry."""
+        if "headers" in entry:
+            headers = {}
+            for key, value in entry["headers"]:
+                headers[key] = "[REDACTED]" if key.lower() in self.sensitive_headers else value
+            entry["headers"] = headers
+            entry["query_params"] = dict(entry["query_params"])
+            entry["user_agent"] = headers.get("user-agent", "")
+            entry["request_size"] = headers.get("content-length", 0)
+        return entry
+
+    def _emit_batch(self, batch: List) -> None:
+        for level, prefix, entry in batch:
+            security_logger.log(level, f"{prefix}: {json.dumps(self._format_entry(entry), default=str)}")
 
-        security_logger.warning(f"SECURITY_EVENT: {json.dumps(log_entry)}")
+    async def _write_batch(self, batch: List) -> None:
+        # Serialización y escritura de handlers fuera del event loop
+        await asyncio.to_thread(self._emit_batch, batch)
 
 
 class IPSecurityValidator:
@@ -372,9 +400,12 @@ class IPSecurityValidator:
             return True, "Invalid IP address format"
 
 
-class ComprehensiveSecurityMiddleware(BaseHTTPMiddleware):
+class ComprehensiveSecurityMiddleware(ASGIMiddleware):
     """
     Comprehensive security middleware combining all security features.
+
+    Pure ASGI: checks run before the app, headers are set on the response
+    start message and the response audit entry is queued once it was sent.
     """
 
     def __init__(self, app, **kwargs):
@@ -401,23 +432,24 @@ class ComprehensiveSecurityMiddleware(BaseHTTPMiddleware):
             "/api/v1/payments"
         }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        # Headers fijos: se calculan una vez, no por petición
+        self._security_header_items = list(self.security_headers.get_security_headers().items())
+        self._api_header_items = list(self.security_headers.get_api_headers().items())
+
+    async def before_request(self, request: Request) -> Optional[Response]:
         """
-        Process request through comprehensive security pipeline.
+        Run the security checks before the request reaches the app.
 
         Args:
             request: FastAPI request object
-            call_next: Next middleware/endpoint
 
         Returns:
-            Response: HTTP response with security headers
+            Optional[Response]: Blocking response, or None to continue
         """
-        start_time = time.time()
-
         # Extract client information
         ip_address = self._get_client_ip(request)
-        user_agent = request.headers.get("user-agent", "")
         user_id = self._extract_user_id(request)
+        request.state.security_client = (ip_address, user_id)
 
         try:
             # 1. IP Address Validation
@@ -450,35 +482,43 @@ class ComprehensiveSecurityMiddleware(BaseHTTPMiddleware):
             if self.enable_audit_logging:
                 self.audit_logger.log_request(request, ip_address, user_id)
 
-            # Process request
-            response = await call_next(request)
-
-            # 5. Add Security Headers
-            self._add_security_headers(response, request)
-
-            # 6. Audit Logging (Response)
-            processing_time = time.time() - start_time
-            if self.enable_audit_logging:
-                self.audit_logger.log_response(
-                    request, response, ip_address, user_id, processing_time
-                )
+        except Exception as e:
+            return self._internal_error(request, e)
 
-            return response
+        return None
 
-        except Exception as e:
-            # Log security exception
-            self.audit_logger.log_security_event(
-                "MIDDLEWARE_EXCEPTION",
-                {"error": str(e), "request_path": request.url.path},
-                ip_address,
-                user_id
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        # 5. Add Security Headers
+        self._add_security_headers(headers, request)
+        request.state.response_size = headers.get("content-length", 0)
+
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        # 6. Audit Logging (Response)
+        if self.enable_audit_logging:
+            ip_address, user_id = request.state.security_client
+            self.audit_logger.log_response(
+                request, status_code, ip_address, user_id, elapsed,
+                getattr(request.state, "response_size", 0)
             )
 
-            # Return generic error to avoid information disclosure
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"detail": "Internal server error"}
-            )
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        return self._internal_error(request, exc)
+
+    def _internal_error(self, request: Request, error: Exception) -> Response:
+        # Log security exception
+        ip_address, user_id = request.state.security_client
+        self.audit_logger.log_security_event(
+            "MIDDLEWARE_EXCEPTION",
+            {"error": str(error), "request_path": request.url.path},
+            ip_address,
+            user_id
+        )
+
+        # Return generic error to avoid information disclosure
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Internal server error"}
+        )
 
     def _get_client_ip(self, request: Request) -> str:
         """
@@ -552,39 +592,41 @@ class ComprehensiveSecurityMiddleware(BaseHTTPMiddleware):
             else:
                 limit_checks.append((user_id, "user_general"))
 
-        # Check each rate limit
-        for identifier, limit_type in limit_checks:
-            is_limited, rate_info = await self.rate_limiter.is_rate_limited(identifier, limit_type)
-
-            if is_limited:
-                # Log rate limit violation
-                self.audit_logger.log_security_event(
-                    "RATE_LIMIT_EXCEEDED",
-                    {
-                        "limit_type": limit_type,
-                        "identifier": hashlib.sha256(identifier.encode()).hexdigest()[:8],
-                        "rate_info": rate_info
-                    },
-                    ip_address,
-                    user_id
-                )
-
-                # Return rate limit response
-                headers = {
-                    "X-Rate-Limit-Limit": str(rate_info["limit"]),
-                    "X-Rate-Limit-Remaining": str(rate_info["remaining"]),
-                    "X-Rate-Limit-Reset": str(rate_info["reset"]),
-                    "Retry-After": str(rate_info["window"])
-                }
-
-                return JSONResponse(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    content={
-                        "detail": "Rate limit exceeded",
-                        "retry_after": rate_info["window"]
-                    },
-                    headers=headers
-                )
+        # Check every applicable limit in one engine call
+        is_limited, rate_info = await self.rate_limiter.check(limit_checks)
+
+        if is_limited:
+            limit_type = rate_info["limit_type"]
+            identifier = next(i for i, t in limit_checks if t == limit_type)
+
+            # Log rate limit violation
+            self.audit_logger.log_security_event(
+                "RATE_LIMIT_EXCEEDED",
+                {
+                    "limit_type": limit_type,
+                    "identifier": hashlib.sha256(identifier.encode()).hexdigest()[:8],
+                    "rate_info": rate_info
+                },
+                ip_address,
+                user_id
+            )
+
+            # Return rate limit response
+            headers = {
+                "X-Rate-Limit-Limit": str(rate_info["limit"]),
+                "X-Rate-Limit-Remaining": str(rate_info["remaining"]),
+                "X-Rate-Limit-Reset": str(rate_info["reset"]),
+                "Retry-After": str(rate_info["retry_after"])
+            }
+
+            return JSONResponse(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                content={
+                    "detail": "Rate limit exceeded",
+                    "retry_after": rate_info["retry_after"]
+                },
+                headers=headers
+            )
 
         return None
 
@@ -607,45 +649,33 @@ class ComprehensiveSecurityMiddleware(BaseHTTPMiddleware):
             )
 
         # Check for suspicious patterns in URL
-        suspicious_patterns = [
-            r"\.\.\/",  # Directory traversal
-            r"<script",  # XSS attempts
-            r"javascript:",  # JavaScript injection
-            r"data:text\/html",  # Data URL injection
-        ]
-
-        url_path = str(request.url)
-        for pattern in suspicious_patterns:
-            if re.search(pattern, url_path, re.IGNORECASE):
-                return JSONResponse(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    content={"detail": "Invalid request"}
-                )
+        if SUSPICIOUS_URL_PATTERN.search(str(request.url)):
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"detail": "Invalid request"}
+            )
 
         return None
 
-    def _add_security_headers(self, response: Response, request: Request):
+    def _add_security_headers(self, headers: MutableHeaders, request: Request):
         """
-        Add security headers to response.
+        Add security headers to the response start message.
 
         Args:
-            response: FastAPI response object
+            headers: Response headers (mutable)
             request: FastAPI request object
         """
         # Add general security headers
-        security_headers = self.security_headers.get_security_headers()
-
-        for header, value in security_headers.items():
-            response.headers[header] = value
+        for header, value in self._security_header_items:
+            headers[header] = value
 
         # Add API-specific headers for API endpoints
         if request.url.path.startswith("/api/"):
-            api_headers = self.security_headers.get_api_headers()
-            for header, value in api_headers.items():
-                response.headers[header] = value
+            for header, value in self._api_header_items:
+                headers[header] = value
 
         # Add CORS headers if needed (handled by separate CORS middleware)
 
         # Add custom headers based on endpoint
         if any(endpoint in request.url.path for endpoint in self.protected_endpoints):
-            response.headers["X-Protected-Endpoint"] = "true"
\ No newline at end of file
+            headers["X-Protected-Endpoint"] = "true"
@@ -8,19 +8,24 @@ This middleware provides comprehensive security features:
 - Enterprise audit logging
 - Colombian compliance features
 
+Both middlewares are pure ASGI (see app.middleware.asgi): checks run
+before the app, headers are set on the response start message and audit
+logging happens once the response was sent.
+
 Author: Backend Senior Developer
-Version: 1.0.0 Enterprise
+Version: 1.1.0 Enterprise
 """
 
 import time
 from datetime import datetime, timezone
-from typing import Callable, Optional, Dict
+from typing import Optional, Dict
 from fastapi import Request, Response, HTTPException, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.middleware.asgi import ASGIMiddleware
 from app.core.redis import get_redis_service
 from app.services.rate_limiting_service import EnterpriseRateLimitingService, RateLimitType
 from app.services.fraud_detection_service import EnterpriseFraudDetectionService, RiskLevel
@@ -29,7 +34,7 @@ from app.services.session_service import EnterpriseSessionService
 logger = get_logger(__name__)
 
 
-class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
+class EnterpriseSecurityMiddleware(ASGIMiddleware):
     """
     Enterprise security middleware providing comprehensive protection.
 
@@ -50,6 +55,10 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
         self.fraud_detector = None
         self.session_manager = None
         self._initialize_services()
+        # Headers fijos: se calculan una vez, no por petición
+        self._security_header_items = [
+            (header, value) for header, value in self._get_security_headers().items() if value
+        ]
 
     def _initialize_services(self):
         """Initialize security services lazily."""
@@ -83,40 +92,36 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
                 )
         return True
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Main middleware dispatch method."""
-        start_time = time.time()
+    async def before_request(self, request: Request) -> Optional[Response]:
+        """Security checks before the request reaches the app."""
+        # Extract request information
+        ip_address = getattr(request.client, 'host', 'unknown') if request.client else 'unknown'
+        user_agent = request.headers.get('User-Agent', 'unknown')
+        endpoint = request.url.path
+
+        # Add security headers to request context
+        request.state.start_time = time.time()
+        request.state.ip_address = ip_address
+        request.state.user_agent = user_agent
 
         try:
             # Ensure services are initialized
-            services_available = await self._ensure_services()
-
-            # Extract request information
-            ip_address = getattr(request.client, 'host', 'unknown') if request.client else 'unknown'
-            user_agent = request.headers.get('User-Agent', 'unknown')
-            endpoint = request.url.path
-            method = request.method
-
-            # Add security headers to request context
-            request.state.start_time = start_time
-            request.state.ip_address = ip_address
-            request.state.user_agent = user_agent
-
-            # Skip security checks for health endpoints
-            if self._is_health_endpoint(endpoint):
-                response = await call_next(request)
-                return self._add_security_headers(response)
-
+            await self._ensure_services()
+        except HTTPException as e:
             # SECURITY FIX: Always apply security checks - fail closed approach
-            if not services_available:
-                logger.critical("Security services unavailable - denying access",
-                              endpoint=endpoint, ip_address=ip_address)
-                return JSONResponse(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    content={"detail": "Security services unavailable"},
-                    headers=self._get_security_headers()
-                )
+            logger.critical("Security services unavailable - denying access",
+                          endpoint=endpoint, ip_address=ip_address)
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers=self._get_security_headers()
+            )
 
+        # Skip security checks for health endpoints
+        if self._is_health_endpoint(endpoint):
+            return None
+
+        try:
             if self.rate_limiter:
                 # 1. Rate Limiting Check
                 rate_limit_result = await self.rate_limiter.check_rate_limit(
@@ -144,43 +149,48 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
 
                 await self._apply_fraud_detection(request)
 
-            # 3. Process the request
-            try:
-                response = await call_next(request)
+        except Exception as e:
+            return self._internal_error(request, e)
 
-                # 4. Post-request processing
-                if self.session_manager:
-                    await self._post_request_processing(request, response)
+        return None
 
-                # 5. Add security headers
-                response = self._add_security_headers(response)
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        # Add security headers
+        self._add_security_headers(headers)
 
-                # 6. Audit logging
-                await self._audit_log_request(request, response, start_time)
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        if self._is_health_endpoint(request.url.path):
+            return
 
-                return response
+        # Post-request processing
+        if self.session_manager:
+            await self._post_request_processing(request)
 
-            except HTTPException as e:
-                # Handle HTTP exceptions with proper logging
-                await self._audit_log_exception(request, e, start_time)
-                raise
+        # Audit logging
+        await self._audit_log_request(request, status_code, request.state.start_time)
 
-        except Exception as e:
-            # Handle unexpected exceptions
-            logger.error(
-                "Unexpected error in security middleware",
-                error=str(e),
-                endpoint=getattr(request, 'url', {}).get('path', 'unknown'),
-                ip_address=ip_address
-            )
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        if isinstance(exc, HTTPException):
+            # Handle HTTP exceptions with proper logging
+            await self._audit_log_exception(request, exc, request.state.start_time)
+            return None
+        return self._internal_error(request, exc)
 
-            # Create error response
-            error_response = JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"detail": "Internal server error"}
-            )
+    def _internal_error(self, request: Request, error: Exception) -> Response:
+        """Handle unexpected exceptions."""
+        logger.error(
+            "Unexpected error in security middleware",
+            error=str(error),
+            endpoint=request.url.path,
+            ip_address=getattr(request.state, 'ip_address', 'unknown')
+        )
 
-            return self._add_security_headers(error_response)
+        # Create error response
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"detail": "Internal server error"},
+            headers=dict(self._security_header_items)
+        )
 
     def _is_health_endpoint(self, endpoint: str) -> bool:
         """Check if endpoint is a health check endpoint."""
@@ -230,7 +240,7 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
         except Exception as e:
             logger.error("Error applying fraud detection", error=str(e))
 
-    async def _post_request_processing(self, request: Request, response: Response) -> None:
+    async def _post_request_processing(self, request: Request) -> None:
         """Post-request security processing."""
         try:
             # Update session activity if user is authenticated
@@ -270,31 +280,20 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
             "X-Fraud-Detection": "active" if settings.FRAUD_DETECTION_ENABLED else "disabled"
         }
 
-    def _add_security_headers(self, response: Response) -> Response:
-        """Add comprehensive security headers to response."""
-        try:
-            # Get security headers
-            security_headers = self._get_security_headers()
-
-            # Add headers to response
-            for header, value in security_headers.items():
-                if value:  # Only add non-empty headers
-                    response.headers[header] = value
-
-            return response
+    def _add_security_headers(self, headers: MutableHeaders) -> None:
+        """Add comprehensive security headers to the response start message."""
+        # Only non-empty headers (precomputed at init)
+        for header, value in self._security_header_items:
+            headers[header] = value
 
-        except Exception as e:
-            logger.error("Error adding security headers", error=str(e))
-            return response
-
-    async def _audit_log_request(self, request: Request, response: Response, start_time: float) -> None:
+    async def _audit_log_request(self, request: Request, status_code: int, start_time: float) -> None:
         """Comprehensive audit logging for security monitoring."""
         try:
             end_time = time.time()
             duration_ms = round((end_time - start_time) * 1000, 2)
 
             # Determine if this request should be audited
-            if self._should_audit_request(request, response):
+            if self._should_audit_request(request, status_code):
                 audit_data = {
                     "timestamp": datetime.now(timezone.utc).isoformat(),
                     "request_id": getattr(request.state, 'request_id', None),
@@ -303,20 +302,20 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
                     "method": request.method,
                     "endpoint": request.url.path,
                     "query_params": dict(request.query_params) if request.query_params else {},
-                    "status_code": response.status_code,
+                    "status_code": status_code,
                     "duration_ms": duration_ms,
                     "user_id": getattr(request.state, 'user_id', None),
                     "session_id": getattr(request.state, 'session_id', None),
                     "rate_limit_info": {
-                        "remaining": getattr(request.state, 'rate_limit_result', {}).get('remaining_requests', 0),
-                        "limit_type": getattr(request.state, 'rate_limit_result', {}).get('limit_type', None)
+                        "remaining": getattr(request.state.rate_limit_result, 'remaining_requests', 0),
+                        "limit_type": getattr(request.state.rate_limit_result, 'limit_type', None)
                     } if hasattr(request.state, 'rate_limit_result') else None
                 }
 
                 # Log based on response status
-                if response.status_code >= 400:
+                if status_code >= 400:
                     logger.warning("Security audit - Client error", **audit_data)
-                elif response.status_code >= 500:
+                elif status_code >= 500:
                     logger.error("Security audit - Server error", **audit_data)
                 elif self._is_sensitive_endpoint(request.url.path):
                     logger.info("Security audit - Sensitive endpoint", **audit_data)
@@ -354,14 +353,14 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
         except Exception as e:
             logger.error("Error in exception audit logging", error=str(e))
 
-    def _should_audit_request(self, request: Request, response: Response) -> bool:
+    def _should_audit_request(self, request: Request, status_code: int) -> bool:
         """Determine if a request should be audited."""
         # Always audit sensitive endpoints
         if self._is_sensitive_endpoint(request.url.path):
             return True
 
         # Always audit error responses
-        if response.status_code >= 400:
+        if status_code >= 400:
             return True
 
         # Always audit POST, PUT, DELETE requests
@@ -384,7 +383,7 @@ class EnterpriseSecurityMiddleware(BaseHTTPMiddleware):
         return any(pattern in endpoint for pattern in sensitive_patterns)
 
 
-class SecurityMetricsMiddleware(BaseHTTPMiddleware):
+class SecurityMetricsMiddleware(ASGIMiddleware):
     """
     Lightweight middleware for collecting security metrics.
     """
@@ -394,23 +393,20 @@ class SecurityMetricsMiddleware(BaseHTTPMiddleware):
         self.request_count = 0
         self.error_count = 0
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def before_request(self, request: Request) -> Optional[Response]:
         """Collect basic security metrics."""
         self.request_count += 1
+        return None
 
-        try:
-            response = await call_next(request)
-
-            if response.status_code >= 400:
-                self.error_count += 1
-
-            # Add metrics headers
-            response.headers["X-Request-Count"] = str(self.request_count)
-            response.headers["X-Error-Rate"] = str(round(self.error_count / self.request_count * 100, 2))
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        if status_code >= 400:
+            self.error_count += 1
 
-            return response
+        # Add metrics headers
+        headers["X-Request-Count"] = str(self.request_count)
+        headers["X-Error-Rate"] = str(round(self.error_count / self.request_count * 100, 2))
 
-        except Exception as e:
-            self.error_count += 1
-            logger.error("Error in security metrics middleware", error=str(e))
-            raise
\ No newline at end of file
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        self.error_count += 1
+        logger.error("Error in security metrics middleware", error=str(exc))
+        return None
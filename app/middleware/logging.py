@@ -10,22 +10,26 @@ Nombre del Archivo: logging.py
 Ruta: ~/app/middleware/logging.py
 Autor: Jairo
 Fecha de Creación: 2025-07-19
-Última Actualización: 2025-07-19
-Versión: 2.0.0
+Última Actualización: 2026-10-19
+Versión: 3.0.0
 Propósito: Middleware FUNCIONAL para registrar requests usando structlog
 
 Modificaciones:
 2025-07-19 - Implementación inicial (v1.0.0) - FALLÓ
 2025-07-19 - Reescritura completa usando BaseHTTPMiddleware correctamente (v2.0.0)
+2026-10-19 - Middleware ASGI puro: tee de bodies acotado, muestreo por ruta (v3.0.0)
 -------------------------------------------------------------------------------------
 """
 
+import random
 import time
-from typing import Callable
+from typing import Any, List, Optional
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.core.config import settings
 from app.core.logger import get_logger
 
 # Instancia del logger estructurado
@@ -33,10 +37,11 @@ logger = get_logger(__name__)
 
 
 # Constantes para logging de bodies
-MAX_BODY_SIZE = 10 * 1024  # 10KB máximo
+MAX_BODY_SIZE = settings.REQUEST_LOG_MAX_BODY_BYTES  # 10KB por defecto
 EXCLUDED_PATHS = {"/docs", "/openapi.json", "/health", "/ready"}
 JSON_CONTENT_TYPES = {"application/json", "application/ld+json"}
 TEXT_CONTENT_TYPES = {"text/plain", "text/html", "text/css", "text/javascript"}
+SENSITIVE_BODY_FIELDS = ("password", "token", "secret", "credential", "api_key")
 
 
 def _should_log_body(path: str, content_type: str = None) -> bool:
@@ -66,13 +71,56 @@ def _should_log_body(path: str, content_type: str = None) -> bool:
     return content_type in allowed_types
 
 
-def _parse_body_safely(body_bytes: bytes, content_type: str = None) -> str | dict | None:
+def _sample_rate(path: str) -> float:
+    """
+    Tasa de muestreo para un path: el prefijo configurado más largo gana.
+
+    Args:
+        path: URL path del request
+
+    Returns:
+        float: Fracción de requests a loguear (0.0 - 1.0)
+    """
+    rate = settings.REQUEST_LOG_SAMPLE_RATE
+    matched = -1
+    for prefix, prefix_rate in settings.REQUEST_LOG_ROUTE_SAMPLE_RATES.items():
+        if path.startswith(prefix) and len(prefix) > matched:
+            rate, matched = prefix_rate, len(prefix)
+    return rate
+
+
+def _redact(value: Any) -> Any:
+    """
+    Oculta campos sensibles (password, token, ...) de un body JSON ya parseado.
+
+    Args:
+        value: Body parseado (dict, list o escalar)
+
+    Returns:
+        Any: Copia con los campos sensibles reemplazados por "[REDACTED]"
+    """
+    if isinstance(value, dict):
+        return {
+            key: "[REDACTED]" if any(field in str(key).lower() for field in SENSITIVE_BODY_FIELDS) else _redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _parse_body_safely(
+    body_bytes: bytes,
+    content_type: str = None,
+    total_size: Optional[int] = None
+) -> str | dict | None:
     """
     Parsea el body de forma segura según su content-type.
 
     Args:
-        body_bytes: Raw bytes del body
+        body_bytes: Raw bytes del body (puede ser solo el prefijo capturado)
         content_type: Content-Type header
+        total_size: Tamaño real del body si solo se capturó un prefijo
 
     Returns:
         str | dict | None: Body parseado o None si no se puede parsear
@@ -81,9 +129,10 @@ def _parse_body_safely(body_bytes: bytes, content_type: str = None) -> str | dic
         return None
 
     # Limitar tamaño
-    if len(body_bytes) > MAX_BODY_SIZE:
+    total_size = total_size if total_size is not None else len(body_bytes)
+    if total_size > MAX_BODY_SIZE or total_size > len(body_bytes):
         truncated_body = body_bytes[:MAX_BODY_SIZE].decode('utf-8', errors='replace')
-        return f"{truncated_body}... [truncated - original size: {len(body_bytes)} bytes]"
+        return f"{truncated_body}... [truncated - original size: {total_size} bytes]"
 
     try:
         body_str = body_bytes.decode('utf-8')
@@ -92,7 +141,7 @@ def _parse_body_safely(body_bytes: bytes, content_type: str = None) -> str | dic
         if content_type and 'application/json' in content_type.lower():
             try:
                 import json
-                return json.loads(body_str)
+                return _redact(json.loads(body_str))
             except json.JSONDecodeError:
                 # Si falla JSON parsing, devolver como string
                 return body_str
@@ -105,45 +154,38 @@ def _parse_body_safely(body_bytes: bytes, content_type: str = None) -> str | dic
         return None
 
 
-async def _capture_response_body(response: Response) -> tuple[Response, str | dict | None]:
+class _BodyTee:
     """
-    Captura el body del response sin consumir el stream.
+    Copia los primeros ``max_bytes`` de un body mientras fluye.
 
-    Args:
-        response: Response de FastAPI
-
-    Returns:
-        tuple: (response_modificado, body_parseado)
+    El resto solo se cuenta: la respuesta (o el request) sigue en streaming
+    y la memoria usada queda acotada sin importar el tamaño del body.
     """
-    # Obtener content-type del response
-    content_type = response.headers.get('content-type', '')
 
-    # Verificar si debemos loguear este response
-    if not _should_log_body('', content_type):
-        return response, None
+    __slots__ = ("content_type", "max_bytes", "chunks", "captured", "total")
 
-    # Leer el body del response
-    response_body = b''
-    async for chunk in response.body_iterator:
-        response_body += chunk
+    def __init__(self, content_type: str, max_bytes: int = MAX_BODY_SIZE):
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.chunks: List[bytes] = []
+        self.captured = 0
+        self.total = 0
 
-    # Parsear el body
-    parsed_body = _parse_body_safely(response_body, content_type)
+    def feed(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        room = self.max_bytes - self.captured
+        if room > 0 and chunk:
+            piece = chunk if len(chunk) <= room else chunk[:room]
+            self.chunks.append(piece)
+            self.captured += len(piece)
 
-    # Crear nuevo response con el mismo contenido
-    new_response = Response(
-        content=response_body,
-        status_code=response.status_code,
-        headers=dict(response.headers),
-        media_type=response.media_type
-    )
+    def parse(self) -> str | dict | None:
+        return _parse_body_safely(b"".join(self.chunks), self.content_type, self.total)
 
-    return new_response, parsed_body
 
-
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
-    Middleware de logging para FastAPI usando BaseHTTPMiddleware CORRECTAMENTE.
+    Middleware de logging ASGI puro.
 
     Este middleware registra automáticamente cada request con:
     - Método HTTP y URL completa
@@ -152,107 +194,95 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
     - Código de respuesta HTTP
     - Usuario autenticado (si existe)
     - Manejo completo de errores
+
+    Los canales receive/send se interceptan sin reconstruir la respuesta:
+    de cada body se copian como máximo ``REQUEST_LOG_MAX_BODY_BYTES`` y los
+    streams (exports, SSE) mantienen memoria constante. Solo se loguean las
+    requests muestreadas (``REQUEST_LOG_SAMPLE_RATE`` /
+    ``REQUEST_LOG_ROUTE_SAMPLE_RATES``); errores 5xx y excepciones siempre.
+    El parseo, la redacción y el log se hacen cuando la respuesta ya se envió.
     """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """
-        Método dispatch que maneja cada request/response.
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        Args:
-            request: Request de FastAPI
-            call_next: Siguiente handler en la cadena
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        Returns:
-            Response: Respuesta HTTP procesada
-        """
         # Marcar inicio de procesamiento
         start_time = time.monotonic()
-
-        # Extraer información del request
-        client_ip = self._get_client_ip(request)
-        user_agent = request.headers.get("user-agent", "Unknown")
-        method = request.method
-        url_path = str(request.url.path)
-        query_string = str(request.url.query) if request.url.query else None
+        request = Request(scope)
+        url_path = scope["path"]
+        sampled = random.random() < _sample_rate(url_path)
 
         # Construir contexto base para logging
         log_context = {
-            "method": method,
+            "method": scope["method"],
             "path": url_path,
-            "client_ip": client_ip,
-            "user_agent": user_agent,
+            "client_ip": self._get_client_ip(request),
+            "user_agent": request.headers.get("user-agent", "Unknown"),
         }
 
         # Agregar query string si existe
-        if query_string:
-            log_context["query_string"] = query_string
-
-        # Capturar request body de forma segura
-        request_body = None
-        content_type = request.headers.get("content-type", "")
-
-        if _should_log_body(url_path, content_type):
-            try:
-                body_bytes = await request.body()
-                request_body = _parse_body_safely(body_bytes, content_type)
-                if request_body is not None:
-                    log_context["request_body"] = request_body
-            except Exception as e:
-                # Si falla la captura del body, no romper el middleware
-                logger.bind(**log_context).warning(
-                    "Failed to capture request body",
-                    error_type=type(e).__name__,
-                    error_message=str(e)
-                )
-
-        # Detectar usuario autenticado
-        user_info = self._get_user_info(request)
-        if user_info:
-            log_context["authenticated_user"] = user_info
-
-        # Log de request iniciado
-        logger.bind(**log_context).info("HTTP request started")
+        if scope.get("query_string"):
+            log_context["query_string"] = scope["query_string"].decode("latin-1")
+
+        request_tee: Optional[_BodyTee] = None
+        if sampled:
+            content_type = request.headers.get("content-type", "")
+            if _should_log_body(url_path, content_type):
+                request_tee = _BodyTee(content_type)
+
+            # Detectar usuario autenticado
+            user_info = self._get_user_info(request)
+            if user_info:
+                log_context["authenticated_user"] = user_info
+
+            # Log de request iniciado
+            logger.bind(**log_context).info("HTTP request started")
+
+        status_code = 500
+        duration_ms = 0.0
+        response_tee: Optional[_BodyTee] = None
+
+        async def receive_with_tee() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                request_tee.feed(message.get("body", b""))
+            return message
+
+        async def send_with_tee(message: Message) -> None:
+            nonlocal status_code, duration_ms, response_tee
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                duration_ms = round((time.monotonic() - start_time) * 1000, 2)
+
+                # Agregar header con tiempo de procesamiento
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(duration_ms))
+
+                content_type = headers.get("content-type", "")
+                if sampled and _should_log_body("", content_type):
+                    response_tee = _BodyTee(content_type)
+            elif message["type"] == "http.response.body" and response_tee is not None:
+                response_tee.feed(message.get("body", b""))
+            await send(message)
 
         try:
             # Procesar request a través de la cadena
-            # Procesar request y capturar response con body
-            original_response = await call_next(request)
-            response, response_body = await _capture_response_body(original_response)
-
-            # Calcular tiempo de procesamiento
-            process_time = time.monotonic() - start_time
-            duration_ms = round(process_time * 1000, 2)
-
-            # Contexto extendido para response
-            response_context = {
-                **log_context,
-                "status_code": response.status_code,
-                "duration_ms": duration_ms,
-                "response_body": response_body,
-            }
-
-            # Log de request completado exitosamente
-            logger.bind(**response_context).info(
-                "HTTP request completed successfully"
-            )
-
-            # Agregar header con tiempo de procesamiento
-            response.headers["X-Process-Time"] = str(duration_ms)
-
-            return response
-
+            await self.app(scope, receive_with_tee if request_tee else receive, send_with_tee)
         except Exception as exc:
-            # Calcular tiempo hasta el error
-            process_time = time.monotonic() - start_time
-            duration_ms = round(process_time * 1000, 2)
-
             # Contexto para logging de error
             error_context = {
                 **log_context,
-                "duration_ms": duration_ms,
+                "duration_ms": round((time.monotonic() - start_time) * 1000, 2),
                 "exception_type": type(exc).__name__,
                 "exception_message": str(exc),
             }
+            if request_tee is not None:
+                error_context["request_body"] = request_tee.parse()
 
             # Log detallado del error
             logger.bind(**error_context).error(
@@ -262,6 +292,26 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             # Re-lanzar excepción para que sea manejada por FastAPI
             raise
 
+        # La respuesta ya salió: el trabajo de logging no suma latencia al cliente
+        if not sampled and status_code < 500:
+            return
+
+        # Contexto extendido para response
+        response_context = {
+            **log_context,
+            "status_code": status_code,
+            "duration_ms": duration_ms,
+        }
+        if request_tee is not None:
+            response_context["request_body"] = request_tee.parse()
+        if response_tee is not None:
+            response_context["response_body"] = response_tee.parse()
+
+        # Log de request completado
+        logger.bind(**response_context).info(
+            "HTTP request completed successfully"
+        )
+
     def _get_client_ip(self, request: Request) -> str:
         """
         Obtiene la IP real del cliente, considerando proxies.
@@ -13,6 +13,10 @@ Características principales:
 - Métricas de pool de conexiones
 - Alertas automáticas para degradación de performance
 - Integración con Query Analyzer para análisis profundo
+
+Las latencias van al núcleo de métricas del proceso (app.core.metrics) por
+route template, método y status: las estadísticas incluyen p50/p95/p99 y se
+fusionan entre workers.
 """
 
 import time
@@ -22,27 +26,30 @@ from contextlib import asynccontextmanager
 
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from loguru import logger
 
+from app.core.metrics import Histogram, MetricsRegistry, metrics, route_template
+from app.middleware.asgi import ASGIMiddleware
 from app.utils.query_analyzer import query_analyzer
 from app.database import engine
 
 
-class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
+class PerformanceMonitorMiddleware(ASGIMiddleware):
     """Middleware para monitoreo de performance en tiempo real."""
 
-    def __init__(self, app, slow_endpoint_threshold: float = 1.0):
+    def __init__(self, app, slow_endpoint_threshold: float = 1.0, registry: Optional[MetricsRegistry] = None):
         """
         Inicializar middleware de performance.
 
         Args:
             app: Aplicación FastAPI
             slow_endpoint_threshold: Tiempo en segundos para considerar endpoint lento
+            registry: Registro de métricas (por defecto el global del proceso)
         """
         super().__init__(app)
         self.slow_threshold = slow_endpoint_threshold
-        self.endpoint_stats: Dict[str, list] = {}
+        self.registry = registry or metrics
         self.critical_endpoints = {
             '/api/v1/auth/login',
             '/api/v1/auth/register', 
@@ -53,84 +60,88 @@ class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
             '/api/v1/users/'
         }
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        """Procesar request con monitoring de performance."""
-        start_time = time.time()
-        endpoint = f"{request.method} {request.url.path}"
-
-        # Obtener métricas del pool antes del request
-        pool_stats_before = self._get_pool_stats()
-
-        try:
-            # Ejecutar request
-            response = await call_next(request)
-
-            # Calcular tiempo de respuesta
-            process_time = time.time() - start_time
-
-            # Obtener métricas del pool después del request
-            pool_stats_after = self._get_pool_stats()
-
-            # Crear métricas del request
-            request_metrics = {
-                'endpoint': endpoint,
-                'method': request.method,
-                'path': request.url.path,
-                'process_time': process_time,
-                'status_code': response.status_code,
-                'timestamp': time.time(),
-                'pool_before': pool_stats_before,
-                'pool_after': pool_stats_after,
-                'is_critical': self._is_critical_endpoint(request.url.path),
-                'is_slow': process_time > self.slow_threshold
-            }
-
-            # Registrar métricas
-            await self._record_metrics(request_metrics)
+    async def before_request(self, request: Request) -> Optional[Response]:
+        """Obtener métricas del pool antes del request."""
+        request.state.pool_stats_before = self._get_pool_stats()
+        return None
+
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        """Agregar headers de performance al iniciar la respuesta."""
+        pool_stats_after = self._get_pool_stats()
+        request.state.pool_stats_after = pool_stats_after
+
+        headers['X-Process-Time'] = str(elapsed)
+        headers['X-Pool-Active'] = str(pool_stats_after.get('active', 0))
+
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        """Registrar métricas cuando la respuesta ya fue enviada."""
+        if getattr(request.state, 'performance_error_recorded', False):
+            return
+
+        route = route_template(request.scope)
+        endpoint = f"{request.method} {route}"
+
+        # Crear métricas del request
+        request_metrics = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.url.path,
+            'route': route,
+            'process_time': elapsed,
+            'status_code': status_code,
+            'timestamp': time.time(),
+            'recorded': self._mark_recorded(request),
+            'pool_before': request.state.pool_stats_before,
+            'pool_after': getattr(request.state, 'pool_stats_after', None) or self._get_pool_stats(),
+            'is_critical': self._is_critical_endpoint(request.url.path),
+            'is_slow': elapsed > self.slow_threshold
+        }
 
-            # Agregar headers de performance
-            response.headers['X-Process-Time'] = str(process_time)
-            response.headers['X-Pool-Active'] = str(pool_stats_after.get('active', 0))
+        # Registrar métricas
+        await self._record_metrics(request_metrics)
 
-            # Log si es endpoint lento
-            if request_metrics['is_slow']:
-                logger.warning(
-                    f"Slow endpoint detected: {endpoint} - {process_time:.3f}s"
-                )
+        # Log si es endpoint lento
+        if request_metrics['is_slow']:
+            logger.warning(
+                f"Slow endpoint detected: {endpoint} - {elapsed:.3f}s"
+            )
 
-                # Si es endpoint crítico y muy lento, hacer análisis profundo
-                if request_metrics['is_critical'] and process_time > 2.0:
-                    asyncio.create_task(self._analyze_slow_endpoint(request, process_time))
+            # Si es endpoint crítico y muy lento, hacer análisis profundo
+            if request_metrics['is_critical'] and elapsed > 2.0:
+                asyncio.create_task(self._analyze_slow_endpoint(request, elapsed))
 
-            return response
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        route = route_template(request.scope)
+        endpoint = f"{request.method} {route}"
 
-        except Exception as e:
-            process_time = time.time() - start_time
-
-            # Log error con contexto de performance
-            logger.error(
-                f"Endpoint error: {endpoint} - {process_time:.3f}s - Error: {str(e)}"
-            )
+        # Log error con contexto de performance
+        logger.error(
+            f"Endpoint error: {endpoint} - {elapsed:.3f}s - Error: {str(exc)}"
+        )
 
-            # Registrar error en métricas
-            error_metrics = {
-                'endpoint': endpoint,
-                'method': request.method,
-                'path': request.url.path,
-                'process_time': process_time,
-                'status_code': 500,
-                'timestamp': time.time(),
-                'error': str(e),
-                'is_critical': self._is_critical_endpoint(request.url.path)
-            }
+        # Registrar error en métricas
+        error_metrics = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.url.path,
+            'route': route,
+            'process_time': elapsed,
+            'status_code': 500,
+            'timestamp': time.time(),
+            'recorded': self._mark_recorded(request),
+            'error': str(exc),
+            'pool_after': self._get_pool_stats(),
+            'is_critical': self._is_critical_endpoint(request.url.path)
+        }
 
-            await self._record_metrics(error_metrics)
+        await self._record_metrics(error_metrics)
+        request.state.performance_error_recorded = True
 
-            # Retornar error response
-            return JSONResponse(
-                status_code=500,
-                content={'detail': 'Internal server error', 'process_time': process_time}
-            )
+        # Retornar error response
+        return JSONResponse(
+            status_code=500,
+            content={'detail': 'Internal server error', 'process_time': elapsed}
+        )
 
     def _get_pool_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas actuales del pool de conexiones."""
@@ -152,19 +163,32 @@ class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
         """Verificar si el endpoint es crítico."""
         return any(critical in path for critical in self.critical_endpoints)
 
+    @staticmethod
+    def _mark_recorded(request: Request) -> bool:
+        """Marcar el request como medido; True si otra capa ya lo registró"""
+        recorded = getattr(request.state, 'metrics_recorded', False)
+        request.state.metrics_recorded = True
+        return recorded
+
+    @property
+    def endpoint_stats(self) -> Dict[str, Histogram]:
+        """Histograma de latencia por endpoint ("METHOD /route/{template}")"""
+        return {
+            f"{dict(labels)['method']} {dict(labels)['route']}": histogram
+            for labels, histogram in self.registry.collect().select("http_request_duration_seconds").items()
+        }
+
     async def _record_metrics(self, metrics: Dict[str, Any]):
         """Registrar métricas del endpoint."""
         endpoint = metrics['endpoint']
 
-        # Inicializar lista si no existe
-        if endpoint not in self.endpoint_stats:
-            self.endpoint_stats[endpoint] = []
-
-        # Agregar métricas
-        self.endpoint_stats[endpoint].append(metrics)
-
-        # Mantener solo últimas 100 ejecuciones por endpoint
-        self.endpoint_stats[endpoint] = self.endpoint_stats[endpoint][-100:]
+        # Registrar en el núcleo de métricas (salvo que otra capa ya lo hiciera)
+        if not metrics.get('recorded'):
+            method, _, path = endpoint.partition(' ')
+            self.registry.record_request(
+                metrics.get('route', path), metrics.get('method', method),
+                metrics['status_code'], metrics['process_time']
+            )
 
         # Log métricas críticas
         if metrics['is_critical']:
@@ -249,45 +273,57 @@ class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
 
     def get_endpoint_statistics(self, endpoint: Optional[str] = None) -> Dict[str, Any]:
         """Obtener estadísticas de endpoints monitoreados."""
+        snapshot = self.registry.collect()
+        histograms = {
+            f"{dict(labels)['method']} {dict(labels)['route']}": histogram
+            for labels, histogram in snapshot.select("http_request_duration_seconds").items()
+        }
+        statuses: Dict[str, list] = {}
+        for labels, count in snapshot.select("http_requests_total", "counters").items():
+            key = f"{dict(labels)['method']} {dict(labels)['route']}"
+            statuses.setdefault(key, []).append((int(dict(labels)['status']), count))
+
+        def success_rate(status_counts: list) -> float:
+            total = sum(count for _, count in status_counts)
+            return sum(count for code, count in status_counts if 200 <= code < 300) / total if total else 0
+
         if endpoint:
-            stats = self.endpoint_stats.get(endpoint, [])
-            if not stats:
+            histogram = histograms.get(endpoint)
+            if not histogram or not histogram.count:
                 return {'endpoint': endpoint, 'error': 'No data available'}
 
-            times = [s['process_time'] for s in stats]
-            status_codes = [s['status_code'] for s in stats]
-
             return {
                 'endpoint': endpoint,
-                'total_requests': len(stats),
-                'avg_response_time': sum(times) / len(times),
-                'min_response_time': min(times),
-                'max_response_time': max(times),
-                'success_rate': len([s for s in status_codes if 200 <= s < 300]) / len(status_codes),
-                'slow_requests': len([t for t in times if t > self.slow_threshold]),
-                'last_request': stats[-1]['timestamp'] if stats else None
+                'total_requests': histogram.count,
+                'avg_response_time': histogram.mean,
+                'min_response_time': histogram.min,
+                'max_response_time': histogram.max,
+                'p50_response_time': histogram.percentile(0.50),
+                'p95_response_time': histogram.percentile(0.95),
+                'p99_response_time': histogram.percentile(0.99),
+                'success_rate': success_rate(statuses.get(endpoint, [])),
+                'slow_requests': histogram.count_above(self.slow_threshold),
+                'last_request': histogram.updated_at
             }
 
         # Estadísticas generales
-        total_requests = sum(len(stats) for stats in self.endpoint_stats.values())
-        all_times = []
-        all_statuses = []
-
-        for stats in self.endpoint_stats.values():
-            all_times.extend([s['process_time'] for s in stats])
-            all_statuses.extend([s['status_code'] for s in stats])
+        overall = Histogram()
+        for histogram in histograms.values():
+            overall.merge(histogram)
 
         critical_endpoints_stats = {}
-        for endpoint in self.endpoint_stats:
-            if any(critical in endpoint for critical in self.critical_endpoints):
-                critical_endpoints_stats[endpoint] = self.get_endpoint_statistics(endpoint)
+        for name in histograms:
+            if any(critical in name for critical in self.critical_endpoints):
+                critical_endpoints_stats[name] = self.get_endpoint_statistics(name)
 
         return {
-            'total_endpoints_monitored': len(self.endpoint_stats),
-            'total_requests': total_requests,
-            'overall_avg_response_time': sum(all_times) / len(all_times) if all_times else 0,
-            'overall_success_rate': len([s for s in all_statuses if 200 <= s < 300]) / len(all_statuses) if all_statuses else 0,
-            'slow_requests_total': len([t for t in all_times if t > self.slow_threshold]),
+            'total_endpoints_monitored': len(histograms),
+            'total_requests': overall.count,
+            'overall_avg_response_time': overall.mean,
+            'overall_p95_response_time': overall.percentile(0.95),
+            'overall_p99_response_time': overall.percentile(0.99),
+            'overall_success_rate': success_rate([pair for pairs in statuses.values() for pair in pairs]),
+            'slow_requests_total': sum(h.count_above(self.slow_threshold) for h in histograms.values()),
             'critical_endpoints': critical_endpoints_stats,
             'pool_current_stats': self._get_pool_stats()
         }
@@ -356,11 +392,9 @@ class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
 
         # Analizar endpoints lentos
         slow_endpoints = []
-        for endpoint, stats in self.endpoint_stats.items():
-            if stats:
-                avg_time = sum(s['process_time'] for s in stats) / len(stats)
-                if avg_time > self.slow_threshold:
-                    slow_endpoints.append((endpoint, avg_time))
+        for endpoint, histogram in self.endpoint_stats.items():
+            if histogram.count and histogram.mean > self.slow_threshold:
+                slow_endpoints.append((endpoint, histogram.mean))
 
         if slow_endpoints:
             recommendations.append(f'Found {len(slow_endpoints)} slow endpoints requiring optimization')
@@ -47,17 +47,24 @@ from typing import Any, Dict, List, Optional
 
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.responses import Response as StarletteResponse
 
+from app.core.metrics import record_http_request
+from app.middleware.asgi import ASGIMiddleware, carry_headers
 from app.services.cache_service import cache_service
-from app.services.performance_monitoring_service import performance_monitoring_service
 
 logger = logging.getLogger(__name__)
 
 
-class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
-    """Performance optimization middleware for API responses"""
+class PerformanceOptimizationMiddleware(ASGIMiddleware):
+    """
+    Performance optimization middleware for API responses.
+
+    Only cacheable GET responses (JSON, 200) are buffered to be optimized,
+    tagged and cached; everything else streams through with the
+    performance headers added.
+    """
 
     def __init__(self, app, config: Optional[Dict[str, Any]] = None):
         super().__init__(app)
@@ -94,38 +101,38 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
             "/api/v1/admin"
         ])
 
-    async def dispatch(self, request: Request, call_next):
-        """Main middleware dispatch method"""
-        start_time = time.time()
-
+    async def before_request(self, request: Request) -> Optional[Response]:
         # Check if request is cacheable
-        is_cacheable = self._is_request_cacheable(request)
+        request.state.is_cacheable = self._is_request_cacheable(request)
 
         # Try to serve from cache if applicable
-        if is_cacheable and self.enable_response_caching:
-            cached_response = await self._get_cached_response(request)
-            if cached_response:
-                return cached_response
-
-        # Performance monitoring context
-        endpoint = request.url.path
-        method = request.method
-        user_id = getattr(request.state, "user_id", None)
+        if request.state.is_cacheable and self.enable_response_caching:
+            return await self._get_cached_response(request)
+        return None
 
-        if self.enable_performance_monitoring:
-            async with performance_monitoring_service.track_endpoint_performance(
-                endpoint=endpoint,
-                method=method,
-                user_id=user_id
-            ) as request_id:
-                response = await call_next(request)
-        else:
-            response = await call_next(request)
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        # Add performance headers
+        headers["x-response-time"] = f"{elapsed * 1000:.2f}ms"
+        headers["x-powered-by"] = "MeStore-PerformanceOptimized"
 
-        # Post-process response
-        response = await self._optimize_response(request, response, start_time, is_cacheable)
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        # Latencia en el núcleo de métricas (una vez por request aunque haya otra capa que mida)
+        if self.enable_performance_monitoring:
+            record_http_request(request, status_code, elapsed)
+
+    def should_buffer(self, request: Request, status_code: int, headers: MutableHeaders) -> bool:
+        # Only optimize successful, cacheable JSON responses
+        return (
+            status_code == 200
+            and request.state.is_cacheable
+            and headers.get("content-type", "").startswith("application/json")
+            and "content-encoding" not in headers
+        )
 
-        return response
+    async def rewrite_response(
+        self, request: Request, status_code: int, headers: MutableHeaders, body: bytes
+    ) -> Optional[Response]:
+        return await self._optimize_response(request, headers, body)
 
     def _is_request_cacheable(self, request: Request) -> bool:
         """Determine if request is cacheable"""
@@ -187,40 +194,19 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
 
         return None
 
-    async def _optimize_response(self, request: Request, response: StarletteResponse,
-                                start_time: float, is_cacheable: bool) -> StarletteResponse:
-        """Optimize response with compression, caching, and headers"""
+    async def _optimize_response(self, request: Request, headers: MutableHeaders,
+                                 response_body: bytes) -> Optional[StarletteResponse]:
+        """Optimize a buffered response with compression, caching, and headers"""
         try:
-            # Calculate response time
-            response_time = (time.time() - start_time) * 1000
-
-            # Add performance headers
-            response.headers["x-response-time"] = f"{response_time:.2f}ms"
-            response.headers["x-powered-by"] = "MeStore-PerformanceOptimized"
-
-            # Only optimize successful responses
-            if response.status_code != 200:
-                return response
-
-            # Get response body
-            response_body = None
-            if hasattr(response, 'body'):
-                response_body = response.body
-            elif hasattr(response, 'content'):
-                response_body = response.content
-
             if not response_body:
-                return response
+                return None
 
             # Parse JSON response for optimization
             try:
-                if isinstance(response_body, bytes):
-                    content = json.loads(response_body.decode('utf-8'))
-                else:
-                    content = json.loads(response_body)
+                content = json.loads(response_body)
             except (json.JSONDecodeError, UnicodeDecodeError):
                 # Not JSON, skip optimization
-                return response
+                return None
 
             # Optimize response content
             optimized_content = await self._optimize_response_content(content)
@@ -229,19 +215,19 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
             etag = None
             if self.enable_etag:
                 etag = self._generate_etag(optimized_content)
-                response.headers["etag"] = etag
 
             # Cache response if applicable
-            if is_cacheable and self.enable_response_caching:
-                await self._cache_response(request, optimized_content, etag, response.headers)
+            if self.enable_response_caching:
+                await self._cache_response(request, optimized_content, etag, headers)
 
             # Compress response if beneficial
             if self.enable_compression:
-                response = await self._compress_response(request, optimized_content, response)
+                response = await self._compress_response(request, optimized_content, headers)
             else:
-                # Update response body
-                optimized_body = json.dumps(optimized_content, separators=(',', ':'))
-                response = JSONResponse(content=optimized_content)
+                response = carry_headers(JSONResponse(content=optimized_content), headers)
+
+            if etag:
+                response.headers["etag"] = etag
 
             # Add cache control headers
             self._add_cache_control_headers(request, response)
@@ -250,7 +236,7 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
 
         except Exception as e:
             logger.error(f"Error optimizing response: {e}")
-            return response
+            return None
 
     async def _optimize_response_content(self, content: Any) -> Any:
         """Optimize response content structure"""
@@ -272,7 +258,7 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
         return content
 
     async def _compress_response(self, request: Request, content: Any,
-                                original_response: StarletteResponse) -> StarletteResponse:
+                                 original_headers: MutableHeaders) -> StarletteResponse:
         """Compress response if beneficial"""
         try:
             # Serialize content
@@ -281,7 +267,7 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
 
             # Check if compression is beneficial
             if len(content_bytes) < self.compression_threshold:
-                return JSONResponse(content=content)
+                return carry_headers(JSONResponse(content=content), original_headers)
 
             # Check client support for compression
             accept_encoding = request.headers.get("accept-encoding", "")
@@ -292,27 +278,20 @@ class PerformanceOptimizationMiddleware(BaseHTTPMiddleware):
 
                 # Only use compression if it reduces size significantly
                 if len(compressed_content) < len(content_bytes) * 0.9:
-                    response = Response(
-                        content=compressed_content,
-                        media_type="application/json"
+                    response = carry_headers(
+                        Response(content=compressed_content, media_type="application/json"),
+                        original_headers
                     )
                     response.headers["content-encoding"] = "gzip"
-                    response.headers["content-length"] = str(len(compressed_content))
                     response.headers["vary"] = "Accept-Encoding"
-
-                    # Copy original headers
-                    for key, value in original_response.headers.items():
-                        if key.lower() not in ["content-encoding", "content-length"]:
-                            response.headers[key] = value
-
                     return response
 
             # Return uncompressed if compression not beneficial
-            return JSONResponse(content=content)
+            return carry_headers(JSONResponse(content=content), original_headers)
 
         except Exception as e:
             logger.error(f"Error compressing response: {e}")
-            return JSONResponse(content=content)
+            return carry_headers(JSONResponse(content=content), original_headers)
 
     def _generate_cache_key(self, request: Request) -> str:
         """Generate cache key for request"""
@@ -13,7 +13,7 @@
 # Propósito: Rate limiting middleware for API protection
 #
 # Características:
-# - Token bucket algorithm implementation
+# - GCRA via the shared rate limit engine (EVALSHA, one Redis call)
 # - User-based and IP-based rate limiting
 # - Redis backend for distributed rate limiting
 # - Different limits for different endpoints
@@ -25,28 +25,34 @@
 Rate limiting middleware for FastAPI.
 
 This module provides:
-- Token bucket rate limiting implementation
+- GCRA rate limiting through app.core.rate_limit_engine
 - User-based and IP-based rate limiting
 - Redis-backed distributed rate limiting
 - Configurable rate limits per endpoint type
 - Graceful handling of rate limit exceeded
 """
 
-import asyncio
 import json
+import math
 import time
-from typing import Dict, Optional
+from typing import Optional
 
 import redis.asyncio as redis
 from fastapi import HTTPException, Request, Response, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 
 from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.rate_limit_engine import RateLimitEngine, RateLimitRule
+from app.core.redis.base import get_redis_client
+from app.middleware.asgi import ASGIMiddleware
 
+logger = get_logger(__name__)
 
-class RateLimitingMiddleware(BaseHTTPMiddleware):
+
+class RateLimitingMiddleware(ASGIMiddleware):
     """
-    Rate limiting middleware using token bucket algorithm.
+    Rate limiting middleware using the shared GCRA engine.
 
     Features:
     - Per-user and per-IP rate limiting
@@ -58,6 +64,8 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, redis_client: Optional[redis.Redis] = None):
         super().__init__(app)
         self.redis_client = redis_client
+        # Sin cliente explícito se toma el Redis async compartido en la primera petición
+        self.engine: Optional[RateLimitEngine] = RateLimitEngine(redis_client) if redis_client else None
 
         # Default rate limits (requests per minute)
         self.default_limits = {
@@ -80,12 +88,12 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
             "/api/v1/products/*/images": "upload",
         }
 
-    async def dispatch(self, request: Request, call_next):
-        """Process request with rate limiting."""
+    async def before_request(self, request: Request) -> Optional[Response]:
+        """Check the rate limit before the request reaches the app."""
         try:
             # Skip rate limiting for health checks and internal endpoints
             if self._should_skip_rate_limiting(request):
-                return await call_next(request)
+                return None
 
             # Get rate limit key and limit
             rate_limit_key, rate_limit = await self._get_rate_limit_info(request)
@@ -99,18 +107,19 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
                 # Rate limit exceeded
                 return self._create_rate_limit_response(remaining, reset_time)
 
-            # Process request
-            response = await call_next(request)
-
-            # Add rate limit headers to response
-            self._add_rate_limit_headers(response, remaining, reset_time, rate_limit)
-
-            return response
+            request.state.rate_limit_headers = (remaining, reset_time, rate_limit)
 
         except Exception as e:
             # Log error but don't block request
-            print(f"Rate limiting error: {e}")
-            return await call_next(request)
+            logger.error(f"Rate limiting error: {e}")
+
+        return None
+
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        rate_limit_headers = getattr(request.state, "rate_limit_headers", None)
+        if rate_limit_headers:
+            # Add rate limit headers to response
+            self._add_rate_limit_headers(headers, *rate_limit_headers)
 
     def _should_skip_rate_limiting(self, request: Request) -> bool:
         """Check if request should skip rate limiting."""
@@ -218,105 +227,33 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
         key: str,
         limit: int
     ) -> tuple[bool, int, int]:
-        """Check rate limit using token bucket algorithm."""
+        """Check rate limit using the shared GCRA engine (Redis or in-memory)."""
         current_time = int(time.time())
-
-        if self.redis_client:
-            # Redis-backed rate limiting
-            return await self._check_rate_limit_redis(key, limit, current_time)
-        else:
-            # In-memory rate limiting (for development)
-            return await self._check_rate_limit_memory(key, limit, current_time)
-
-    async def _check_rate_limit_redis(
-        self,
-        key: str,
-        limit: int,
-        current_time: int
-    ) -> tuple[bool, int, int]:
-        """Redis-backed rate limiting."""
         try:
-            # Lua script for atomic rate limiting check
-            lua_script = """
-            local key = KEYS[1]
-            local limit = tonumber(ARGV[1])
-            local window = tonumber(ARGV[2])
-            local current_time = tonumber(ARGV[3])
-
-            local bucket = redis.call('HMGET', key, 'tokens', 'last_refill')
-            local tokens = tonumber(bucket[1]) or limit
-            local last_refill = tonumber(bucket[2]) or current_time
-
-            -- Calculate tokens to add based on time passed
-            local time_passed = current_time - last_refill
-            local tokens_to_add = math.floor(time_passed * limit / window)
-            tokens = math.min(limit, tokens + tokens_to_add)
-
-            if tokens >= 1 then
-                tokens = tokens - 1
-                redis.call('HMSET', key, 'tokens', tokens, 'last_refill', current_time)
-                redis.call('EXPIRE', key, window)
-                return {1, tokens, current_time + window}
-            else
-                redis.call('HMSET', key, 'tokens', tokens, 'last_refill', current_time)
-                redis.call('EXPIRE', key, window)
-                return {0, tokens, current_time + window}
-            end
-            """
-
-            result = await self.redis_client.eval(
-                lua_script,
-                1,
-                key,
-                limit,
-                self.time_window,
-                current_time
-            )
-
-            is_allowed = bool(result[0])
-            remaining = int(result[1])
-            reset_time = int(result[2])
-
-            return is_allowed, remaining, reset_time
-
+            engine = await self._get_engine()
+            decision = await engine.check([
+                RateLimitRule(key=f"gcra:{key}", limit=limit, period_seconds=self.time_window)
+            ])
         except Exception as e:
-            print(f"Redis rate limiting error: {e}")
+            logger.error(f"Redis rate limiting error: {e}")
             # Fallback to allowing request
             return True, limit, current_time + self.time_window
 
-    _memory_store: Dict[str, Dict] = {}
+        if not decision.allowed:
+            return False, 0, current_time + max(1, math.ceil(decision.retry_after))
+        return True, decision.remaining, current_time + math.ceil(decision.reset_after)
 
-    async def _check_rate_limit_memory(
-        self,
-        key: str,
-        limit: int,
-        current_time: int
-    ) -> tuple[bool, int, int]:
-        """In-memory rate limiting for development."""
-        if key not in self._memory_store:
-            self._memory_store[key] = {
-                "tokens": limit,
-                "last_refill": current_time
-            }
-
-        bucket = self._memory_store[key]
-        tokens = bucket["tokens"]
-        last_refill = bucket["last_refill"]
-
-        # Calculate tokens to add
-        time_passed = current_time - last_refill
-        tokens_to_add = (time_passed * limit) // self.time_window
-        tokens = min(limit, tokens + tokens_to_add)
-
-        if tokens >= 1:
-            tokens -= 1
-            bucket["tokens"] = tokens
-            bucket["last_refill"] = current_time
-            return True, tokens, current_time + self.time_window
-        else:
-            bucket["tokens"] = tokens
-            bucket["last_refill"] = current_time
-            return False, tokens, current_time + self.time_window
+    async def _get_engine(self) -> RateLimitEngine:
+        """Engine over the shared async Redis client (in-memory backend in tests or without Redis)."""
+        if self.engine is None:
+            redis_client = None
+            if not settings.TESTING:
+                try:
+                    redis_client = await get_redis_client()
+                except Exception as e:
+                    logger.warning(f"Redis unavailable for rate limiting, using in-memory limits: {e}")
+            self.engine = RateLimitEngine(redis_client)
+        return self.engine
 
     def _create_rate_limit_response(self, remaining: int, reset_time: int) -> Response:
         """Create rate limit exceeded response."""
@@ -344,15 +281,15 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
 
     def _add_rate_limit_headers(
         self,
-        response: Response,
+        headers: MutableHeaders,
         remaining: int,
         reset_time: int,
         limit: int
     ):
-        """Add rate limit headers to response."""
-        response.headers["X-RateLimit-Limit"] = str(limit)
-        response.headers["X-RateLimit-Remaining"] = str(remaining)
-        response.headers["X-RateLimit-Reset"] = str(reset_time)
+        """Add rate limit headers to the response start message."""
+        headers["X-RateLimit-Limit"] = str(limit)
+        headers["X-RateLimit-Remaining"] = str(remaining)
+        headers["X-RateLimit-Reset"] = str(reset_time)
 
 
 # Utility function to create middleware with Redis
@@ -366,7 +303,7 @@ async def create_rate_limiting_middleware(app, redis_url: Optional[str] = None):
             # Test connection
             await redis_client.ping()
         except Exception as e:
-            print(f"Redis connection failed, using in-memory rate limiting: {e}")
+            logger.warning(f"Redis connection failed, using in-memory rate limiting: {e}")
             redis_client = None
 
     return RateLimitingMiddleware(app, redis_client)
\ No newline at end of file
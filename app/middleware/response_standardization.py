@@ -18,19 +18,20 @@ This middleware provides:
 
 import time
 import uuid
-from typing import Callable
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Optional
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
 from starlette.responses import Response, JSONResponse
 import json
 import logging
 
+from app.middleware.asgi import ASGIMiddleware, carry_headers
 from app.schemas.response_base import create_success_response
 
 logger = logging.getLogger(__name__)
 
 
-class ResponseStandardizationMiddleware(BaseHTTPMiddleware):
+class ResponseStandardizationMiddleware(ASGIMiddleware):
     """
     Middleware para estandarizar todas las respuestas de la API.
 
@@ -39,123 +40,92 @@ class ResponseStandardizationMiddleware(BaseHTTPMiddleware):
     - Formatea respuestas que no siguen el formato estándar
     - Tracking de tiempo de respuesta
     - Content-Type validation
+
+    Solo se bufferizan las respuestas JSON exitosas que pueden necesitar el
+    envoltorio estándar; el resto pasa en streaming.
     """
 
+    skip_paths = ("/docs", "/redoc", "/openapi.json", "/health")
+
     def __init__(self, app, api_version: str = "1.0.0"):
         super().__init__(app)
         self.api_version = api_version
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Process request and standardize response."""
-
-        # Generate request ID for tracking
-        request_id = f"req_{str(uuid.uuid4())[:8]}"
-        start_time = time.time()
-
+    async def before_request(self, request: Request) -> Optional[Response]:
         # Add request ID to request state for access in handlers
-        request.state.request_id = request_id
-
-        try:
-            # Process request
-            response = await call_next(request)
-
-            # Calculate response time
-            process_time = time.time() - start_time
-
-            # Add standard headers
-            response.headers["X-Request-ID"] = request_id
-            response.headers["X-Response-Time"] = f"{process_time:.4f}s"
-            response.headers["X-API-Version"] = self.api_version
-
-            # Only process JSON responses for standardization
-            if response.headers.get("content-type", "").startswith("application/json"):
-                response = await self._standardize_json_response(request, response)
-
-            return response
-
-        except Exception as e:
-            # If middleware processing fails, log and return original response
-            logger.error(f"Response standardization middleware error: {e}")
-            process_time = time.time() - start_time
-
-            # Create error response
-            error_response = JSONResponse(
-                status_code=500,
-                content={
-                    "status": "error",
-                    "error_code": "MIDDLEWARE_ERROR",
-                    "error_message": "Response processing failed",
-                    "timestamp": time.time(),
-                    "version": self.api_version
-                }
-            )
-            error_response.headers["X-Request-ID"] = request_id
-            error_response.headers["X-Response-Time"] = f"{process_time:.4f}s"
-            error_response.headers["X-API-Version"] = self.api_version
-
-            return error_response
+        request.state.request_id = f"req_{str(uuid.uuid4())[:8]}"
+        return None
+
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        # Add standard headers
+        headers["X-Request-ID"] = request.state.request_id
+        headers["X-Response-Time"] = f"{elapsed:.4f}s"
+        headers["X-API-Version"] = self.api_version
+
+    def should_buffer(self, request: Request, status_code: int, headers: MutableHeaders) -> bool:
+        # Only process JSON responses for standardization
+        return (
+            status_code == 200
+            and headers.get("content-type", "").startswith("application/json")
+            and "content-encoding" not in headers
+            and not request.url.path.startswith(self.skip_paths)
+        )
 
-    async def _standardize_json_response(self, request: Request, response: Response) -> Response:
+    async def rewrite_response(
+        self, request: Request, status_code: int, headers: MutableHeaders, body: bytes
+    ) -> Optional[Response]:
         """
         Standardize JSON response format if not already standardized.
 
-        Args:
-            request: The original request
-            response: The response to potentially standardize
-
-        Returns:
-            Standardized response
+        Returns None to send the original body unchanged.
         """
         try:
-            # Skip standardization for certain paths
-            skip_paths = ["/docs", "/redoc", "/openapi.json", "/health"]
-            if any(request.url.path.startswith(path) for path in skip_paths):
-                return response
-
-            # Skip if already an error response (handled by exception handlers)
-            if response.status_code >= 400:
-                return response
-
-            # Get response body
-            body = b""
-            async for chunk in response.body_iterator:
-                body += chunk
-
             if not body:
-                return response
+                return None
 
             try:
-                response_data = json.loads(body.decode())
-            except json.JSONDecodeError:
-                return response
+                response_data = json.loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return None
 
             # Check if response is already standardized
             if isinstance(response_data, dict) and "status" in response_data:
-                # Already standardized, recreate response with same content
-                return JSONResponse(
-                    content=response_data,
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
+                return None
 
             # Standardize the response
-            if response.status_code == 200:
-                standardized_data = create_success_response(
-                    data=response_data,
-                    message=self._get_success_message(request)
-                )
-
-                return JSONResponse(
-                    content=standardized_data.model_dump(),
-                    status_code=response.status_code,
-                    headers=dict(response.headers)
-                )
+            standardized_data = create_success_response(
+                data=response_data,
+                message=self._get_success_message(request)
+            )
 
-            return response
+            return carry_headers(
+                JSONResponse(content=standardized_data.model_dump(), status_code=status_code),
+                headers
+            )
 
         except Exception as e:
             logger.warning(f"Failed to standardize response: {e}")
-            return response
+            return None
+
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        # If middleware processing fails, log and return error response
+        logger.error(f"Response standardization middleware error: {exc}")
+
+        error_response = JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "error_code": "MIDDLEWARE_ERROR",
+                "error_message": "Response processing failed",
+                "timestamp": time.time(),
+                "version": self.api_version
+            }
+        )
+        error_response.headers["X-Request-ID"] = request.state.request_id
+        error_response.headers["X-Response-Time"] = f"{elapsed:.4f}s"
+        error_response.headers["X-API-Version"] = self.api_version
+
+        return error_response
 
     def _get_success_message(self, request: Request) -> str:
         """Generate appropriate success message based on request method and path."""
@@ -200,22 +170,17 @@ class ResponseStandardizationMiddleware(BaseHTTPMiddleware):
         return base_message
 
 
-class ResponseTimingMiddleware(BaseHTTPMiddleware):
+class ResponseTimingMiddleware(ASGIMiddleware):
     """
     Lightweight middleware for response timing without standardization.
     Use this when you only need timing headers without response modification.
     """
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-
-        response.headers["X-Process-Time"] = f"{process_time:.4f}s"
-        return response
+    def on_response_start(self, request: Request, status_code: int, headers: MutableHeaders, elapsed: float) -> None:
+        headers["X-Process-Time"] = f"{elapsed:.4f}s"
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware(ASGIMiddleware):
     """
     Middleware for logging requests and responses with standardized format.
     """
@@ -225,31 +190,28 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         self.log_level = getattr(logging, log_level.upper(), logging.INFO)
         self.logger = logging.getLogger("request_logger")
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        request_id = getattr(request.state, 'request_id', f"req_{str(uuid.uuid4())[:8]}")
-        start_time = time.time()
+    def _request_id(self, request: Request) -> str:
+        if not hasattr(request.state, "request_id"):
+            request.state.request_id = f"req_{str(uuid.uuid4())[:8]}"
+        return request.state.request_id
 
+    async def before_request(self, request: Request) -> Optional[Response]:
         # Log incoming request
         self.logger.log(
             self.log_level,
-            f"Request started - ID: {request_id} - Method: {request.method} - URL: {request.url}"
+            f"Request started - ID: {self._request_id(request)} - Method: {request.method} - URL: {request.url}"
         )
+        return None
 
-        try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-
-            # Log response
-            self.logger.log(
-                self.log_level,
-                f"Request completed - ID: {request_id} - Status: {response.status_code} - Time: {process_time:.4f}s"
-            )
-
-            return response
+    async def after_response(self, request: Request, status_code: int, elapsed: float) -> None:
+        # Log response
+        self.logger.log(
+            self.log_level,
+            f"Request completed - ID: {self._request_id(request)} - Status: {status_code} - Time: {elapsed:.4f}s"
+        )
 
-        except Exception as e:
-            process_time = time.time() - start_time
-            self.logger.error(
-                f"Request failed - ID: {request_id} - Error: {str(e)} - Time: {process_time:.4f}s"
-            )
-            raise
\ No newline at end of file
+    async def on_exception(self, request: Request, exc: Exception, elapsed: float) -> Optional[Response]:
+        self.logger.error(
+            f"Request failed - ID: {self._request_id(request)} - Error: {str(exc)} - Time: {elapsed:.4f}s"
+        )
+        return None
@@ -16,6 +16,7 @@
 #
 # Modificaciones:
 # 2025-07-28 - Creación inicial del modelo Transaction con campos básicos
+# 2026-10-18 - Columna integrity_hash persistida para conciliación financiera
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -247,6 +248,12 @@ class Transaction(BaseModel):
         comment="Observaciones adicionales sobre la transacción"
     )
 
+    integrity_hash = Column(
+        String(64),
+        nullable=True,
+        comment="HMAC-SHA256 de los campos financieros críticos (conciliación)"
+    )
+
     # Relationships
     comprador = relationship(
         "User",
@@ -18,6 +18,8 @@
 # - Role-based access control (RBAC) implementation
 # - Permission inheritance and delegation
 # - Security clearance level validation
+# - Conjunto efectivo de permisos compilado a bitset, cache en dos niveles
+#   (memoria + Redis) invalidado por versión en grant/revoke
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -31,10 +33,22 @@ Este servicio implementa el sistema granular de permisos administrativos:
 - Permission delegation and temporary grants
 - Audit logging for permission changes
 - Cache optimization for permission checks
+
+Permission checks are answered from each user's compiled permission set:
+every (resource, action, scope) combination has a fixed bit, and the first
+check compiles hierarchy, direct grants and inheritance into one integer
+bitset (two queries). The set is cached in process (LRU) and in Redis
+(``permission_set:<user>``), stamped with the catalog and user versions
+(``permission_version:*``). ``grant_permission``/``revoke_permission`` bump
+the user's version; other workers notice on their next revalidation, at
+most ``ADMIN_PERMISSION_LOCAL_TTL_SECONDS`` later.
 """
 
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any, Set
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import product
+from typing import Optional, List, Dict, Any, Set, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, func
 import redis
@@ -70,6 +84,74 @@ class InsufficientClearanceError(PermissionDeniedError):
     pass
 
 
+# Bit fijo por combinación (recurso, acción, alcance)
+_PERMISSION_BITS: Dict[Tuple[ResourceType, PermissionAction, PermissionScope], int] = {
+    key: bit for bit, key in enumerate(product(ResourceType, PermissionAction, PermissionScope))
+}
+
+
+class CompiledPermissions:
+    """
+    Effective permission set of one user.
+
+    ``granted`` is a bitset over ``_PERMISSION_BITS``; catalog permissions the
+    user lacks clearance for are kept apart so the check can still raise
+    ``InsufficientClearanceError``.
+    """
+
+    __slots__ = ("version", "fingerprint", "granted", "insufficient_clearance",
+                 "names", "conditions", "valid_until", "checked_at")
+
+    def __init__(
+        self,
+        version: str,
+        fingerprint: Tuple,
+        granted: int = 0,
+        insufficient_clearance: Optional[Dict[int, int]] = None,
+        names: Optional[Dict[int, str]] = None,
+        conditions: Optional[Dict[int, Dict[str, Any]]] = None,
+        valid_until: Optional[float] = None
+    ):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.granted = granted
+        self.insufficient_clearance = insufficient_clearance or {}
+        self.names = names or {}
+        self.conditions = conditions or {}
+        self.valid_until = valid_until  # Primer vencimiento de un permiso temporal
+        self.checked_at = time.time()
+
+    def allows(self, bit: int) -> bool:
+        return bool(self.granted >> bit & 1)
+
+    def is_expired(self, now: float) -> bool:
+        return self.valid_until is not None and now >= self.valid_until
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "version": self.version,
+            "fingerprint": list(self.fingerprint),
+            "granted": format(self.granted, "x"),
+            "insufficient_clearance": self.insufficient_clearance,
+            "names": self.names,
+            "conditions": self.conditions,
+            "valid_until": self.valid_until,
+        })
+
+    @classmethod
+    def from_json(cls, raw) -> "CompiledPermissions":
+        data = json.loads(raw)
+        return cls(
+            version=data["version"],
+            fingerprint=tuple(data["fingerprint"]),
+            granted=int(data["granted"], 16),
+            insufficient_clearance={int(k): v for k, v in data["insufficient_clearance"].items()},
+            names={int(k): v for k, v in data["names"].items()},
+            conditions={int(k): v for k, v in data["conditions"].items()},
+            valid_until=data["valid_until"]
+        )
+
+
 class AdminPermissionService:
     """
     Enterprise Admin Permission Management Service.
@@ -92,6 +174,11 @@ class AdminPermissionService:
             self.redis_client = None
             self.cache_ttl = 0
 
+        # Nivel 1: conjuntos compilados en memoria (LRU)
+        self._compiled: "OrderedDict[str, CompiledPermissions]" = OrderedDict()
+        self.local_cache_size = settings.ADMIN_PERMISSION_CACHE_SIZE
+        self.local_ttl = settings.ADMIN_PERMISSION_LOCAL_TTL_SECONDS
+
         # Permission hierarchy for inheritance
         self.permission_hierarchy = {
             UserType.SYSTEM: 5,
@@ -141,39 +228,33 @@ class AdminPermissionService:
         # Build permission key
         permission_key = f"{resource_type.value}.{action.value}.{scope.value}".lower()
 
-        # Check cache first
-        cached_result = await self._get_cached_permission(user.id, permission_key)
-        if cached_result is not None:
-            await self._log_permission_check(db, user, resource_type, action, scope, cached_result, "CACHED")
-            return cached_result
-
-        # Validate base requirements
+        # Validate base requirements (in memory, depends on lockout time)
         if not await self._validate_base_requirements(db, user):
-            await self._cache_permission_result(user.id, permission_key, False)
             raise PermissionDeniedError("User does not meet base security requirements")
 
-        # Get required permission
-        required_permission = await self._get_required_permission(db, resource_type, action, scope)
+        compiled, source = await self._get_compiled_permissions(db, user)
+        bit = _PERMISSION_BITS[(resource_type, action, scope)]
+
+        required_clearance = compiled.insufficient_clearance.get(bit)
+        if required_clearance is not None:
+            raise InsufficientClearanceError(
+                f"Insufficient security clearance. Required: {required_clearance}, "
+                f"User has: {user.security_clearance_level}"
+            )
 
-        if not required_permission:
-            # No specific permission required - check user type hierarchy
-            result = await self._validate_by_hierarchy(user, resource_type, action, scope)
-        else:
-            # Check specific permission
-            result = await self._validate_specific_permission(db, user, required_permission, target_user)
+        result = compiled.allows(bit)
 
-        # Additional context validation
+        # Additional context validation (per request, never cached)
         if result and additional_context:
-            result = await self._validate_additional_context(db, user, required_permission, additional_context)
-
-        # Cache result
-        await self._cache_permission_result(user.id, permission_key, result)
+            result = await self._validate_additional_context(
+                db, user, compiled.conditions.get(bit), additional_context
+            )
 
         # Log the permission check
-        await self._log_permission_check(db, user, resource_type, action, scope, result)
+        await self._log_permission_check(db, user, resource_type, action, scope, result, source)
 
         if not result:
-            permission_name = required_permission.name if required_permission else permission_key
+            permission_name = compiled.names.get(bit, permission_key)
             raise PermissionDeniedError(
                 f"Permission denied for {permission_name}",
                 required_permission=permission_name,
@@ -204,21 +285,6 @@ class AdminPermissionService:
 
         return True
 
-    async def _get_required_permission(
-        self,
-        db: Session,
-        resource_type: ResourceType,
-        action: PermissionAction,
-        scope: PermissionScope
-    ) -> Optional[AdminPermission]:
-        """Get the specific permission required for this action."""
-
-        return db.query(AdminPermission).filter(
-            AdminPermission.resource_type == resource_type,
-            AdminPermission.action == action,
-            AdminPermission.scope == scope
-        ).first()
-
     async def _validate_by_hierarchy(
         self,
         user: User,
@@ -269,41 +335,61 @@ class AdminPermissionService:
 
         return False
 
-    async def _validate_specific_permission(
-        self,
-        db: Session,
-        user: User,
-        permission: AdminPermission,
-        target_user: User = None
-    ) -> bool:
-        """Validate a specific permission against user's grants."""
-
-        # Check security clearance level
-        if user.security_clearance_level < permission.required_clearance_level:
-            raise InsufficientClearanceError(
-                f"Insufficient security clearance. Required: {permission.required_clearance_level}, "
-                f"User has: {user.security_clearance_level}"
-            )
+    async def _compile_permissions(self, db: Session, user: User, version: str) -> CompiledPermissions:
+        """
+        Compile the user's effective permission set.
 
-        # Check if user has this permission directly assigned
-        user_permission = db.query(admin_user_permissions).filter(
+        Two queries (catalog and active direct grants); every combination
+        without a catalog permission is decided by the user type hierarchy.
+        """
+        catalog: Dict[Tuple, AdminPermission] = {}
+        for permission in db.query(AdminPermission).all():
+            catalog.setdefault((permission.resource_type, permission.action, permission.scope), permission)
+
+        now = datetime.utcnow()
+        grants = db.query(
+            admin_user_permissions.c.permission_id,
+            admin_user_permissions.c.expires_at
+        ).filter(
             admin_user_permissions.c.user_id == user.id,
-            admin_user_permissions.c.permission_id == permission.id,
             admin_user_permissions.c.is_active == True,
             or_(
                 admin_user_permissions.c.expires_at == None,
-                admin_user_permissions.c.expires_at > datetime.utcnow()
+                admin_user_permissions.c.expires_at > now
             )
-        ).first()
-
-        if user_permission:
-            return True
-
-        # Check role-based inheritance
-        if permission.is_inheritable:
-            return await self._check_inherited_permissions(db, user, permission)
+        ).all()
+        direct_ids = {permission_id for permission_id, _ in grants}
+        expirations = [
+            (expires_at if expires_at.tzinfo else expires_at.replace(tzinfo=timezone.utc)).timestamp()
+            for _, expires_at in grants if expires_at
+        ]
+
+        compiled = CompiledPermissions(
+            version=version,
+            fingerprint=self._user_fingerprint(user),
+            valid_until=min(expirations) if expirations else None
+        )
+        for key, bit in _PERMISSION_BITS.items():
+            permission = catalog.get(key)
+            if permission is None:
+                # No specific permission required - check user type hierarchy
+                allowed = await self._validate_by_hierarchy(user, *key)
+            else:
+                compiled.names[bit] = permission.name
+                if permission.conditions:
+                    compiled.conditions[bit] = permission.conditions
+                if user.security_clearance_level < permission.required_clearance_level:
+                    compiled.insufficient_clearance[bit] = permission.required_clearance_level
+                    continue
+                # Direct grant, or role-based inheritance
+                allowed = permission.id in direct_ids or (
+                    permission.is_inheritable
+                    and await self._check_inherited_permissions(db, user, permission)
+                )
+            if allowed:
+                compiled.granted |= 1 << bit
 
-        return False
+        return compiled
 
     async def _check_inherited_permissions(
         self,
@@ -357,16 +443,14 @@ class AdminPermissionService:
         self,
         db: Session,
         user: User,
-        permission: AdminPermission,
+        conditions: Optional[Dict[str, Any]],
         context: Dict[str, Any]
     ) -> bool:
-        """Validate additional context-specific requirements."""
+        """Validate additional context-specific requirements of a permission."""
 
-        if not permission or not permission.conditions:
+        if not conditions:
             return True
 
-        conditions = permission.conditions
-
         # Time-based restrictions
         if 'allowed_hours' in conditions:
             current_hour = datetime.utcnow().hour
@@ -428,9 +512,6 @@ class AdminPermissionService:
             )
         )
 
-        # Clear cache for this user
-        await self._clear_user_permission_cache(target_user.id)
-
         # Log the permission grant
         await self._log_admin_activity(
             db, granter, AdminActionType.SECURITY, "grant_permission",
@@ -439,6 +520,9 @@ class AdminPermissionService:
         )
 
         db.commit()
+
+        # Nueva versión tras el commit: ningún worker recompila con el estado anterior
+        await self._clear_user_permission_cache(target_user.id)
         return True
 
     async def revoke_permission(
@@ -466,9 +550,6 @@ class AdminPermissionService:
             .values(is_active=False)
         )
 
-        # Clear cache for this user
-        await self._clear_user_permission_cache(target_user.id)
-
         # Log the permission revocation
         await self._log_admin_activity(
             db, revoker, AdminActionType.SECURITY, "revoke_permission",
@@ -477,6 +558,9 @@ class AdminPermissionService:
         )
 
         db.commit()
+
+        # Nueva versión tras el commit: ningún worker recompila con el estado anterior
+        await self._clear_user_permission_cache(target_user.id)
         return True
 
     async def get_user_permissions(
@@ -640,49 +724,112 @@ class AdminPermissionService:
 
     # === CACHING METHODS ===
 
-    async def _get_cached_permission(self, user_id: str, permission_key: str) -> Optional[bool]:
-        """Get cached permission result with performance optimization."""
+    @staticmethod
+    def _user_fingerprint(user: User) -> Tuple:
+        """User attributes the compiled set depends on; a change forces recompilation"""
+        user_type = getattr(user.user_type, "value", user.user_type)
+        return (user_type, user.security_clearance_level, user.department_id)
+
+    async def _get_compiled_permissions(self, db: Session, user: User) -> Tuple[CompiledPermissions, str]:
+        """
+        Compiled permission set for ``user`` and where it came from.
+
+        Memory first (revalidated against the Redis version every
+        ``local_ttl`` seconds), then Redis, then compilation.
+        """
+        user_id = str(user.id)
+        now = time.time()
+        fingerprint = self._user_fingerprint(user)
+
+        compiled = self._compiled.get(user_id)
+        if compiled is not None and (compiled.fingerprint != fingerprint or compiled.is_expired(now)):
+            compiled = None
+        if compiled is not None and now - compiled.checked_at < self.local_ttl:
+            self._compiled.move_to_end(user_id)
+            return compiled, "CACHED"
+
+        version = self._get_permission_version(user_id)
+        if compiled is not None and compiled.version == version:
+            compiled.checked_at = now
+            self._compiled.move_to_end(user_id)
+            return compiled, "CACHED"
+
+        compiled = self._read_shared_permissions(user_id)
+        if compiled is not None and compiled.version == version \
+                and compiled.fingerprint == fingerprint and not compiled.is_expired(now):
+            self._remember_permissions(user_id, compiled)
+            return compiled, "CACHED"
+
+        compiled = await self._compile_permissions(db, user, version)
+        self._remember_permissions(user_id, compiled)
+        self._write_shared_permissions(user_id, compiled)
+        return compiled, "VALIDATION"
+
+    def _remember_permissions(self, user_id: str, compiled: CompiledPermissions):
+        self._compiled[user_id] = compiled
+        self._compiled.move_to_end(user_id)
+        while len(self._compiled) > self.local_cache_size:
+            self._compiled.popitem(last=False)
+
+    def _get_permission_version(self, user_id: str) -> str:
+        """Version stamp: catalog version and user version"""
+        if not self.redis_client:
+            return "0:0"
+
+        try:
+            catalog, user = self.redis_client.mget(
+                "permission_version:catalog", f"permission_version:{user_id}"
+            )
+            return f"{int(catalog or 0)}:{int(user or 0)}"
+        except Exception as e:
+            logger.warning(f"Error reading permission version: {e}")
+            return "0:0"
+
+    def _read_shared_permissions(self, user_id: str) -> Optional[CompiledPermissions]:
         if not self.redis_client:
             return None
 
         try:
-            cache_key = f"permission:{user_id}:{permission_key}"
-            # Use pipeline for better performance
-            pipe = self.redis_client.pipeline()
-            pipe.get(cache_key)
-            results = pipe.execute()
-            result = results[0]
-            return json.loads(result) if result else None
+            raw = self.redis_client.get(f"permission_set:{user_id}")
+            return CompiledPermissions.from_json(raw) if raw else None
         except Exception as e:
             logger.warning(f"Error reading permission cache: {e}")
             return None
 
-    async def _cache_permission_result(self, user_id: str, permission_key: str, result: bool):
-        """Cache permission result with performance optimization."""
+    def _write_shared_permissions(self, user_id: str, compiled: CompiledPermissions):
+        if not self.redis_client or not self.cache_ttl:
+            return
+
+        try:
+            self.redis_client.setex(f"permission_set:{user_id}", self.cache_ttl, compiled.to_json())
+        except Exception as e:
+            logger.warning(f"Error caching permission set: {e}")
+
+    async def _clear_user_permission_cache(self, user_id: str):
+        """Invalidate a user's compiled permissions in every worker."""
+        user_id = str(user_id)
+        self._compiled.pop(user_id, None)
         if not self.redis_client:
             return
 
         try:
-            cache_key = f"permission:{user_id}:{permission_key}"
-            # Use pipeline for better performance
             pipe = self.redis_client.pipeline()
-            pipe.setex(cache_key, self.cache_ttl, json.dumps(result))
+            pipe.incr(f"permission_version:{user_id}")
+            pipe.delete(f"permission_set:{user_id}")
             pipe.execute()
         except Exception as e:
-            logger.warning(f"Error caching permission result: {e}")
+            logger.warning(f"Error clearing permission cache: {e}")
 
-    async def _clear_user_permission_cache(self, user_id: str):
-        """Clear all cached permissions for a user."""
+    def _clear_permission_catalog_cache(self):
+        """Invalidate every compiled permission set (catalog changed)."""
+        self._compiled.clear()
         if not self.redis_client:
             return
 
         try:
-            pattern = f"permission:{user_id}:*"
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
+            self.redis_client.incr("permission_version:catalog")
         except Exception as e:
-            logger.warning(f"Error clearing permission cache: {e}")
+            logger.warning(f"Error clearing permission catalog cache: {e}")
 
     # === LOGGING METHODS ===
 
@@ -766,6 +913,7 @@ class AdminPermissionService:
         """Initialize system permissions from predefined list."""
 
         try:
+            added = False
             for perm_data in SYSTEM_PERMISSIONS:
                 # Check if permission already exists
                 existing = db.query(AdminPermission).filter(
@@ -775,8 +923,11 @@ class AdminPermissionService:
                 if not existing:
                     permission = AdminPermission(**perm_data)
                     db.add(permission)
+                    added = True
 
             db.commit()
+            if added:
+                self._clear_permission_catalog_cache()
             logger.info("System permissions initialized successfully")
 
         except Exception as e:
@@ -8,6 +8,11 @@ This module provides comprehensive audit logging for enterprise compliance:
 - Colombian compliance logging
 - Security event monitoring
 
+Events are not written inside the request: they go to a bounded AuditSink
+and a background task writes them in batches (one Redis pipeline per
+batch). Compliance-relevant events are still written before the logging
+call returns.
+
 Author: Backend Senior Developer
 Version: 1.0.0 Enterprise
 """
@@ -19,6 +24,7 @@ from enum import Enum
 from pydantic import BaseModel
 from fastapi import Request
 
+from app.core.audit_sink import AuditSink
 from app.core.config import settings
 from app.core.logger import get_logger
 from app.core.security import generate_device_fingerprint
@@ -86,14 +92,14 @@ class AuditEvent(BaseModel):
     timestamp: datetime
     event_type: AuditEventType
     severity: AuditSeverity
-    user_id: Optional[str]
-    session_id: Optional[str]
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
     ip_address: str
     user_agent: str
-    device_fingerprint: Optional[str]
-    endpoint: Optional[str]
-    method: Optional[str]
-    status_code: Optional[int]
+    device_fingerprint: Optional[str] = None
+    endpoint: Optional[str] = None
+    method: Optional[str] = None
+    status_code: Optional[int] = None
     message: str
     details: Dict[str, Any]
     compliance_relevant: bool = False
@@ -113,7 +119,7 @@ class EnterpriseAuditLoggingService:
     - Colombian compliance logging
     - Real-time monitoring integration
     - Tamper-proof logging
-    - Performance optimized
+    - Performance optimized (batched, off the request path)
     """
 
     def __init__(self, redis_client=None):
@@ -121,6 +127,7 @@ class EnterpriseAuditLoggingService:
         self.redis = redis_client
         self.audit_log_prefix = "audit:log:"
         self.compliance_log_prefix = "audit:compliance:"
+        self.sink = AuditSink("audit_events", self._write_audit_batch)
 
     async def log_authentication_event(
         self,
@@ -277,7 +284,6 @@ class EnterpriseAuditLoggingService:
             )
 
             await self._store_audit_event(event)
-            await self._store_compliance_event(event)
 
             return event.event_id
 
@@ -385,7 +391,6 @@ class EnterpriseAuditLoggingService:
             )
 
             await self._store_audit_event(event)
-            await self._store_compliance_event(event)
 
             return event.event_id
 
@@ -443,8 +448,21 @@ class EnterpriseAuditLoggingService:
         )
 
     async def _store_audit_event(self, event: AuditEvent) -> None:
-        """Store audit event in multiple locations for redundancy."""
+        """
+        Hand the event to the audit sink.
+
+        Compliance-relevant events are written (audit and compliance keys)
+        before returning; everything else is batched in the background.
+        """
         try:
+            await self.sink.put(event, durable=event.compliance_relevant)
+        except Exception as e:
+            # Never fail the main operation due to audit logging issues
+            logger.error("Error storing audit event", error=str(e), event_id=event.event_id)
+
+    async def _write_audit_batch(self, events: List[AuditEvent]) -> None:
+        """Write a batch of events: structured log lines plus one Redis pipeline."""
+        for event in events:
             # Primary logging to structured logger
             log_data = {
                 "audit_event_id": event.event_id,
@@ -467,42 +485,33 @@ class EnterpriseAuditLoggingService:
             else:
                 logger.info("AUDIT EVENT", **log_data)
 
-            # Store in Redis for real-time access (if available)
-            if self.redis:
-                audit_key = f"{self.audit_log_prefix}{event.event_id}"
-                await self.redis.setex(
-                    audit_key,
-                    86400 * 30,  # 30 days retention
-                    json.dumps(event.dict(), default=str)
-                )
+        # Store in Redis for real-time access (if available)
+        if not self.redis:
+            return
 
-                # Add to daily index
-                date_key = f"audit:daily:{event.timestamp.strftime('%Y-%m-%d')}"
-                await self.redis.sadd(date_key, event.event_id)
-                await self.redis.expire(date_key, 86400 * 365)  # 1 year retention
+        pipe = self.redis.pipeline(transaction=False)
+        daily_indexes = {}
+        for event in events:
+            payload = json.dumps(event.dict(), default=str)
+            day = event.timestamp.strftime('%Y-%m-%d')
 
-        except Exception as e:
-            # Never fail the main operation due to audit logging issues
-            logger.error("Error storing audit event", error=str(e), event_id=event.event_id)
+            pipe.setex(f"{self.audit_log_prefix}{event.event_id}", 86400 * 30, payload)  # 30 days retention
+            pipe.sadd(f"audit:daily:{day}", event.event_id)
+            daily_indexes[f"audit:daily:{day}"] = 86400 * 365  # 1 year retention
 
-    async def _store_compliance_event(self, event: AuditEvent) -> None:
-        """Store compliance-relevant events separately."""
-        try:
-            if self.redis and event.compliance_relevant:
-                compliance_key = f"{self.compliance_log_prefix}{event.event_id}"
-                await self.redis.setex(
-                    compliance_key,
+            # Compliance-relevant events are stored separately
+            if event.compliance_relevant:
+                pipe.setex(
+                    f"{self.compliance_log_prefix}{event.event_id}",
                     86400 * 365 * 7,  # 7 years retention for compliance
-                    json.dumps(event.dict(), default=str)
+                    payload
                 )
+                pipe.sadd(f"compliance:daily:{day}", event.event_id)
+                daily_indexes[f"compliance:daily:{day}"] = 86400 * 365 * 7
 
-                # Add to compliance index
-                compliance_date_key = f"compliance:daily:{event.timestamp.strftime('%Y-%m-%d')}"
-                await self.redis.sadd(compliance_date_key, event.event_id)
-                await self.redis.expire(compliance_date_key, 86400 * 365 * 7)  # 7 years
-
-        except Exception as e:
-            logger.error("Error storing compliance event", error=str(e))
+        for key, ttl in daily_indexes.items():
+            pipe.expire(key, ttl)
+        await pipe.execute()
 
     async def _handle_critical_security_event(self, event: AuditEvent) -> None:
         """Handle critical security events with immediate alerts."""
@@ -29,6 +29,7 @@ import secrets
 import hashlib
 import time
 import json
+import math
 from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple, Dict, List, Any
 from datetime import datetime, timedelta
@@ -39,11 +40,38 @@ from app.services.otp_service import OTPService
 from app.services.smtp_email_service import SMTPEmailService as EmailService
 from app.services.sms_service import SMSService
 from app.core.redis.session import get_redis_sessions
-from app.core.security import create_access_token, decode_access_token
+from app.core.security import create_access_token, decode_access_token, get_token_revocation_id
+from app.core.token_revocation import token_blacklist
+from app.core.password_hashing import PasswordHashingOverloaded, get_password_hasher
+from app.core.rate_limit_engine import RateLimitEngine, RateLimitRule
+from app.core.redis.base import get_redis_client
 
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+_login_guard: Optional[RateLimitEngine] = None
+
+
+async def get_login_guard() -> RateLimitEngine:
+    """
+    Shared GCRA engine for login attempts and account lockouts.
+
+    Uses the async Redis client (one script call per check, lockouts cached
+    locally); in tests or without Redis it falls back to the in-process backend.
+    """
+    global _login_guard
+    if _login_guard is None:
+        from app.core.config import settings
+
+        redis_client = None
+        if not settings.TESTING:
+            try:
+                redis_client = await get_redis_client()
+            except Exception as e:
+                logger.warning(f"Redis unavailable for login attempts, using in-process tracking: {e}")
+        _login_guard = RateLimitEngine(redis_client, lease_tokens=0)
+    return _login_guard
+
 
 class AuthService:
     """
@@ -69,7 +97,7 @@ class AuthService:
             schemes=["bcrypt"],
             deprecated="auto"
         )
-        # ThreadPoolExecutor para operaciones bcrypt async
+        # Executor legacy; bcrypt se ejecuta en el pool dedicado (app.core.password_hashing)
         self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bcrypt")
 
         # Configuración de seguridad
@@ -114,10 +142,10 @@ class AuthService:
     
     async def get_password_hash(self, password: str) -> str:
         """
-        Hash password usando bcrypt con ThreadPoolExecutor.
+        Hash password usando bcrypt en el pool dedicado de hashing.
         
-        Esta función corrige el error RuntimeError: Event loop is closed
-        ejecutando bcrypt en thread separado.
+        El pool es compartido por todo el proceso y acotado: si la cola está
+        llena lanza PasswordHashingOverloaded (HTTP 429) sin esperar.
         
         Args:
             password: Password en texto plano
@@ -125,32 +153,11 @@ class AuthService:
         Returns:
             Password hasheado con bcrypt
         """
-        loop = asyncio.get_event_loop()
-        
-        # Ejecutar bcrypt.hash en thread separado para evitar bloqueo del event loop
-        hashed_password = await loop.run_in_executor(
-            self.executor,
-            self._hash_password_sync,
-            password
-        )
-        
-        return hashed_password
-    
-    def _hash_password_sync(self, password: str) -> str:
-        """
-        Función sync interna para hash con bcrypt.
-        
-        Args:
-            password: Password a hashear
-            
-        Returns:
-            Password hasheado
-        """
-        return self.pwd_context.hash(password)
+        return await get_password_hasher().hash(password)
     
     async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
-        Verificar password usando bcrypt con ThreadPoolExecutor.
+        Verificar password usando bcrypt en el pool dedicado de hashing.
         
         Args:
             plain_password: Password en texto plano
@@ -159,30 +166,8 @@ class AuthService:
         Returns:
             True si coincide, False si no
         """
-        loop = asyncio.get_event_loop()
-        
-        # Ejecutar bcrypt.verify en thread separado
-        is_valid = await loop.run_in_executor(
-            self.executor,
-            self._verify_password_sync,
-            plain_password,
-            hashed_password
-        )
-        
+        is_valid, _ = await get_password_hasher().verify(plain_password, hashed_password)
         return is_valid
-    
-    def _verify_password_sync(self, plain_password: str, hashed_password: str) -> bool:
-        """
-        Función sync interna para verificar password.
-        
-        Args:
-            plain_password: Password en texto plano
-            hashed_password: Password hasheado
-            
-        Returns:
-            True si coincide, False si no
-        """
-        return self.pwd_context.verify(plain_password, hashed_password)
 
     async def validate_password_strength(self, password: str) -> Tuple[bool, List[str]]:
         """
@@ -280,10 +265,25 @@ class AuthService:
 
         return False
 
+    def _attempt_rule(self, identifier: str) -> RateLimitRule:
+        """Presupuesto de intentos fallidos: max_login_attempts por lockout_duration"""
+        return RateLimitRule(
+            key=f"auth_attempts:{identifier}:failed",
+            limit=self.max_login_attempts,
+            period_seconds=self.lockout_duration
+        )
+
+    @staticmethod
+    def _lockout_key(identifier: str) -> str:
+        return f"auth_attempts:{identifier}:lockout"
+
     async def _track_login_attempt(self, identifier: str, success: bool, ip_address: str = None, user_agent: str = None) -> None:
         """
         Rastrear intento de login para protección contra fuerza bruta.
 
+        Un único script GCRA por intento; el fallo que agota el presupuesto
+        bloquea la cuenta durante lockout_duration.
+
         Args:
             identifier: Email del usuario o IP address
             success: True si el login fue exitoso
@@ -291,19 +291,19 @@ class AuthService:
             user_agent: User agent del cliente
         """
         try:
-            redis_client = await get_redis_sessions()
-            key_base = f"auth_attempts:{identifier}"
-
+            guard = await get_login_guard()
+            rule = self._attempt_rule(identifier)
             current_time = time.time()
 
             if success:
-                # Login exitoso: limpiar intentos fallidos
-                await redis_client.delete(f"{key_base}:failed")
-                await redis_client.delete(f"{key_base}:lockout")
+                # Login exitoso: limpiar intentos fallidos y bloqueo
+                await guard.reset(rule.key, self._lockout_key(identifier))
 
                 # Registrar login exitoso
-                await redis_client.setex(
-                    f"{key_base}:last_success",
+                redis_client = await get_redis_sessions()
+                await self._redis_safe_call(
+                    redis_client, 'setex',
+                    f"auth_attempts:{identifier}:last_success",
                     3600,  # 1 hora
                     json.dumps({
                         "timestamp": current_time,
@@ -318,23 +318,17 @@ class AuthService:
                     "user_agent": user_agent
                 })
             else:
-                # Login fallido: incrementar contador
-                failed_key = f"{key_base}:failed"
-                attempts = await redis_client.get(failed_key)
-                attempts = int(attempts) if attempts else 0
-                attempts += 1
-
-                # Exponential backoff: 2^attempts segundos (max 900 segundos)
-                backoff_time = min(2 ** attempts, 900)
-
-                await redis_client.setex(failed_key, backoff_time, str(attempts))
-
-                # Si excede el límite, bloquear cuenta
-                if attempts >= self.max_login_attempts:
-                    await redis_client.setex(
-                        f"{key_base}:lockout",
+                # Login fallido: debitar el presupuesto
+                decision = await guard.check([rule])
+                remaining = decision.remaining if decision.allowed else 0
+                attempts = self.max_login_attempts - remaining
+
+                # Si agota el límite, bloquear cuenta
+                if remaining <= 0:
+                    await guard.deny(
+                        self._lockout_key(identifier),
                         self.lockout_duration,
-                        json.dumps({
+                        value=json.dumps({
                             "locked_at": current_time,
                             "attempts": attempts,
                             "ip": ip_address,
@@ -354,12 +348,45 @@ class AuthService:
                     "attempts": attempts,
                     "ip_address": ip_address,
                     "user_agent": user_agent,
-                    "backoff_time": backoff_time
+                    "remaining_attempts": remaining
                 })
 
         except Exception as e:
             logger.error(f"Error tracking login attempt: {str(e)}")
 
+    async def _check_login_guard(self, identifiers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Lockout state and failed attempts for several identifiers in one script call.
+
+        Returns:
+            Dict identifier -> {"is_locked", "failed_attempts", "retry_after"}
+        """
+        guard = await get_login_guard()
+        rules = [self._attempt_rule(identifier) for identifier in identifiers]
+        decision = await guard.check(
+            rules,
+            deny_keys=[self._lockout_key(identifier) for identifier in identifiers],
+            charge=False
+        )
+
+        status = {
+            identifier: {"is_locked": False, "failed_attempts": 0, "retry_after": 0}
+            for identifier in identifiers
+        }
+        if decision.source == "denylist":
+            locked = identifiers[[self._lockout_key(i) for i in identifiers].index(decision.denied_key)]
+            status[locked].update(
+                is_locked=True,
+                failed_attempts=self.max_login_attempts,
+                retry_after=max(1, math.ceil(decision.denied_for))
+            )
+            return status
+
+        for identifier, state in zip(identifiers, decision.states):
+            # Consulta sin cargo: remaining ya descuenta un intento hipotético
+            status[identifier]["failed_attempts"] = max(0, self.max_login_attempts - 1 - state.remaining)
+        return status
+
     async def _is_account_locked(self, identifier: str) -> Tuple[bool, Optional[Dict]]:
         """
         Verificar si una cuenta está bloqueada por intentos fallidos.
@@ -371,14 +398,9 @@ class AuthService:
             Tuple[bool, Optional[Dict]]: (Está bloqueada, Información del bloqueo)
         """
         try:
-            redis_client = await get_redis_sessions()
-            lockout_key = f"auth_attempts:{identifier}:lockout"
-
-            lockout_data = await self._redis_safe_call(redis_client, 'get', lockout_key)
-            if lockout_data:
-                lockout_info = json.loads(lockout_data)
-                return True, lockout_info
-
+            status = (await self._check_login_guard([identifier]))[identifier]
+            if status["is_locked"]:
+                return True, {"retry_after": status["retry_after"]}
             return False, None
         except Exception as e:
             logger.error(f"Error checking account lockout: {str(e)}")
@@ -395,10 +417,7 @@ class AuthService:
             int: Número de intentos fallidos
         """
         try:
-            redis_client = await get_redis_sessions()
-            failed_key = f"auth_attempts:{identifier}:failed"
-            attempts = await self._redis_safe_call(redis_client, 'get', failed_key)
-            return int(attempts) if attempts else 0
+            return (await self._check_login_guard([identifier]))[identifier]["failed_attempts"]
         except Exception as e:
             logger.error(f"Error getting failed attempts: {str(e)}")
             return 0
@@ -415,29 +434,22 @@ class AuthService:
             Dict con información del estado de protección
         """
         try:
-            # Verificar si la cuenta está bloqueada
-            is_locked, lockout_info = await self._is_account_locked(identifier)
-
-            # Obtener intentos fallidos
-            failed_attempts = await self._get_failed_attempts(identifier)
-
-            # Verificar protección adicional por IP si se proporciona
-            ip_locked = False
-            ip_attempts = 0
-            if ip_address:
-                ip_locked, _ = await self._is_account_locked(ip_address)
-                ip_attempts = await self._get_failed_attempts(ip_address)
+            # Cuenta e IP en una sola llamada al motor
+            identifiers = [identifier] + ([ip_address] if ip_address and ip_address != identifier else [])
+            status = await self._check_login_guard(identifiers)
+            account = status[identifier]
+            ip_status = status.get(ip_address, account) if ip_address else None
 
             protection_status = {
-                "is_locked": is_locked,
-                "failed_attempts": failed_attempts,
+                "is_locked": account["is_locked"],
+                "failed_attempts": account["failed_attempts"],
                 "max_attempts": self.max_login_attempts,
-                "remaining_attempts": max(0, self.max_login_attempts - failed_attempts),
+                "remaining_attempts": max(0, self.max_login_attempts - account["failed_attempts"]),
                 "lockout_duration": self.lockout_duration,
-                "lockout_info": lockout_info,
+                "lockout_info": {"retry_after": account["retry_after"]} if account["is_locked"] else None,
                 "ip_protection": {
-                    "is_locked": ip_locked,
-                    "failed_attempts": ip_attempts
+                    "is_locked": ip_status["is_locked"],
+                    "failed_attempts": ip_status["failed_attempts"]
                 } if ip_address else None
             }
 
@@ -573,6 +585,11 @@ class AuthService:
                 user_id, user_email, password_hash, user_type, is_active, nombre, apellido = user_row
                 is_valid = await self.verify_password(password, password_hash)
                 user_active = is_active
+                if is_valid and get_password_hasher().needs_update(password_hash):
+                    # Coste bcrypt cambiado: persistir el rehash de forma transparente
+                    new_hash = await self.get_password_hash(password)
+                    with sqlite3.connect(db_path) as conn:
+                        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user_id))
             else:
                 # Realizar verificación dummy para protección de tiempo
                 await self.verify_password(password, dummy_hash)
@@ -609,6 +626,8 @@ class AuthService:
             await self._enforce_timing_consistency()
             return SimpleUser(user_id, user_email, user_type, is_active, nombre, apellido)
 
+        except PasswordHashingOverloaded:
+            raise
         except Exception as e:
             await self._log_security_event("authentication_error", {
                 "email": email,
@@ -1144,43 +1163,25 @@ class AuthService:
 
     async def revoke_token(self, token: str, user_email: str = None) -> bool:
         """
-        Revocar token agregándolo a la lista negra en Redis.
+        Revocar token en el almacén de revocación compartido (Redis + pub/sub).
 
         Args:
-            token: Token JWT a revocar
+            token: Token JWT a revocar (access o refresh)
             user_email: Email del usuario (opcional, para logging)
 
         Returns:
             bool: True si el token fue revocado exitosamente
         """
         try:
-            redis_client = await get_redis_sessions()
+            # Identificado por jti (o digest si no verifica) hasta su expiración
+            jti, exp = get_token_revocation_id(token)
+            token_hash = hashlib.sha256(token.encode()).hexdigest()
 
-            # Decodificar token para obtener información de expiración
-            try:
+            if not user_email:
                 payload = decode_access_token(token)
-                if payload and 'exp' in payload:
-                    # Calcular TTL hasta la expiración del token
-                    exp_timestamp = payload.get('exp')
-                    current_timestamp = time.time()
-                    ttl = max(0, int(exp_timestamp - current_timestamp))
-
-                    # Extraer información del usuario del token si no se proporciona
-                    if not user_email and 'sub' in payload:
-                        user_email = payload['sub']
-                else:
-                    # Token inválido o sin expiración, usar TTL por defecto
-                    ttl = 86400  # 24 horas
-
-            except Exception as e:
-                logger.warning(f"Could not decode token for revocation: {e}")
-                ttl = 86400  # TTL por defecto
+                if payload and 'sub' in payload:
+                    user_email = payload['sub']
 
-            # Crear hash del token para almacenamiento seguro
-            token_hash = hashlib.sha256(token.encode()).hexdigest()
-            blacklist_key = f"blacklisted_token:{token_hash}"
-
-            # Almacenar en Redis con TTL
             revocation_data = {
                 "revoked_at": time.time(),
                 "user_email": user_email or "unknown",
@@ -1188,16 +1189,13 @@ class AuthService:
                 "reason": "manual_revocation"
             }
 
-            await self._redis_safe_call(
-                redis_client, 'setex',
-                blacklist_key, ttl, json.dumps(revocation_data)
-            )
+            await token_blacklist.revoke(jti, expires_at=exp, value=json.dumps(revocation_data))
 
             # Log de evento de seguridad
             await self.log_security_event("token_revoked", {
                 "user_email": user_email or "unknown",
                 "token_hash_partial": token_hash[:16],
-                "ttl": ttl,
+                "ttl": max(0, int(exp - time.time())) if exp else None,
                 "revocation_method": "manual"
             })
 
@@ -1223,23 +1221,17 @@ class AuthService:
             bool: True si el token está revocado
         """
         try:
-            redis_client = await get_redis_sessions()
-
-            # Crear hash del token
-            token_hash = hashlib.sha256(token.encode()).hexdigest()
-            blacklist_key = f"blacklisted_token:{token_hash}"
-
-            # Verificar existencia en Redis
-            is_blacklisted = await self._redis_safe_call(redis_client, 'exists', blacklist_key)
+            jti, _ = get_token_revocation_id(token)
+            is_blacklisted = await token_blacklist.is_revoked(jti)
 
             if is_blacklisted:
                 # Log de intento de uso de token revocado
                 await self.log_security_event("revoked_token_usage_attempt", {
-                    "token_hash_partial": token_hash[:16],
+                    "token_hash_partial": hashlib.sha256(token.encode()).hexdigest()[:16],
                     "detection_method": "blacklist_check"
                 }, "WARNING")
 
-            return bool(is_blacklisted)
+            return is_blacklisted
 
         except Exception as e:
             logger.error(f"Error checking token revocation: {str(e)}")
@@ -16,6 +16,7 @@
 #
 # Modificaciones:
 # 2025-09-12 - Creación inicial con preparación hosting enterprise
+# 2026-10-18 - AsyncCommissionService sobre el pool AsyncSession compartido
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -33,6 +34,7 @@ Este módulo contiene:
 import os
 import logging
 import asyncio
+from contextlib import asynccontextmanager
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, List, Optional, Tuple
 from uuid import UUID, uuid4
@@ -42,9 +44,10 @@ from sqlalchemy import select, and_, func, text
 from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import SessionLocal, AsyncSessionLocal
+from app.database import SessionLocal
+from app.core.database import AsyncSessionLocal
 from app.models.commission import Commission, CommissionStatus, CommissionType, CommissionSettings, commission_settings
-from app.models.order import Order, OrderStatus
+from app.models.order import Order, OrderItem, OrderStatus
 from app.models.user import User
 from app.models.transaction import Transaction, EstadoTransaccion, TransactionType
 
@@ -60,14 +63,12 @@ class CommissionCalculationError(Exception):
         self.details = details or {}
 
 
-class CommissionService:
+class CommissionServiceBase:
     """
-    PRODUCTION_READY: Servicio de cálculo automático de comisiones
-    
-    Maneja cálculos financieros precisos, separación vendor/platform,
-    y logging de auditoría para todas las operaciones de comisiones.
+    Configuración, construcción de comisiones y reportes compartidos por
+    CommissionService (Session) y AsyncCommissionService (AsyncSession).
     """
-    
+
     def __init__(self, db_session: Optional[Session] = None):
         self.db = db_session
         self.settings = commission_settings
@@ -80,13 +81,265 @@ class CommissionService:
         # Performance configuration
         self.batch_size = int(os.getenv('COMMISSION_BATCH_SIZE', '100'))
         self.async_threshold = int(os.getenv('COMMISSION_ASYNC_THRESHOLD', '50'))
+
+    def _build_commission(
+        self,
+        order: Order,
+        commission_type: CommissionType,
+        custom_rate: Optional[Decimal] = None
+    ) -> Commission:
+        """
+        Construye (sin persistir) la comisión de una orden
+
+        Requiere ``order.items`` y ``item.product`` ya cargados; lo comparten
+        CommissionService y AsyncCommissionService.
+        """
+        # Get commission rate
+        commission_rate = custom_rate or Decimal(str(self.settings.get_commission_rate(commission_type)))
+        
+        # Get vendor from order (assuming first item's vendor for simplicity)
+        # In a real system, you might have multiple vendors per order
+        if not order.items:
+            raise CommissionCalculationError(
+                f"Order {order.id} has no items",
+                order_id=order.id
+            )
+        
+        # For now, get vendor from first item's product
+        # TODO: Handle multi-vendor orders
+        first_item = order.items[0]
+        if not hasattr(first_item.product, 'vendedor_id') or not first_item.product.vendedor_id:
+            raise CommissionCalculationError(
+                f"Product {first_item.product_id} has no vendor assigned",
+                order_id=order.id,
+                details={'product_id': str(first_item.product_id)}
+            )
+        
+        vendor_id = first_item.product.vendedor_id
+        
+        # Calculate commission amounts
+        order_amount = Decimal(str(order.total_amount))
+        commission_amount, vendor_amount, platform_amount = Commission.calculate_commission(
+            order_amount, commission_rate, commission_type
+        )
+        
+        return Commission(
+            id=str(uuid4()),
+            commission_number=self._generate_commission_number(),
+            order_id=order.id,
+            vendor_id=vendor_id,
+            order_amount=order_amount,
+            commission_rate=commission_rate,
+            commission_amount=commission_amount,
+            vendor_amount=vendor_amount,
+            platform_amount=platform_amount,
+            commission_type=commission_type,
+            status=CommissionStatus.PENDING,
+            currency=getattr(order, 'currency', 'COP'),
+            calculation_method="automatic",
+            notes=f"Auto-calculated for order {order.order_number}"
+        )
+
+    def _build_earnings_report(
+        self,
+        vendor_id: UUID,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        commissions: List[Commission]
+    ) -> Dict:
+        """Arma el reporte de earnings a partir de las comisiones del periodo"""
+        # Calculate metrics
+        total_commissions = len(commissions)
+        total_order_amount = sum(c.order_amount for c in commissions)
+        total_commission_amount = sum(c.commission_amount for c in commissions)
+        total_vendor_earnings = sum(c.vendor_amount for c in commissions)
+        
+        paid_commissions = [c for c in commissions if c.status == CommissionStatus.PAID]
+        paid_earnings = sum(c.vendor_amount for c in paid_commissions)
+        
+        pending_commissions = [c for c in commissions if c.status == CommissionStatus.PENDING]
+        pending_earnings = sum(c.vendor_amount for c in pending_commissions)
+        
+        # Average commission rate
+        avg_commission_rate = (
+            sum(c.commission_rate for c in commissions) / len(commissions)
+            if commissions else Decimal('0')
+        )
+        
+        return {
+            'vendor_id': str(vendor_id),
+            'period': {
+                'start_date': start_date.isoformat() if start_date else None,
+                'end_date': end_date.isoformat() if end_date else None
+            },
+            'summary': {
+                'total_commissions': total_commissions,
+                'total_order_amount': float(total_order_amount),
+                'total_commission_amount': float(total_commission_amount),
+                'total_vendor_earnings': float(total_vendor_earnings),
+                'paid_earnings': float(paid_earnings),
+                'pending_earnings': float(pending_earnings),
+                'average_commission_rate': float(avg_commission_rate)
+            },
+            'breakdown_by_status': {
+                status.value: {
+                    'count': len([c for c in commissions if c.status == status]),
+                    'earnings': float(sum(c.vendor_amount for c in commissions if c.status == status))
+                }
+                for status in CommissionStatus
+            },
+            'currency': 'COP'
+        }
+
+    def _generate_commission_number(self) -> str:
+        """Genera número único de comisión"""
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        random_suffix = str(uuid4())[:8].upper()
+        return f"COM-{timestamp}-{random_suffix}"
+
+    def _log_commission_calculation(self, commission: Commission, order: Order) -> None:
+        """Log de auditoría para cálculo de comisión"""
+        audit_data = {
+            'commission_id': str(commission.id),
+            'commission_number': commission.commission_number,
+            'order_id': order.id,
+            'order_number': order.order_number,
+            'vendor_id': str(commission.vendor_id),
+            'order_amount': float(commission.order_amount),
+            'commission_rate': float(commission.commission_rate),
+            'commission_amount': float(commission.commission_amount),
+            'vendor_amount': float(commission.vendor_amount),
+            'platform_amount': float(commission.platform_amount),
+            'calculation_method': commission.calculation_method,
+            'timestamp': datetime.now().isoformat(),
+            'environment': self.environment
+        }
         
+        if self.enable_detailed_logging:
+            logger.info(f"Commission calculation audit: {audit_data}")
+        else:
+            logger.info(f"Commission calculated: {commission.commission_number} for order {order.order_number}")
+
+    def _trigger_webhook(self, event_type: str, commission: Commission) -> None:
+        """Trigger webhook for commission events"""
+        try:
+            webhook_url = self.settings.WEBHOOK_URLS.get(f'commission_{event_type}')
+            if webhook_url and self.environment == 'production':
+                # In production, implement actual webhook calls
+                logger.info(f"Webhook triggered: {event_type} for commission {commission.id}")
+                # TODO: Implement actual webhook HTTP call with retries
+            elif self.environment == 'development':
+                logger.debug(f"Development webhook: {event_type} for commission {commission.id}")
+        except Exception as e:
+            logger.error(f"Error triggering webhook {event_type}: {e}")
+
+    def _build_commission_list(
+        self,
+        commissions: List[Commission],
+        total_count: int,
+        limit: int,
+        offset: int,
+        vendor_id: Optional[UUID],
+        status_filter: Optional[List[CommissionStatus]],
+        start_date: Optional[datetime],
+        end_date: Optional[datetime]
+    ) -> Dict:
+        """Formatea la página de comisiones con paginación y resumen"""
+        # Format response
+        commission_data = []
+        for commission in commissions:
+            commission_dict = {
+                'id': str(commission.id),
+                'commission_number': commission.commission_number,
+                'order_id': commission.order_id,
+                'vendor_id': str(commission.vendor_id),
+                'order_amount': float(commission.order_amount),
+                'commission_rate': float(commission.commission_rate),
+                'commission_amount': float(commission.commission_amount),
+                'vendor_amount': float(commission.vendor_amount),
+                'platform_amount': float(commission.platform_amount),
+                'commission_type': commission.commission_type.value,
+                'status': commission.status.value,
+                'currency': commission.currency,
+                'calculation_method': commission.calculation_method,
+                'created_at': commission.created_at.isoformat(),
+                'updated_at': commission.updated_at.isoformat() if commission.updated_at else None,
+                'approved_at': commission.approved_at.isoformat() if commission.approved_at else None,
+                'paid_at': commission.paid_at.isoformat() if commission.paid_at else None,
+                'notes': commission.notes
+            }
+
+            # Add order information if available
+            if commission.order:
+                commission_dict['order_number'] = commission.order.order_number
+                commission_dict['order_status'] = commission.order.status.value
+
+            commission_data.append(commission_dict)
+
+        # Calculate pagination metadata
+        total_pages = (total_count + limit - 1) // limit
+        current_page = (offset // limit) + 1
+        has_next = (offset + limit) < total_count
+        has_previous = offset > 0
+
+        # Calculate summary statistics for the filtered results
+        if commissions:
+            total_commission_amount = sum(c.commission_amount for c in commissions)
+            total_vendor_earnings = sum(c.vendor_amount for c in commissions)
+            total_platform_earnings = sum(c.platform_amount for c in commissions)
+            avg_commission_rate = sum(c.commission_rate for c in commissions) / len(commissions)
+        else:
+            total_commission_amount = Decimal('0')
+            total_vendor_earnings = Decimal('0')
+            total_platform_earnings = Decimal('0')
+            avg_commission_rate = Decimal('0')
+
+        return {
+            'commissions': commission_data,
+            'pagination': {
+                'total_count': total_count,
+                'total_pages': total_pages,
+                'current_page': current_page,
+                'limit': limit,
+                'offset': offset,
+                'has_next': has_next,
+                'has_previous': has_previous
+            },
+            'summary': {
+                'results_count': len(commission_data),
+                'total_commission_amount': float(total_commission_amount),
+                'total_vendor_earnings': float(total_vendor_earnings),
+                'total_platform_earnings': float(total_platform_earnings),
+                'average_commission_rate': float(avg_commission_rate),
+                'currency': 'COP'
+            },
+            'filters_applied': {
+                'vendor_id': str(vendor_id) if vendor_id else None,
+                'status_filter': [s.value for s in status_filter] if status_filter else None,
+                'start_date': start_date.isoformat() if start_date else None,
+                'end_date': end_date.isoformat() if end_date else None
+            }
+        }
+
+    def validate_commission_integrity(self, commission: Commission) -> bool:
+        """Valida la integridad de los cálculos de comisión"""
+        return self.settings.validate_commission_calculation(commission)
+
+
+class CommissionService(CommissionServiceBase):
+    """
+    PRODUCTION_READY: Servicio de cálculo automático de comisiones
+    
+    Maneja cálculos financieros precisos, separación vendor/platform,
+    y logging de auditoría para todas las operaciones de comisiones.
+    """
+
     def get_db(self) -> Session:
         """Get database session - use provided or create new"""
         if self.db:
             return self.db
         return SessionLocal()
-    
+
     def calculate_commission_for_order(
         self,
         order: Order,
@@ -128,54 +381,7 @@ class CommissionService:
                 logger.info(f"Commission already exists for order {order.id}: {existing_commission.id}")
                 return existing_commission
             
-            # Get commission rate
-            commission_rate = custom_rate or Decimal(str(self.settings.get_commission_rate(commission_type)))
-            
-            # Get vendor from order (assuming first item's vendor for simplicity)
-            # In a real system, you might have multiple vendors per order
-            if not order.items:
-                raise CommissionCalculationError(
-                    f"Order {order.id} has no items",
-                    order_id=order.id
-                )
-            
-            # For now, get vendor from first item's product
-            # TODO: Handle multi-vendor orders
-            first_item = order.items[0]
-            if not hasattr(first_item.product, 'vendedor_id') or not first_item.product.vendedor_id:
-                raise CommissionCalculationError(
-                    f"Product {first_item.product_id} has no vendor assigned",
-                    order_id=order.id,
-                    details={'product_id': str(first_item.product_id)}
-                )
-            
-            vendor_id = first_item.product.vendedor_id
-            
-            # Calculate commission amounts
-            order_amount = Decimal(str(order.total_amount))
-            commission_amount, vendor_amount, platform_amount = Commission.calculate_commission(
-                order_amount, commission_rate, commission_type
-            )
-            
-            # Generate unique commission number
-            commission_number = self._generate_commission_number()
-            
-            # Create commission record
-            commission = Commission(
-                commission_number=commission_number,
-                order_id=order.id,
-                vendor_id=vendor_id,
-                order_amount=order_amount,
-                commission_rate=commission_rate,
-                commission_amount=commission_amount,
-                vendor_amount=vendor_amount,
-                platform_amount=platform_amount,
-                commission_type=commission_type,
-                status=CommissionStatus.PENDING,
-                currency=getattr(order, 'currency', 'COP'),
-                calculation_method="automatic",
-                notes=f"Auto-calculated for order {order.order_number}"
-            )
+            commission = self._build_commission(order, commission_type, custom_rate)
             
             # Save to database
             db.add(commission)
@@ -202,7 +408,7 @@ class CommissionService:
                 f"Unexpected error calculating commission: {str(e)}",
                 order_id=order.id if order else None
             )
-    
+
     def process_orders_batch(
         self,
         order_ids: List[int],
@@ -254,7 +460,7 @@ class CommissionService:
             logger.error(f"Error in batch processing: {e}")
             results['failed'].extend([oid for oid in order_ids if oid not in results['success']])
             return results
-    
+
     async def _process_orders_async(
         self,
         orders: List[Order],
@@ -282,7 +488,7 @@ class CommissionService:
                         results['success'].append(order_id)
         
         return results
-    
+
     async def _calculate_commission_async(
         self,
         order: Order,
@@ -297,7 +503,7 @@ class CommissionService:
         except Exception as e:
             logger.error(f"Async commission calculation failed for order {order.id}: {e}")
             raise
-    
+
     def approve_commission(
         self,
         commission_id: UUID,
@@ -333,7 +539,7 @@ class CommissionService:
             db.rollback()
             logger.error(f"Error approving commission {commission_id}: {e}")
             raise
-    
+
     def get_vendor_earnings(
         self,
         vendor_id: UUID,
@@ -363,95 +569,12 @@ class CommissionService:
             
             commissions = query.all()
             
-            # Calculate metrics
-            total_commissions = len(commissions)
-            total_order_amount = sum(c.order_amount for c in commissions)
-            total_commission_amount = sum(c.commission_amount for c in commissions)
-            total_vendor_earnings = sum(c.vendor_amount for c in commissions)
-            
-            paid_commissions = [c for c in commissions if c.status == CommissionStatus.PAID]
-            paid_earnings = sum(c.vendor_amount for c in paid_commissions)
-            
-            pending_commissions = [c for c in commissions if c.status == CommissionStatus.PENDING]
-            pending_earnings = sum(c.vendor_amount for c in pending_commissions)
-            
-            # Average commission rate
-            avg_commission_rate = (
-                sum(c.commission_rate for c in commissions) / len(commissions)
-                if commissions else Decimal('0')
-            )
-            
-            return {
-                'vendor_id': str(vendor_id),
-                'period': {
-                    'start_date': start_date.isoformat() if start_date else None,
-                    'end_date': end_date.isoformat() if end_date else None
-                },
-                'summary': {
-                    'total_commissions': total_commissions,
-                    'total_order_amount': float(total_order_amount),
-                    'total_commission_amount': float(total_commission_amount),
-                    'total_vendor_earnings': float(total_vendor_earnings),
-                    'paid_earnings': float(paid_earnings),
-                    'pending_earnings': float(pending_earnings),
-                    'average_commission_rate': float(avg_commission_rate)
-                },
-                'breakdown_by_status': {
-                    status.value: {
-                        'count': len([c for c in commissions if c.status == status]),
-                        'earnings': float(sum(c.vendor_amount for c in commissions if c.status == status))
-                    }
-                    for status in CommissionStatus
-                },
-                'currency': 'COP'
-            }
+            return self._build_earnings_report(vendor_id, start_date, end_date, commissions)
             
         except Exception as e:
             logger.error(f"Error getting vendor earnings for {vendor_id}: {e}")
             raise CommissionCalculationError(f"Error generating earnings report: {str(e)}")
-    
-    def _generate_commission_number(self) -> str:
-        """Genera número único de comisión"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_suffix = str(uuid4())[:8].upper()
-        return f"COM-{timestamp}-{random_suffix}"
-    
-    def _log_commission_calculation(self, commission: Commission, order: Order) -> None:
-        """Log de auditoría para cálculo de comisión"""
-        audit_data = {
-            'commission_id': str(commission.id),
-            'commission_number': commission.commission_number,
-            'order_id': order.id,
-            'order_number': order.order_number,
-            'vendor_id': str(commission.vendor_id),
-            'order_amount': float(commission.order_amount),
-            'commission_rate': float(commission.commission_rate),
-            'commission_amount': float(commission.commission_amount),
-            'vendor_amount': float(commission.vendor_amount),
-            'platform_amount': float(commission.platform_amount),
-            'calculation_method': commission.calculation_method,
-            'timestamp': datetime.now().isoformat(),
-            'environment': self.environment
-        }
-        
-        if self.enable_detailed_logging:
-            logger.info(f"Commission calculation audit: {audit_data}")
-        else:
-            logger.info(f"Commission calculated: {commission.commission_number} for order {order.order_number}")
-    
-    def _trigger_webhook(self, event_type: str, commission: Commission) -> None:
-        """Trigger webhook for commission events"""
-        try:
-            webhook_url = self.settings.WEBHOOK_URLS.get(f'commission_{event_type}')
-            if webhook_url and self.environment == 'production':
-                # In production, implement actual webhook calls
-                logger.info(f"Webhook triggered: {event_type} for commission {commission.id}")
-                # TODO: Implement actual webhook HTTP call with retries
-            elif self.environment == 'development':
-                logger.debug(f"Development webhook: {event_type} for commission {commission.id}")
-        except Exception as e:
-            logger.error(f"Error triggering webhook {event_type}: {e}")
-    
+
     def list_commissions(
         self,
         vendor_id: Optional[UUID] = None,
@@ -505,86 +628,261 @@ class CommissionService:
             # Apply pagination
             commissions = query.order_by(Commission.created_at.desc()).offset(offset).limit(limit).all()
 
-            # Format response
-            commission_data = []
-            for commission in commissions:
-                commission_dict = {
-                    'id': str(commission.id),
-                    'commission_number': commission.commission_number,
-                    'order_id': commission.order_id,
-                    'vendor_id': str(commission.vendor_id),
-                    'order_amount': float(commission.order_amount),
-                    'commission_rate': float(commission.commission_rate),
-                    'commission_amount': float(commission.commission_amount),
-                    'vendor_amount': float(commission.vendor_amount),
-                    'platform_amount': float(commission.platform_amount),
-                    'commission_type': commission.commission_type.value,
-                    'status': commission.status.value,
-                    'currency': commission.currency,
-                    'calculation_method': commission.calculation_method,
-                    'created_at': commission.created_at.isoformat(),
-                    'updated_at': commission.updated_at.isoformat() if commission.updated_at else None,
-                    'approved_at': commission.approved_at.isoformat() if commission.approved_at else None,
-                    'paid_at': commission.paid_at.isoformat() if commission.paid_at else None,
-                    'notes': commission.notes
-                }
-
-                # Add order information if available
-                if commission.order:
-                    commission_dict['order_number'] = commission.order.order_number
-                    commission_dict['order_status'] = commission.order.status.value
-
-                commission_data.append(commission_dict)
-
-            # Calculate pagination metadata
-            total_pages = (total_count + limit - 1) // limit
-            current_page = (offset // limit) + 1
-            has_next = (offset + limit) < total_count
-            has_previous = offset > 0
-
-            # Calculate summary statistics for the filtered results
-            if commissions:
-                total_commission_amount = sum(c.commission_amount for c in commissions)
-                total_vendor_earnings = sum(c.vendor_amount for c in commissions)
-                total_platform_earnings = sum(c.platform_amount for c in commissions)
-                avg_commission_rate = sum(c.commission_rate for c in commissions) / len(commissions)
-            else:
-                total_commission_amount = Decimal('0')
-                total_vendor_earnings = Decimal('0')
-                total_platform_earnings = Decimal('0')
-                avg_commission_rate = Decimal('0')
-
-            return {
-                'commissions': commission_data,
-                'pagination': {
-                    'total_count': total_count,
-                    'total_pages': total_pages,
-                    'current_page': current_page,
-                    'limit': limit,
-                    'offset': offset,
-                    'has_next': has_next,
-                    'has_previous': has_previous
-                },
-                'summary': {
-                    'results_count': len(commission_data),
-                    'total_commission_amount': float(total_commission_amount),
-                    'total_vendor_earnings': float(total_vendor_earnings),
-                    'total_platform_earnings': float(total_platform_earnings),
-                    'average_commission_rate': float(avg_commission_rate),
-                    'currency': 'COP'
-                },
-                'filters_applied': {
-                    'vendor_id': str(vendor_id) if vendor_id else None,
-                    'status_filter': [s.value for s in status_filter] if status_filter else None,
-                    'start_date': start_date.isoformat() if start_date else None,
-                    'end_date': end_date.isoformat() if end_date else None
-                }
-            }
+            return self._build_commission_list(
+                commissions, total_count, limit, offset,
+                vendor_id, status_filter, start_date, end_date
+            )
 
         except Exception as e:
             logger.error(f"Error listing commissions: {e}")
             raise CommissionCalculationError(f"Error retrieving commissions: {str(e)}")
 
-    def validate_commission_integrity(self, commission: Commission) -> bool:
-        """Valida la integridad de los cálculos de comisión"""
-        return self.settings.validate_commission_calculation(commission)
\ No newline at end of file
+
+class AsyncCommissionService(CommissionServiceBase):
+    """
+    Versión async-native de CommissionService
+
+    Mismo comportamiento que CommissionService, pero sobre AsyncSession y el
+    pool compartido de la API (app.core.database), sin bloquear el event loop.
+    No hereda de CommissionService: sus métodos públicos son corrutinas y se
+    usan con ``await``; la lógica común vive en CommissionServiceBase.
+    """
+
+    def __init__(self, db_session: Optional[AsyncSession] = None):
+        super().__init__()
+        self.db = db_session
+
+    @asynccontextmanager
+    async def session_scope(self, db: Optional[AsyncSession] = None):
+        """Usa la sesión recibida o abre una del pool compartido y la cierra al final"""
+        if db is not None or self.db is not None:
+            yield db or self.db
+            return
+        async with AsyncSessionLocal() as session:
+            yield session
+
+    async def _load_order_for_commission(self, order_id: int, db: AsyncSession) -> Optional[Order]:
+        """Carga la orden con items y productos, necesarios para _build_commission"""
+        result = await db.execute(
+            select(Order)
+            .options(selectinload(Order.items).selectinload(OrderItem.product))
+            .where(Order.id == order_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def calculate_commission_for_order(
+        self,
+        order: Order,
+        commission_type: CommissionType = CommissionType.STANDARD,
+        custom_rate: Optional[Decimal] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Commission:
+        """Calcula automáticamente la comisión para una orden específica"""
+        # Tras un rollback los atributos expiran y no se pueden recargar sin await
+        order_id = order.id if order else None
+        async with self.session_scope(db) as db:
+            try:
+                # Validate order
+                if not order or order.status not in [OrderStatus.CONFIRMED, OrderStatus.DELIVERED]:
+                    raise CommissionCalculationError(
+                        f"Order {order.id if order else 'None'} is not in valid status for commission calculation",
+                        order_id=order.id if order else None
+                    )
+
+                # Check if commission already exists
+                existing_commission = (await db.execute(
+                    select(Commission).where(Commission.order_id == order.id)
+                )).scalars().first()
+
+                if existing_commission:
+                    logger.info(f"Commission already exists for order {order.id}: {existing_commission.id}")
+                    return existing_commission
+
+                # Lazy loading is not available on AsyncSession
+                loaded_order = await self._load_order_for_commission(order.id, db) or order
+                commission = self._build_commission(loaded_order, commission_type, custom_rate)
+
+                # Save to database
+                db.add(commission)
+                await db.commit()
+                await db.refresh(commission)
+
+                # Log for audit trail
+                self._log_commission_calculation(commission, loaded_order)
+
+                # Trigger webhooks if configured
+                if self.settings.WEBHOOK_URLS:
+                    self._trigger_webhook('commission_calculated', commission)
+
+                logger.info(f"Commission calculated successfully: {commission.id} for order {order.id}")
+
+                return commission
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error calculating commission for order {order_id}: {e}")
+                if isinstance(e, CommissionCalculationError):
+                    raise
+                raise CommissionCalculationError(
+                    f"Unexpected error calculating commission: {str(e)}",
+                    order_id=order_id
+                )
+
+    async def process_orders_batch(
+        self,
+        order_ids: List[int],
+        commission_type: CommissionType = CommissionType.STANDARD,
+        db: Optional[AsyncSession] = None
+    ) -> Dict[str, List[int]]:
+        """
+        Procesa múltiples órdenes para cálculo de comisiones
+
+        Una AsyncSession no admite operaciones concurrentes, así que las
+        órdenes se procesan en secuencia dentro de la misma sesión; el event
+        loop sigue libre entre cada consulta.
+        """
+        results = {'success': [], 'failed': []}
+
+        async with self.session_scope(db) as db:
+            try:
+                orders = (await db.execute(
+                    select(Order)
+                    .options(selectinload(Order.items).selectinload(OrderItem.product))
+                    .where(
+                        Order.id.in_(order_ids),
+                        Order.status.in_([OrderStatus.CONFIRMED, OrderStatus.DELIVERED])
+                    )
+                )).scalars().all()
+
+                for order in orders:
+                    try:
+                        await self.calculate_commission_for_order(order, commission_type, db=db)
+                        results['success'].append(order.id)
+
+                    except CommissionCalculationError as e:
+                        logger.error(f"Failed to calculate commission for order {order.id}: {e}")
+                        results['failed'].append(order.id)
+
+                logger.info(f"Batch processing completed: {len(results['success'])} success, {len(results['failed'])} failed")
+
+                return results
+
+            except Exception as e:
+                logger.error(f"Error in batch processing: {e}")
+                results['failed'].extend([oid for oid in order_ids if oid not in results['success']])
+                return results
+
+    async def approve_commission(
+        self,
+        commission_id: UUID,
+        approver_user_id: UUID,
+        notes: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Commission:
+        """Aprueba una comisión para pago"""
+        async with self.session_scope(db) as db:
+            try:
+                commission = (await db.execute(
+                    select(Commission).where(Commission.id == commission_id)
+                )).scalars().first()
+                if not commission:
+                    raise CommissionCalculationError(f"Commission {commission_id} not found")
+
+                if commission.status != CommissionStatus.PENDING:
+                    raise CommissionCalculationError(
+                        f"Commission {commission_id} cannot be approved from status {commission.status}"
+                    )
+
+                commission.approve(approver_user_id, notes)
+                await db.commit()
+                # approved_at is a server-side func.now(); reload it
+                await db.refresh(commission)
+
+                # Log approval
+                logger.info(f"Commission {commission_id} approved by {approver_user_id}")
+
+                # Trigger webhook
+                self._trigger_webhook('commission_approved', commission)
+
+                return commission
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error approving commission {commission_id}: {e}")
+                raise
+
+    async def get_vendor_earnings(
+        self,
+        vendor_id: UUID,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status_filter: Optional[List[CommissionStatus]] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Dict:
+        """Obtiene reporte de earnings para un vendedor"""
+        async with self.session_scope(db) as db:
+            try:
+                query = select(Commission).where(Commission.vendor_id == vendor_id)
+
+                if start_date:
+                    query = query.where(Commission.created_at >= start_date)
+                if end_date:
+                    query = query.where(Commission.created_at <= end_date)
+                if status_filter:
+                    query = query.where(Commission.status.in_(status_filter))
+
+                commissions = (await db.execute(query)).scalars().all()
+
+                return self._build_earnings_report(vendor_id, start_date, end_date, commissions)
+
+            except Exception as e:
+                logger.error(f"Error getting vendor earnings for {vendor_id}: {e}")
+                raise CommissionCalculationError(f"Error generating earnings report: {str(e)}")
+
+    async def list_commissions(
+        self,
+        vendor_id: Optional[UUID] = None,
+        status_filter: Optional[List[CommissionStatus]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        limit: int = 50,
+        offset: int = 0,
+        db: Optional[AsyncSession] = None
+    ) -> Dict:
+        """Lista comisiones con filtros y paginación"""
+        async with self.session_scope(db) as db:
+            try:
+                conditions = []
+                if vendor_id:
+                    conditions.append(Commission.vendor_id == vendor_id)
+                if status_filter:
+                    conditions.append(Commission.status.in_(status_filter))
+                if start_date:
+                    conditions.append(Commission.created_at >= start_date)
+                if end_date:
+                    conditions.append(Commission.created_at <= end_date)
+
+                total_count = (await db.execute(
+                    select(func.count(Commission.id)).where(*conditions)
+                )).scalar_one()
+
+                commissions = (await db.execute(
+                    select(Commission)
+                    .options(
+                        selectinload(Commission.order),
+                        selectinload(Commission.vendor)
+                    )
+                    .where(*conditions)
+                    .order_by(Commission.created_at.desc())
+                    .offset(offset)
+                    .limit(limit)
+                )).scalars().all()
+
+                return self._build_commission_list(
+                    commissions, total_count, limit, offset,
+                    vendor_id, status_filter, start_date, end_date
+                )
+
+            except Exception as e:
+                logger.error(f"Error listing commissions: {e}")
+                raise CommissionCalculationError(f"Error retrieving commissions: {str(e)}")
@@ -0,0 +1,435 @@
+# ~/app/services/financial_reconciliation_service.py
+# ---------------------------------------------------------------------------------------------
+# MESTORE - Financial Reconciliation Service (PRODUCTION_READY)
+# Copyright (c) 2025 Jairo. Todos los derechos reservados.
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: financial_reconciliation_service.py
+# Ruta: ~/app/services/financial_reconciliation_service.py
+# Autor: Jairo
+# Fecha de Creación: 2026-10-18
+# Última Actualización: 2026-10-18
+# Versión: 1.0.0
+# Propósito: Conciliación financiera por periodo: verificación masiva de hashes de
+#            integridad en procesos worker y cruce de totales con agregados SQL
+#
+# Modificaciones:
+# 2026-10-18 - Creación inicial
+# 2026-10-18 - Snapshot REPEATABLE READ explícito y secreto de integridad desde settings
+#
+# ---------------------------------------------------------------------------------------------
+
+"""
+PRODUCTION_READY: Conciliación financiera por periodo
+
+Este módulo contiene:
+- FinancialReconciliationService: Job de conciliación nocturna
+- verify_transaction_chunk: Verificación de un bloque de filas (ejecutable en un ProcessPool)
+- ReconciliationReport: Reporte compacto de discrepancias
+
+Las transacciones y sus comisiones se leen con un cursor del servidor en bloques
+de ``chunk_size`` filas; cada bloque se verifica en un proceso worker mientras
+se lee el siguiente. Los totales de órdenes, comisiones y transacciones se
+cruzan con agregados SQL, sin materializar filas en Python.
+
+Toda la conciliación corre en una única transacción de lectura abierta con
+``isolation_level`` REPEATABLE READ (SERIALIZABLE en SQLite), de modo que el
+streaming de filas y los agregados ven el mismo snapshot.
+"""
+
+import os
+import asyncio
+import hmac
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.commission import Commission
+from app.models.order import Order
+from app.models.transaction import Transaction, TransactionType
+from app.services.transaction_service import compute_integrity_hash, integrity_hash_fields
+
+logger = logging.getLogger(__name__)
+
+# Tolerancia monetaria usada por TransactionService
+AMOUNT_TOLERANCE = Decimal('0.01')
+
+# Nivel de aislamiento del snapshot por dialecto (SQLite no implementa REPEATABLE READ)
+SNAPSHOT_ISOLATION_LEVELS = {
+    'postgresql': 'REPEATABLE READ',
+    'sqlite': 'SERIALIZABLE',
+}
+
+# Columnas leídas por fila; el orden define la tupla enviada a los workers
+_TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.referencia_externa,
+    Transaction.monto,
+    Transaction.monto_vendedor,
+    Transaction.porcentaje_mestocker,
+    Transaction.transaction_type,
+    Transaction.comprador_id,
+    Transaction.vendedor_id,
+    Transaction.integrity_hash,
+)
+_COMMISSION_COLUMNS = (
+    Commission.id,
+    Commission.commission_rate,
+    Commission.commission_amount,
+    Commission.vendor_amount,
+    Commission.order_id,
+)
+
+
+@dataclass
+class ReconciliationReport:
+    """Reporte compacto de una conciliación por periodo"""
+
+    period_start: datetime
+    period_end: datetime
+    transactions_checked: int = 0
+    hashes_verified: int = 0
+    hash_verification_skipped: bool = False
+    isolation_level: Optional[str] = None
+    transaction_mismatches: List[Dict[str, Any]] = field(default_factory=list)
+    commission_mismatches: List[Dict[str, Any]] = field(default_factory=list)
+    order_mismatches: List[Dict[str, Any]] = field(default_factory=list)
+    totals: Dict[str, float] = field(default_factory=dict)
+    duration_seconds: float = 0.0
+
+    @property
+    def is_consistent(self) -> bool:
+        return not (self.transaction_mismatches or self.commission_mismatches or self.order_mismatches)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'period': {
+                'start': self.period_start.isoformat(),
+                'end': self.period_end.isoformat()
+            },
+            'consistent': self.is_consistent,
+            'transactions_checked': self.transactions_checked,
+            'hashes_verified': self.hashes_verified,
+            'hash_verification_skipped': self.hash_verification_skipped,
+            'isolation_level': self.isolation_level,
+            'mismatch_counts': {
+                'transactions': len(self.transaction_mismatches),
+                'commissions': len(self.commission_mismatches),
+                'orders': len(self.order_mismatches)
+            },
+            'transaction_mismatches': self.transaction_mismatches,
+            'commission_mismatches': self.commission_mismatches,
+            'order_mismatches': self.order_mismatches,
+            'totals': self.totals,
+            'duration_seconds': round(self.duration_seconds, 3)
+        }
+
+
+def verify_transaction_chunk(
+    secret: Optional[str],
+    rows: Sequence[Tuple]
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Verifica un bloque de filas (transacción + comisión opcional)
+
+    Función de módulo para poder ejecutarse en un ProcessPoolExecutor. Cada fila
+    sigue el orden de _TRANSACTION_COLUMNS + _COMMISSION_COLUMNS.
+
+    Returns:
+        Tuple con (hashes verificados, discrepancias encontradas)
+    """
+    n_tx = len(_TRANSACTION_COLUMNS)
+    verified = 0
+    mismatches = []
+
+    for row in rows:
+        tx = SimpleNamespace(**dict(zip(
+            ('id', 'referencia_externa', 'monto', 'monto_vendedor', 'porcentaje_mestocker',
+             'transaction_type', 'comprador_id', 'vendedor_id', 'integrity_hash'),
+            row[:n_tx]
+        )))
+        commission = None
+        if row[n_tx] is not None:
+            commission = SimpleNamespace(**dict(zip(
+                ('id', 'commission_rate', 'commission_amount', 'vendor_amount', 'order_id'),
+                row[n_tx:]
+            )))
+
+        errors = []
+
+        if tx.monto is None or tx.monto <= 0:
+            errors.append('non_positive_amount')
+
+        if commission is not None and tx.transaction_type == TransactionType.COMISION:
+            if tx.monto_vendedor is None or abs(tx.monto_vendedor - commission.vendor_amount) > AMOUNT_TOLERANCE:
+                errors.append('vendor_amount_mismatch')
+            expected_percentage = Decimal(str(commission.commission_rate)) * 100
+            if tx.porcentaje_mestocker is None or abs(Decimal(str(tx.porcentaje_mestocker)) - expected_percentage) > AMOUNT_TOLERANCE:
+                errors.append('commission_percentage_mismatch')
+
+        if secret and tx.integrity_hash:
+            expected_hash = compute_integrity_hash(secret, integrity_hash_fields(tx, commission))
+            verified += 1
+            if not hmac.compare_digest(tx.integrity_hash, expected_hash):
+                errors.append('integrity_hash_mismatch')
+
+        if errors:
+            mismatches.append({
+                'transaction_id': str(tx.id),
+                'reference': tx.referencia_externa,
+                'commission_id': str(commission.id) if commission else None,
+                'errors': errors
+            })
+
+    return verified, mismatches
+
+
+class FinancialReconciliationService:
+    """
+    PRODUCTION_READY: Conciliación financiera de un periodo
+
+    Pensado para ejecutarse fuera de horario (job nocturno) sobre millones de
+    filas: memoria acotada por ``chunk_size * max_pending_chunks`` y CPU de
+    verificación de hashes repartida en ``max_workers`` procesos.
+    """
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        integrity_secret: Optional[str] = None
+    ):
+        self.chunk_size = chunk_size or int(os.getenv('RECONCILIATION_CHUNK_SIZE', '5000'))
+        self.max_workers = max_workers or int(os.getenv('RECONCILIATION_WORKERS', str(os.cpu_count() or 2)))
+        # Sin secreto compartido los hashes no son verificables entre procesos/reinicios
+        self.integrity_secret = integrity_secret or settings.TRANSACTION_INTEGRITY_SECRET or None
+        self.max_pending_chunks = self.max_workers * 2
+
+    def _transactions_statement(self, start: datetime, end: datetime):
+        """Transacciones del periodo con su comisión (si existe)"""
+        return (
+            select(*_TRANSACTION_COLUMNS, *_COMMISSION_COLUMNS)
+            .outerjoin(Commission, Commission.transaction_id == Transaction.id)
+            .where(Transaction.created_at >= start, Transaction.created_at < end)
+            .order_by(Transaction.created_at, Transaction.id)
+            .execution_options(yield_per=self.chunk_size)
+        )
+
+    async def reconcile_period(
+        self,
+        db: AsyncSession,
+        start: datetime,
+        end: datetime,
+        executor: Optional[ProcessPoolExecutor] = None
+    ) -> ReconciliationReport:
+        """
+        Ejecuta la conciliación completa del periodo [start, end)
+
+        Args:
+            db: Sesión async sin transacción abierta; la conciliación abre
+                (y cierra) su propia transacción de solo lectura
+            start: Inicio del periodo (inclusive)
+            end: Fin del periodo (exclusive)
+            executor: Pool de procesos opcional (se crea uno si no se provee)
+
+        Raises:
+            ValueError: Si la sesión ya tiene una transacción en curso
+        """
+        started = time.perf_counter()
+        report = ReconciliationReport(period_start=start, period_end=end)
+        report.hash_verification_skipped = not self.integrity_secret
+        if report.hash_verification_skipped:
+            logger.warning("TRANSACTION_INTEGRITY_SECRET not configured: integrity hashes will not be verified")
+
+        report.isolation_level = await self._begin_snapshot(db)
+        own_executor = executor is None
+        executor = executor or ProcessPoolExecutor(max_workers=self.max_workers)
+        try:
+            await self._verify_transactions(db, start, end, executor, report)
+            report.commission_mismatches = await self._commission_transaction_mismatches(db, start, end)
+            report.order_mismatches = await self._order_commission_mismatches(db, start, end)
+            report.totals = await self._period_totals(db, start, end)
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+            # Solo lectura: cerrar el snapshot sin escribir nada
+            await db.rollback()
+        report.duration_seconds = time.perf_counter() - started
+
+        logger.info(
+            f"Reconciliation {start.isoformat()} - {end.isoformat()}: "
+            f"{report.transactions_checked} transactions, "
+            f"{len(report.transaction_mismatches)} tx / {len(report.commission_mismatches)} commission / "
+            f"{len(report.order_mismatches)} order mismatches in {report.duration_seconds:.1f}s"
+        )
+        return report
+
+    @staticmethod
+    async def _begin_snapshot(db: AsyncSession) -> str:
+        """
+        Abre la transacción de lectura con el aislamiento del snapshot
+
+        El nivel se fija al obtener la conexión, antes de la primera consulta;
+        por eso la sesión no puede tener una transacción ya iniciada.
+        """
+        if db.in_transaction():
+            raise ValueError("reconcile_period requires a session without an active transaction")
+        isolation_level = SNAPSHOT_ISOLATION_LEVELS.get(db.get_bind().dialect.name, 'REPEATABLE READ')
+        await db.connection(execution_options={'isolation_level': isolation_level})
+        return isolation_level
+
+    async def _verify_transactions(
+        self,
+        db: AsyncSession,
+        start: datetime,
+        end: datetime,
+        executor: ProcessPoolExecutor,
+        report: ReconciliationReport
+    ) -> None:
+        """Lee en bloques y verifica cada bloque en un worker, con backpressure"""
+        loop = asyncio.get_running_loop()
+        pending = set()
+
+        async def drain(return_when):
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            for future in done:
+                verified, mismatches = future.result()
+                report.hashes_verified += verified
+                report.transaction_mismatches.extend(mismatches)
+
+        result = await db.stream(self._transactions_statement(start, end))
+        async for partition in result.partitions(self.chunk_size):
+            rows = [tuple(row) for row in partition]
+            report.transactions_checked += len(rows)
+            pending.add(loop.run_in_executor(executor, verify_transaction_chunk, self.integrity_secret, rows))
+            if len(pending) >= self.max_pending_chunks:
+                await drain(asyncio.FIRST_COMPLETED)
+
+        if pending:
+            await drain(asyncio.ALL_COMPLETED)
+
+    async def _commission_transaction_mismatches(
+        self,
+        db: AsyncSession,
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        """Comisiones cuyo vendor_amount no coincide con su transacción de pago"""
+        result = await db.execute(
+            select(
+                Commission.id,
+                Commission.vendor_amount,
+                Transaction.id,
+                Transaction.monto_vendedor
+            )
+            .join(Transaction, Transaction.id == Commission.transaction_id)
+            .where(
+                Commission.created_at >= start,
+                Commission.created_at < end,
+                func.abs(Commission.vendor_amount - func.coalesce(Transaction.monto_vendedor, 0)) > AMOUNT_TOLERANCE
+            )
+        )
+        return [
+            {
+                'commission_id': str(commission_id),
+                'transaction_id': str(transaction_id),
+                'commission_vendor_amount': float(vendor_amount),
+                'transaction_vendor_amount': float(monto_vendedor) if monto_vendedor is not None else None
+            }
+            for commission_id, vendor_amount, transaction_id, monto_vendedor in result.all()
+        ]
+
+    async def _order_commission_mismatches(
+        self,
+        db: AsyncSession,
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        """Órdenes cuyo total no coincide con el order_amount de sus comisiones"""
+        commission_totals = (
+            select(
+                Commission.order_id.label('order_id'),
+                func.sum(Commission.order_amount).label('order_amount')
+            )
+            .where(Commission.created_at >= start, Commission.created_at < end)
+            .group_by(Commission.order_id)
+            .subquery()
+        )
+        result = await db.execute(
+            select(Order.id, Order.order_number, Order.total_amount, commission_totals.c.order_amount)
+            .join(commission_totals, commission_totals.c.order_id == cast(Order.id, String))
+            .where(func.abs(Order.total_amount - commission_totals.c.order_amount) > AMOUNT_TOLERANCE)
+        )
+        return [
+            {
+                'order_id': order_id,
+                'order_number': order_number,
+                'order_total': float(total_amount),
+                'commission_order_amount': float(order_amount)
+            }
+            for order_id, order_number, total_amount, order_amount in result.all()
+        ]
+
+    async def _period_totals(self, db: AsyncSession, start: datetime, end: datetime) -> Dict[str, float]:
+        """Totales del periodo por fuente, calculados con agregados SQL"""
+        commissions = (await db.execute(
+            select(
+                func.count(Commission.id),
+                func.coalesce(func.sum(Commission.order_amount), 0),
+                func.coalesce(func.sum(Commission.commission_amount), 0),
+                func.coalesce(func.sum(Commission.vendor_amount), 0)
+            ).where(Commission.created_at >= start, Commission.created_at < end)
+        )).one()
+        transactions = (await db.execute(
+            select(
+                func.count(Transaction.id),
+                func.coalesce(func.sum(Transaction.monto), 0),
+                func.coalesce(func.sum(Transaction.monto_vendedor), 0)
+            ).where(
+                Transaction.created_at >= start,
+                Transaction.created_at < end,
+                Transaction.transaction_type == TransactionType.COMISION
+            )
+        )).one()
+        orders = (await db.execute(
+            select(
+                func.count(Order.id),
+                func.coalesce(func.sum(Order.total_amount), 0)
+            ).where(Order.created_at >= start, Order.created_at < end)
+        )).one()
+
+        return {
+            'orders_count': orders[0],
+            'orders_total': float(orders[1]),
+            'commissions_count': commissions[0],
+            'commissions_order_amount': float(commissions[1]),
+            'commissions_commission_amount': float(commissions[2]),
+            'commissions_vendor_amount': float(commissions[3]),
+            'commission_transactions_count': transactions[0],
+            'commission_transactions_amount': float(transactions[1]),
+            'commission_transactions_vendor_amount': float(transactions[2])
+        }
+
+
+async def run_nightly_reconciliation(
+    period_start: datetime,
+    period_end: datetime,
+    service: Optional[FinancialReconciliationService] = None
+) -> ReconciliationReport:
+    """Punto de entrada del job: abre su propia sesión del pool compartido"""
+    from app.core.database import AsyncSessionLocal
+
+    service = service or FinancialReconciliationService()
+    async with AsyncSessionLocal() as session:
+        return await service.reconcile_period(session, period_start, period_end)
@@ -21,6 +21,7 @@ Purpose: Complete integration of payment processing with business logic
 
 import asyncio
 import logging
+import time
 from decimal import Decimal
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Tuple
@@ -32,6 +33,7 @@ from fastapi import HTTPException, status
 # Import payment services
 from app.services.payments.wompi_service import WompiService, WompiError
 from app.services.payments.payu_service import get_payu_service
+from app.services.payments.gateway_router import get_gateway_router
 from app.services.payments.fraud_detection_service import FraudDetectionService
 from app.services.payments.payment_commission_service import PaymentCommissionService
 from app.services.payments.webhook_handler import WompiWebhookHandler
@@ -69,6 +71,7 @@ class IntegratedPaymentService:
         self.commission_service = None  # Will be initialized with db when needed
         self.webhook_handler = None  # Will be initialized with db when needed
         self.audit_service = AuditLoggingService
+        self.gateway_router = get_gateway_router()
 
     def _ensure_services_initialized(self, db: AsyncSession):
         """Initialize services that require database session."""
@@ -593,9 +596,17 @@ class IntegratedPaymentService:
         Process payment with automatic fallback to secondary gateway.
 
         This method implements intelligent gateway routing with automatic failover:
-        1. Try primary/preferred gateway first
-        2. If it fails, automatically fall back to secondary gateway
-        3. Return error only if all gateways fail
+        1. Rank eligible gateways by rolling p95 latency and error rate
+           (the preferred gateway wins when they perform alike)
+        2. Try each gateway with a deadline carved out of the checkout budget,
+           so a slow gateway cannot starve the fallback
+        3. After a timeout, look the abandoned attempt up by its reference and
+           fail over only if the gateway did not charge it; otherwise return
+           it (approved, or pending when the outcome cannot be confirmed)
+        4. Return error only if all gateways fail
+
+        The routing decision (ranking, metrics and per-attempt outcomes) is
+        returned under the "routing" key.
 
         Args:
             order_id: Order ID to process payment for
@@ -617,36 +628,77 @@ class IntegratedPaymentService:
                 f"method: {payment_method}, preference: {gateway_preference}"
             )
 
-            # Determine gateway priority based on preference and configuration
+            # Eligible gateways (static priority), re-ranked by observed latency/errors
             primary_gateway = gateway_preference or settings.PAYMENT_PRIMARY_GATEWAY
-            gateways = self._get_gateway_priority(primary_gateway, payment_method)
+            candidates = self._get_gateway_priority(primary_gateway, payment_method)
+            if not settings.PAYMENT_FALLBACK_ENABLED:
+                candidates = candidates[:1]
+            gateways, gateway_metrics = self.gateway_router.rank(
+                candidates, payment_method, preferred_gateway=primary_gateway
+            )
 
+            budget = self.gateway_router.config.checkout_budget_seconds
+            checkout_started = time.monotonic()
+            attempts: List[Dict[str, Any]] = []
             last_error = None
 
-            # Try each gateway in priority order
-            for gateway_name in gateways:
-                try:
-                    logger.info(f"Attempting payment via {gateway_name} gateway")
+            # Try each gateway in ranked order, each bounded by its own deadline
+            for index, gateway_name in enumerate(gateways):
+                remaining = budget - (time.monotonic() - checkout_started)
+                deadline = self.gateway_router.attempt_deadline(
+                    gateway_name, payment_method, remaining, len(gateways) - index
+                )
+                if deadline <= 0:
+                    logger.warning(f"Checkout budget exhausted before trying {gateway_name}")
+                    break
+
+                if gateway_name == "wompi":
+                    processor = self._process_via_wompi
+                elif gateway_name == "payu":
+                    processor = self._process_via_payu
+                else:
+                    logger.warning(f"Unknown gateway: {gateway_name}, skipping")
+                    continue
 
-                    if gateway_name == "wompi":
-                        result = await self._process_via_wompi(
-                            order_id, amount, payment_method, payment_data, db
-                        )
-                    elif gateway_name == "payu":
-                        result = await self._process_via_payu(
-                            order_id, amount, payment_method, payment_data, db
-                        )
-                    else:
-                        logger.warning(f"Unknown gateway: {gateway_name}, skipping")
-                        continue
+                logger.info(f"Attempting payment via {gateway_name} gateway (deadline {deadline:.2f}s)")
+                attempt = {"gateway": gateway_name, "deadline": round(deadline, 3)}
+                attempts.append(attempt)
+                attempt_started = time.monotonic()
 
-                    # If successful, return result
-                    if result.get("success") or result.get("state") in ["APPROVED", "PENDING"]:
-                        logger.info(f"Payment successful via {gateway_name}")
+                try:
+                    result = await asyncio.wait_for(
+                        processor(order_id, amount, payment_method, payment_data, db),
+                        timeout=deadline
+                    )
+                except asyncio.TimeoutError:
+                    latency = time.monotonic() - attempt_started
+                    self.gateway_router.record_attempt(
+                        gateway_name, payment_method, latency, ok=False, timed_out=True
+                    )
+                    attempt.update({"latency": round(latency, 3), "outcome": "timeout"})
+
+                    # The cancelled request may still have charged the customer:
+                    # only fail over once the gateway confirms it did not
+                    resolution = await self._resolve_abandoned_attempt(gateway_name, order_id, db)
+                    attempt["resolution"] = resolution["outcome"]
+                    if resolution["outcome"] != "not_charged":
+                        logger.warning(
+                            f"Gateway {gateway_name} timed out; abandoned attempt is "
+                            f"{resolution['outcome']}, not failing over"
+                        )
+                        result = resolution["result"]
                         result["gateway_used"] = gateway_name
+                        result["routing"] = self._routing_details(gateways, gateway_metrics, attempts, checkout_started)
                         return result
 
+                    last_error = PaymentProcessingError(
+                        message=f"Gateway {gateway_name} exceeded {deadline:.2f}s deadline",
+                        error_code="GATEWAY_TIMEOUT"
+                    )
+                    logger.warning(f"{last_error.message}. Attempting next gateway if available.")
+                    continue
                 except WompiError as e:
+                    self._record_gateway_failure(gateway_name, payment_method, attempt, attempt_started)
                     last_error = e
                     logger.warning(
                         f"Gateway {gateway_name} failed: {e.message}. "
@@ -654,6 +706,7 @@ class IntegratedPaymentService:
                     )
                     continue
                 except Exception as e:
+                    self._record_gateway_failure(gateway_name, payment_method, attempt, attempt_started)
                     last_error = e
                     logger.warning(
                         f"Gateway {gateway_name} error: {str(e)}. "
@@ -661,13 +714,32 @@ class IntegratedPaymentService:
                     )
                     continue
 
+                # The gateway answered: a decline is a business outcome, not a gateway fault
+                latency = time.monotonic() - attempt_started
+                self.gateway_router.record_attempt(gateway_name, payment_method, latency, ok=True)
+                attempt["latency"] = round(latency, 3)
+
+                # If successful, return result
+                if result.get("success") or result.get("state") in ["APPROVED", "PENDING"]:
+                    attempt["outcome"] = "success"
+                    logger.info(f"Payment successful via {gateway_name}")
+                    result["gateway_used"] = gateway_name
+                    result["routing"] = self._routing_details(gateways, gateway_metrics, attempts, checkout_started)
+                    return result
+
+                attempt["outcome"] = "declined"
+
             # All gateways failed
             error_message = f"All payment gateways failed. Last error: {str(last_error)}"
             logger.error(error_message)
             raise PaymentProcessingError(
                 message="Payment processing failed across all gateways",
                 error_code="ALL_GATEWAYS_FAILED",
-                details={"last_error": str(last_error), "gateways_tried": gateways}
+                details={
+                    "last_error": str(last_error),
+                    "gateways_tried": [attempt["gateway"] for attempt in attempts],
+                    "attempts": attempts,
+                }
             )
 
         except PaymentProcessingError:
@@ -680,13 +752,109 @@ class IntegratedPaymentService:
                 details={"error": str(e)}
             )
 
+    @staticmethod
+    def _routing_details(
+        gateways: List[str],
+        gateway_metrics: Dict[str, Dict[str, Any]],
+        attempts: List[Dict[str, Any]],
+        checkout_started: float
+    ) -> Dict[str, Any]:
+        """Routing decision returned with the payment result"""
+        return {
+            "ranking": gateways,
+            "metrics": gateway_metrics,
+            "attempts": attempts,
+            "elapsed": round(time.monotonic() - checkout_started, 3),
+        }
+
+    async def _gateway_reference(self, gateway_name: str, order_id: str, db: AsyncSession) -> str:
+        """Reference the gateway processor sends for this order"""
+        if gateway_name == "payu":
+            result = await db.execute(select(Order.order_number).where(Order.id == order_id))
+            return f"ORDER-{result.scalar_one()}"
+        return f"ORDER-{order_id}"
+
+    async def _resolve_abandoned_attempt(
+        self,
+        gateway_name: str,
+        order_id: str,
+        db: AsyncSession
+    ) -> Dict[str, Any]:
+        """
+        Find out what happened to an attempt cancelled by its deadline.
+
+        The attempt is looked up at the gateway by its reference:
+        - approved/pending: that result is used and no other gateway is tried
+        - declined/error/voided or no transaction: safe to fail over
+        - lookup failed: the outcome is unknown, so the payment is left
+          pending for webhook/reconciliation instead of charging again
+
+        Returns:
+            Dict with "outcome" (charged, pending, not_charged, unknown) and
+            the "result" to return when not failing over
+        """
+        reference = None
+        try:
+            reference = await self._gateway_reference(gateway_name, order_id, db)
+            timeout = self.gateway_router.config.min_attempt_seconds
+            if gateway_name == "wompi":
+                found = await asyncio.wait_for(
+                    self.wompi_service.find_transaction_by_reference(reference), timeout=timeout
+                )
+                transaction_id = found.get("id") if found else None
+                state = found.get("status") if found else None
+            else:
+                found = await asyncio.wait_for(
+                    get_payu_service().find_transaction_by_reference(reference), timeout=timeout
+                )
+                transaction_id = found.get("transaction_id") if found else None
+                state = found.get("state") if found else None
+        except Exception as e:
+            logger.error(f"Could not resolve abandoned {gateway_name} attempt {reference}: {e!r}")
+            transaction_id, state, outcome = None, "PENDING", "unknown"
+        else:
+            if state == "APPROVED":
+                outcome = "charged"
+            elif state == "PENDING":
+                outcome = "pending"
+            else:
+                outcome = "not_charged"
+
+        return {
+            "outcome": outcome,
+            "result": {
+                "success": outcome == "charged",
+                "transaction_id": transaction_id,
+                "state": state,
+                "status": state,
+                "reference": reference,
+                "requires_reconciliation": outcome == "unknown",
+                "gateway": gateway_name
+            }
+        }
+
+    def _record_gateway_failure(
+        self,
+        gateway_name: str,
+        payment_method: str,
+        attempt: Dict[str, Any],
+        attempt_started: float
+    ) -> None:
+        """Record a failed gateway attempt in the router and the attempt log"""
+        latency = time.monotonic() - attempt_started
+        self.gateway_router.record_attempt(gateway_name, payment_method, latency, ok=False)
+        attempt.update({"latency": round(latency, 3), "outcome": "error"})
+
     def _get_gateway_priority(
         self,
         preferred_gateway: str,
         payment_method: str
     ) -> List[str]:
         """
-        Determine gateway priority based on preference and payment method.
+        Determine eligible gateways and their static priority.
+
+        The gateway router re-ranks this list using observed latency and error
+        rates; this method only decides which gateways may handle the method.
 
         Args:
             preferred_gateway: Preferred gateway (wompi, payu)
@@ -846,6 +1014,8 @@ class IntegratedPaymentService:
                 "error": str(e)
             }
 
+        health_status["gateway_routing"] = self.gateway_router.snapshot()
+
         # Overall health
         all_healthy = all(
             comp.get("status") != "unhealthy"
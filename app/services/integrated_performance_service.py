@@ -11,6 +11,8 @@ Comprehensive performance management service that integrates:
 
 This service orchestrates all performance-related functionality to provide
 a unified interface for performance optimization across the application.
+Operation timings go to the shared in-process metrics core (app.core.metrics)
+through the global PerformanceMonitoringService; no separate history is kept.
 
 Author: System Architect AI
 Date: 2025-09-17
@@ -31,7 +33,7 @@ import psutil
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import performance services
-from app.services.performance_monitoring_service import PerformanceMonitoringService
+from app.services.performance_monitoring_service import performance_monitoring_service
 from app.services.cache_service import CacheService
 from app.services.search_performance_service import SearchPerformanceService
 from app.core.config import settings
@@ -68,7 +70,7 @@ class IntegratedPerformanceService:
     """
 
     def __init__(self):
-        self.monitoring_service = PerformanceMonitoringService()
+        self.monitoring_service = performance_monitoring_service
         self.cache_service = CacheService()
         self.search_performance_service = SearchPerformanceService()
 
@@ -82,7 +84,6 @@ class IntegratedPerformanceService:
         }
 
         self.alerts = []
-        self.metrics_history = []
 
     async def initialize(self):
         """Initialize all performance services"""
@@ -117,32 +118,16 @@ class IntegratedPerformanceService:
                 # Your operation here
                 result = await some_operation()
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         operation_id = str(uuid4())
 
         try:
-            # Start monitoring
-            await self.monitoring_service.start_operation_monitoring(
-                operation_id, operation_name, tags
-            )
-
-            yield operation_id
-
-        except Exception as e:
-            # Record error in performance monitoring
-            await self.monitoring_service.record_operation_error(
-                operation_id, str(e)
-            )
-            raise
+            # Duration and errors are recorded in the shared metrics core
+            async with self.monitoring_service.track_operation(operation_name):
+                yield operation_id
 
         finally:
-            # End monitoring and record metrics
-            end_time = time.time()
-            duration_ms = (end_time - start_time) * 1000
-
-            await self.monitoring_service.end_operation_monitoring(
-                operation_id, duration_ms
-            )
+            duration_ms = (time.perf_counter() - start_time) * 1000
 
             # Check for performance alerts
             if alert_on_slow:
@@ -305,7 +290,7 @@ class IntegratedPerformanceService:
         """
         try:
             # Get metrics from all services
-            monitoring_data = await self.monitoring_service.get_metrics_summary(time_range)
+            monitoring_data = self.monitoring_service.get_metrics_summary(time_range)
             cache_data = await self.cache_service.get_performance_metrics()
             search_data = await self.search_performance_service.get_metrics()
 
@@ -346,7 +331,7 @@ class IntegratedPerformanceService:
         try:
             # Get current metrics
             cache_metrics = await self.cache_service.get_performance_metrics()
-            monitoring_metrics = await self.monitoring_service.get_current_metrics()
+            monitoring_metrics = self.monitoring_service.get_current_metrics()
 
             # Cache recommendations
             if cache_metrics.get("hit_rate", 0) < 70:
@@ -468,14 +453,6 @@ class IntegratedPerformanceService:
             self.alerts.append(alert)
             logger.warning(f"Performance alert: {alert.message}")
 
-            # Send alert through monitoring service
-            await self.monitoring_service.send_performance_alert(
-                alert.metric_name,
-                alert.current_value,
-                alert.threshold,
-                alert.severity
-            )
-
     async def _get_active_alerts(self) -> List[Dict[str, Any]]:
         """Get currently active performance alerts"""
         # Filter alerts from last hour
@@ -23,7 +23,8 @@ This service provides enterprise-grade JWT token blacklisting capabilities:
 - Secure token revocation and blacklisting
 - User session management and cleanup
 - Token audit trails and security monitoring
-- Redis-based high-performance storage
+- Redis-based storage shared with app.core.token_revocation (local bloom
+  filter answers "not revoked" without a Redis round-trip)
 - Automatic cleanup and garbage collection
 """
 
@@ -37,6 +38,7 @@ from enum import Enum
 import structlog
 from app.core.redis.base import get_redis_client
 from app.core.config import settings
+from app.core.token_revocation import REVOCATION_KEY_PREFIX, token_blacklist
 
 logger = structlog.get_logger(__name__)
 
@@ -77,7 +79,7 @@ class JWTBlacklistService:
     """
 
     def __init__(self):
-        self.redis_prefix = "jwt_blacklist"
+        self.redis_prefix = REVOCATION_KEY_PREFIX
         self.session_prefix = "user_sessions"
         self.audit_prefix = "blacklist_audit"
 
@@ -137,8 +139,7 @@ class JWTBlacklistService:
                 notes=notes
             )
 
-            # Store in Redis with expiration
-            blacklist_key = f"{self.redis_prefix}:{token_jti}"
+            # Store in Redis with expiration and notify every worker (one round-trip)
             entry_data = json.dumps(asdict(entry), default=str)
 
             # Calculate TTL in seconds
@@ -146,7 +147,12 @@ class JWTBlacklistService:
             if ttl <= 0:
                 ttl = 60  # Minimum 1 minute TTL
 
-            await redis_client.setex(blacklist_key, ttl, entry_data)
+            await token_blacklist.revoke(
+                token_jti,
+                expires_at=datetime.now(timezone.utc).timestamp() + ttl,
+                value=entry_data,
+                redis_client=redis_client
+            )
 
             # Update user session tracking
             await self._update_user_session_tracking(user_id, token_jti, "blacklisted")
@@ -191,6 +197,12 @@ class JWTBlacklistService:
             False
         """
         try:
+            if token_blacklist.is_token_blacklisted(token_jti):
+                return True
+            if token_blacklist.synchronized:
+                # Estado local completo (carga inicial + pub/sub): sin round-trip
+                return False
+
             redis_client = await get_redis_client()
             blacklist_key = f"{self.redis_prefix}:{token_jti}"
 
@@ -339,6 +351,9 @@ class JWTBlacklistService:
             int: Number of entries cleaned up
         """
         try:
+            # Copia local (bloom + mapa exacto) de revocaciones ya expiradas
+            token_blacklist._cleanup_expired_tokens()
+
             redis_client = await get_redis_client()
 
             # Get all blacklist keys
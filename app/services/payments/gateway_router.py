@@ -0,0 +1,255 @@
+"""
+Payment Gateway Router
+======================
+
+Latency-aware routing between payment gateways (Wompi, PayU).
+
+The router keeps a rolling window of observations per gateway and payment
+method, and uses it to:
+- Rank the eligible gateways by expected time-to-success: p95 latency of
+  successful calls plus a deadline-sized penalty for every expected failure,
+  with gateways above an error-rate threshold ranked after healthy ones
+- Derive a per-attempt deadline from the overall checkout budget, so a slow
+  gateway cannot consume the whole budget before failover happens
+- Expose the statistics behind every decision for health checks and logs
+
+Gateway eligibility (e.g. Nequi is Wompi-only) remains the responsibility of
+the caller; the router only reorders and times the candidates it is given.
+
+Purpose: Reduce checkout tail latency during partial gateway outages
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GatewayRouterConfig:
+    """Configuration for gateway ranking and attempt deadlines"""
+    checkout_budget_seconds: float = 25.0
+    min_attempt_seconds: float = 3.0
+    window_size: int = 200
+    window_seconds: float = 300.0
+    min_samples: int = 5
+    cold_start_latency_seconds: float = 1.5
+    deadline_p95_multiplier: float = 2.0
+    preferred_gateway_bonus: float = 0.85
+    max_error_rate: float = 0.95
+    unhealthy_error_rate: float = 0.5
+
+
+class GatewayStats:
+    """Rolling latency/error window for one (gateway, payment method) pair"""
+
+    def __init__(self, window_size: int, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window_size)
+        self.total_attempts = 0
+        self.total_failures = 0
+        self.total_timeouts = 0
+
+    def record(self, latency: float, ok: bool, timed_out: bool = False, now: Optional[float] = None) -> None:
+        self._samples.append((now if now is not None else time.monotonic(), latency, ok))
+        self.total_attempts += 1
+        if not ok:
+            self.total_failures += 1
+        if timed_out:
+            self.total_timeouts += 1
+
+    def _recent(self, now: Optional[float] = None) -> List[Tuple[float, float, bool]]:
+        """Samples inside the time window (old observations stop influencing routing)"""
+        cutoff = (now if now is not None else time.monotonic()) - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return list(self._samples)
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        samples = self._recent(now)
+        latencies = sorted(sample[1] for sample in samples)
+        success_latencies = sorted(sample[1] for sample in samples if sample[2])
+        failures = sum(1 for sample in samples if not sample[2])
+        count = len(samples)
+        return {
+            "samples": count,
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "success_p95": _percentile(success_latencies, 0.95),
+            "error_rate": failures / count if count else 0.0,
+            "total_attempts": self.total_attempts,
+            "total_failures": self.total_failures,
+            "total_timeouts": self.total_timeouts,
+        }
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile over an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class GatewayRouter:
+    """
+    Ranks payment gateways and computes per-attempt deadlines.
+
+    Thread-safe; one shared instance is used by the payment service so every
+    checkout contributes to (and benefits from) the same observations.
+    """
+
+    def __init__(self, config: Optional[GatewayRouterConfig] = None):
+        self.config = config or GatewayRouterConfig()
+        self._stats: Dict[Tuple[str, str], GatewayStats] = {}
+        self._lock = threading.RLock()
+
+    def _get_stats(self, gateway: str, payment_method: str) -> GatewayStats:
+        key = (gateway, payment_method)
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(
+                    key, GatewayStats(self.config.window_size, self.config.window_seconds)
+                )
+        return stats
+
+    def record_attempt(
+        self,
+        gateway: str,
+        payment_method: str,
+        latency: float,
+        ok: bool,
+        timed_out: bool = False
+    ) -> None:
+        """Record the outcome of one gateway call (declines count as ok: the gateway answered)"""
+        stats = self._get_stats(gateway, payment_method)
+        with self._lock:
+            stats.record(latency, ok, timed_out)
+
+    def score(self, gateway: str, payment_method: str, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Expected seconds until a successful answer from this gateway.
+
+        A failure is charged as a whole attempt deadline, not at its own
+        latency: a gateway that fails fast still costs the checkout a
+        failover, so it must not outrank a slower gateway that succeeds.
+        Expected failures before a success follow ``error_rate / success_rate``.
+
+        With too few samples the gateway is scored with the cold-start latency
+        so it keeps being tried and its statistics can build up.
+        """
+        with self._lock:
+            summary = self._get_stats(gateway, payment_method).summary(now)
+
+        if summary["samples"] < self.config.min_samples:
+            expected = self.config.cold_start_latency_seconds
+            summary["healthy"] = True
+        else:
+            error_rate = min(summary["error_rate"], self.config.max_error_rate)
+            success_latency = summary["success_p95"] or self.config.cold_start_latency_seconds
+            failure_penalty = max(
+                success_latency * self.config.deadline_p95_multiplier,
+                self.config.min_attempt_seconds
+            )
+            expected = success_latency + failure_penalty * error_rate / (1.0 - error_rate)
+            summary["healthy"] = summary["error_rate"] < self.config.unhealthy_error_rate
+
+        summary["score"] = expected
+        return summary
+
+    def rank(
+        self,
+        candidates: List[str],
+        payment_method: str,
+        preferred_gateway: Optional[str] = None
+    ) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+        """
+        Order candidate gateways by score (lower is better).
+
+        Unhealthy gateways (error rate above the threshold) go after every
+        healthy one and are only tried as a last resort. The preferred gateway
+        gets a small bonus so configuration still wins when gateways perform
+        alike; ties keep the caller's static order.
+
+        Returns:
+            Tuple of (ordered gateways, per-gateway decision metrics)
+        """
+        metrics = {}
+        keyed = []
+        for position, gateway in enumerate(candidates):
+            gateway_metrics = self.score(gateway, payment_method)
+            effective = gateway_metrics["score"]
+            if gateway == preferred_gateway:
+                effective *= self.config.preferred_gateway_bonus
+            gateway_metrics["effective_score"] = effective
+            metrics[gateway] = gateway_metrics
+            keyed.append((not gateway_metrics["healthy"], effective, position, gateway))
+
+        ordered = [gateway for *_, gateway in sorted(keyed)]
+        return ordered, metrics
+
+    def attempt_deadline(
+        self,
+        gateway: str,
+        payment_method: str,
+        remaining_budget: float,
+        attempts_left: int
+    ) -> float:
+        """
+        Seconds allowed for the next attempt.
+
+        The last attempt may use the whole remaining budget. Earlier attempts
+        get a multiple of the gateway's p95 (or a fair share of the budget
+        when it has no history), always leaving at least the minimum attempt
+        time for each gateway still to be tried.
+        """
+        if remaining_budget <= 0:
+            return 0.0
+        if attempts_left <= 1:
+            return remaining_budget
+
+        reserved = self.config.min_attempt_seconds * (attempts_left - 1)
+        ceiling = max(remaining_budget - reserved, min(self.config.min_attempt_seconds, remaining_budget))
+
+        summary = self.score(gateway, payment_method)
+        if summary["samples"] < self.config.min_samples:
+            wanted = remaining_budget / attempts_left
+        else:
+            wanted = summary["p95"] * self.config.deadline_p95_multiplier
+
+        return min(ceiling, max(wanted, self.config.min_attempt_seconds))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Current statistics for every gateway/method pair seen so far"""
+        with self._lock:
+            keys = list(self._stats.keys())
+        result: Dict[str, Dict[str, Any]] = {}
+        for gateway, payment_method in keys:
+            result.setdefault(gateway, {})[payment_method] = self.score(gateway, payment_method)
+        return result
+
+    def reset(self) -> None:
+        """Forget all observations (used by tests and benchmarks)"""
+        with self._lock:
+            self._stats.clear()
+
+
+_gateway_router: Optional[GatewayRouter] = None
+
+
+def get_gateway_router() -> GatewayRouter:
+    """Get or create the gateway router singleton"""
+    global _gateway_router
+    if _gateway_router is None:
+        from app.core.config import settings
+        _gateway_router = GatewayRouter(GatewayRouterConfig(
+            checkout_budget_seconds=settings.PAYMENT_CHECKOUT_BUDGET_SECONDS,
+            min_attempt_seconds=settings.PAYMENT_GATEWAY_MIN_ATTEMPT_SECONDS,
+        ))
+    return _gateway_router
@@ -15,7 +15,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
-from app.models.order import Order, OrderStatus, Transaction
+from app.models.order import Order, OrderItem, OrderStatus, Transaction
 from app.models.payment import Payment, WebhookEvent
 from app.models.commission import Commission, CommissionStatus, CommissionType
 from app.models.user import User
@@ -60,7 +60,9 @@ class PaymentCommissionService:
             result = await self.db.execute(
                 select(Transaction)
                 .options(
-                    selectinload(Transaction.order).selectinload(Order.items),
+                    # items.product: el vendedor sale del producto; todo debe estar
+                    # cargado antes de construir la comisión (AsyncSession no hace lazy load)
+                    selectinload(Transaction.order).selectinload(Order.items).selectinload(OrderItem.product),
                     selectinload(Transaction.order).selectinload(Order.buyer)
                 )
                 .where(Transaction.id == transaction_id)
@@ -142,8 +144,9 @@ class PaymentCommissionService:
 
     async def _check_existing_commission(self, order_id: int) -> Optional[Commission]:
         """Check if commission already exists for the order"""
+        # Commission.order_id es String(36); Order.id es entero
         result = await self.db.execute(
-            select(Commission).where(Commission.order_id == order_id)
+            select(Commission).where(Commission.order_id == str(order_id))
         )
         return result.scalar_one_or_none()
 
@@ -155,10 +158,9 @@ class PaymentCommissionService:
         webhook_event_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """Calculate and create commission for the approved payment"""
+        # Tras un rollback los atributos expiran y no se pueden recargar sin await
+        order_id = order.id
         try:
-            # Use the existing commission service to calculate commission
-            # Note: This is a placeholder - we'll implement a simpler calculation for now
-            # In a real system, integrate with the actual commission service
             commission_calculation = self._calculate_simple_commission(order)
 
             if not commission_calculation.get("success"):
@@ -168,37 +170,20 @@ class PaymentCommissionService:
 
             commission_data = commission_calculation.get("commission", {})
 
-            # Get vendor_id - for now, use a placeholder since Order model doesn't have direct vendor relationship
-            # In a real system, this would be determined from the order items or business logic
-            vendor_id = getattr(order, 'vendor_id', None)
-            if not vendor_id and hasattr(order, 'items') and order.items:
-                # Try to get vendor from first item if available
-                vendor_id = getattr(order.items[0], 'vendor_id', None) if order.items else None
-
-            # Create commission record with payment integration metadata
-            commission = Commission(
-                order_id=order.id,
-                vendor_id=vendor_id,
-                buyer_id=order.buyer_id,
-                transaction_id=transaction.id,
-                commission_type=CommissionType.STANDARD,
-                base_amount=Decimal(str(order.total_amount)),
-                commission_rate=Decimal(str(commission_data.get("commission_rate", "0.0"))),
-                commission_amount=Decimal(str(commission_data.get("commission_amount", "0.0"))),
-                vendor_amount=Decimal(str(commission_data.get("vendor_amount", "0.0"))),
-                platform_amount=Decimal(str(commission_data.get("platform_amount", "0.0"))),
-                status=CommissionStatus.PENDING,
-                metadata={
-                    "payment_gateway": "wompi",
-                    "payment_reference": payment_data.get("reference"),
-                    "payment_id": payment_data.get("id"),
-                    "payment_amount_cents": payment_data.get("amount_in_cents"),
-                    "payment_currency": payment_data.get("currency", "COP"),
-                    "payment_method": payment_data.get("payment_method", {}),
-                    "webhook_event_id": webhook_event_id,
-                    "processed_at": datetime.utcnow().isoformat(),
-                    "calculation_details": commission_data
-                }
+            # Vendor, montos y número de comisión con las mismas reglas que CommissionService
+            # (requiere order.items[].product cargados)
+            commission = self.commission_service._build_commission(
+                order,
+                CommissionType.STANDARD,
+                custom_rate=Decimal(str(commission_data.get("commission_rate", "0.1")))
+            )
+            commission.order_id = str(order_id)
+            commission.calculation_method = commission_data.get("calculation_method", "automatic")
+            # transaction_id referencia transacciones financieras (transactions), no la
+            # transacción de pago: el pago queda trazado en las notas
+            commission.notes = (
+                f"Payment {payment_data.get('id')} ({payment_data.get('reference')}) via wompi, "
+                f"payment transaction {transaction.id}, webhook event {webhook_event_id}"
             )
 
             self.db.add(commission)
@@ -209,8 +194,8 @@ class PaymentCommissionService:
                 "Commission created for approved payment",
                 extra={
                     "commission_id": commission.id,
-                    "order_id": order.id,
-                    "vendor_id": order.vendor_id,
+                    "order_id": order_id,
+                    "vendor_id": commission.vendor_id,
                     "commission_amount": float(commission.commission_amount),
                     "vendor_amount": float(commission.vendor_amount),
                     "platform_amount": float(commission.platform_amount),
@@ -233,7 +218,7 @@ class PaymentCommissionService:
 
         except Exception as e:
             await self.db.rollback()
-            logger.error(f"Error creating commission for order {order.id}: {e}")
+            logger.error(f"Error creating commission for order {order_id}: {e}")
             raise PaymentCommissionError(f"Commission creation failed: {e}")
 
     async def _trigger_post_commission_actions(
@@ -244,30 +229,12 @@ class PaymentCommissionService:
     ) -> None:
         """Trigger any post-commission creation actions"""
         try:
-            # 1. Update order metadata with commission info
-            if order.metadata:
-                order.metadata.update({
-                    "commission_id": commission.id,
-                    "commission_calculated_at": datetime.utcnow().isoformat(),
-                    "vendor_payout_amount": float(commission.vendor_amount),
-                    "platform_fee": float(commission.platform_amount)
-                })
-            else:
-                order.metadata = {
-                    "commission_id": commission.id,
-                    "commission_calculated_at": datetime.utcnow().isoformat(),
-                    "vendor_payout_amount": float(commission.vendor_amount),
-                    "platform_fee": float(commission.platform_amount)
-                }
-
-            # 2. Create vendor notification (placeholder for notification service)
+            # 1. Create vendor notification (placeholder for notification service)
             await self._create_vendor_notification(commission, order)
 
-            # 3. Update vendor metrics (placeholder for analytics service)
+            # 2. Update vendor metrics (placeholder for analytics service)
             await self._update_vendor_metrics(commission, order)
 
-            await self.db.commit()
-
         except Exception as e:
             logger.error(f"Error in post-commission actions: {e}")
             # Don't fail the main commission creation for notification errors
@@ -1,3 +1,4 @@
+import json
 import logging
 import uuid
 from datetime import datetime, timedelta
@@ -137,7 +138,7 @@ class PaymentProcessor:
                 
                 # Update transaction with Wompi response
                 transaction.gateway_transaction_id = wompi_response["data"]["id"]
-                transaction.gateway_response = wompi_response
+                transaction.gateway_response = json.dumps(wompi_response)
                 transaction.status = PaymentStatus.PROCESSING
                 transaction.processed_at = datetime.utcnow()
                 
@@ -234,7 +235,7 @@ class PaymentProcessor:
                 
                 # Update transaction
                 transaction.gateway_transaction_id = wompi_response["data"]["id"]
-                transaction.gateway_response = wompi_response
+                transaction.gateway_response = json.dumps(wompi_response)
                 transaction.status = PaymentStatus.PROCESSING
                 transaction.processed_at = datetime.utcnow()
                 
@@ -300,7 +301,7 @@ class PaymentProcessor:
             transaction.status = new_status
             
             if wompi_data:
-                transaction.gateway_response = wompi_data
+                transaction.gateway_response = json.dumps(wompi_data)
                 
             if new_status == PaymentStatus.APPROVED:
                 transaction.confirmed_at = datetime.utcnow()
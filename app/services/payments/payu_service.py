@@ -606,6 +606,51 @@ class PayUService:
         except Exception as e:
             raise PayUError(f"PayU status query error: {e}")
 
+    async def find_transaction_by_reference(self, reference_code: str) -> Optional[Dict[str, Any]]:
+        """
+        Latest transaction of the PayU order created with ``reference_code``.
+
+        Returns:
+            Dict with transaction_id, order_id and state, or None if PayU has no order
+        """
+        try:
+            payload = {
+                "language": self.config.language,
+                "command": "ORDER_DETAIL_BY_REFERENCE_CODE",
+                "merchant": {
+                    "apiLogin": self.config.api_login,
+                    "apiKey": self.config.api_key
+                },
+                "details": {"referenceCode": reference_code},
+                "test": not self.config.is_production
+            }
+
+            response = await self.client.post(self.config.base_url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+
+            if data.get("code") != "SUCCESS":
+                raise PayUError(f"PayU reference lookup failed: {data.get('error')}", error_code=data.get("code"))
+
+            orders = (data.get("result") or {}).get("payload") or []
+            for order in reversed(orders):
+                transactions = order.get("transactions") or []
+                if transactions:
+                    transaction = transactions[-1]
+                    return {
+                        "transaction_id": transaction.get("id"),
+                        "order_id": order.get("id"),
+                        "state": (transaction.get("transactionResponse") or {}).get("state"),
+                    }
+            return None
+
+        except httpx.HTTPError as e:
+            raise PayUNetworkError(f"PayU reference lookup network error: {e}")
+        except PayUError:
+            raise
+        except Exception as e:
+            raise PayUError(f"PayU reference lookup error: {e}")
+
     async def health_check(self) -> Dict[str, Any]:
         """
         Comprehensive health check for PayU service.
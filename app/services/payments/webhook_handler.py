@@ -3,7 +3,7 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import inspect, select
 from sqlalchemy.orm import selectinload
 
 from app.models.order import Transaction
@@ -64,6 +64,11 @@ class WompiWebhookHandler:
             
             # Process the event
             result = await self._process_event(webhook_event, event_type, data)
+
+            # Un rollback durante el procesamiento (p. ej. comisión fallida) expira el
+            # evento ya persistido: recargarlo antes de actualizarlo
+            if inspect(webhook_event).expired:
+                await self.db.refresh(webhook_event)
             
             # Update webhook event status
             webhook_event.event_status = WebhookEventStatus.PROCESSED if result["processed"] else WebhookEventStatus.FAILED
@@ -162,42 +167,47 @@ class WompiWebhookHandler:
                 logger.warning(f"Transaction not found for Wompi ID {transaction_id}")
                 return {"error": "Transaction not found", "processed": False}
             
+            # Ids capturados ahora: un rollback posterior (p. ej. al fallar la comisión)
+            # expira las instancias y leerlos dispararía un lazy load fuera de greenlet
+            payment_transaction_id = transaction.id
+            webhook_event_id = webhook_event.id
+
             # Link webhook event to transaction
-            webhook_event.transaction_id = transaction.id
+            webhook_event.transaction_id = payment_transaction_id
             
             # Update transaction status
             updated_transaction = await self.payment_processor.update_transaction_status(
-                transaction.id,
+                payment_transaction_id,
                 status,
                 data
             )
 
-            logger.info(f"Updated transaction {transaction.id} status to {status}")
+            logger.info(f"Updated transaction {payment_transaction_id} status to {status}")
 
             # Trigger commission calculation for approved payments
             commission_result = None
             if status == "APPROVED":
                 try:
                     commission_result = await self.commission_service.process_payment_approval(
-                        transaction_id=transaction.id,
+                        transaction_id=payment_transaction_id,
                         payment_data=data,
-                        webhook_event_id=webhook_event.id
+                        webhook_event_id=webhook_event_id
                     )
                     logger.info(
-                        f"Commission processing completed for transaction {transaction.id}",
+                        f"Commission processing completed for transaction {payment_transaction_id}",
                         extra={
                             "commission_success": commission_result.get("success"),
                             "commission_id": commission_result.get("commission_id")
                         }
                     )
                 except Exception as e:
-                    logger.error(f"Commission processing failed for transaction {transaction.id}: {e}")
+                    logger.error(f"Commission processing failed for transaction {payment_transaction_id}: {e}")
                     # Don't fail the webhook processing if commission calculation fails
                     commission_result = {"success": False, "error": str(e)}
 
             response_data = {
                 "message": "Transaction updated successfully",
-                "transaction_id": transaction.id,
+                "transaction_id": payment_transaction_id,
                 "new_status": status,
                 "processed": True
             }
@@ -591,6 +591,19 @@ class WompiService:
                 logger.error(f"Response: {e.response.text}")
             raise Exception("Failed to get transaction")
 
+    async def find_transaction_by_reference(self, reference: str) -> Optional[Dict[str, Any]]:
+        """Most recent transaction created with ``reference``, or None if Wompi has none"""
+        try:
+            response = await self.client.get("/transactions", params={"reference": reference})
+            response.raise_for_status()
+
+            transactions = response.json().get("data", [])
+            return transactions[-1] if transactions else None
+
+        except httpx.HTTPError as e:
+            logger.error(f"Error looking up transaction by reference {reference}: {e}")
+            raise Exception("Failed to look up transaction")
+
     async def get_pse_banks(self) -> List[Dict[str, Any]]:
         """Get available PSE banks"""
         try:
@@ -21,6 +21,7 @@
 # - Automated alerting for performance degradation
 # - Performance dashboard data collection
 # - Load testing integration and benchmarking
+# - Métricas en memoria (app.core.metrics): sin Redis en el camino de la petición
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -35,10 +36,16 @@ Este módulo implementa monitoreo comprehensivo de performance:
 - Alertas automáticas para degradación de performance
 - Recolección de datos para dashboard de performance
 - Integración con load testing y benchmarking
+
+Las latencias se registran en el núcleo de métricas del proceso
+(app.core.metrics, histogramas log-lineales); los SLAs de p95/p99 se evalúan
+periódicamente sobre la ventana desde la última evaluación y Redis solo se
+usa para las alertas.
 """
 
 import asyncio
 import logging
+import re
 import time
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
@@ -51,22 +58,12 @@ from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.metrics import Histogram, Labels, MetricsRegistry, labels_of, metrics
 from app.core.redis.base import get_redis_client
 
 logger = logging.getLogger(__name__)
 
 
-class PerformanceMetrics:
-    """Performance metrics data structure"""
-
-    def __init__(self):
-        self.endpoint_metrics: Dict[str, Dict] = {}
-        self.database_metrics: Dict[str, Dict] = {}
-        self.cache_metrics: Dict[str, Dict] = {}
-        self.system_metrics: Dict[str, Any] = {}
-        self.custom_metrics: Dict[str, Any] = {}
-
-
 class PerformanceSLAs:
     """Performance SLA thresholds"""
 
@@ -97,12 +94,14 @@ class PerformanceSLAs:
 class PerformanceMonitoringService:
     """Comprehensive performance monitoring service"""
 
-    def __init__(self):
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
         self.redis_client: Optional[redis.Redis] = None
-        self.metrics = PerformanceMetrics()
+        self.registry = registry or metrics
         self.slas = PerformanceSLAs()
         self.active_requests: Dict[str, float] = {}
         self.request_id_counter = 0
+        # Copia de cada histograma en la última evaluación de SLAs (inicio de la ventana)
+        self._sla_baseline: Dict[Tuple[str, Labels], Histogram] = {}
 
     async def _get_redis(self) -> redis.Redis:
         """Get Redis client with lazy initialization"""
@@ -119,8 +118,7 @@ class PerformanceMonitoringService:
     async def track_endpoint_performance(self, endpoint: str, method: str, user_id: Optional[UUID] = None):
         """Context manager to track endpoint performance"""
         request_id = self._generate_request_id()
-        start_time = time.time()
-        start_memory = psutil.Process().memory_info().rss
+        start_time = time.perf_counter()
 
         try:
             # Record request start
@@ -129,37 +127,39 @@ class PerformanceMonitoringService:
             yield request_id
 
         finally:
-            # Record request completion
-            end_time = time.time()
-            end_memory = psutil.Process().memory_info().rss
-            duration_ms = (end_time - start_time) * 1000
-            memory_delta = end_memory - start_memory
-
             # Remove from active requests
             self.active_requests.pop(request_id, None)
 
             # Record metrics
-            await self._record_endpoint_metrics(
-                endpoint=endpoint,
-                method=method,
-                duration_ms=duration_ms,
-                memory_delta=memory_delta,
-                user_id=user_id,
-                request_id=request_id
-            )
+            self._record_endpoint_metrics(endpoint, method, time.perf_counter() - start_time)
+
+    @asynccontextmanager
+    async def track_operation(self, operation_name: str):
+        """Context manager to track any named operation (errors are counted and re-raised)"""
+        start_time = time.perf_counter()
+        labels = labels_of(operation=operation_name)
+
+        try:
+            yield
+
+        except Exception:
+            self.registry.inc("operation_errors_total", labels)
+            raise
+
+        finally:
+            self.registry.observe("operation_duration_seconds", labels, time.perf_counter() - start_time)
 
     @asynccontextmanager
     async def track_database_query(self, query_type: str, query_description: str = ""):
         """Context manager to track database query performance"""
         query_id = str(uuid4())
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         try:
             yield query_id
 
         finally:
-            end_time = time.time()
-            duration_ms = (end_time - start_time) * 1000
+            duration_ms = (time.perf_counter() - start_time) * 1000
 
             await self._record_database_metrics(
                 query_type=query_type,
@@ -172,158 +172,119 @@ class PerformanceMonitoringService:
     async def track_cache_operation(self, operation: str, cache_type: str = "redis"):
         """Context manager to track cache operation performance"""
         operation_id = str(uuid4())
-        start_time = time.time()
+        start_time = time.perf_counter()
 
         try:
             yield operation_id
 
         finally:
-            end_time = time.time()
-            duration_ms = (end_time - start_time) * 1000
+            duration_ms = (time.perf_counter() - start_time) * 1000
 
-            await self._record_cache_metrics(
+            self._record_cache_metrics(
                 operation=operation,
                 cache_type=cache_type,
                 duration_ms=duration_ms,
                 operation_id=operation_id
             )
 
-    async def _record_endpoint_metrics(self, endpoint: str, method: str, duration_ms: float,
-                                     memory_delta: int, user_id: Optional[UUID], request_id: str):
-        """Record endpoint performance metrics"""
-        try:
-            redis_client = await self._get_redis()
-            timestamp = datetime.utcnow()
-
-            # Endpoint key
-            endpoint_key = f"perf:endpoint:{endpoint}:{method}"
-
-            # Metrics data
-            metrics_data = {
-                "duration_ms": duration_ms,
-                "memory_delta": memory_delta,
-                "timestamp": timestamp.isoformat(),
-                "user_id": str(user_id) if user_id else None,
-                "request_id": request_id
-            }
-
-            # Store detailed metrics (24h TTL)
-            detail_key = f"{endpoint_key}:{timestamp.strftime('%Y%m%d_%H')}"
-            await redis_client.lpush(detail_key, str(metrics_data))
-            await redis_client.expire(detail_key, 86400)  # 24 hours
-
-            # Update aggregate metrics
-            await self._update_aggregate_metrics(endpoint_key, duration_ms, timestamp)
-
-            # Check SLA violations
-            await self._check_api_sla_violations(endpoint, method, duration_ms)
-
-        except Exception as e:
-            logger.error(f"Error recording endpoint metrics: {e}")
+    def _record_endpoint_metrics(self, endpoint: str, method: str, duration_seconds: float):
+        """Record endpoint latency in the in-process histograms"""
+        self.registry.observe(
+            "http_request_duration_seconds", labels_of(method=method, route=endpoint), duration_seconds
+        )
 
     async def _record_database_metrics(self, query_type: str, query_description: str,
                                      duration_ms: float, query_id: str):
         """Record database query performance metrics"""
-        try:
-            redis_client = await self._get_redis()
-            timestamp = datetime.utcnow()
-
-            # Database metrics key
-            db_key = f"perf:database:{query_type}"
-
-            # Metrics data
-            metrics_data = {
-                "duration_ms": duration_ms,
-                "query_description": query_description,
-                "timestamp": timestamp.isoformat(),
-                "query_id": query_id
-            }
+        self.registry.observe("db_query_duration_seconds", labels_of(query_type=query_type), duration_ms / 1000)
 
-            # Store detailed metrics (24h TTL)
-            detail_key = f"{db_key}:{timestamp.strftime('%Y%m%d_%H')}"
-            await redis_client.lpush(detail_key, str(metrics_data))
-            await redis_client.expire(detail_key, 86400)
-
-            # Update aggregate metrics
-            await self._update_aggregate_metrics(db_key, duration_ms, timestamp)
-
-            # Check for slow queries
-            if duration_ms > self.slas.DB_SLOW_QUERY_THRESHOLD:
+        # Check for slow queries
+        if duration_ms > self.slas.DB_SLOW_QUERY_THRESHOLD:
+            try:
                 await self._alert_slow_query(query_type, query_description, duration_ms)
+            except Exception as e:
+                logger.error(f"Error recording slow query alert: {e}")
 
-        except Exception as e:
-            logger.error(f"Error recording database metrics: {e}")
-
-    async def _record_cache_metrics(self, operation: str, cache_type: str,
-                                  duration_ms: float, operation_id: str):
+    def _record_cache_metrics(self, operation: str, cache_type: str,
+                              duration_ms: float, operation_id: str):
         """Record cache operation performance metrics"""
-        try:
-            redis_client = await self._get_redis()
-            timestamp = datetime.utcnow()
-
-            # Cache metrics key
-            cache_key = f"perf:cache:{cache_type}:{operation}"
+        self.registry.observe(
+            "cache_operation_duration_seconds",
+            labels_of(cache=cache_type, operation=operation),
+            duration_ms / 1000
+        )
 
-            # Metrics data
-            metrics_data = {
-                "duration_ms": duration_ms,
-                "timestamp": timestamp.isoformat(),
-                "operation_id": operation_id
+    async def record_cache_hit(self, cache_key: str, namespace: str = "default"):
+        """Count a cache hit (per namespace; keys are not labels)"""
+        self.registry.inc("cache_requests_total", labels_of(namespace=namespace, result="hit"))
+
+    async def record_cache_miss(self, cache_key: str, namespace: str = "default"):
+        """Count a cache miss"""
+        self.registry.inc("cache_requests_total", labels_of(namespace=namespace, result="miss"))
+
+    async def record_cache_invalidation(self, pattern: str, namespace: str = "default"):
+        """Count a pattern invalidation"""
+        self.registry.inc("cache_invalidations_total", labels_of(namespace=namespace))
+
+    async def evaluate_slas(self) -> List[Dict[str, Any]]:
+        """
+        Check p95/p99 of every route and query type against PerformanceSLAs.
+
+        Each series is evaluated over the values recorded since its previous
+        evaluation, once it has METRICS_SLA_MIN_SAMPLES of them; violations
+        are alerted and returned.
+        """
+        checks = (
+            ("http_request_duration_seconds", "API_RESPONSE",
+             self.slas.API_RESPONSE_P95_THRESHOLD, self.slas.API_RESPONSE_P99_THRESHOLD),
+            ("db_query_duration_seconds", "DB_QUERY",
+             self.slas.DB_QUERY_P95_THRESHOLD, self.slas.DB_QUERY_P99_THRESHOLD),
+        )
+        violations = []
+
+        for name, sla_type, p95_threshold, p99_threshold in checks:
+            for labels, histogram in self.registry.select(name).items():
+                window = histogram.since(self._sla_baseline.get((name, labels)))
+                if window.count < settings.METRICS_SLA_MIN_SAMPLES:
+                    continue  # La ventana sigue abierta hasta tener muestras suficientes
+                self._sla_baseline[(name, labels)] = histogram.copy()
+
+                resource = " ".join(value for _, value in labels)
+                for quantile, threshold in (("P95", p95_threshold), ("P99", p99_threshold)):
+                    actual = window.percentile(0.95 if quantile == "P95" else 0.99) * 1000
+                    if actual > threshold:
+                        violations.append({
+                            "type": f"{sla_type}_{quantile}",
+                            "resource": resource,
+                            "actual": round(actual, 2),
+                            "threshold": threshold,
+                            "samples": window.count
+                        })
+                        await self._alert_sla_violation(f"{sla_type}_{quantile}", resource, actual, threshold)
+
+        return violations
+
+    def get_latency_sla_compliance(self) -> Dict[str, Any]:
+        """Real p95/p99 per route (all workers, since start) against the API SLAs"""
+        routes = {}
+        for labels, histogram in self.registry.collect().select("http_request_duration_seconds").items():
+            p95 = histogram.percentile(0.95) * 1000
+            p99 = histogram.percentile(0.99) * 1000
+            routes[" ".join(value for _, value in labels)] = {
+                "request_count": histogram.count,
+                "p95_ms": round(p95, 2),
+                "p99_ms": round(p99, 2),
+                "p95_under_threshold": p95 <= self.slas.API_RESPONSE_P95_THRESHOLD,
+                "p99_under_threshold": p99 <= self.slas.API_RESPONSE_P99_THRESHOLD
             }
 
-            # Store detailed metrics (24h TTL)
-            detail_key = f"{cache_key}:{timestamp.strftime('%Y%m%d_%H')}"
-            await redis_client.lpush(detail_key, str(metrics_data))
-            await redis_client.expire(detail_key, 86400)
-
-            # Update aggregate metrics
-            await self._update_aggregate_metrics(cache_key, duration_ms, timestamp)
-
-        except Exception as e:
-            logger.error(f"Error recording cache metrics: {e}")
-
-    async def _update_aggregate_metrics(self, key: str, duration_ms: float, timestamp: datetime):
-        """Update aggregate performance metrics"""
-        try:
-            redis_client = await self._get_redis()
-
-            # Current hour aggregate
-            hour_key = f"{key}:agg:{timestamp.strftime('%Y%m%d_%H')}"
-
-            # Use Redis pipeline for atomic operations
-            pipe = redis_client.pipeline()
-
-            # Increment request count
-            pipe.hincrby(hour_key, "count", 1)
-
-            # Update sum for average calculation
-            pipe.hincrbyfloat(hour_key, "sum_duration", duration_ms)
-
-            # Update min/max
-            current_stats = await redis_client.hmget(hour_key, "min_duration", "max_duration")
-            min_duration = float(current_stats[0]) if current_stats[0] else float('inf')
-            max_duration = float(current_stats[1]) if current_stats[1] else 0
-
-            pipe.hset(hour_key, "min_duration", min(min_duration, duration_ms))
-            pipe.hset(hour_key, "max_duration", max(max_duration, duration_ms))
-
-            # Set expiry (7 days)
-            pipe.expire(hour_key, 604800)
-
-            await pipe.execute()
-
-        except Exception as e:
-            logger.error(f"Error updating aggregate metrics: {e}")
-
-    async def _check_api_sla_violations(self, endpoint: str, method: str, duration_ms: float):
-        """Check for API SLA violations and alert"""
-        if duration_ms > self.slas.API_RESPONSE_P99_THRESHOLD:
-            await self._alert_sla_violation(
-                "API_RESPONSE_TIME",
-                f"{method} {endpoint}",
-                duration_ms,
-                self.slas.API_RESPONSE_P99_THRESHOLD
-            )
+        return {
+            "routes": routes,
+            "compliant_routes": sum(
+                1 for route in routes.values() if route["p95_under_threshold"] and route["p99_under_threshold"]
+            ),
+            "total_routes": len(routes)
+        }
 
     async def _alert_slow_query(self, query_type: str, query_description: str, duration_ms: float):
         """Alert on slow database queries"""
@@ -367,48 +328,89 @@ class PerformanceMonitoringService:
         await redis_client.expire("perf:alerts:sla_violations", 86400)
 
     async def get_endpoint_performance_summary(self, endpoint: str, method: str, hours: int = 1) -> Dict[str, Any]:
-        """Get performance summary for specific endpoint"""
-        try:
-            redis_client = await self._get_redis()
-            current_time = datetime.utcnow()
+        """
+        Get performance summary for specific endpoint.
 
-            endpoint_key = f"perf:endpoint:{endpoint}:{method}"
-            total_stats = {"count": 0, "sum_duration": 0, "min_duration": float('inf'), "max_duration": 0}
+        Figures cover every worker since it started; ``hours`` is kept for API
+        compatibility (per-window rates come from Prometheus on /metrics).
+        """
+        try:
+            histogram = self.registry.collect().histogram(
+                "http_request_duration_seconds", method=method, route=endpoint
+            )
+            return self._summarize(f"{method} {endpoint}", histogram or Histogram())
 
-            # Aggregate data over specified hours
-            for hour in range(hours):
-                hour_time = current_time - timedelta(hours=hour)
-                hour_key = f"{endpoint_key}:agg:{hour_time.strftime('%Y%m%d_%H')}"
+        except Exception as e:
+            logger.error(f"Error getting endpoint performance summary: {e}")
+            return {}
 
-                stats = await redis_client.hmget(
-                    hour_key, "count", "sum_duration", "min_duration", "max_duration"
-                )
+    def _summarize(self, resource: str, histogram: Histogram) -> Dict[str, Any]:
+        """Latency summary (ms) with SLA compliance on the real percentiles"""
+        p95 = histogram.percentile(0.95) * 1000
+        p99 = histogram.percentile(0.99) * 1000
+        mean = histogram.mean * 1000
+
+        return {
+            "endpoint": resource,
+            "request_count": histogram.count,
+            "avg_response_time_ms": round(mean, 2),
+            "min_response_time_ms": round(histogram.min * 1000, 2) if histogram.count else 0,
+            "max_response_time_ms": round(histogram.max * 1000, 2),
+            "p50_response_time_ms": round(histogram.percentile(0.50) * 1000, 2),
+            "p95_response_time_ms": round(p95, 2),
+            "p99_response_time_ms": round(p99, 2),
+            "sla_compliance": {
+                "mean_under_threshold": mean < self.slas.API_RESPONSE_MEAN_THRESHOLD,
+                "p95_under_threshold": p95 <= self.slas.API_RESPONSE_P95_THRESHOLD,
+                "p99_under_threshold": p99 <= self.slas.API_RESPONSE_P99_THRESHOLD
+            }
+        }
 
-                if stats[0]:  # If data exists
-                    total_stats["count"] += int(stats[0])
-                    total_stats["sum_duration"] += float(stats[1] or 0)
-                    total_stats["min_duration"] = min(total_stats["min_duration"], float(stats[2] or float('inf')))
-                    total_stats["max_duration"] = max(total_stats["max_duration"], float(stats[3] or 0))
+    def get_metrics_summary(self, time_range: str = "1h") -> Dict[str, Any]:
+        """API and DB latency summaries from the merged metrics (cumulative; ``time_range`` is informative)"""
+        snapshot = self.registry.collect()
+        return {
+            "time_range": time_range,
+            "api_metrics": {
+                " ".join(value for _, value in labels): self._summarize(" ".join(value for _, value in labels), histogram)
+                for labels, histogram in snapshot.select("http_request_duration_seconds").items()
+            },
+            "db_metrics": {
+                dict(labels)["query_type"]: self._summarize(dict(labels)["query_type"], histogram)
+                for labels, histogram in snapshot.select("db_query_duration_seconds").items()
+            }
+        }
 
-            # Calculate averages and percentiles
-            avg_duration = total_stats["sum_duration"] / max(total_stats["count"], 1)
+    def get_current_metrics(self) -> Dict[str, Any]:
+        """Headline figures across all series"""
+        snapshot = self.registry.collect()
+        db = Histogram()
+        for histogram in snapshot.select("db_query_duration_seconds").values():
+            db.merge(histogram)
+        api = Histogram()
+        for histogram in snapshot.select("http_request_duration_seconds").values():
+            api.merge(histogram)
+
+        return {
+            "avg_db_query_time": round(db.mean * 1000, 2),
+            "p95_db_query_time": round(db.percentile(0.95) * 1000, 2),
+            "avg_api_response_time": round(api.mean * 1000, 2),
+            "p95_api_response_time": round(api.percentile(0.95) * 1000, 2),
+            "p99_api_response_time": round(api.percentile(0.99) * 1000, 2),
+            "active_requests": len(self.active_requests)
+        }
 
-            return {
-                "endpoint": f"{method} {endpoint}",
-                "time_period_hours": hours,
-                "request_count": total_stats["count"],
-                "avg_response_time_ms": round(avg_duration, 2),
-                "min_response_time_ms": round(total_stats["min_duration"], 2) if total_stats["min_duration"] != float('inf') else 0,
-                "max_response_time_ms": round(total_stats["max_duration"], 2),
-                "sla_compliance": {
-                    "mean_under_threshold": avg_duration < self.slas.API_RESPONSE_MEAN_THRESHOLD,
-                    "max_under_p99_threshold": total_stats["max_duration"] < self.slas.API_RESPONSE_P99_THRESHOLD
-                }
-            }
+    async def initialize(self):
+        """Nothing to set up: metrics live in memory, Redis is connected lazily for alerts"""
 
-        except Exception as e:
-            logger.error(f"Error getting endpoint performance summary: {e}")
-            return {}
+    async def health_check(self) -> Dict[str, Any]:
+        """Metrics core status"""
+        return {
+            "status": "healthy",
+            "series": len(self.registry.counters) + len(self.registry.histograms) + len(self.registry.gauges),
+            "active_requests": len(self.active_requests),
+            "multiprocess": bool(self.registry.multiproc_dir)
+        }
 
     async def get_system_performance_metrics(self) -> Dict[str, Any]:
         """Get current system performance metrics"""
@@ -509,24 +511,9 @@ class PerformanceMonitoringService:
             return []
 
     async def record_custom_metric(self, metric_name: str, value: float, tags: Optional[Dict[str, str]] = None):
-        """Record custom performance metric"""
-        try:
-            redis_client = await self._get_redis()
-            timestamp = datetime.utcnow()
-
-            metric_data = {
-                "value": value,
-                "tags": tags or {},
-                "timestamp": timestamp.isoformat()
-            }
-
-            # Store metric
-            metric_key = f"perf:custom:{metric_name}:{timestamp.strftime('%Y%m%d_%H')}"
-            await redis_client.lpush(metric_key, str(metric_data))
-            await redis_client.expire(metric_key, 604800)  # 7 days
-
-        except Exception as e:
-            logger.error(f"Error recording custom metric: {e}")
+        """Record custom performance metric (gauge, last value wins)"""
+        name = "custom_" + re.sub(r"[^a-zA-Z0-9_]", "_", metric_name)
+        self.registry.set_gauge(name, labels_of(**(tags or {})), value)
 
     async def generate_performance_report(self) -> Dict[str, Any]:
         """Generate comprehensive performance report"""
@@ -538,20 +525,9 @@ class PerformanceMonitoringService:
             alerts = await self.get_performance_alerts(hours=24)
 
             # Get top endpoints by request count
-            redis_client = await self._get_redis()
-            endpoint_keys = await redis_client.keys("perf:endpoint:*:agg:*")
-
-            endpoint_summary = {}
-            for key in endpoint_keys[:10]:  # Top 10 endpoints
-                parts = key.split(':')
-                if len(parts) >= 4:
-                    endpoint = parts[2]
-                    method = parts[3] if len(parts) > 3 else "GET"
-
-                    if endpoint not in endpoint_summary:
-                        summary = await self.get_endpoint_performance_summary(endpoint, method, hours=24)
-                        if summary.get("request_count", 0) > 0:
-                            endpoint_summary[f"{method} {endpoint}"] = summary
+            api_metrics = self.get_metrics_summary()["api_metrics"]
+            top_endpoints = sorted(api_metrics.items(), key=lambda item: item[1]["request_count"], reverse=True)
+            endpoint_summary = dict(top_endpoints[:10])  # Top 10 endpoints
 
             return {
                 "report_generated_at": datetime.utcnow().isoformat(),
@@ -574,6 +550,9 @@ class PerformanceMonitoringService:
 # Global performance monitoring service instance
 performance_monitoring_service = PerformanceMonitoringService()
 
+# SLAs de latencia evaluados en la tarea periódica del núcleo de métricas
+metrics.add_periodic_hook(performance_monitoring_service.evaluate_slas)
+
 
 async def get_performance_monitoring_service() -> PerformanceMonitoringService:
     """Dependency function to get performance monitoring service instance"""
@@ -2,7 +2,7 @@
 Enterprise Rate Limiting Service for MeStore.
 
 This module provides comprehensive rate limiting capabilities:
-- IP-based rate limiting with sliding window
+- IP-based rate limiting with GCRA (single Redis call per request)
 - User-based rate limiting for authenticated requests
 - Endpoint-specific rate limiting
 - Enterprise security patterns for Colombian compliance
@@ -12,14 +12,16 @@ Version: 1.0.0 Enterprise
 """
 
 import json
+import math
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from enum import Enum
 from pydantic import BaseModel
 from fastapi import Request
 
 from app.core.config import settings
 from app.core.logger import get_logger
+from app.core.rate_limit_engine import RateLimitDecision, RateLimitEngine, RateLimitRule
 
 logger = get_logger(__name__)
 
@@ -43,20 +45,28 @@ class RateLimitResult(BaseModel):
 
 class EnterpriseRateLimitingService:
     """
-    Enterprise-grade rate limiting service using Redis sliding window.
+    Enterprise-grade rate limiting service using the shared GCRA engine.
 
     Features:
     - Multiple rate limiting strategies
-    - Sliding window counters
+    - GCRA counters evaluated atomically in one EVALSHA call
     - Burst protection
     - Whitelist/blacklist support
     - Real-time monitoring
     """
 
-    def __init__(self, redis_client):
+    # (window seconds, max requests, key suffix)
+    # SECURITY FIX: More restrictive IP limits for better security
+    IP_LIMITS = [(60, 60, "1m"), (3600, 600, "1h"), (86400, 2400, "1d")]
+    # SECURITY FIX: More reasonable limits for authenticated users
+    USER_LIMITS = [(60, 120, "1m"), (3600, 2400, "1h"), (86400, 7200, "1d")]
+
+    def __init__(self, redis_client, engine: Optional[RateLimitEngine] = None):
         """Initialize rate limiting service with Redis client."""
         self.redis = redis_client
-        self.rate_limit_prefix = "rate_limit:"
+        self.engine = engine or RateLimitEngine(redis_client)
+        # Claves GCRA (un valor TAT por clave); prefijo distinto a los sorted sets anteriores
+        self.rate_limit_prefix = "rate_limit:gcra:"
         self.whitelist_prefix = "whitelist:"
         self.blacklist_prefix = "blacklist:"
 
@@ -69,6 +79,10 @@ class EnterpriseRateLimitingService:
         """
         Check if a request should be rate limited.
 
+        Whitelist, blacklist and every endpoint/user/IP window are evaluated
+        by the GCRA engine in a single Redis call (or none, when a local
+        lease covers the request).
+
         Args:
             request: FastAPI request object
             endpoint: API endpoint being accessed
@@ -77,52 +91,19 @@ class EnterpriseRateLimitingService:
         Returns:
             RateLimitResult: Rate limit check result
         """
+        ip_address = getattr(request.client, 'host', 'unknown') if request.client else 'unknown'
         try:
-            ip_address = getattr(request.client, 'host', 'unknown') if request.client else 'unknown'
-
-            # Check IP whitelist first
-            if await self._is_whitelisted_ip(ip_address):
-                return RateLimitResult(
-                    allowed=True,
-                    remaining_requests=9999,
-                    reset_time=datetime.now(timezone.utc) + timedelta(hours=1),
-                    limit_type=RateLimitType.GLOBAL
-                )
-
-            # Check IP blacklist
-            if await self._is_blacklisted_ip(ip_address):
-                return RateLimitResult(
-                    allowed=False,
-                    remaining_requests=0,
-                    reset_time=datetime.now(timezone.utc) + timedelta(hours=24),
-                    limit_type=RateLimitType.GLOBAL,
-                    retry_after_seconds=86400
-                )
-
-            # Check different rate limit types in order of specificity
-            checks = []
-
-            # 1. Endpoint-specific rate limits
-            endpoint_result = await self._check_endpoint_rate_limit(ip_address, endpoint, user_id)
-            checks.append(endpoint_result)
-
-            # 2. User-based rate limits (if authenticated)
+            rules = self._endpoint_rules(ip_address, endpoint, user_id)
             if user_id:
-                user_result = await self._check_user_rate_limit(user_id)
-                checks.append(user_result)
+                rules += self._user_rules(user_id)
+            rules += self._ip_rules(ip_address)
 
-            # 3. IP-based rate limits
-            ip_result = await self._check_ip_rate_limit(ip_address)
-            checks.append(ip_result)
-
-            # Return the most restrictive result
-            for result in checks:
-                if not result.allowed:
-                    return result
-
-            # If all checks pass, return the most restrictive allowed result
-            most_restrictive = min(checks, key=lambda x: x.remaining_requests)
-            return most_restrictive
+            decision = await self.engine.check(
+                rules,
+                allow_key=f"{self.whitelist_prefix}ip:{ip_address}",
+                deny_key=f"{self.blacklist_prefix}ip:{ip_address}"
+            )
+            return self._to_result(decision)
 
         except Exception as e:
             logger.critical("Critical rate limiting service failure", error=str(e), endpoint=endpoint, ip=ip_address)
@@ -152,206 +133,103 @@ class EnterpriseRateLimitingService:
                     limit_type=RateLimitType.GLOBAL
                 )
 
-    async def _check_ip_rate_limit(self, ip_address: str) -> RateLimitResult:
-        """Check IP-based rate limits."""
-        try:
-            # SECURITY FIX: More restrictive IP limits for better security
-            limits = [
-                {"window": 60, "max_requests": 60, "key_suffix": "1m"},       # Reduced from 100
-                {"window": 3600, "max_requests": 600, "key_suffix": "1h"},    # Reduced from 1000
-                {"window": 86400, "max_requests": 2400, "key_suffix": "1d"}   # Reduced from 5000
-            ]
-
-            for limit in limits:
-                key = f"{self.rate_limit_prefix}ip:{ip_address}:{limit['key_suffix']}"
-                current_count, reset_time = await self._sliding_window_counter(
-                    key, limit['window'], limit['max_requests']
-                )
-
-                if current_count > limit['max_requests']:
-                    return RateLimitResult(
-                        allowed=False,
-                        remaining_requests=0,
-                        reset_time=reset_time,
-                        limit_type=RateLimitType.IP_BASED,
-                        retry_after_seconds=int((reset_time - datetime.now(timezone.utc)).total_seconds())
-                    )
-
-            # Return most restrictive window that's still allowing requests
-            key = f"{self.rate_limit_prefix}ip:{ip_address}:1m"
-            current_count, reset_time = await self._sliding_window_counter(key, 60, 60)
-
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=max(0, 60 - current_count),
-                reset_time=reset_time,
-                limit_type=RateLimitType.IP_BASED
-            )
-
-        except Exception as e:
-            logger.error("Error checking IP rate limit", error=str(e), ip=ip_address)
-            # SECURITY FIX: Fail with conservative limits when Redis unavailable
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=10,  # Very conservative limit
-                reset_time=datetime.now(timezone.utc) + timedelta(minutes=1),
-                limit_type=RateLimitType.IP_BASED
+    def _window_rules(
+        self,
+        limit_type: RateLimitType,
+        scope_key: str,
+        identifier: str,
+        windows: List[Tuple[int, int, str]]
+    ) -> List[RateLimitRule]:
+        return [
+            RateLimitRule(
+                key=f"{self.rate_limit_prefix}{scope_key}:{identifier}:{suffix}",
+                limit=max_requests,
+                period_seconds=window,
+                scope=limit_type.value
             )
+            for window, max_requests, suffix in windows
+        ]
 
-    async def _check_user_rate_limit(self, user_id: str) -> RateLimitResult:
-        """Check user-based rate limits for authenticated users."""
-        try:
-            # SECURITY FIX: More reasonable limits for authenticated users
-            limits = [
-                {"window": 60, "max_requests": 120, "key_suffix": "1m"},      # Reduced from 200
-                {"window": 3600, "max_requests": 2400, "key_suffix": "1h"},   # Reduced from 5000
-                {"window": 86400, "max_requests": 7200, "key_suffix": "1d"}   # Reduced from 20000
-            ]
-
-            for limit in limits:
-                key = f"{self.rate_limit_prefix}user:{user_id}:{limit['key_suffix']}"
-                current_count, reset_time = await self._sliding_window_counter(
-                    key, limit['window'], limit['max_requests']
-                )
-
-                if current_count > limit['max_requests']:
-                    return RateLimitResult(
-                        allowed=False,
-                        remaining_requests=0,
-                        reset_time=reset_time,
-                        limit_type=RateLimitType.USER_BASED,
-                        retry_after_seconds=int((reset_time - datetime.now(timezone.utc)).total_seconds())
-                    )
-
-            # Return most restrictive window
-            key = f"{self.rate_limit_prefix}user:{user_id}:1m"
-            current_count, reset_time = await self._sliding_window_counter(key, 60, 120)
-
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=max(0, 120 - current_count),
-                reset_time=reset_time,
-                limit_type=RateLimitType.USER_BASED
-            )
+    def _ip_rules(self, ip_address: str) -> List[RateLimitRule]:
+        """IP-based limits (1m / 1h / 1d)."""
+        return self._window_rules(RateLimitType.IP_BASED, "ip", ip_address, self.IP_LIMITS)
 
-        except Exception as e:
-            logger.error("Error checking user rate limit", error=str(e), user_id=user_id)
-            # SECURITY FIX: Fail with conservative limits
-            return RateLimitResult(
-                allowed=True,
-                remaining_requests=20,  # Conservative limit
-                reset_time=datetime.now(timezone.utc) + timedelta(minutes=1),
-                limit_type=RateLimitType.USER_BASED
-            )
+    def _user_rules(self, user_id: str) -> List[RateLimitRule]:
+        """User-based limits for authenticated users (1m / 1h / 1d)."""
+        return self._window_rules(RateLimitType.USER_BASED, "user", user_id, self.USER_LIMITS)
 
-    async def _check_endpoint_rate_limit(
+    def _endpoint_rules(
         self,
         ip_address: str,
         endpoint: str,
         user_id: Optional[str] = None
-    ) -> RateLimitResult:
-        """Check endpoint-specific rate limits."""
-        try:
-            # Define endpoint-specific limits
-            endpoint_limits = {
-                "auth/login": {"window": 3600, "max_requests": settings.RATE_LIMIT_LOGIN_ATTEMPTS_PER_HOUR},
-                "auth/forgot-password": {"window": 86400, "max_requests": settings.RATE_LIMIT_PASSWORD_RESET_PER_DAY},
-                "auth/register": {"window": 86400, "max_requests": 5},  # 5 registrations per day per IP
-                "otp/send": {"window": 3600, "max_requests": settings.RATE_LIMIT_OTP_REQUESTS_PER_HOUR}
-            }
-
-            # Normalize endpoint name
-            endpoint_key = endpoint.lstrip('/').replace('/', '_')
-
-            if endpoint_key in endpoint_limits:
-                limit = endpoint_limits[endpoint_key]
-                identifier = user_id if user_id else ip_address
-                key = f"{self.rate_limit_prefix}endpoint:{endpoint_key}:{identifier}"
-
-                current_count, reset_time = await self._sliding_window_counter(
-                    key, limit['window'], limit['max_requests']
-                )
-
-                if current_count > limit['max_requests']:
-                    return RateLimitResult(
-                        allowed=False,
-                        remaining_requests=0,
-                        reset_time=reset_time,
-                        limit_type=RateLimitType.ENDPOINT_BASED,
-                        retry_after_seconds=int((reset_time - datetime.now(timezone.utc)).total_seconds())
-                    )
-
-                return RateLimitResult(
-                    allowed=True,
-                    remaining_requests=max(0, limit['max_requests'] - current_count),
-                    reset_time=reset_time,
-                    limit_type=RateLimitType.ENDPOINT_BASED
-                )
-
-            # No specific limit for this endpoint
+    ) -> List[RateLimitRule]:
+        """Endpoint-specific limits, keyed by user when authenticated or by IP otherwise."""
+        endpoint_limits = {
+            "auth/login": {"window": 3600, "max_requests": settings.RATE_LIMIT_LOGIN_ATTEMPTS_PER_HOUR},
+            "auth/forgot-password": {"window": 86400, "max_requests": settings.RATE_LIMIT_PASSWORD_RESET_PER_DAY},
+            "auth/register": {"window": 86400, "max_requests": 5},  # 5 registrations per day per IP
+            "otp/send": {"window": 3600, "max_requests": settings.RATE_LIMIT_OTP_REQUESTS_PER_HOUR}
+        }
+
+        # Normalize endpoint name ("/auth/login" -> "auth/login"; "auth_login" in the Redis key)
+        limit = endpoint_limits.get(endpoint.strip('/'))
+        if limit is None:
+            return []
+        endpoint_key = endpoint.strip('/').replace('/', '_')
+
+        identifier = user_id if user_id else ip_address
+        return [RateLimitRule(
+            key=f"{self.rate_limit_prefix}endpoint:{endpoint_key}:{identifier}",
+            limit=limit['max_requests'],
+            period_seconds=limit['window'],
+            scope=RateLimitType.ENDPOINT_BASED.value
+        )]
+
+    @staticmethod
+    def _to_result(decision: RateLimitDecision) -> RateLimitResult:
+        """Map an engine decision to the public RateLimitResult."""
+        now = datetime.now(timezone.utc)
+        if decision.source == "allowlist":
             return RateLimitResult(
                 allowed=True,
                 remaining_requests=9999,
-                reset_time=datetime.now(timezone.utc) + timedelta(hours=1),
-                limit_type=RateLimitType.ENDPOINT_BASED
+                reset_time=now + timedelta(hours=1),
+                limit_type=RateLimitType.GLOBAL
+            )
+        if decision.source == "denylist":
+            return RateLimitResult(
+                allowed=False,
+                remaining_requests=0,
+                reset_time=now + timedelta(hours=24),
+                limit_type=RateLimitType.GLOBAL,
+                retry_after_seconds=86400
             )
 
-        except Exception as e:
-            logger.error("Error checking endpoint rate limit", error=str(e), endpoint=endpoint)
-            # SECURITY FIX: Conservative fallback for endpoint limits
+        state = decision.most_restrictive
+        if state is None:
             return RateLimitResult(
                 allowed=True,
-                remaining_requests=5,  # Very conservative for endpoint-specific
-                reset_time=datetime.now(timezone.utc) + timedelta(minutes=5),
-                limit_type=RateLimitType.ENDPOINT_BASED
+                remaining_requests=9999,
+                reset_time=now + timedelta(hours=1),
+                limit_type=RateLimitType.GLOBAL
             )
 
-    async def _sliding_window_counter(
-        self,
-        key: str,
-        window_seconds: int,
-        max_requests: int
-    ) -> Tuple[int, datetime]:
-        """
-        Implement sliding window rate limiting using Redis sorted sets.
-
-        Args:
-            key: Redis key for the counter
-            window_seconds: Time window in seconds
-            max_requests: Maximum requests allowed in the window
-
-        Returns:
-            Tuple[int, datetime]: Current count and reset time
-        """
-        try:
-            now = datetime.now(timezone.utc)
-            window_start = now - timedelta(seconds=window_seconds)
-
-            # Remove expired entries
-            await self.redis.zremrangebyscore(
-                key,
-                0,
-                window_start.timestamp()
+        if not decision.allowed:
+            return RateLimitResult(
+                allowed=False,
+                remaining_requests=0,
+                reset_time=now + timedelta(seconds=state.reset_after),
+                limit_type=RateLimitType(state.rule.scope),
+                retry_after_seconds=max(1, math.ceil(state.retry_after))
             )
 
-            # Add current request
-            await self.redis.zadd(key, {str(now.timestamp()): now.timestamp()})
-
-            # Set expiration for the key
-            await self.redis.expire(key, window_seconds + 60)
-
-            # Count current requests in window
-            current_count = await self.redis.zcard(key)
-
-            # Calculate reset time (start of next window)
-            reset_time = now + timedelta(seconds=window_seconds)
-
-            return current_count, reset_time
-
-        except Exception as e:
-            logger.error("Error in sliding window counter", error=str(e), key=key)
-            # Return conservative values on error
-            return 0, datetime.now(timezone.utc) + timedelta(seconds=window_seconds)
+        return RateLimitResult(
+            allowed=True,
+            remaining_requests=state.remaining,
+            reset_time=now + timedelta(seconds=state.reset_after),
+            limit_type=RateLimitType(state.rule.scope)
+        )
 
     async def _is_whitelisted_ip(self, ip_address: str) -> bool:
         """Check if IP is whitelisted."""
@@ -404,6 +282,9 @@ class EnterpriseRateLimitingService:
                     "reason": "rate_limit_exceeded"
                 })
             )
+            # Las leases locales de este proceso no deben seguir admitiendo la IP;
+            # en los demás expiran como máximo en MAX_LEASE_TTL (1s)
+            self.engine.invalidate(blacklist_key)
             logger.warning("IP added to blacklist", ip_address=ip_address, duration_hours=duration_hours)
             return True
         except Exception as e:
@@ -432,21 +313,27 @@ class EnterpriseRateLimitingService:
             logger.error("Error removing IP from blacklist", error=str(e), ip_address=ip_address)
             return False
 
+    def _rules_for(self, identifier: str, limit_type: RateLimitType) -> Optional[List[RateLimitRule]]:
+        if limit_type == RateLimitType.IP_BASED:
+            return self._ip_rules(identifier)
+        if limit_type == RateLimitType.USER_BASED:
+            return self._user_rules(identifier)
+        return None
+
     async def get_rate_limit_stats(self, identifier: str, limit_type: RateLimitType) -> Dict:
         """Get rate limiting statistics for monitoring."""
         try:
-            if limit_type == RateLimitType.IP_BASED:
-                prefix = f"{self.rate_limit_prefix}ip:{identifier}"
-            elif limit_type == RateLimitType.USER_BASED:
-                prefix = f"{self.rate_limit_prefix}user:{identifier}"
-            else:
+            rules = self._rules_for(identifier, limit_type)
+            if rules is None:
                 return {"error": "Unsupported limit type for stats"}
 
+            # Un solo MGET para todas las ventanas; el consumo se deriva del TAT
+            tats = await self.redis.mget([rule.key for rule in rules])
+            now_ms = (await self.redis.time())[0] * 1000
             stats = {}
-            for window in ["1m", "1h", "1d"]:
-                key = f"{prefix}:{window}"
-                count = await self.redis.zcard(key)
-                stats[window] = count
+            for rule, tat in zip(rules, tats):
+                used = max(0.0, float(tat) - now_ms) / rule.emission_interval_ms if tat else 0.0
+                stats[rule.key.rsplit(":", 1)[-1]] = min(rule.limit, math.ceil(used))
 
             return {
                 "identifier": identifier,
@@ -462,21 +349,18 @@ class EnterpriseRateLimitingService:
     async def reset_rate_limit(self, identifier: str, limit_type: RateLimitType) -> bool:
         """Reset rate limits for a specific identifier (admin function)."""
         try:
-            if limit_type == RateLimitType.IP_BASED:
-                prefix = f"{self.rate_limit_prefix}ip:{identifier}"
-            elif limit_type == RateLimitType.USER_BASED:
-                prefix = f"{self.rate_limit_prefix}user:{identifier}"
-            else:
+            rules = self._rules_for(identifier, limit_type)
+            if rules is None:
                 return False
 
             # Delete all time window keys
-            for window in ["1m", "1h", "1d"]:
-                key = f"{prefix}:{window}"
-                await self.redis.delete(key)
+            await self.redis.delete(*(rule.key for rule in rules))
+            for rule in rules:
+                self.engine.invalidate(rule.key)
 
             logger.info("Rate limits reset", identifier=identifier, limit_type=limit_type.value)
             return True
 
         except Exception as e:
             logger.error("Error resetting rate limits", error=str(e))
-            return False
\ No newline at end of file
+            return False
@@ -9,7 +9,7 @@
 # Ruta: ~/app/services/search_analytics_service.py
 # Autor: Data Engineering AI
 # Fecha de Creación: 2025-09-17
-# Versión: 1.0.0
+# Versión: 1.1.0
 # Propósito: Servicio de analytics avanzado para métricas de búsqueda y business intelligence
 #            Análisis de patrones, performance metrics y insights de usuario
 #
@@ -20,6 +20,7 @@
 # - User behavior analytics
 # - Business intelligence para decisiones de producto
 # - Reportes automatizados y alertas
+# - Eventos encolados y pre-agregados: un MULTI por flush, fuera del camino de la búsqueda
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -36,25 +37,68 @@ Este módulo proporciona analytics avanzados de búsqueda:
 """
 
 import asyncio
-import json
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Union
 from collections import defaultdict, Counter
 import statistics
 
+from app.core.audit_sink import AuditSink
+from app.core.config import settings
 from app.core.redis.base import RedisManager
 from app.services.search_cache_service import SearchCacheService
 
 logger = logging.getLogger(__name__)
 
+PERFORMANCE_SAMPLES = 1000  # Muestras de tiempo/resultados conservadas para percentiles
+
+
+class SearchAnalyticsBatch:
+    """
+    Escrituras de un flush, ya agregadas por clave de Redis.
+
+    N búsquedas de la misma query/día/hora suman sobre los mismos campos,
+    así el número de comandos depende de las claves distintas del lote y
+    no del número de búsquedas.
+    """
+
+    def __init__(self):
+        self.increments: Dict[str, Counter] = defaultdict(Counter)  # HINCRBY
+        self.fields: Dict[str, Dict[str, str]] = defaultdict(dict)  # HSET, gana el último
+        self.sorted_sets: Dict[str, Counter] = defaultdict(Counter)  # ZINCRBY
+        self.lists: Dict[str, List[int]] = defaultdict(list)  # LPUSH + LTRIM
+        self.expirations: Dict[str, int] = {}  # EXPIRE, una vez por clave
+
+    def apply(self, pipe) -> int:
+        """Encolar los comandos en un pipeline; devuelve cuántos se encolaron"""
+        commands = 0
+        for key, counts in self.increments.items():
+            for field_name, amount in counts.items():
+                pipe.hincrby(key, field_name, amount)
+                commands += 1
+        for key, mapping in self.fields.items():
+            pipe.hset(key, mapping=mapping)
+            commands += 1
+        for key, members in self.sorted_sets.items():
+            for member, amount in members.items():
+                pipe.zincrby(key, amount, member)
+                commands += 1
+        for key, values in self.lists.items():
+            pipe.lpush(key, *values[-PERFORMANCE_SAMPLES:])
+            pipe.ltrim(key, 0, PERFORMANCE_SAMPLES - 1)
+            commands += 2
+        for key, ttl in self.expirations.items():
+            pipe.expire(key, ttl)
+            commands += 1
+        return commands
+
 
 class SearchAnalyticsService:
     """
     Servicio de analytics avanzado para métricas de búsqueda.
 
     Proporciona:
-    - Tracking detallado de searches
+    - Tracking detallado de searches (encolado, escrito en lotes)
     - Análisis de performance
     - Business intelligence
     - Reporting automatizado
@@ -83,6 +127,16 @@ class SearchAnalyticsService:
         self.low_results_threshold = 5  # Searches with fewer results
         self.zero_results_threshold = 0  # No results
 
+        # Pipeline de eventos: cola acotada, agregada y escrita en un MULTI por flush
+        self._pipeline = AuditSink(
+            "search_analytics",
+            self._write_events,
+            max_events=settings.SEARCH_ANALYTICS_MAX_EVENTS,
+            batch_size=settings.SEARCH_ANALYTICS_BATCH_SIZE,
+            flush_interval=settings.SEARCH_ANALYTICS_FLUSH_INTERVAL_SECONDS,
+            overflow_policy="drop_oldest"
+        )
+
     async def track_search_event(
         self,
         query: str,
@@ -97,6 +151,9 @@ class SearchAnalyticsService:
         """
         Trackear evento de búsqueda con metadata detallada.
 
+        El evento solo se encola: la agregación y la escritura en Redis
+        ocurren en el flush del pipeline (un MULTI por lote).
+
         Args:
             query: Query de búsqueda
             user_id: ID del usuario (opcional)
@@ -108,39 +165,29 @@ class SearchAnalyticsService:
             source: Fuente de la búsqueda (web, mobile, api)
         """
         try:
-            timestamp = datetime.now()
-            date_str = timestamp.strftime("%Y-%m-%d")
-            hour_str = timestamp.strftime("%Y-%m-%d:%H")
-
-            # Event data
-            event_data = {
+            self._pipeline.put_nowait({
                 "query": query,
                 "user_id": user_id,
                 "user_type": user_type,
                 "results_count": results_count,
                 "search_time_ms": search_time_ms,
-                "filters_applied": json.dumps(filters_applied or {}),
+                "filters_applied": filters_applied,
                 "page": page,
                 "source": source,
-                "timestamp": timestamp.isoformat(),
-                "has_results": results_count > 0,
-                "is_slow": search_time_ms > self.slow_search_threshold,
-                "is_zero_results": results_count == 0
-            }
-
-            # Track en múltiples agregaciones
-            await asyncio.gather(
-                self._track_daily_stats(date_str, event_data),
-                self._track_hourly_stats(hour_str, event_data),
-                self._track_query_metrics(query, event_data),
-                self._track_performance_metrics(event_data),
-                self._track_user_behavior(user_id, user_type, event_data),
-                self._detect_patterns(event_data)
-            )
+                "timestamp": datetime.now(),
+            })
 
         except Exception as e:
             logger.error(f"Error tracking search event: {e}")
 
+    async def flush(self) -> None:
+        """Escribir ahora los eventos pendientes de este proceso"""
+        await self._pipeline.flush()
+
+    def get_pipeline_stats(self) -> Dict:
+        """Contadores del pipeline de eventos (encolados, escritos, descartados, lotes)"""
+        return {**self._pipeline.stats, "buffered": len(self._pipeline)}
+
     async def get_search_dashboard_metrics(
         self,
         days: int = 7,
@@ -160,6 +207,9 @@ class SearchAnalyticsService:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
 
+            # Incluir los eventos de este proceso aún sin escribir
+            await self.flush()
+
             # Obtener métricas principales en paralelo
             overview_metrics, trending_queries, performance_metrics, user_metrics = await asyncio.gather(
                 self._get_overview_metrics(start_date, end_date),
@@ -220,7 +270,9 @@ class SearchAnalyticsService:
             query_key = f"{self.queries_key}:{query}"
 
             # Obtener datos históricos de la query
-            query_data = await self.redis_manager.hgetall(query_key)
+            await self.flush()
+            client = await self.redis_manager.get_redis()
+            query_data = await client.hgetall(query_key)
 
             if not query_data:
                 return {
@@ -230,10 +282,10 @@ class SearchAnalyticsService:
                 }
 
             # Procesar métricas de la query
-            total_searches = int(query_data.get(b"total_searches", 0))
-            avg_results = float(query_data.get(b"avg_results", 0))
-            avg_time_ms = float(query_data.get(b"avg_time_ms", 0))
-            zero_results_count = int(query_data.get(b"zero_results_count", 0))
+            total_searches = int(query_data.get("total_searches", 0))
+            avg_results = (int(query_data.get("total_results", 0)) / total_searches) if total_searches > 0 else 0
+            avg_time_ms = (int(query_data.get("total_time_ms", 0)) / total_searches) if total_searches > 0 else 0
+            zero_results_count = int(query_data.get("zero_results_count", 0))
             zero_results_rate = (zero_results_count / total_searches * 100) if total_searches > 0 else 0
 
             # Obtener trending info
@@ -342,132 +394,131 @@ class SearchAnalyticsService:
             logger.error(f"Error generando reporte BI: {e}")
             return {"error": str(e)}
 
-    async def _track_daily_stats(self, date_str: str, event_data: Dict) -> None:
-        """Track estadísticas diarias."""
-        try:
-            daily_key = f"{self.daily_key}:{date_str}"
+    def _aggregate_events(self, events: List[Dict]) -> "SearchAnalyticsBatch":
+        """Pre-agregar un lote de eventos en los incrementos por clave de Redis."""
+        batch = SearchAnalyticsBatch()
 
-            # Incrementar contadores
-            await self.redis_manager.hincrby(daily_key, "total_searches", 1)
+        for event in events:
+            timestamp = event["timestamp"]
+            event_data = {
+                **event,
+                "timestamp": timestamp.isoformat(),
+                "has_results": event["results_count"] > 0,
+                "is_slow": event["search_time_ms"] > self.slow_search_threshold,
+                "is_zero_results": event["results_count"] == 0
+            }
 
-            if event_data["has_results"]:
-                await self.redis_manager.hincrby(daily_key, "searches_with_results", 1)
-            else:
-                await self.redis_manager.hincrby(daily_key, "zero_result_searches", 1)
+            self._track_daily_stats(batch, timestamp.strftime("%Y-%m-%d"), event_data)
+            self._track_hourly_stats(batch, timestamp.strftime("%Y-%m-%d:%H"), event_data)
+            self._track_query_metrics(batch, event_data["query"], event_data)
+            self._track_performance_metrics(batch, event_data)
+            self._track_user_behavior(batch, event_data["user_id"], event_data["user_type"], event_data)
+            self._detect_patterns(batch, event_data)
 
-            if event_data["is_slow"]:
-                await self.redis_manager.hincrby(daily_key, "slow_searches", 1)
+        return batch
 
-            # Agregar tiempo de búsqueda para promedio
-            await self.redis_manager.hincrby(daily_key, "total_search_time_ms", event_data["search_time_ms"])
-            await self.redis_manager.hincrby(daily_key, "total_results", event_data["results_count"])
+    async def _write_events(self, events: List[Dict]) -> None:
+        """Writer del pipeline: un lote agregado, un MULTI/EXEC."""
+        batch = self._aggregate_events(events)
+        client = await self.redis_manager.get_redis()
+        pipe = client.pipeline(transaction=True)
+        batch.apply(pipe)
+        await pipe.execute()
 
-            # Trackear por fuente
-            if event_data["source"]:
-                await self.redis_manager.hincrby(daily_key, f"source_{event_data['source']}", 1)
+    def _track_daily_stats(self, batch: "SearchAnalyticsBatch", date_str: str, event_data: Dict) -> None:
+        """Track estadísticas diarias."""
+        daily_key = f"{self.daily_key}:{date_str}"
+        counts = batch.increments[daily_key]
 
-            # Trackear por tipo de usuario
-            if event_data["user_type"]:
-                await self.redis_manager.hincrby(daily_key, f"user_type_{event_data['user_type']}", 1)
+        counts["total_searches"] += 1
+        if event_data["has_results"]:
+            counts["searches_with_results"] += 1
+        else:
+            counts["zero_result_searches"] += 1
 
-            # Expiración
-            await self.redis_manager.expire(daily_key, 86400 * 90)  # 90 días
+        if event_data["is_slow"]:
+            counts["slow_searches"] += 1
 
-        except Exception as e:
-            logger.warning(f"Error tracking daily stats: {e}")
+        # Agregar tiempo de búsqueda para promedio
+        counts["total_search_time_ms"] += event_data["search_time_ms"]
+        counts["total_results"] += event_data["results_count"]
 
-    async def _track_hourly_stats(self, hour_str: str, event_data: Dict) -> None:
-        """Track estadísticas por hora."""
-        try:
-            hourly_key = f"{self.hourly_key}:{hour_str}"
+        # Trackear por fuente y por tipo de usuario
+        if event_data["source"]:
+            counts[f"source_{event_data['source']}"] += 1
+        if event_data["user_type"]:
+            counts[f"user_type_{event_data['user_type']}"] += 1
 
-            await self.redis_manager.hincrby(hourly_key, "searches", 1)
-            await self.redis_manager.hincrby(hourly_key, "total_time_ms", event_data["search_time_ms"])
-            await self.redis_manager.hincrby(hourly_key, "total_results", event_data["results_count"])
+        batch.expirations[daily_key] = 86400 * 90  # 90 días
 
-            await self.redis_manager.expire(hourly_key, 86400 * 7)  # 7 días
-
-        except Exception as e:
-            logger.warning(f"Error tracking hourly stats: {e}")
-
-    async def _track_query_metrics(self, query: str, event_data: Dict) -> None:
-        """Track métricas específicas por query."""
-        try:
-            query_key = f"{self.queries_key}:{query}"
+    def _track_hourly_stats(self, batch: "SearchAnalyticsBatch", hour_str: str, event_data: Dict) -> None:
+        """Track estadísticas por hora."""
+        hourly_key = f"{self.hourly_key}:{hour_str}"
+        counts = batch.increments[hourly_key]
 
-            # Incrementar contadores
-            await self.redis_manager.hincrby(query_key, "total_searches", 1)
-            await self.redis_manager.hincrby(query_key, "total_results", event_data["results_count"])
-            await self.redis_manager.hincrby(query_key, "total_time_ms", event_data["search_time_ms"])
+        counts["searches"] += 1
+        counts["total_time_ms"] += event_data["search_time_ms"]
+        counts["total_results"] += event_data["results_count"]
 
-            if event_data["is_zero_results"]:
-                await self.redis_manager.hincrby(query_key, "zero_results_count", 1)
+        batch.expirations[hourly_key] = 86400 * 7  # 7 días
 
-            # Actualizar timestamp de última búsqueda
-            await self.redis_manager.hset(query_key, "last_searched", event_data["timestamp"])
+    def _track_query_metrics(self, batch: "SearchAnalyticsBatch", query: str, event_data: Dict) -> None:
+        """Track métricas específicas por query."""
+        query_key = f"{self.queries_key}:{query}"
+        counts = batch.increments[query_key]
 
-            await self.redis_manager.expire(query_key, 86400 * 30)  # 30 días
+        counts["total_searches"] += 1
+        counts["total_results"] += event_data["results_count"]
+        counts["total_time_ms"] += event_data["search_time_ms"]
+        if event_data["is_zero_results"]:
+            counts["zero_results_count"] += 1
 
-        except Exception as e:
-            logger.warning(f"Error tracking query metrics: {e}")
+        # Última búsqueda: gana el evento más reciente del lote
+        batch.fields[query_key]["last_searched"] = event_data["timestamp"]
+        batch.expirations[query_key] = 86400 * 30  # 30 días
 
-    async def _track_performance_metrics(self, event_data: Dict) -> None:
+    def _track_performance_metrics(self, batch: "SearchAnalyticsBatch", event_data: Dict) -> None:
         """Track métricas de performance."""
-        try:
-            perf_key = f"{self.performance_key}:current"
+        perf_key = f"{self.performance_key}:current"
 
-            # Agregar tiempo de respuesta a lista para percentiles
-            await self.redis_manager.lpush(f"{perf_key}:response_times", event_data["search_time_ms"])
-            await self.redis_manager.ltrim(f"{perf_key}:response_times", 0, 1000)  # Mantener últimos 1000
+        # Listas para percentiles, recortadas a las últimas 1000 muestras en el flush
+        batch.lists[f"{perf_key}:response_times"].append(event_data["search_time_ms"])
+        batch.lists[f"{perf_key}:result_counts"].append(event_data["results_count"])
 
-            # Agregar conteo de resultados
-            await self.redis_manager.lpush(f"{perf_key}:result_counts", event_data["results_count"])
-            await self.redis_manager.ltrim(f"{perf_key}:result_counts", 0, 1000)
-
-            await self.redis_manager.expire(f"{perf_key}:response_times", 86400)
-            await self.redis_manager.expire(f"{perf_key}:result_counts", 86400)
-
-        except Exception as e:
-            logger.warning(f"Error tracking performance metrics: {e}")
+        batch.expirations[f"{perf_key}:response_times"] = 86400
+        batch.expirations[f"{perf_key}:result_counts"] = 86400
 
-    async def _track_user_behavior(self, user_id: Optional[str], user_type: Optional[str], event_data: Dict) -> None:
+    def _track_user_behavior(
+        self,
+        batch: "SearchAnalyticsBatch",
+        user_id: Optional[str],
+        user_type: Optional[str],
+        event_data: Dict
+    ) -> None:
         """Track comportamiento de usuarios."""
-        try:
-            if not user_id:
-                return
-
-            user_key = f"{self.users_key}:{user_id}"
+        if not user_id:
+            return
 
-            await self.redis_manager.hincrby(user_key, "total_searches", 1)
-            await self.redis_manager.hset(user_key, "last_search", event_data["timestamp"])
+        user_key = f"{self.users_key}:{user_id}"
 
-            if user_type:
-                await self.redis_manager.hset(user_key, "user_type", user_type)
+        batch.increments[user_key]["total_searches"] += 1
+        batch.fields[user_key]["last_search"] = event_data["timestamp"]
+        if user_type:
+            batch.fields[user_key]["user_type"] = user_type
 
-            await self.redis_manager.expire(user_key, 86400 * 30)  # 30 días
+        batch.expirations[user_key] = 86400 * 30  # 30 días
 
-        except Exception as e:
-            logger.warning(f"Error tracking user behavior: {e}")
-
-    async def _detect_patterns(self, event_data: Dict) -> None:
-        """Detectar patrones en búsquedas."""
-        try:
-            patterns_key = f"{self.patterns_key}:current"
+    def _detect_patterns(self, batch: "SearchAnalyticsBatch", event_data: Dict) -> None:
+        """Detectar patrones en búsquedas (queries sin resultados / lentas más frecuentes)."""
+        patterns_key = f"{self.patterns_key}:current"
 
-            # Detectar queries sin resultados frecuentes
-            if event_data["is_zero_results"]:
-                await self.redis_manager.zadd(f"{patterns_key}:zero_results", {event_data["query"]: 1})
+        if event_data["is_zero_results"]:
+            batch.sorted_sets[f"{patterns_key}:zero_results"][event_data["query"]] += 1
+            batch.expirations[f"{patterns_key}:zero_results"] = 86400 * 7
 
-            # Detectar búsquedas lentas frecuentes
-            if event_data["is_slow"]:
-                await self.redis_manager.zadd(f"{patterns_key}:slow_queries", {event_data["query"]: 1})
-
-            # Expiración
-            await self.redis_manager.expire(f"{patterns_key}:zero_results", 86400 * 7)
-            await self.redis_manager.expire(f"{patterns_key}:slow_queries", 86400 * 7)
-
-        except Exception as e:
-            logger.warning(f"Error detecting patterns: {e}")
+        if event_data["is_slow"]:
+            batch.sorted_sets[f"{patterns_key}:slow_queries"][event_data["query"]] += 1
+            batch.expirations[f"{patterns_key}:slow_queries"] = 86400 * 7
 
     async def _get_overview_metrics(self, start_date: datetime, end_date: datetime) -> Dict:
         """Obtener métricas generales."""
@@ -477,20 +528,20 @@ class SearchAnalyticsService:
             zero_result_searches = 0
             slow_searches = 0
 
-            # Iterar por días en el rango
+            # Un HGETALL por día del rango, en un solo round trip
+            client = await self.redis_manager.get_redis()
+            pipe = client.pipeline(transaction=False)
             current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime("%Y-%m-%d")
-                daily_key = f"{self.daily_key}:{date_str}"
+            while current_date.date() <= end_date.date():
+                pipe.hgetall(f"{self.daily_key}:{current_date.strftime('%Y-%m-%d')}")
+                current_date += timedelta(days=1)
 
-                daily_data = await self.redis_manager.hgetall(daily_key)
+            for daily_data in await pipe.execute():
                 if daily_data:
-                    total_searches += int(daily_data.get(b"total_searches", 0))
-                    total_results += int(daily_data.get(b"total_results", 0))
-                    zero_result_searches += int(daily_data.get(b"zero_result_searches", 0))
-                    slow_searches += int(daily_data.get(b"slow_searches", 0))
-
-                current_date += timedelta(days=1)
+                    total_searches += int(daily_data.get("total_searches", 0))
+                    total_results += int(daily_data.get("total_results", 0))
+                    zero_result_searches += int(daily_data.get("zero_result_searches", 0))
+                    slow_searches += int(daily_data.get("slow_searches", 0))
 
             # Calcular métricas derivadas
             avg_results_per_search = (total_results / total_searches) if total_searches > 0 else 0
@@ -534,8 +585,11 @@ class SearchAnalyticsService:
             perf_key = f"{self.performance_key}:current"
 
             # Obtener tiempos de respuesta
-            response_times = await self.redis_manager.lrange(f"{perf_key}:response_times", 0, -1)
-            result_counts = await self.redis_manager.lrange(f"{perf_key}:result_counts", 0, -1)
+            client = await self.redis_manager.get_redis()
+            pipe = client.pipeline(transaction=False)
+            pipe.lrange(f"{perf_key}:response_times", 0, -1)
+            pipe.lrange(f"{perf_key}:result_counts", 0, -1)
+            response_times, result_counts = await pipe.execute()
 
             if response_times:
                 times = [int(t) for t in response_times]
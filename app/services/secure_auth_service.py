@@ -26,7 +26,7 @@ import hashlib
 import secrets
 import redis
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple, Dict, Any
 from passlib.context import CryptContext
 from sqlalchemy import select, update
@@ -34,7 +34,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import models and core modules
 from app.models.user import User, UserType
-from app.core.security import create_access_token, create_refresh_token, decode_access_token
+from app.core.security import (
+    create_access_token,
+    create_refresh_token,
+    decode_access_token,
+    get_token_revocation_id,
+)
+from app.core.token_revocation import TokenRevocationStore, token_blacklist
 from app.core.config import settings
 
 # Configure logger
@@ -249,28 +255,14 @@ class BruteForceProtection:
 class TokenBlacklist:
     """
     JWT token blacklisting for secure token revocation.
-    """
 
-    def __init__(self, redis_client=None):
-        """Initialize token blacklist with Redis client."""
-        self.redis_client = redis_client or self._get_redis_client()
-
-    def _get_redis_client(self):
-        """Get Redis client for token blacklisting."""
-        try:
-            return redis.Redis(
-                host=getattr(settings, 'REDIS_HOST', 'localhost'),
-                port=getattr(settings, 'REDIS_PORT', 6379),
-                decode_responses=True
-            )
-        except Exception as e:
-            logger.warning(f"Redis not available for token blacklisting: {e}")
-            return None
+    Thin adapter over the shared TokenRevocationStore (app.core.token_revocation),
+    so tokens revoked here are rejected by every other auth path and worker.
+    """
 
-    def _get_token_key(self, token: str) -> str:
-        """Generate Redis key for blacklisted token."""
-        token_hash = hashlib.sha256(token.encode()).hexdigest()
-        return f"blacklist_token:{token_hash}"
+    def __init__(self, store: Optional[TokenRevocationStore] = None):
+        """Initialize token blacklist on the shared revocation store."""
+        self.store = store or token_blacklist
 
     async def blacklist_token(self, token: str, expires_at: datetime = None):
         """
@@ -278,15 +270,13 @@ class TokenBlacklist:
 
         Args:
             token: JWT token to blacklist
-            expires_at: Token expiration time for TTL
+            expires_at: Token expiration time (naive UTC); defaults to the token's exp
         """
-        if not self.redis_client:
-            return
-
-        key = self._get_token_key(token)
-        ttl = int((expires_at - datetime.utcnow()).total_seconds()) if expires_at else 3600
+        jti, exp = get_token_revocation_id(token)
+        if expires_at is not None:
+            exp = expires_at.replace(tzinfo=timezone.utc).timestamp()
 
-        self.redis_client.setex(key, ttl, "blacklisted")
+        await self.store.revoke(jti, expires_at=exp)
 
     async def is_token_blacklisted(self, token: str) -> bool:
         """
@@ -298,11 +288,8 @@ class TokenBlacklist:
         Returns:
             bool: True if blacklisted
         """
-        if not self.redis_client:
-            return False
-
-        key = self._get_token_key(token)
-        return self.redis_client.exists(key)
+        jti, _ = get_token_revocation_id(token)
+        return await self.store.is_revoked(jti)
 
 
 class SecureAuthService:
@@ -7,15 +7,27 @@ This module provides comprehensive session management with:
 - Session timeout management (idle and absolute)
 - Enterprise security features for PCI DSS compliance
 
+Storage layout (Redis):
+- ``session:v2:<id>``: hash with one field per attribute (timestamps as epoch
+  seconds), expiring at the absolute timeout
+- ``user_sessions:v2:<user>``: ZSET of session ids scored by creation time,
+  so limit enforcement and pruning are O(log n)
+- ``device_sessions:<fingerprint>``: set of session ids per device
+
+Every multi-key operation goes out as one pipeline. ``update_session_activity``
+runs on every request, so it is coalesced: a session seen within
+``SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS`` is answered from a bounded local
+cache and ``last_activity`` is written (one HSET) at most once per interval.
+
 Author: Backend Senior Developer
 Version: 1.0.0 Enterprise
 """
 
-import json
-import uuid
+import time
 import secrets
 import hashlib
 import hmac
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 from fastapi import Request
@@ -54,21 +66,32 @@ class EnterpriseSessionService:
     - Concurrent session limits
     - Device fingerprinting and tracking
     - Session timeout management
-    - Redis-based session storage
+    - Redis hash storage with pipelined, coalesced updates
     - Security audit logging
     """
 
     def __init__(self, redis_client):
         """Initialize session service with Redis client."""
         self.redis = redis_client
-        self.session_prefix = "session:"
-        self.user_sessions_prefix = "user_sessions:"
+        # v2: hashes + ZSET index (the v1 JSON strings/SETs use other Redis types)
+        self.session_prefix = "session:v2:"
+        self.user_sessions_prefix = "user_sessions:v2:"
         self.device_sessions_prefix = "device_sessions:"
 
         # SECURITY FIX: Secure session configuration
         self.session_secret = settings.SECRET_KEY.encode('utf-8')
         self.token_entropy_bits = 256  # High entropy for session tokens
 
+        self.absolute_timeout = settings.SESSION_ABSOLUTE_TIMEOUT_HOURS * 3600
+        self.idle_timeout = settings.SESSION_IDLE_TIMEOUT_MINUTES * 60
+        # Coalesced writes must stay well inside the idle window
+        self.activity_write_interval = min(
+            settings.SESSION_ACTIVITY_WRITE_INTERVAL_SECONDS, self.idle_timeout / 2
+        )
+        self.activity_cache_size = settings.SESSION_ACTIVITY_CACHE_SIZE
+        # session_id -> (written_at, created_at) in epoch seconds, LRU
+        self._activity: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
     async def create_session(
         self,
         user_id: str,
@@ -79,6 +102,9 @@ class EnterpriseSessionService:
         """
         Create a new user session with device tracking.
 
+        The session hash, both indexes and the concurrent-limit lookup go out
+        in a single pipeline; sessions beyond the limit are evicted oldest first.
+
         Args:
             user_id: User identifier
             request: FastAPI request object
@@ -89,7 +115,7 @@ class EnterpriseSessionService:
             SessionInfo: Created session information
 
         Raises:
-            ValueError: If maximum concurrent sessions exceeded
+            ValueError: If device fingerprinting fails validation
         """
         try:
             # SECURITY FIX: Generate cryptographically secure session ID
@@ -102,9 +128,6 @@ class EnterpriseSessionService:
             ip_address = getattr(request.client, 'host', 'unknown') if request.client else 'unknown'
             user_agent = request.headers.get('User-Agent', 'unknown')
 
-            # Check concurrent session limits
-            await self._enforce_session_limits(user_id, device_fingerprint)
-
             # Create session info
             now = datetime.now(timezone.utc)
             session_info = SessionInfo(
@@ -115,36 +138,43 @@ class EnterpriseSessionService:
                 user_agent=user_agent,
                 created_at=now,
                 last_activity=now,
-                expires_at=now + timedelta(hours=settings.SESSION_ABSOLUTE_TIMEOUT_HOURS)
+                expires_at=now + timedelta(seconds=self.absolute_timeout)
             )
 
             # SECURITY FIX: Encrypt sensitive session data
             session_data = {
-                **session_info.dict(),
+                'user_id': user_id,
+                'device_fingerprint': device_fingerprint,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+                'created_at': self._to_epoch(session_info.created_at),
+                'last_activity': self._to_epoch(session_info.last_activity),
+                'expires_at': self._to_epoch(session_info.expires_at),
                 'access_token': self._encrypt_token(access_token),
                 'refresh_token': self._encrypt_token(refresh_token),
                 'session_hash': self._generate_session_hash(session_id, user_id, device_fingerprint)
             }
 
-            # Store with multiple keys for efficient lookups
             session_key = f"{self.session_prefix}{session_id}"
             user_sessions_key = f"{self.user_sessions_prefix}{user_id}"
             device_sessions_key = f"{self.device_sessions_prefix}{device_fingerprint}"
-
-            # Store session data
-            await self.redis.setex(
-                session_key,
-                settings.SESSION_ABSOLUTE_TIMEOUT_HOURS * 3600,
-                json.dumps(session_data, default=str)
-            )
-
-            # Add to user's active sessions
-            await self.redis.sadd(user_sessions_key, session_id)
-            await self.redis.expire(user_sessions_key, settings.SESSION_ABSOLUTE_TIMEOUT_HOURS * 3600)
-
-            # Add to device sessions
-            await self.redis.sadd(device_sessions_key, session_id)
-            await self.redis.expire(device_sessions_key, settings.SESSION_ABSOLUTE_TIMEOUT_HOURS * 3600)
+            created = now.timestamp()
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(session_key, mapping=session_data)
+            pipe.expire(session_key, self.absolute_timeout)
+            # Index by creation time; entries past the absolute timeout are dead
+            pipe.zremrangebyscore(user_sessions_key, "-inf", created - self.absolute_timeout)
+            pipe.zadd(user_sessions_key, {session_id: created})
+            pipe.expire(user_sessions_key, self.absolute_timeout)
+            pipe.sadd(device_sessions_key, session_id)
+            pipe.expire(device_sessions_key, self.absolute_timeout)
+            # Everything but the newest SESSION_MAX_CONCURRENT_SESSIONS
+            pipe.zrange(user_sessions_key, 0, -(settings.SESSION_MAX_CONCURRENT_SESSIONS + 1))
+            results = await pipe.execute()
+
+            self._remember_activity(session_id, created, created)
+            await self._enforce_session_limits(user_id, overflow=results[-1])
 
             logger.info(
                 "Session created",
@@ -172,31 +202,13 @@ class EnterpriseSessionService:
         """
         try:
             session_key = f"{self.session_prefix}{session_id}"
-            session_data = await self.redis.get(session_key)
-
-            if not session_data:
-                return None
+            data = self._decode_hash(await self.redis.hgetall(session_key))
 
-            data = json.loads(session_data)
-
-            # SECURITY FIX: Validate session integrity
-            if not self._validate_session_integrity(session_id, data):
+            session_info = self._session_from_hash(session_id, data)
+            if session_info is None and data:
                 logger.warning("Session integrity check failed", session_id=session_id)
                 await self.invalidate_session(session_id)
-                return None
-
-            # Convert datetime strings back to datetime objects
-            for field in ['created_at', 'last_activity', 'expires_at']:
-                if data.get(field):
-                    data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
-
-            # Decrypt tokens if needed for validation
-            if 'access_token' in data:
-                data['access_token'] = self._decrypt_token(data['access_token'])
-            if 'refresh_token' in data:
-                data['refresh_token'] = self._decrypt_token(data['refresh_token'])
-
-            return SessionInfo(**{k: v for k, v in data.items() if k in SessionInfo.__fields__})
+            return session_info
 
         except Exception as e:
             logger.error("Error retrieving session", error=str(e), session_id=session_id)
@@ -206,6 +218,10 @@ class EnterpriseSessionService:
         """
         Update session's last activity timestamp.
 
+        Called on every request. Within the write interval the answer comes
+        from the local cache (no Redis call); otherwise one HMGET validates
+        the session and one pipelined HSET records the activity.
+
         Args:
             session_id: Session identifier
 
@@ -213,26 +229,33 @@ class EnterpriseSessionService:
             bool: True if successfully updated
         """
         try:
+            now = time.time()
+            cached = self._activity.get(session_id)
+            if cached is not None:
+                written_at, created_at = cached
+                if now - written_at < self.activity_write_interval and now - created_at <= self.absolute_timeout:
+                    self._activity.move_to_end(session_id)
+                    return True
+
             session_key = f"{self.session_prefix}{session_id}"
-            session_data = await self.redis.get(session_key)
+            fields = ('user_id', 'device_fingerprint', 'created_at', 'last_activity', 'session_hash')
+            data = dict(zip(fields, (self._decode(v) for v in await self.redis.hmget(session_key, *fields))))
 
-            if not session_data:
+            if not data['user_id']:
+                self._activity.pop(session_id, None)
                 return False
 
-            data = json.loads(session_data)
-            now = datetime.now(timezone.utc)
-
             # SECURITY FIX: Enhanced timeout validation
-            last_activity = datetime.fromisoformat(data['last_activity'].replace('Z', '+00:00'))
-            idle_limit = timedelta(minutes=settings.SESSION_IDLE_TIMEOUT_MINUTES)
-            created_at = datetime.fromisoformat(data['created_at'].replace('Z', '+00:00'))
-            absolute_limit = timedelta(hours=settings.SESSION_ABSOLUTE_TIMEOUT_HOURS)
+            last_activity = float(data['last_activity'])
+            created_at = float(data['created_at'])
+            idle_expired = now - last_activity > self.idle_timeout
+            absolute_expired = now - created_at > self.absolute_timeout
 
             # Check both idle and absolute timeouts
-            if (now - last_activity > idle_limit) or (now - created_at > absolute_limit):
+            if idle_expired or absolute_expired:
                 logger.info("Session expired", session_id=session_id,
-                           idle_expired=now - last_activity > idle_limit,
-                           absolute_expired=now - created_at > absolute_limit)
+                           idle_expired=idle_expired,
+                           absolute_expired=absolute_expired)
                 await self.invalidate_session(session_id)
                 return False
 
@@ -242,16 +265,14 @@ class EnterpriseSessionService:
                 await self.invalidate_session(session_id)
                 return False
 
-            # Update last activity
-            data['last_activity'] = now.isoformat()
-
-            # Update in Redis
-            await self.redis.setex(
-                session_key,
-                settings.SESSION_ABSOLUTE_TIMEOUT_HOURS * 3600,
-                json.dumps(data, default=str)
-            )
+            # Only the changed field; EXPIREAT keeps the absolute deadline even
+            # if the session was deleted between the read and the write
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(session_key, 'last_activity', self._to_epoch(now))
+            pipe.expireat(session_key, int(created_at + self.absolute_timeout))
+            await pipe.execute()
 
+            self._remember_activity(session_id, now, created_at)
             return True
 
         except Exception as e:
@@ -269,29 +290,25 @@ class EnterpriseSessionService:
             bool: True if successfully invalidated
         """
         try:
-            # Get session info first
-            session_info = await self.get_session(session_id)
-            if not session_info:
-                return True  # Already invalid
-
-            # Remove from Redis
+            self._activity.pop(session_id, None)
             session_key = f"{self.session_prefix}{session_id}"
-            user_sessions_key = f"{self.user_sessions_prefix}{session_info.user_id}"
-            device_sessions_key = f"{self.device_sessions_prefix}{session_info.device_fingerprint}"
-
-            # Delete session data
-            await self.redis.delete(session_key)
-
-            # Remove from user's sessions
-            await self.redis.srem(user_sessions_key, session_id)
+            user_id, device_fingerprint = (
+                self._decode(v) for v in await self.redis.hmget(session_key, 'user_id', 'device_fingerprint')
+            )
+            if not user_id:
+                return True  # Already invalid
 
-            # Remove from device sessions
-            await self.redis.srem(device_sessions_key, session_id)
+            # Session data and both indexes in one round trip
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(session_key)
+            pipe.zrem(f"{self.user_sessions_prefix}{user_id}", session_id)
+            pipe.srem(f"{self.device_sessions_prefix}{device_fingerprint}", session_id)
+            await pipe.execute()
 
             logger.info(
                 "Session invalidated",
                 session_id=session_id,
-                user_id=session_info.user_id
+                user_id=user_id
             )
 
             return True
@@ -312,15 +329,9 @@ class EnterpriseSessionService:
         """
         try:
             user_sessions_key = f"{self.user_sessions_prefix}{user_id}"
-            session_ids = await self.redis.smembers(user_sessions_key)
+            session_ids = [self._decode(s) for s in await self.redis.zrange(user_sessions_key, 0, -1)]
 
-            invalidated_count = 0
-            for session_id in session_ids:
-                if isinstance(session_id, bytes):
-                    session_id = session_id.decode('utf-8')
-
-                if await self.invalidate_session(session_id):
-                    invalidated_count += 1
+            invalidated_count = await self._delete_sessions(user_id, session_ids, drop_index=True)
 
             logger.info(
                 "All user sessions invalidated",
@@ -336,7 +347,7 @@ class EnterpriseSessionService:
 
     async def get_user_active_sessions(self, user_id: str) -> List[SessionInfo]:
         """
-        Get all active sessions for a user.
+        Get all active sessions for a user (one ZRANGE plus one pipelined read).
 
         Args:
             user_id: User identifier
@@ -346,16 +357,27 @@ class EnterpriseSessionService:
         """
         try:
             user_sessions_key = f"{self.user_sessions_prefix}{user_id}"
-            session_ids = await self.redis.smembers(user_sessions_key)
+            session_ids = [self._decode(s) for s in await self.redis.zrange(user_sessions_key, 0, -1)]
+            if not session_ids:
+                return []
 
-            active_sessions = []
+            pipe = self.redis.pipeline(transaction=False)
             for session_id in session_ids:
-                if isinstance(session_id, bytes):
-                    session_id = session_id.decode('utf-8')
+                pipe.hgetall(f"{self.session_prefix}{session_id}")
+            results = await pipe.execute()
 
-                session_info = await self.get_session(session_id)
+            active_sessions = []
+            stale = []
+            for session_id, raw in zip(session_ids, results):
+                session_info = self._session_from_hash(session_id, self._decode_hash(raw))
                 if session_info and session_info.is_active:
                     active_sessions.append(session_info)
+                elif not raw:
+                    stale.append(session_id)
+
+            if stale:
+                # Hash expired but the index entry survived: drop it
+                await self.redis.zrem(user_sessions_key, *stale)
 
             return active_sessions
 
@@ -363,36 +385,66 @@ class EnterpriseSessionService:
             logger.error("Error getting user active sessions", error=str(e), user_id=user_id)
             return []
 
-    async def _enforce_session_limits(self, user_id: str, device_fingerprint: str) -> None:
+    async def _enforce_session_limits(self, user_id: str, overflow: Optional[List[str]] = None) -> None:
         """
         Enforce concurrent session limits per user.
 
+        The ZSET index is ordered by creation time, so the sessions to evict
+        are a single ZRANGE (already fetched by ``create_session`` as
+        ``overflow``).
+
         Args:
             user_id: User identifier
-            device_fingerprint: Device fingerprint
-
-        Raises:
-            ValueError: If session limits exceeded
+            overflow: Session ids beyond the limit, oldest first
         """
         try:
-            # Get current active sessions
-            active_sessions = await self.get_user_active_sessions(user_id)
-
-            # If at limit, remove oldest session
-            if len(active_sessions) >= settings.SESSION_MAX_CONCURRENT_SESSIONS:
-                oldest_session = min(active_sessions, key=lambda s: s.created_at)
-                await self.invalidate_session(oldest_session.session_id)
-
-                logger.info(
-                    "Oldest session invalidated due to limit",
-                    user_id=user_id,
-                    invalidated_session=oldest_session.session_id
+            if overflow is None:
+                overflow = await self.redis.zrange(
+                    f"{self.user_sessions_prefix}{user_id}",
+                    0, -(settings.SESSION_MAX_CONCURRENT_SESSIONS + 1)
                 )
+            overflow = [self._decode(s) for s in overflow]
+            if not overflow:
+                return
+
+            await self._delete_sessions(user_id, overflow)
+
+            logger.info(
+                "Oldest sessions invalidated due to limit",
+                user_id=user_id,
+                invalidated_sessions=overflow
+            )
 
         except Exception as e:
             logger.error("Error enforcing session limits", error=str(e), user_id=user_id)
             # Don't raise here to avoid blocking login
 
+    async def _delete_sessions(self, user_id: str, session_ids: List[str], drop_index: bool = False) -> int:
+        """Delete several sessions of one user with two pipelines; returns how many existed"""
+        if not session_ids:
+            return 0
+
+        for session_id in session_ids:
+            self._activity.pop(session_id, None)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for session_id in session_ids:
+            pipe.hget(f"{self.session_prefix}{session_id}", 'device_fingerprint')
+        fingerprints = [self._decode(fp) for fp in await pipe.execute()]
+
+        user_sessions_key = f"{self.user_sessions_prefix}{user_id}"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*(f"{self.session_prefix}{session_id}" for session_id in session_ids))
+        for session_id, device_fingerprint in zip(session_ids, fingerprints):
+            if device_fingerprint:
+                pipe.srem(f"{self.device_sessions_prefix}{device_fingerprint}", session_id)
+        if drop_index:
+            pipe.delete(user_sessions_key)
+        else:
+            pipe.zrem(user_sessions_key, *session_ids)
+        results = await pipe.execute()
+        return int(results[0])
+
     async def cleanup_expired_sessions(self) -> int:
         """
         Cleanup expired sessions (maintenance task).
@@ -401,8 +453,8 @@ class EnterpriseSessionService:
             int: Number of sessions cleaned up
         """
         try:
-            # This would be implemented as a background task
-            # For now, Redis TTL handles most cleanup automatically
+            # Redis TTL expires the hashes; stale index entries are pruned by
+            # score on session creation and dropped on read
             return 0
         except Exception as e:
             logger.error("Error cleaning up expired sessions", error=str(e))
@@ -446,6 +498,48 @@ class EnterpriseSessionService:
             logger.error("Error getting session statistics", error=str(e))
             return {"error": str(e)}
 
+    # === STORAGE HELPERS ===
+
+    def _remember_activity(self, session_id: str, written_at: float, created_at: float) -> None:
+        """Record a last_activity write in the bounded local cache"""
+        self._activity[session_id] = (written_at, created_at)
+        self._activity.move_to_end(session_id)
+        while len(self._activity) > self.activity_cache_size:
+            self._activity.popitem(last=False)
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def _decode_hash(self, raw) -> Dict[str, str]:
+        return {self._decode(k): self._decode(v) for k, v in (raw or {}).items()}
+
+    @staticmethod
+    def _to_epoch(value) -> str:
+        """Compact timestamp representation stored in the session hash"""
+        timestamp = value.timestamp() if isinstance(value, datetime) else value
+        return f"{timestamp:.3f}"
+
+    def _session_from_hash(self, session_id: str, data: Dict[str, str]) -> Optional[SessionInfo]:
+        """Build SessionInfo from a session hash; None if missing or tampered with"""
+        if not data:
+            return None
+
+        # SECURITY FIX: Validate session integrity
+        if not self._validate_session_integrity(session_id, data):
+            return None
+
+        return SessionInfo(
+            session_id=session_id,
+            user_id=data['user_id'],
+            device_fingerprint=data['device_fingerprint'],
+            ip_address=data.get('ip_address', 'unknown'),
+            user_agent=data.get('user_agent', 'unknown'),
+            created_at=datetime.fromtimestamp(float(data['created_at']), timezone.utc),
+            last_activity=datetime.fromtimestamp(float(data['last_activity']), timezone.utc),
+            expires_at=datetime.fromtimestamp(float(data['expires_at']), timezone.utc)
+        )
+
     # === SECURITY METHODS ===
 
     def _generate_secure_session_id(self) -> str:
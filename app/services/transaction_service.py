@@ -16,6 +16,9 @@
 #
 # Modificaciones:
 # 2025-09-12 - Creación inicial con preparación hosting enterprise
+# 2026-10-18 - Historial con agregados SQL, paginación keyset y exportación en streaming
+# 2026-10-18 - AsyncTransactionService sobre el pool AsyncSession compartido
+# 2026-10-18 - Hash de integridad canónico y reutilizable por la conciliación
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -31,20 +34,27 @@ Este módulo contiene:
 """
 
 import os
+import io
+import csv
+import json
+import base64
 import logging
 import hashlib
 import hmac
-import secrets
 from decimal import Decimal
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from uuid import UUID, uuid4
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 
-from sqlalchemy import select, and_, func, text, or_
+from sqlalchemy import select, and_, func, text, or_, case
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from app.database import SessionLocal
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.models.transaction import Transaction, EstadoTransaccion, TransactionType, MetodoPago
 from app.models.commission import Commission, CommissionStatus
 from app.models.user import User
@@ -53,6 +63,62 @@ from app.models.order import Order
 # Configure structured logging for financial auditing
 logger = logging.getLogger(__name__)
 
+# Columnas exportadas en el modo streaming (NDJSON/CSV) del historial
+HISTORY_EXPORT_FIELDS = (
+    'id', 'created_at', 'referencia_externa', 'transaction_type', 'estado',
+    'metodo_pago', 'monto', 'monto_vendedor', 'porcentaje_mestocker',
+    'comprador_id', 'vendedor_id', 'referencia_pago', 'fecha_pago'
+)
+
+
+def _canonical_value(value) -> str:
+    """Representación estable de un valor para el hash (1000 == 1000.00)"""
+    if isinstance(value, (Decimal, float)):
+        return format(Decimal(str(value)).normalize(), 'f')
+    if hasattr(value, 'value'):
+        return str(value.value)
+    return str(value)
+
+
+def integrity_hash_fields(transaction, commission=None) -> Dict[str, str]:
+    """
+    Campos críticos que cubre el hash de integridad
+
+    Acepta cualquier objeto con los atributos de Transaction/Commission, de
+    modo que la conciliación puede calcularlo sobre filas planas en procesos
+    worker sin instancias ORM.
+    """
+    hash_data = {
+        'monto': _canonical_value(transaction.monto),
+        'vendedor_id': str(transaction.vendedor_id),
+        'comprador_id': str(transaction.comprador_id),
+        'monto_vendedor': _canonical_value(transaction.monto_vendedor),
+        'porcentaje_mestocker': _canonical_value(transaction.porcentaje_mestocker),
+        'transaction_type': _canonical_value(transaction.transaction_type),
+        'referencia_externa': str(transaction.referencia_externa),
+    }
+
+    # Add commission data if available
+    if commission is not None:
+        hash_data.update({
+            'commission_id': str(commission.id),
+            'commission_rate': _canonical_value(commission.commission_rate),
+            'commission_amount': _canonical_value(commission.commission_amount),
+            'order_id': str(commission.order_id)
+        })
+
+    return hash_data
+
+
+def compute_integrity_hash(secret: str, hash_data: Dict[str, str]) -> str:
+    """HMAC-SHA256 determinístico sobre los campos de integrity_hash_fields"""
+    hash_string = '|'.join(f"{k}:{v}" for k, v in sorted(hash_data.items()))
+    return hmac.new(
+        secret.encode('utf-8'),
+        hash_string.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
 
 class TransactionError(Exception):
     """Exception raised for transaction errors"""
@@ -62,35 +128,681 @@ class TransactionError(Exception):
         self.details = details or {}
 
 
-class TransactionService:
+class TransactionServiceBase:
+    """
+    Configuración, validaciones, construcción de transacciones e historial
+    compartidos por TransactionService (Session) y AsyncTransactionService
+    (AsyncSession).
+    """
+
+    def __init__(self, db_session: Optional[Session] = None):
+        self.db = db_session
+        self.environment = os.getenv('ENVIRONMENT', 'development')
+        self.audit_level = os.getenv('TRANSACTION_AUDIT_LEVEL', 'standard')
+        self.enable_detailed_logging = self.audit_level in ['detailed', 'debug']
+
+        # Financial validation settings
+        self.max_transaction_amount = Decimal(os.getenv('MAX_TRANSACTION_AMOUNT', '10000000'))  # 10M COP
+        self.min_transaction_amount = Decimal(os.getenv('MIN_TRANSACTION_AMOUNT', '100'))      # 100 COP
+
+        # SECURITY FIX: Cryptographic integrity settings
+        # La clave es compartida (settings): un hash generado en un worker debe
+        # verificarse en cualquier otro. Sin clave no se generan ni verifican hashes.
+        self.integrity_secret = settings.TRANSACTION_INTEGRITY_SECRET or None
+        self.enable_integrity_checks = (
+            os.getenv('ENABLE_TRANSACTION_INTEGRITY', 'true').lower() == 'true'
+            and self.integrity_secret is not None
+        )
+
+    async def get_transaction_history_async(
+        self,
+        db: AsyncSession,
+        user_id: Optional[UUID] = None,
+        transaction_type: Optional[TransactionType] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status_filter: Optional[List[EstadoTransaccion]] = None,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Versión async de get_transaction_history para sesiones AsyncSession
+
+        Conteo, resumen y página se leen en el mismo snapshot (REPEATABLE READ
+        en PostgreSQL) para que los totales sean coherentes con las filas.
+        """
+        try:
+            await self._begin_history_snapshot(db)
+            conditions = self._build_history_conditions(
+                user_id, transaction_type, start_date, end_date, status_filter
+            )
+
+            total_count = (await db.execute(
+                select(func.count(Transaction.id)).where(*conditions)
+            )).scalar_one()
+            summary = self._summary_from_aggregate_rows(
+                (await db.execute(self._history_summary_statement(conditions))).all()
+            )
+            transactions = (await db.execute(
+                self._history_page_statement(conditions, limit, offset, cursor)
+            )).scalars().all()
+
+            return self._build_history_response(
+                transactions, total_count, summary, limit, offset, cursor,
+                user_id, transaction_type, start_date, end_date, status_filter
+            )
+
+        except Exception as e:
+            logger.error(f"Error getting transaction history: {e}")
+            raise TransactionError(f"Error retrieving transaction history: {str(e)}")
+
+    async def stream_transaction_history_async(
+        self,
+        db: AsyncSession,
+        user_id: Optional[UUID] = None,
+        transaction_type: Optional[TransactionType] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status_filter: Optional[List[EstadoTransaccion]] = None,
+        chunk_size: int = 500
+    ) -> AsyncIterator[Transaction]:
+        """Recorre el historial con un cursor del servidor sobre AsyncSession"""
+        await self._begin_history_snapshot(db)
+        conditions = self._build_history_conditions(
+            user_id, transaction_type, start_date, end_date, status_filter
+        )
+        statement = self._history_order(select(Transaction).where(*conditions)).execution_options(
+            yield_per=chunk_size
+        )
+        result = await db.stream_scalars(statement)
+        async for transaction in result:
+            yield transaction
+
+    async def export_transaction_history_async(
+        self,
+        db: AsyncSession,
+        export_format: str = 'ndjson',
+        **filters
+    ) -> AsyncIterator[str]:
+        """
+        Exporta el historial como NDJSON o CSV, fila por fila
+
+        Reutiliza stream_transaction_history_async, por lo que la memoria
+        usada es constante sin importar el rango de fechas.
+        """
+        if export_format not in ('ndjson', 'csv'):
+            raise TransactionError(f"Unsupported export format: {export_format}")
+
+        if export_format == 'csv':
+            yield self._format_csv_row(HISTORY_EXPORT_FIELDS)
+
+        async for transaction in self.stream_transaction_history_async(db, **filters):
+            row = self._history_export_row(transaction)
+            if export_format == 'csv':
+                yield self._format_csv_row(row[field] for field in HISTORY_EXPORT_FIELDS)
+            else:
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+
+    @staticmethod
+    def encode_history_cursor(transaction: Transaction) -> str:
+        """Codifica la posición keyset (created_at, id) de una transacción"""
+        payload = json.dumps([transaction.created_at.isoformat(), str(transaction.id)])
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_history_cursor(cursor: str) -> Tuple[datetime, str]:
+        """Decodifica un cursor generado por encode_history_cursor"""
+        try:
+            created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(created_at), transaction_id
+        except (ValueError, TypeError) as e:
+            raise TransactionError(f"Invalid history cursor: {cursor}") from e
+
+    def _build_history_conditions(
+        self,
+        user_id: Optional[UUID],
+        transaction_type: Optional[TransactionType],
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        status_filter: Optional[List[EstadoTransaccion]]
+    ) -> List:
+        """Construye los filtros compartidos por paginación, resumen y streaming"""
+        conditions = []
+
+        if user_id:
+            conditions.append(
+                or_(
+                    Transaction.comprador_id == user_id,
+                    Transaction.vendedor_id == user_id
+                )
+            )
+
+        if transaction_type:
+            conditions.append(Transaction.transaction_type == transaction_type)
+
+        if start_date:
+            conditions.append(Transaction.created_at >= start_date)
+
+        if end_date:
+            conditions.append(Transaction.created_at <= end_date)
+
+        if status_filter:
+            conditions.append(Transaction.estado.in_(status_filter))
+
+        return conditions
+
+    @staticmethod
+    def _history_order(statement):
+        """Orden estable requerido por la paginación keyset"""
+        return statement.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+
+    def _history_page_statement(
+        self,
+        conditions: List,
+        limit: int,
+        offset: int,
+        cursor: Optional[str]
+    ):
+        """Consulta de una página: keyset si hay cursor, offset en caso contrario"""
+        statement = self._history_order(select(Transaction).where(*conditions)).limit(limit)
+
+        if cursor:
+            cursor_created_at, cursor_id = self.decode_history_cursor(cursor)
+            return statement.where(
+                or_(
+                    Transaction.created_at < cursor_created_at,
+                    and_(
+                        Transaction.created_at == cursor_created_at,
+                        Transaction.id < cursor_id
+                    )
+                )
+            )
+
+        return statement.offset(offset)
+
+    @staticmethod
+    def _history_summary_statement(conditions: List):
+        """Agregados SQL del resumen, agrupados por método de pago"""
+        return select(
+            Transaction.metodo_pago,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.monto), 0),
+            func.coalesce(func.sum(
+                case((Transaction.transaction_type == TransactionType.COMISION, Transaction.monto), else_=0)
+            ), 0)
+        ).where(
+            *conditions,
+            Transaction.estado == EstadoTransaccion.COMPLETADA
+        ).group_by(Transaction.metodo_pago)
+
+    async def _begin_history_snapshot(self, db: AsyncSession) -> None:
+        """Abre la transacción de lectura en REPEATABLE READ cuando es posible"""
+        if db.in_transaction() or db.get_bind().dialect.name != 'postgresql':
+            return
+        await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"))
+
+    def _build_history_response(
+        self,
+        transactions: List[Transaction],
+        total_count: int,
+        summary: Dict,
+        limit: int,
+        offset: int,
+        cursor: Optional[str],
+        user_id: Optional[UUID],
+        transaction_type: Optional[TransactionType],
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        status_filter: Optional[List[EstadoTransaccion]]
+    ) -> Dict:
+        """Arma la respuesta de historial común a las variantes sync y async"""
+        has_next = len(transactions) == limit and (
+            cursor is not None or offset + limit < total_count
+        )
+
+        return {
+            'transactions': [t.to_dict() for t in transactions],
+            'pagination': {
+                'total': total_count,
+                'limit': limit,
+                'offset': offset,
+                'has_next': has_next,
+                'has_prev': offset > 0 or cursor is not None,
+                'next_cursor': self.encode_history_cursor(transactions[-1]) if has_next else None
+            },
+            'summary': summary,
+            'filters_applied': {
+                'user_id': str(user_id) if user_id else None,
+                'transaction_type': transaction_type.value if transaction_type else None,
+                'start_date': start_date.isoformat() if start_date else None,
+                'end_date': end_date.isoformat() if end_date else None,
+                'status_filter': [s.value for s in status_filter] if status_filter else None
+            }
+        }
+
+    @staticmethod
+    def _history_export_row(transaction: Transaction) -> Dict:
+        """Fila plana para exportación NDJSON/CSV"""
+        return {
+            'id': str(transaction.id),
+            'created_at': transaction.created_at.isoformat() if transaction.created_at else None,
+            'referencia_externa': transaction.referencia_externa,
+            'transaction_type': transaction.transaction_type.value if transaction.transaction_type else None,
+            'estado': transaction.estado.value if transaction.estado else None,
+            'metodo_pago': transaction.metodo_pago.value if transaction.metodo_pago else None,
+            'monto': str(transaction.monto) if transaction.monto is not None else None,
+            'monto_vendedor': str(transaction.monto_vendedor) if transaction.monto_vendedor is not None else None,
+            'porcentaje_mestocker': str(transaction.porcentaje_mestocker) if transaction.porcentaje_mestocker is not None else None,
+            'comprador_id': str(transaction.comprador_id) if transaction.comprador_id else None,
+            'vendedor_id': str(transaction.vendedor_id) if transaction.vendedor_id else None,
+            'referencia_pago': transaction.referencia_pago,
+            'fecha_pago': transaction.fecha_pago.isoformat() if transaction.fecha_pago else None,
+        }
+
+    @staticmethod
+    def _format_csv_row(values) -> str:
+        """Serializa una fila CSV individual"""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(['' if v is None else v for v in values])
+        return buffer.getvalue()
+
+    def _generate_transaction_reference(self) -> str:
+        """Genera referencia única de transacción"""
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        random_suffix = str(uuid4())[:8].upper()
+        return f"TXN-{timestamp}-{random_suffix}"
+
+    def _simulate_payment_processing(self, transaction: Transaction) -> bool:
+        """
+        Simula procesamiento de pago
+        En producción, aquí se integraría con gateway de pago real
+        """
+        # In development, simulate random success/failure for testing
+        if self.environment == 'development':
+            import random
+            return random.choice([True, True, True, False])  # 75% success rate
+        
+        # In production, implement actual payment gateway integration
+        return True
+
+    def _log_transaction_creation(self, transaction: Transaction, commission: Commission) -> None:
+        """Log de auditoría para creación de transacción"""
+        audit_data = {
+            'transaction_id': str(transaction.id),
+            'commission_id': str(commission.id),
+            'amount': float(transaction.monto),
+            'vendor_amount': float(transaction.monto_vendedor),
+            'payment_method': transaction.metodo_pago.value,
+            'transaction_type': transaction.transaction_type.value,
+            'vendor_id': str(transaction.vendedor_id),
+            'buyer_id': str(transaction.comprador_id),
+            'reference': transaction.referencia_externa,
+            'timestamp': datetime.now().isoformat(),
+            'environment': self.environment
+        }
+        
+        if self.enable_detailed_logging:
+            logger.info(f"Transaction creation audit: {audit_data}")
+        else:
+            logger.info(f"Transaction created: {transaction.referencia_externa}")
+
+    def _log_transaction_processing(self, transaction: Transaction, success: bool) -> None:
+        """Log de auditoría para procesamiento de transacción"""
+        status = "SUCCESS" if success else "FAILED"
+        logger.info(f"Transaction processing {status}: {transaction.id} - {transaction.referencia_externa}")
+
+    def _calculate_transaction_summary(self, transactions: List[Transaction]) -> Dict:
+        """Calcula resumen estadístico de transacciones"""
+        if not transactions:
+            return {
+                'total_amount': 0.0,
+                'total_transactions': 0,
+                'avg_amount': 0.0,
+                'commission_total': 0.0,
+                'by_payment_method': {}
+            }
+        
+        total_amount = sum(t.monto for t in transactions)
+        commission_transactions = [t for t in transactions if t.transaction_type == TransactionType.COMISION]
+        commission_total = sum(t.monto for t in commission_transactions)
+        
+        by_method = {}
+        for t in transactions:
+            method = t.metodo_pago.value
+            if method not in by_method:
+                by_method[method] = {'count': 0, 'amount': 0.0}
+            by_method[method]['count'] += 1
+            by_method[method]['amount'] += float(t.monto)
+        
+        return {
+            'total_amount': float(total_amount),
+            'total_transactions': len(transactions),
+            'avg_amount': float(total_amount / len(transactions)),
+            'commission_total': float(commission_total),
+            'by_payment_method': by_method
+        }
+
+    def _summary_from_aggregate_rows(self, rows) -> Dict:
+        """Convierte filas (metodo_pago, count, sum, sum_comision) al formato de resumen"""
+        total_transactions = 0
+        total_amount = Decimal('0')
+        commission_total = Decimal('0')
+        by_method = {}
+
+        for method, count, amount, commission_amount in rows:
+            total_transactions += count
+            total_amount += Decimal(str(amount))
+            commission_total += Decimal(str(commission_amount))
+            by_method[method.value if method else None] = {'count': count, 'amount': float(amount)}
+
+        return {
+            'total_amount': float(total_amount),
+            'total_transactions': total_transactions,
+            'avg_amount': float(total_amount / total_transactions) if total_transactions else 0.0,
+            'commission_total': float(commission_total),
+            'by_payment_method': by_method
+        }
+
+    def _validate_commission_calculation(self, commission: Commission) -> bool:
+        """Valida cálculos de comisión"""
+        expected_commission, expected_vendor, expected_platform = Commission.calculate_commission(
+            commission.order_amount,
+            commission.commission_rate,
+            commission.commission_type
+        )
+
+        return (
+            abs(commission.commission_amount - expected_commission) < Decimal('0.01') and
+            abs(commission.vendor_amount - expected_vendor) < Decimal('0.01') and
+            abs(commission.platform_amount - expected_platform) < Decimal('0.01')
+        )
+
+    # === Builders compartidos por TransactionService y AsyncTransactionService ===
+
+    def _build_commission_transaction(
+        self,
+        commission: Commission,
+        order: Order,
+        payment_method: MetodoPago,
+        notes: Optional[str]
+    ) -> Transaction:
+        """Construye (sin persistir) la transacción de pago de una comisión"""
+        # Generate transaction reference
+        transaction_ref = self._generate_transaction_reference()
+
+        # Create transaction for vendor payment
+        transaction = Transaction(
+            monto=commission.vendor_amount,
+            metodo_pago=payment_method,
+            estado=EstadoTransaccion.PENDIENTE,
+            transaction_type=TransactionType.COMISION,
+            comprador_id=order.buyer_id,  # Buyer pays
+            vendedor_id=commission.vendor_id,  # Vendor receives
+            porcentaje_mestocker=commission.commission_rate * 100,  # Convert to percentage
+            monto_vendedor=commission.vendor_amount,
+            referencia_externa=transaction_ref,
+            observaciones=notes or f"Commission payment for order {order.order_number}",
+            inventory_id=None  # Commission transactions don't relate to specific inventory
+        )
+
+        # SECURITY FIX: Generate cryptographic integrity hash
+        if self.enable_integrity_checks:
+            transaction.integrity_hash = self._generate_integrity_hash(transaction, commission)
+
+        return transaction
+
+    def _validate_transaction_amount(self, monto: Decimal) -> None:
+        """Valida los límites de monto configurados por ambiente"""
+        if monto <= 0:
+            raise TransactionError("Transaction amount must be positive")
+
+        if monto > self.max_transaction_amount:
+            raise TransactionError(f"Transaction amount exceeds maximum: {self.max_transaction_amount}")
+
+        if monto < self.min_transaction_amount:
+            raise TransactionError(f"Transaction amount below minimum: {self.min_transaction_amount}")
+
+    def _build_transaction(
+        self,
+        monto: Decimal,
+        metodo_pago: MetodoPago,
+        transaction_type: TransactionType,
+        comprador_id: UUID,
+        vendedor_id: Optional[UUID],
+        inventory_id: Optional[int],
+        porcentaje_mestocker: Optional[Decimal],
+        notes: Optional[str]
+    ) -> Transaction:
+        """Construye (sin persistir) una transacción genérica"""
+        # Calculate vendor amount
+        if porcentaje_mestocker and vendedor_id:
+            commission_rate = porcentaje_mestocker / Decimal('100')
+            platform_amount = monto * commission_rate
+            vendor_amount = monto - platform_amount
+        else:
+            vendor_amount = monto if vendedor_id else Decimal('0')
+
+        # Generate transaction reference
+        transaction_ref = self._generate_transaction_reference()
+
+        # Create transaction
+        transaction = Transaction(
+            monto=monto,
+            metodo_pago=metodo_pago,
+            estado=EstadoTransaccion.PENDIENTE,
+            transaction_type=transaction_type,
+            comprador_id=comprador_id,
+            vendedor_id=vendedor_id,
+            porcentaje_mestocker=float(porcentaje_mestocker) if porcentaje_mestocker else None,
+            monto_vendedor=vendor_amount,
+            referencia_externa=transaction_ref,
+            observaciones=notes,
+            inventory_id=inventory_id
+        )
+
+        # Generate integrity hash
+        if self.enable_integrity_checks:
+            transaction.integrity_hash = self._generate_integrity_hash(transaction)
+
+        return transaction
+
+    def _apply_status_transition(
+        self,
+        transaction: Transaction,
+        new_status: EstadoTransaccion,
+        notes: Optional[str],
+        payment_reference: Optional[str]
+    ) -> EstadoTransaccion:
+        """Valida y aplica un cambio de estado; retorna el estado anterior"""
+        # Validate state transition
+        valid_transitions = {
+            EstadoTransaccion.PENDIENTE: [EstadoTransaccion.PROCESANDO, EstadoTransaccion.FALLIDA, EstadoTransaccion.CANCELADA],
+            EstadoTransaccion.PROCESANDO: [EstadoTransaccion.COMPLETADA, EstadoTransaccion.FALLIDA],
+            EstadoTransaccion.COMPLETADA: [],  # Final state
+            EstadoTransaccion.FALLIDA: [EstadoTransaccion.PENDIENTE],  # Can retry
+            EstadoTransaccion.CANCELADA: []  # Final state
+        }
+
+        if new_status not in valid_transitions.get(transaction.estado, []):
+            raise TransactionError(
+                f"Invalid state transition from {transaction.estado} to {new_status}"
+            )
+
+        # Update transaction
+        old_status = transaction.estado
+        transaction.estado = new_status
+
+        if payment_reference:
+            transaction.referencia_pago = payment_reference
+
+        if notes:
+            current_notes = transaction.observaciones or ""
+            transaction.observaciones = f"{current_notes}\n{datetime.now().isoformat()}: {notes}".strip()
+
+        # Handle specific status updates
+        if new_status == EstadoTransaccion.COMPLETADA and payment_reference:
+            transaction.marcar_pago_completado(payment_reference)
+
+        return old_status
+
+    def _build_refund_transaction(
+        self,
+        original_tx: Transaction,
+        refund_amount: Optional[Decimal],
+        reason: Optional[str]
+    ) -> Transaction:
+        """Construye (sin persistir) la transacción de reembolso"""
+        # Determine refund amount
+        if refund_amount is None:
+            refund_amount = original_tx.monto
+        elif refund_amount <= 0 or refund_amount > original_tx.monto:
+            raise TransactionError(f"Invalid refund amount: {refund_amount}")
+
+        # Create refund transaction
+        refund_ref = self._generate_transaction_reference()
+
+        refund_transaction = Transaction(
+            monto=refund_amount,
+            metodo_pago=original_tx.metodo_pago,
+            estado=EstadoTransaccion.PENDIENTE,
+            transaction_type=TransactionType.DEVOLUCION,
+            comprador_id=original_tx.comprador_id,
+            vendedor_id=original_tx.vendedor_id,
+            porcentaje_mestocker=0.0,  # No commission on refunds
+            monto_vendedor=refund_amount,  # Full amount goes back to buyer
+            referencia_externa=refund_ref,
+            observaciones=f"Refund for transaction {original_tx.referencia_externa}. Reason: {reason or 'Not specified'}",
+            inventory_id=original_tx.inventory_id
+        )
+
+        # Generate integrity hash
+        if self.enable_integrity_checks:
+            refund_transaction.integrity_hash = self._generate_integrity_hash(refund_transaction)
+
+        return refund_transaction
+
+    # === SECURITY METHODS - Cryptographic Integrity ===
+
+    def _generate_integrity_hash(self, transaction: Transaction, commission: Commission = None) -> str:
+        """Generate cryptographic integrity hash for transaction."""
+        return compute_integrity_hash(
+            self.integrity_secret,
+            integrity_hash_fields(transaction, commission)
+        )
+
+    def _validate_transaction_integrity_hash(self, transaction: Transaction, commission: Commission = None) -> bool:
+        """Validate transaction integrity hash."""
+
+        if not self.enable_integrity_checks or not getattr(transaction, 'integrity_hash', None):
+            return True  # Skip validation if not enabled or hash not present (legacy rows)
+
+        # Regenerate hash with current transaction data
+        expected_hash = self._generate_integrity_hash(transaction, commission)
+
+        # Use constant-time comparison to prevent timing attacks
+        return hmac.compare_digest(transaction.integrity_hash, expected_hash)
+
+    def _validate_financial_consistency(self, transaction: Transaction, commission: Commission = None) -> Dict[str, bool]:
+        """Comprehensive financial consistency validation."""
+
+        validation_results = {'valid': True, 'errors': []}
+
+        # Basic amount validation
+        if transaction.monto <= 0:
+            validation_results['valid'] = False
+            validation_results['errors'].append('Transaction amount must be positive')
+
+        # Commission-transaction consistency
+        if commission and transaction.transaction_type == TransactionType.COMISION:
+            # Validate amounts match
+            if abs(transaction.monto_vendedor - commission.vendor_amount) > Decimal('0.01'):
+                validation_results['valid'] = False
+                validation_results['errors'].append('Transaction-commission amount mismatch')
+
+            # Validate percentage calculation
+            expected_percentage = float(commission.commission_rate * 100)
+            if abs(transaction.porcentaje_mestocker - expected_percentage) > 0.01:
+                validation_results['valid'] = False
+                validation_results['errors'].append('Commission percentage mismatch')
+
+        # Cryptographic integrity validation
+        if self.enable_integrity_checks:
+            if not self._validate_transaction_integrity_hash(transaction, commission):
+                validation_results['valid'] = False
+                validation_results['errors'].append('Cryptographic integrity validation failed')
+
+        return validation_results
+
+    def calculate_fees(
+        self,
+        base_amount: Decimal,
+        commission_rate: Decimal,
+        transaction_type: TransactionType = TransactionType.VENTA
+    ) -> Dict[str, Decimal]:
+        """
+        Calcula tarifas y montos para una transacción
+
+        Args:
+            base_amount: Monto base de la transacción
+            commission_rate: Tasa de comisión (como decimal, ej: 0.15 para 15%)
+            transaction_type: Tipo de transacción
+
+        Returns:
+            Dict con breakdown de montos calculados
+        """
+        try:
+            if base_amount <= 0:
+                raise TransactionError("Base amount must be positive")
+
+            if commission_rate < 0 or commission_rate > 1:
+                raise TransactionError("Commission rate must be between 0 and 1")
+
+            # Calculate amounts
+            platform_fee = base_amount * commission_rate
+            vendor_amount = base_amount - platform_fee
+
+            # Apply transaction type specific adjustments
+            processing_fee = Decimal('0')
+            if transaction_type == TransactionType.COMISION:
+                # Small processing fee for commission transactions
+                processing_fee = base_amount * Decimal('0.001')  # 0.1%
+            elif transaction_type == TransactionType.DEVOLUCION:
+                # No platform fee for refunds
+                platform_fee = Decimal('0')
+                vendor_amount = base_amount
+
+            net_amount = base_amount - platform_fee - processing_fee
+
+            return {
+                'base_amount': base_amount,
+                'platform_fee': platform_fee,
+                'processing_fee': processing_fee,
+                'vendor_amount': vendor_amount,
+                'net_amount': net_amount,
+                'commission_rate': commission_rate,
+                'effective_rate': platform_fee / base_amount if base_amount > 0 else Decimal('0')
+            }
+
+        except Exception as e:
+            logger.error(f"Error calculating fees: {e}")
+            raise TransactionError(f"Error calculating transaction fees: {str(e)}")
+
+
+class TransactionService(TransactionServiceBase):
     """
     PRODUCTION_READY: Servicio de registro de transacciones financieras
     
     Maneja el registro completo de movimientos financieros con auditoría,
     validación de integridad y trazabilidad completa de comisiones.
     """
-    
-    def __init__(self, db_session: Optional[Session] = None):
-        self.db = db_session
-        self.environment = os.getenv('ENVIRONMENT', 'development')
-        self.audit_level = os.getenv('TRANSACTION_AUDIT_LEVEL', 'standard')
-        self.enable_detailed_logging = self.audit_level in ['detailed', 'debug']
-
-        # Financial validation settings
-        self.max_transaction_amount = Decimal(os.getenv('MAX_TRANSACTION_AMOUNT', '10000000'))  # 10M COP
-        self.min_transaction_amount = Decimal(os.getenv('MIN_TRANSACTION_AMOUNT', '100'))      # 100 COP
 
-        # SECURITY FIX: Cryptographic integrity settings
-        self.integrity_secret = os.getenv('TRANSACTION_INTEGRITY_SECRET',
-                                         secrets.token_urlsafe(32))  # Secure random default
-        self.enable_integrity_checks = os.getenv('ENABLE_TRANSACTION_INTEGRITY', 'true').lower() == 'true'
-        
     def get_db(self) -> Session:
         """Get database session - use provided or create new"""
         if self.db:
             return self.db
         return SessionLocal()
-    
+
     def create_commission_transaction(
         self,
         commission: Commission,
@@ -148,27 +860,7 @@ class TransactionService:
                     details={'order_id': commission.order_id}
                 )
             
-            # Generate transaction reference
-            transaction_ref = self._generate_transaction_reference()
-
-            # Create transaction for vendor payment
-            transaction = Transaction(
-                monto=commission.vendor_amount,
-                metodo_pago=payment_method,
-                estado=EstadoTransaccion.PENDIENTE,
-                transaction_type=TransactionType.COMISION,
-                comprador_id=order.buyer_id,  # Buyer pays
-                vendedor_id=commission.vendor_id,  # Vendor receives
-                porcentaje_mestocker=commission.commission_rate * 100,  # Convert to percentage
-                monto_vendedor=commission.vendor_amount,
-                referencia_externa=transaction_ref,
-                observaciones=notes or f"Commission payment for order {order.order_number}",
-                inventory_id=None  # Commission transactions don't relate to specific inventory
-            )
-
-            # SECURITY FIX: Generate cryptographic integrity hash
-            if self.enable_integrity_checks:
-                transaction.integrity_hash = self._generate_integrity_hash(transaction, commission)
+            transaction = self._build_commission_transaction(commission, order, payment_method, notes)
             
             # Save transaction
             db.add(transaction)
@@ -196,7 +888,7 @@ class TransactionService:
                 f"Unexpected error creating transaction: {str(e)}",
                 details={'commission_id': str(commission.id) if commission else None}
             )
-    
+
     def process_transaction_payment(
         self,
         transaction_id: UUID,
@@ -230,7 +922,10 @@ class TransactionService:
             
             # SECURITY FIX: Validate transaction integrity before processing
             if self.enable_integrity_checks:
-                if not self._validate_transaction_integrity_hash(transaction):
+                commission = db.query(Commission).filter(
+                    Commission.transaction_id == transaction.id
+                ).first() if transaction.transaction_type == TransactionType.COMISION else None
+                if not self._validate_transaction_integrity_hash(transaction, commission):
                     raise TransactionError(f"Transaction integrity validation failed for {transaction_id}")
 
             # Update transaction status
@@ -271,7 +966,7 @@ class TransactionService:
             if isinstance(e, TransactionError):
                 raise
             raise TransactionError(f"Unexpected error processing transaction: {str(e)}")
-    
+
     def get_transaction_history(
         self,
         user_id: Optional[UUID] = None,
@@ -281,76 +976,69 @@ class TransactionService:
         status_filter: Optional[List[EstadoTransaccion]] = None,
         limit: int = 100,
         offset: int = 0,
+        cursor: Optional[str] = None,
         db: Optional[Session] = None
     ) -> Dict:
         """
         Obtiene historial de transacciones con filtros
-        
+
+        El resumen se calcula con agregados SQL en lugar de materializar las
+        transacciones completadas. Si se envía ``cursor`` se usa paginación
+        keyset (created_at, id) y ``offset`` se ignora.
+
         Returns:
             Dict con transacciones y metadata de paginación
         """
         db = db or self.get_db()
-        
+
         try:
-            # Build query
-            query = db.query(Transaction)
-            
-            if user_id:
-                query = query.filter(
-                    or_(
-                        Transaction.comprador_id == user_id,
-                        Transaction.vendedor_id == user_id
-                    )
-                )
-            
-            if transaction_type:
-                query = query.filter(Transaction.transaction_type == transaction_type)
-            
-            if start_date:
-                query = query.filter(Transaction.created_at >= start_date)
-            
-            if end_date:
-                query = query.filter(Transaction.created_at <= end_date)
-            
-            if status_filter:
-                query = query.filter(Transaction.estado.in_(status_filter))
-            
-            # Get total count
-            total_count = query.count()
-            
-            # Apply pagination and ordering
-            transactions = query.order_by(
-                Transaction.created_at.desc()
-            ).offset(offset).limit(limit).all()
-            
-            # Calculate summary statistics
-            summary = self._calculate_transaction_summary(
-                query.filter(Transaction.estado == EstadoTransaccion.COMPLETADA).all()
+            conditions = self._build_history_conditions(
+                user_id, transaction_type, start_date, end_date, status_filter
             )
-            
-            return {
-                'transactions': [t.to_dict() for t in transactions],
-                'pagination': {
-                    'total': total_count,
-                    'limit': limit,
-                    'offset': offset,
-                    'has_next': offset + limit < total_count,
-                    'has_prev': offset > 0
-                },
-                'summary': summary,
-                'filters_applied': {
-                    'user_id': str(user_id) if user_id else None,
-                    'transaction_type': transaction_type.value if transaction_type else None,
-                    'start_date': start_date.isoformat() if start_date else None,
-                    'end_date': end_date.isoformat() if end_date else None,
-                    'status_filter': [s.value for s in status_filter] if status_filter else None
-                }
-            }
-            
+
+            total_count = db.execute(
+                select(func.count(Transaction.id)).where(*conditions)
+            ).scalar_one()
+            summary = self._summary_from_aggregate_rows(
+                db.execute(self._history_summary_statement(conditions)).all()
+            )
+            transactions = db.execute(
+                self._history_page_statement(conditions, limit, offset, cursor)
+            ).scalars().all()
+
+            return self._build_history_response(
+                transactions, total_count, summary, limit, offset, cursor,
+                user_id, transaction_type, start_date, end_date, status_filter
+            )
+
         except Exception as e:
             logger.error(f"Error getting transaction history: {e}")
             raise TransactionError(f"Error retrieving transaction history: {str(e)}")
-    
+
+    def iter_transaction_history(
+        self,
+        user_id: Optional[UUID] = None,
+        transaction_type: Optional[TransactionType] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status_filter: Optional[List[EstadoTransaccion]] = None,
+        chunk_size: int = 500,
+        db: Optional[Session] = None
+    ) -> Iterator[Transaction]:
+        """
+        Recorre el historial completo con cursor del lado del servidor
+
+        Usa ``stream_results``/``yield_per`` para no materializar el resultado.
+        """
+        db = db or self.get_db()
+        conditions = self._build_history_conditions(
+            user_id, transaction_type, start_date, end_date, status_filter
+        )
+        statement = self._history_order(select(Transaction).where(*conditions)).execution_options(
+            stream_results=True, yield_per=chunk_size
+        )
+        yield from db.execute(statement).scalars()
+
     def validate_transaction_integrity(
         self,
         transaction: Transaction,
@@ -364,6 +1052,7 @@ class TransactionService:
         """
         db = db or self.get_db()
         results = {'valid': True, 'errors': []}
+        commission = None
         
         try:
             # Basic amount validation
@@ -374,220 +1063,52 @@ class TransactionService:
             if transaction.monto > self.max_transaction_amount:
                 results['valid'] = False
                 results['errors'].append(f'Transaction amount exceeds maximum: {self.max_transaction_amount}')
-            
-            if transaction.monto < self.min_transaction_amount:
-                results['valid'] = False
-                results['errors'].append(f'Transaction amount below minimum: {self.min_transaction_amount}')
-            
-            # Commission-specific validation
-            if transaction.transaction_type == TransactionType.COMISION:
-                commission = db.query(Commission).filter(
-                    Commission.transaction_id == transaction.id
-                ).first()
-                
-                if commission:
-                    # Validate amounts match
-                    if abs(transaction.monto_vendedor - commission.vendor_amount) > Decimal('0.01'):
-                        results['valid'] = False
-                        results['errors'].append('Transaction vendor amount does not match commission')
-                    
-                    # Validate commission integrity
-                    if not self._validate_commission_calculation(commission):
-                        results['valid'] = False
-                        results['errors'].append('Commission calculation integrity failed')
-            
-            # User validation
-            if transaction.comprador_id:
-                buyer = db.query(User).filter(User.id == transaction.comprador_id).first()
-                if not buyer:
-                    results['valid'] = False
-                    results['errors'].append('Buyer user not found')
-            
-            if transaction.vendedor_id:
-                vendor = db.query(User).filter(User.id == transaction.vendedor_id).first()
-                if not vendor:
-                    results['valid'] = False
-                    results['errors'].append('Vendor user not found')
-            
-            # SECURITY FIX: Enhanced validation with cryptographic checks
-            crypto_validation = self._validate_financial_consistency(transaction, commission)
-            if not crypto_validation['valid']:
-                results['valid'] = False
-                results['errors'].extend(crypto_validation['errors'])
-
-            return results
-
-        except Exception as e:
-            logger.error(f"Error validating transaction integrity: {e}")
-            return {'valid': False, 'errors': [f'Validation error: {str(e)}']}
-    
-    def _generate_transaction_reference(self) -> str:
-        """Genera referencia única de transacción"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_suffix = str(uuid4())[:8].upper()
-        return f"TXN-{timestamp}-{random_suffix}"
-    
-    def _simulate_payment_processing(self, transaction: Transaction) -> bool:
-        """
-        Simula procesamiento de pago
-        En producción, aquí se integraría con gateway de pago real
-        """
-        # In development, simulate random success/failure for testing
-        if self.environment == 'development':
-            import random
-            return random.choice([True, True, True, False])  # 75% success rate
-        
-        # In production, implement actual payment gateway integration
-        return True
-    
-    def _log_transaction_creation(self, transaction: Transaction, commission: Commission) -> None:
-        """Log de auditoría para creación de transacción"""
-        audit_data = {
-            'transaction_id': str(transaction.id),
-            'commission_id': str(commission.id),
-            'amount': float(transaction.monto),
-            'vendor_amount': float(transaction.monto_vendedor),
-            'payment_method': transaction.metodo_pago.value,
-            'transaction_type': transaction.transaction_type.value,
-            'vendor_id': str(transaction.vendedor_id),
-            'buyer_id': str(transaction.comprador_id),
-            'reference': transaction.referencia_externa,
-            'timestamp': datetime.now().isoformat(),
-            'environment': self.environment
-        }
-        
-        if self.enable_detailed_logging:
-            logger.info(f"Transaction creation audit: {audit_data}")
-        else:
-            logger.info(f"Transaction created: {transaction.referencia_externa}")
-    
-    def _log_transaction_processing(self, transaction: Transaction, success: bool) -> None:
-        """Log de auditoría para procesamiento de transacción"""
-        status = "SUCCESS" if success else "FAILED"
-        logger.info(f"Transaction processing {status}: {transaction.id} - {transaction.referencia_externa}")
-    
-    def _calculate_transaction_summary(self, transactions: List[Transaction]) -> Dict:
-        """Calcula resumen estadístico de transacciones"""
-        if not transactions:
-            return {
-                'total_amount': 0.0,
-                'total_transactions': 0,
-                'avg_amount': 0.0,
-                'commission_total': 0.0,
-                'by_payment_method': {}
-            }
-        
-        total_amount = sum(t.monto for t in transactions)
-        commission_transactions = [t for t in transactions if t.transaction_type == TransactionType.COMISION]
-        commission_total = sum(t.monto for t in commission_transactions)
-        
-        by_method = {}
-        for t in transactions:
-            method = t.metodo_pago.value
-            if method not in by_method:
-                by_method[method] = {'count': 0, 'amount': 0.0}
-            by_method[method]['count'] += 1
-            by_method[method]['amount'] += float(t.monto)
-        
-        return {
-            'total_amount': float(total_amount),
-            'total_transactions': len(transactions),
-            'avg_amount': float(total_amount / len(transactions)),
-            'commission_total': float(commission_total),
-            'by_payment_method': by_method
-        }
-    
-    def _validate_commission_calculation(self, commission: Commission) -> bool:
-        """Valida cálculos de comisión"""
-        expected_commission, expected_vendor, expected_platform = Commission.calculate_commission(
-            commission.order_amount,
-            commission.commission_rate,
-            commission.commission_type
-        )
-
-        return (
-            abs(commission.commission_amount - expected_commission) < Decimal('0.01') and
-            abs(commission.vendor_amount - expected_vendor) < Decimal('0.01') and
-            abs(commission.platform_amount - expected_platform) < Decimal('0.01')
-        )
-
-    # === SECURITY METHODS - Cryptographic Integrity ===
-
-    def _generate_integrity_hash(self, transaction: Transaction, commission: Commission = None) -> str:
-        """Generate cryptographic integrity hash for transaction."""
-
-        # Create hash input from critical transaction data
-        hash_data = {
-            'monto': str(transaction.monto),
-            'vendedor_id': str(transaction.vendedor_id),
-            'comprador_id': str(transaction.comprador_id),
-            'monto_vendedor': str(transaction.monto_vendedor),
-            'porcentaje_mestocker': str(transaction.porcentaje_mestocker),
-            'transaction_type': transaction.transaction_type.value,
-            'referencia_externa': transaction.referencia_externa,
-        }
-
-        # Add commission data if available
-        if commission:
-            hash_data.update({
-                'commission_id': str(commission.id),
-                'commission_rate': str(commission.commission_rate),
-                'commission_amount': str(commission.commission_amount),
-                'order_id': str(commission.order_id)
-            })
-
-        # Create deterministic string representation
-        hash_string = '|'.join(f"{k}:{v}" for k, v in sorted(hash_data.items()))
-
-        # Generate HMAC-SHA256 with secret
-        return hmac.new(
-            self.integrity_secret.encode('utf-8'),
-            hash_string.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-
-    def _validate_transaction_integrity_hash(self, transaction: Transaction) -> bool:
-        """Validate transaction integrity hash."""
-
-        if not self.enable_integrity_checks or not hasattr(transaction, 'integrity_hash'):
-            return True  # Skip validation if not enabled or hash not present
-
-        # Regenerate hash with current transaction data
-        expected_hash = self._generate_integrity_hash(transaction)
-
-        # Use constant-time comparison to prevent timing attacks
-        return hmac.compare_digest(transaction.integrity_hash, expected_hash)
-
-    def _validate_financial_consistency(self, transaction: Transaction, commission: Commission = None) -> Dict[str, bool]:
-        """Comprehensive financial consistency validation."""
-
-        validation_results = {'valid': True, 'errors': []}
-
-        # Basic amount validation
-        if transaction.monto <= 0:
-            validation_results['valid'] = False
-            validation_results['errors'].append('Transaction amount must be positive')
-
-        # Commission-transaction consistency
-        if commission and transaction.transaction_type == TransactionType.COMISION:
-            # Validate amounts match
-            if abs(transaction.monto_vendedor - commission.vendor_amount) > Decimal('0.01'):
-                validation_results['valid'] = False
-                validation_results['errors'].append('Transaction-commission amount mismatch')
-
-            # Validate percentage calculation
-            expected_percentage = float(commission.commission_rate * 100)
-            if abs(transaction.porcentaje_mestocker - expected_percentage) > 0.01:
-                validation_results['valid'] = False
-                validation_results['errors'].append('Commission percentage mismatch')
+            
+            if transaction.monto < self.min_transaction_amount:
+                results['valid'] = False
+                results['errors'].append(f'Transaction amount below minimum: {self.min_transaction_amount}')
+            
+            # Commission-specific validation
+            if transaction.transaction_type == TransactionType.COMISION:
+                commission = db.query(Commission).filter(
+                    Commission.transaction_id == transaction.id
+                ).first()
+                
+                if commission:
+                    # Validate amounts match
+                    if abs(transaction.monto_vendedor - commission.vendor_amount) > Decimal('0.01'):
+                        results['valid'] = False
+                        results['errors'].append('Transaction vendor amount does not match commission')
+                    
+                    # Validate commission integrity
+                    if not self._validate_commission_calculation(commission):
+                        results['valid'] = False
+                        results['errors'].append('Commission calculation integrity failed')
+            
+            # User validation
+            if transaction.comprador_id:
+                buyer = db.query(User).filter(User.id == transaction.comprador_id).first()
+                if not buyer:
+                    results['valid'] = False
+                    results['errors'].append('Buyer user not found')
+            
+            if transaction.vendedor_id:
+                vendor = db.query(User).filter(User.id == transaction.vendedor_id).first()
+                if not vendor:
+                    results['valid'] = False
+                    results['errors'].append('Vendor user not found')
+            
+            # SECURITY FIX: Enhanced validation with cryptographic checks
+            crypto_validation = self._validate_financial_consistency(transaction, commission)
+            if not crypto_validation['valid']:
+                results['valid'] = False
+                results['errors'].extend(crypto_validation['errors'])
 
-        # Cryptographic integrity validation
-        if self.enable_integrity_checks:
-            if not self._validate_transaction_integrity_hash(transaction):
-                validation_results['valid'] = False
-                validation_results['errors'].append('Cryptographic integrity validation failed')
+            return results
 
-        return validation_results
+        except Exception as e:
+            logger.error(f"Error validating transaction integrity: {e}")
+            return {'valid': False, 'errors': [f'Validation error: {str(e)}']}
 
     def create_transaction(
         self,
@@ -624,15 +1145,7 @@ class TransactionService:
         db = db or self.get_db()
 
         try:
-            # Validate amount
-            if monto <= 0:
-                raise TransactionError("Transaction amount must be positive")
-
-            if monto > self.max_transaction_amount:
-                raise TransactionError(f"Transaction amount exceeds maximum: {self.max_transaction_amount}")
-
-            if monto < self.min_transaction_amount:
-                raise TransactionError(f"Transaction amount below minimum: {self.min_transaction_amount}")
+            self._validate_transaction_amount(monto)
 
             # Validate users exist
             buyer = db.query(User).filter(User.id == comprador_id).first()
@@ -644,43 +1157,18 @@ class TransactionService:
                 if not vendor:
                     raise TransactionError(f"Vendor {vendedor_id} not found")
 
-            # Calculate vendor amount
-            if porcentaje_mestocker and vendedor_id:
-                commission_rate = porcentaje_mestocker / Decimal('100')
-                platform_amount = monto * commission_rate
-                vendor_amount = monto - platform_amount
-            else:
-                vendor_amount = monto if vendedor_id else Decimal('0')
-
-            # Generate transaction reference
-            transaction_ref = self._generate_transaction_reference()
-
-            # Create transaction
-            transaction = Transaction(
-                monto=monto,
-                metodo_pago=metodo_pago,
-                estado=EstadoTransaccion.PENDIENTE,
-                transaction_type=transaction_type,
-                comprador_id=comprador_id,
-                vendedor_id=vendedor_id,
-                porcentaje_mestocker=float(porcentaje_mestocker) if porcentaje_mestocker else None,
-                monto_vendedor=vendor_amount,
-                referencia_externa=transaction_ref,
-                observaciones=notes,
-                inventory_id=inventory_id
+            transaction = self._build_transaction(
+                monto, metodo_pago, transaction_type, comprador_id,
+                vendedor_id, inventory_id, porcentaje_mestocker, notes
             )
 
-            # Generate integrity hash
-            if self.enable_integrity_checks:
-                transaction.integrity_hash = self._generate_integrity_hash(transaction)
-
             # Save transaction
             db.add(transaction)
             db.commit()
             db.refresh(transaction)
 
             # Log creation
-            logger.info(f"Transaction created: {transaction.id} - {transaction_ref}")
+            logger.info(f"Transaction created: {transaction.id} - {transaction.referencia_externa}")
 
             return transaction
 
@@ -722,34 +1210,7 @@ class TransactionService:
             if not transaction:
                 raise TransactionError(f"Transaction {transaction_id} not found")
 
-            # Validate state transition
-            valid_transitions = {
-                EstadoTransaccion.PENDIENTE: [EstadoTransaccion.PROCESANDO, EstadoTransaccion.FALLIDA, EstadoTransaccion.CANCELADA],
-                EstadoTransaccion.PROCESANDO: [EstadoTransaccion.COMPLETADA, EstadoTransaccion.FALLIDA],
-                EstadoTransaccion.COMPLETADA: [],  # Final state
-                EstadoTransaccion.FALLIDA: [EstadoTransaccion.PENDIENTE],  # Can retry
-                EstadoTransaccion.CANCELADA: []  # Final state
-            }
-
-            if new_status not in valid_transitions.get(transaction.estado, []):
-                raise TransactionError(
-                    f"Invalid state transition from {transaction.estado} to {new_status}"
-                )
-
-            # Update transaction
-            old_status = transaction.estado
-            transaction.estado = new_status
-
-            if payment_reference:
-                transaction.referencia_pago = payment_reference
-
-            if notes:
-                current_notes = transaction.observaciones or ""
-                transaction.observaciones = f"{current_notes}\n{datetime.now().isoformat()}: {notes}".strip()
-
-            # Handle specific status updates
-            if new_status == EstadoTransaccion.COMPLETADA and payment_reference:
-                transaction.marcar_pago_completado(payment_reference)
+            old_status = self._apply_status_transition(transaction, new_status, notes, payment_reference)
 
             db.commit()
 
@@ -765,60 +1226,6 @@ class TransactionService:
                 raise
             raise TransactionError(f"Unexpected error updating transaction: {str(e)}")
 
-    def calculate_fees(
-        self,
-        base_amount: Decimal,
-        commission_rate: Decimal,
-        transaction_type: TransactionType = TransactionType.VENTA
-    ) -> Dict[str, Decimal]:
-        """
-        Calcula tarifas y montos para una transacción
-
-        Args:
-            base_amount: Monto base de la transacción
-            commission_rate: Tasa de comisión (como decimal, ej: 0.15 para 15%)
-            transaction_type: Tipo de transacción
-
-        Returns:
-            Dict con breakdown de montos calculados
-        """
-        try:
-            if base_amount <= 0:
-                raise TransactionError("Base amount must be positive")
-
-            if commission_rate < 0 or commission_rate > 1:
-                raise TransactionError("Commission rate must be between 0 and 1")
-
-            # Calculate amounts
-            platform_fee = base_amount * commission_rate
-            vendor_amount = base_amount - platform_fee
-
-            # Apply transaction type specific adjustments
-            processing_fee = Decimal('0')
-            if transaction_type == TransactionType.COMISION:
-                # Small processing fee for commission transactions
-                processing_fee = base_amount * Decimal('0.001')  # 0.1%
-            elif transaction_type == TransactionType.DEVOLUCION:
-                # No platform fee for refunds
-                platform_fee = Decimal('0')
-                vendor_amount = base_amount
-
-            net_amount = base_amount - platform_fee - processing_fee
-
-            return {
-                'base_amount': base_amount,
-                'platform_fee': platform_fee,
-                'processing_fee': processing_fee,
-                'vendor_amount': vendor_amount,
-                'net_amount': net_amount,
-                'commission_rate': commission_rate,
-                'effective_rate': platform_fee / base_amount if base_amount > 0 else Decimal('0')
-            }
-
-        except Exception as e:
-            logger.error(f"Error calculating fees: {e}")
-            raise TransactionError(f"Error calculating transaction fees: {str(e)}")
-
     def process_refund(
         self,
         original_transaction_id: UUID,
@@ -855,32 +1262,7 @@ class TransactionService:
             if original_tx.estado != EstadoTransaccion.COMPLETADA:
                 raise TransactionError(f"Original transaction must be completed to process refund")
 
-            # Determine refund amount
-            if refund_amount is None:
-                refund_amount = original_tx.monto
-            elif refund_amount <= 0 or refund_amount > original_tx.monto:
-                raise TransactionError(f"Invalid refund amount: {refund_amount}")
-
-            # Create refund transaction
-            refund_ref = self._generate_transaction_reference()
-
-            refund_transaction = Transaction(
-                monto=refund_amount,
-                metodo_pago=original_tx.metodo_pago,
-                estado=EstadoTransaccion.PENDIENTE,
-                transaction_type=TransactionType.DEVOLUCION,
-                comprador_id=original_tx.comprador_id,
-                vendedor_id=original_tx.vendedor_id,
-                porcentaje_mestocker=0.0,  # No commission on refunds
-                monto_vendedor=refund_amount,  # Full amount goes back to buyer
-                referencia_externa=refund_ref,
-                observaciones=f"Refund for transaction {original_tx.referencia_externa}. Reason: {reason or 'Not specified'}",
-                inventory_id=original_tx.inventory_id
-            )
-
-            # Generate integrity hash
-            if self.enable_integrity_checks:
-                refund_transaction.integrity_hash = self._generate_integrity_hash(refund_transaction)
+            refund_transaction = self._build_refund_transaction(original_tx, refund_amount, reason)
 
             # Save refund transaction
             db.add(refund_transaction)
@@ -888,7 +1270,7 @@ class TransactionService:
 
             # Process refund immediately (in production, this would go through payment gateway)
             refund_transaction.estado = EstadoTransaccion.COMPLETADA
-            refund_transaction.marcar_pago_completado(f"REFUND-{refund_ref}")
+            refund_transaction.marcar_pago_completado(f"REFUND-{refund_transaction.referencia_externa}")
 
             db.commit()
             db.refresh(refund_transaction)
@@ -903,4 +1285,375 @@ class TransactionService:
             logger.error(f"Error processing refund for {original_transaction_id}: {e}")
             if isinstance(e, TransactionError):
                 raise
-            raise TransactionError(f"Unexpected error processing refund: {str(e)}")
\ No newline at end of file
+            raise TransactionError(f"Unexpected error processing refund: {str(e)}")
+
+
+class AsyncTransactionService(TransactionServiceBase):
+    """
+    Versión async-native de TransactionService
+
+    Mismo comportamiento que TransactionService, pero sobre AsyncSession y el
+    pool compartido de la API (app.core.database). No hereda de
+    TransactionService: sus métodos públicos son corrutinas y se usan con
+    ``await``; la lógica común vive en TransactionServiceBase.
+    """
+
+    def __init__(self, db_session: Optional[AsyncSession] = None):
+        super().__init__()
+        self.db = db_session
+
+    @asynccontextmanager
+    async def session_scope(self, db: Optional[AsyncSession] = None):
+        """Usa la sesión recibida o abre una del pool compartido y la cierra al final"""
+        if db is not None or self.db is not None:
+            yield db or self.db
+            return
+        async with AsyncSessionLocal() as session:
+            yield session
+
+    @staticmethod
+    async def _get_by_id(db: AsyncSession, model, entity_id):
+        """Obtiene una entidad por id o None"""
+        return (await db.execute(select(model).where(model.id == entity_id))).scalars().first()
+
+    async def create_commission_transaction(
+        self,
+        commission: Commission,
+        payment_method: MetodoPago,
+        notes: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Transaction:
+        """Crea transacción financiera asociada a una comisión"""
+        # Tras un rollback los atributos expiran y no se pueden recargar sin await
+        commission_id = str(commission.id) if commission else None
+        async with self.session_scope(db) as db:
+            try:
+                # Validate commission
+                if not commission or commission.status != CommissionStatus.APPROVED:
+                    raise TransactionError(
+                        f"Commission {commission.id if commission else 'None'} is not approved for transaction",
+                        details={'commission_id': str(commission.id) if commission else None}
+                    )
+
+                # Check if transaction already exists for this commission
+                existing_transaction = await self._get_by_id(
+                    db, Transaction, commission.transaction_id
+                ) if commission.transaction_id else None
+
+                if existing_transaction:
+                    logger.info(f"Transaction already exists for commission {commission.id}: {existing_transaction.id}")
+                    return existing_transaction
+
+                # Validate vendor exists
+                vendor = await self._get_by_id(db, User, commission.vendor_id)
+                if not vendor:
+                    raise TransactionError(
+                        f"Vendor {commission.vendor_id} not found",
+                        details={'vendor_id': str(commission.vendor_id)}
+                    )
+
+                # Validate order exists
+                order = await self._get_by_id(db, Order, commission.order_id)
+                if not order:
+                    raise TransactionError(
+                        f"Order {commission.order_id} not found",
+                        details={'order_id': commission.order_id}
+                    )
+
+                transaction = self._build_commission_transaction(commission, order, payment_method, notes)
+
+                # Save transaction
+                db.add(transaction)
+                await db.flush()  # Get the ID without committing
+
+                # Link transaction to commission
+                commission.transaction_id = transaction.id
+
+                await db.commit()
+                await db.refresh(transaction)
+
+                # Log for audit trail
+                self._log_transaction_creation(transaction, commission)
+
+                logger.info(f"Transaction created successfully: {transaction.id} for commission {commission.id}")
+
+                return transaction
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error creating transaction for commission {commission_id}: {e}")
+                if isinstance(e, TransactionError):
+                    raise
+                raise TransactionError(
+                    f"Unexpected error creating transaction: {str(e)}",
+                    details={'commission_id': commission_id}
+                )
+
+    async def process_transaction_payment(
+        self,
+        transaction_id: UUID,
+        payment_reference: Optional[str] = None,
+        gateway_response: Optional[Dict] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Transaction:
+        """Procesa el pago de una transacción"""
+        async with self.session_scope(db) as db:
+            try:
+                transaction = await self._get_by_id(db, Transaction, transaction_id)
+                if not transaction:
+                    raise TransactionError(f"Transaction {transaction_id} not found")
+
+                if transaction.estado != EstadoTransaccion.PENDIENTE:
+                    raise TransactionError(
+                        f"Transaction {transaction_id} is not in pending status: {transaction.estado}"
+                    )
+
+                # SECURITY FIX: Validate transaction integrity before processing
+                if self.enable_integrity_checks:
+                    commission = (await db.execute(
+                        select(Commission).where(Commission.transaction_id == transaction.id)
+                    )).scalars().first() if transaction.transaction_type == TransactionType.COMISION else None
+                    if not self._validate_transaction_integrity_hash(transaction, commission):
+                        raise TransactionError(f"Transaction integrity validation failed for {transaction_id}")
+
+                # Update transaction status
+                transaction.estado = EstadoTransaccion.PROCESANDO
+                transaction.referencia_pago = payment_reference
+                if gateway_response:
+                    transaction.observaciones = (transaction.observaciones or '') + f"\nGateway response: {gateway_response}"
+
+                await db.commit()
+
+                success = self._simulate_payment_processing(transaction)
+
+                if success:
+                    transaction.marcar_pago_completado(payment_reference)
+                    transaction.estado = EstadoTransaccion.COMPLETADA
+
+                    # Mark associated commission as paid
+                    if transaction.transaction_type == TransactionType.COMISION:
+                        commission = (await db.execute(
+                            select(Commission).where(Commission.transaction_id == transaction.id)
+                        )).scalars().first()
+                        if commission:
+                            commission.mark_as_paid(f"Payment processed via transaction {transaction.id}")
+                else:
+                    transaction.estado = EstadoTransaccion.FALLIDA
+                    transaction.observaciones = (transaction.observaciones or '') + "\nPayment processing failed"
+
+                await db.commit()
+
+                self._log_transaction_processing(transaction, success)
+
+                return transaction
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error processing transaction {transaction_id}: {e}")
+                if isinstance(e, TransactionError):
+                    raise
+                raise TransactionError(f"Unexpected error processing transaction: {str(e)}")
+
+    async def get_transaction_history(
+        self,
+        user_id: Optional[UUID] = None,
+        transaction_type: Optional[TransactionType] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status_filter: Optional[List[EstadoTransaccion]] = None,
+        limit: int = 100,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Dict:
+        """Obtiene historial de transacciones con filtros"""
+        async with self.session_scope(db) as db:
+            return await self.get_transaction_history_async(
+                db,
+                user_id=user_id,
+                transaction_type=transaction_type,
+                start_date=start_date,
+                end_date=end_date,
+                status_filter=status_filter,
+                limit=limit,
+                offset=offset,
+                cursor=cursor
+            )
+
+    async def validate_transaction_integrity(
+        self,
+        transaction: Transaction,
+        db: Optional[AsyncSession] = None
+    ) -> Dict[str, bool]:
+        """Valida la integridad de una transacción"""
+        results = {'valid': True, 'errors': []}
+        commission = None
+
+        async with self.session_scope(db) as db:
+            try:
+                # Basic amount validation
+                if transaction.monto <= 0:
+                    results['valid'] = False
+                    results['errors'].append('Transaction amount must be positive')
+
+                if transaction.monto > self.max_transaction_amount:
+                    results['valid'] = False
+                    results['errors'].append(f'Transaction amount exceeds maximum: {self.max_transaction_amount}')
+
+                if transaction.monto < self.min_transaction_amount:
+                    results['valid'] = False
+                    results['errors'].append(f'Transaction amount below minimum: {self.min_transaction_amount}')
+
+                # Commission-specific validation
+                if transaction.transaction_type == TransactionType.COMISION:
+                    commission = (await db.execute(
+                        select(Commission).where(Commission.transaction_id == transaction.id)
+                    )).scalars().first()
+
+                    if commission:
+                        # Validate amounts match
+                        if abs(transaction.monto_vendedor - commission.vendor_amount) > Decimal('0.01'):
+                            results['valid'] = False
+                            results['errors'].append('Transaction vendor amount does not match commission')
+
+                        # Validate commission integrity
+                        if not self._validate_commission_calculation(commission):
+                            results['valid'] = False
+                            results['errors'].append('Commission calculation integrity failed')
+
+                # User validation
+                if transaction.comprador_id and not await self._get_by_id(db, User, transaction.comprador_id):
+                    results['valid'] = False
+                    results['errors'].append('Buyer user not found')
+
+                if transaction.vendedor_id and not await self._get_by_id(db, User, transaction.vendedor_id):
+                    results['valid'] = False
+                    results['errors'].append('Vendor user not found')
+
+                crypto_validation = self._validate_financial_consistency(transaction, commission)
+                if not crypto_validation['valid']:
+                    results['valid'] = False
+                    results['errors'].extend(crypto_validation['errors'])
+
+                return results
+
+            except Exception as e:
+                logger.error(f"Error validating transaction integrity: {e}")
+                return {'valid': False, 'errors': [f'Validation error: {str(e)}']}
+
+    async def create_transaction(
+        self,
+        monto: Decimal,
+        metodo_pago: MetodoPago,
+        transaction_type: TransactionType,
+        comprador_id: UUID,
+        vendedor_id: Optional[UUID] = None,
+        inventory_id: Optional[int] = None,
+        porcentaje_mestocker: Optional[Decimal] = None,
+        notes: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Transaction:
+        """Crea una nueva transacción genérica"""
+        async with self.session_scope(db) as db:
+            try:
+                self._validate_transaction_amount(monto)
+
+                # Validate users exist
+                if not await self._get_by_id(db, User, comprador_id):
+                    raise TransactionError(f"Buyer {comprador_id} not found")
+
+                if vendedor_id and not await self._get_by_id(db, User, vendedor_id):
+                    raise TransactionError(f"Vendor {vendedor_id} not found")
+
+                transaction = self._build_transaction(
+                    monto, metodo_pago, transaction_type, comprador_id,
+                    vendedor_id, inventory_id, porcentaje_mestocker, notes
+                )
+
+                # Save transaction
+                db.add(transaction)
+                await db.commit()
+                await db.refresh(transaction)
+
+                logger.info(f"Transaction created: {transaction.id} - {transaction.referencia_externa}")
+
+                return transaction
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error creating transaction: {e}")
+                if isinstance(e, TransactionError):
+                    raise
+                raise TransactionError(f"Unexpected error creating transaction: {str(e)}")
+
+    async def update_transaction_status(
+        self,
+        transaction_id: UUID,
+        new_status: EstadoTransaccion,
+        notes: Optional[str] = None,
+        payment_reference: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Transaction:
+        """Actualiza el estado de una transacción"""
+        async with self.session_scope(db) as db:
+            try:
+                transaction = await self._get_by_id(db, Transaction, transaction_id)
+                if not transaction:
+                    raise TransactionError(f"Transaction {transaction_id} not found")
+
+                old_status = self._apply_status_transition(transaction, new_status, notes, payment_reference)
+
+                await db.commit()
+
+                logger.info(f"Transaction {transaction_id} status changed: {old_status} -> {new_status}")
+
+                return transaction
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error updating transaction {transaction_id}: {e}")
+                if isinstance(e, TransactionError):
+                    raise
+                raise TransactionError(f"Unexpected error updating transaction: {str(e)}")
+
+    async def process_refund(
+        self,
+        original_transaction_id: UUID,
+        refund_amount: Optional[Decimal] = None,
+        reason: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> Transaction:
+        """Procesa una devolución/reembolso"""
+        async with self.session_scope(db) as db:
+            try:
+                original_tx = await self._get_by_id(db, Transaction, original_transaction_id)
+
+                if not original_tx:
+                    raise TransactionError(f"Original transaction {original_transaction_id} not found")
+
+                if original_tx.estado != EstadoTransaccion.COMPLETADA:
+                    raise TransactionError(f"Original transaction must be completed to process refund")
+
+                refund_transaction = self._build_refund_transaction(original_tx, refund_amount, reason)
+
+                # Save refund transaction
+                db.add(refund_transaction)
+                await db.flush()
+
+                # Process refund immediately (in production, this would go through payment gateway)
+                refund_transaction.estado = EstadoTransaccion.COMPLETADA
+                refund_transaction.marcar_pago_completado(f"REFUND-{refund_transaction.referencia_externa}")
+
+                await db.commit()
+                await db.refresh(refund_transaction)
+
+                logger.info(f"Refund processed: {refund_transaction.id} for original {original_transaction_id}")
+
+                return refund_transaction
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error processing refund for {original_transaction_id}: {e}")
+                if isinstance(e, TransactionError):
+                    raise
+                raise TransactionError(f"Unexpected error processing refund: {str(e)}")
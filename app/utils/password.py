@@ -9,14 +9,15 @@
 # Ruta: ~/app/utils/password.py
 # Autor: Jairo
 # Fecha de Creación: 2025-07-21
-# Última Actualización: 2025-07-31
-# Versión: 1.1.0
+# Última Actualización: 2025-10-18
+# Versión: 1.2.0
 # Propósito: Utilidades para hash y verificación segura de contraseñas usando bcrypt
 #            CORRECCIÓN: Manejo async/sync corregido para prevenir RuntimeError
 #
 # Modificaciones:
 # 2025-07-21 - Extracción inicial desde app/core/security.py
 # 2025-07-31 - CORRECCIÓN CRÍTICA: ThreadPoolExecutor global para evitar "Event loop is closed"
+# 2025-10-18 - hash/verify delegados al pool dedicado de app.core.password_hashing
 #
 # ---------------------------------------------------------------------------------------------
 
@@ -33,15 +34,18 @@ CORRECCIÓN APLICADA v1.1.0:
 - Evita RuntimeError: Event loop is closed
 - Corrige ERROR 500 en validación de email duplicado
 
+Desde v1.2.0 el trabajo bcrypt se ejecuta en el pool acotado de
+``app.core.password_hashing`` (procesos dedicados, 429 si la cola está llena).
+
 Extraído desde app/core/security.py para mejor modularización.
 """
 
-import asyncio
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 
+from app.core.password_hashing import get_password_hasher, shutdown_password_hasher
+
 # Configuración del contexto de passwords con bcrypt
 # Environment-aware configuration for performance optimization
 
@@ -72,16 +76,13 @@ pwd_context = CryptContext(
     bcrypt__rounds=_get_bcrypt_rounds()
 )
 
-# CORRECCIÓN CRÍTICA: ThreadPoolExecutor global para evitar RuntimeError
-_bcrypt_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bcrypt-pool")
-
 
 async def hash_password(password: str) -> str:
     """
     Generar hash seguro de una contraseña usando bcrypt.
     
-    CORRECCIÓN v1.1.0: Usa ThreadPoolExecutor global para evitar
-    RuntimeError: Event loop is closed que causaba ERROR 500
+    v1.2.0: Se ejecuta en el pool dedicado de hashing; si la cola está
+    llena lanza PasswordHashingOverloaded (HTTP 429).
 
     Args:
         password: Contraseña en texto plano
@@ -97,17 +98,15 @@ async def hash_password(password: str) -> str:
         >>> len(hash1)  # Longitud típica de hash bcrypt
         60
     """
-    # CORRECCIÓN: Usar executor global en lugar de with statement
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(_bcrypt_executor, pwd_context.hash, password)
+    return await get_password_hasher().hash(password)
 
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verificar si una contraseña en texto plano coincide con su hash.
     
-    CORRECCIÓN v1.1.0: Usa ThreadPoolExecutor global para evitar
-    RuntimeError: Event loop is closed que causaba ERROR 500
+    v1.2.0: Se ejecuta en el pool dedicado de hashing; si la cola está
+    llena lanza PasswordHashingOverloaded (HTTP 429).
 
     Args:
         plain_password: Contraseña en texto plano
@@ -123,17 +122,14 @@ async def verify_password(plain_password: str, hashed_password: str) -> bool:
         >>> await verify_password("password_incorrecta", hashed)
         False
     """
-    # CORRECCIÓN: Usar executor global en lugar de with statement
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(_bcrypt_executor, pwd_context.verify, plain_password, hashed_password)
+    is_valid, _ = await get_password_hasher().verify(plain_password, hashed_password)
+    return is_valid
 
 
 def cleanup_bcrypt_executor():
     """
-    Función para limpiar el ThreadPoolExecutor al cerrar la aplicación.
+    Función para liberar el pool de hashing al cerrar la aplicación.
     
     Debe ser llamada en el shutdown de la aplicación FastAPI.
     """
-    global _bcrypt_executor
-    if _bcrypt_executor:
-        _bcrypt_executor.shutdown(wait=True)
+    shutdown_password_hasher()
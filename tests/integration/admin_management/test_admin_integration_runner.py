@@ -378,21 +378,15 @@ class TestAdminIntegrationFrameworkValidation:
 
         for i in range(cache_operations):
             try:
-                user_id = str(multiple_admin_users[i % len(multiple_admin_users)].id)
-                permission_key = f"benchmark_permission_{i % 10}"
+                user = multiple_admin_users[i % len(multiple_admin_users)]
 
-                # Simulate cache operations
-                cached_result = await admin_permission_service_with_redis._get_cached_permission(
-                    user_id, permission_key
+                # Compiled permission set: compiled once, then served from cache
+                _, source = await admin_permission_service_with_redis._get_compiled_permissions(
+                    integration_db_session, user
                 )
 
-                if cached_result is not None:
+                if source == "CACHED":
                     cache_hits += 1
-                else:
-                    # Cache a result for next iteration
-                    await admin_permission_service_with_redis._cache_permission_result(
-                        user_id, permission_key, True, ttl=300
-                    )
 
                 cache_operations_completed += 1
             except Exception:
@@ -107,9 +107,8 @@ class TestAdminSessionIntegration:
 
         assert result is True
 
-        # Verify permission was cached
-        permission_key = f"permission:{user_id}:users.create.global"
-        cached_permission = integration_redis_client.get(permission_key)
+        # Verify the compiled permission set was cached
+        cached_permission = integration_redis_client.get(f"permission_set:{user_id}")
         assert cached_permission is not None
 
         # Update session to mark permissions as loaded
@@ -157,17 +156,15 @@ class TestAdminSessionIntegration:
         session_key = f"session:{session_id}"
         integration_redis_client.setex(session_key, 3, json.dumps(session_data, default=str))
 
-        # Cache some permissions
-        await admin_permission_service_with_redis._cache_permission_result(
-            user_id, "users.read.global", True
+        # Cache the compiled permission set
+        await admin_permission_service_with_redis._get_compiled_permissions(
+            integration_db_session, admin_user
         )
 
         # Verify session and permissions exist
         assert integration_redis_client.get(session_key) is not None
-        cached_perm = await admin_permission_service_with_redis._get_cached_permission(
-            user_id, "users.read.global"
-        )
-        assert cached_perm is True
+        cached_perm = integration_redis_client.get(f"permission_set:{user_id}")
+        assert cached_perm is not None
 
         # Wait for session to expire
         await asyncio.sleep(4)
@@ -181,9 +178,7 @@ class TestAdminSessionIntegration:
         await admin_permission_service_with_redis._clear_user_permission_cache(user_id)
 
         # Verify permissions were cleared
-        cached_perm_after_expiry = await admin_permission_service_with_redis._get_cached_permission(
-            user_id, "users.read.global"
-        )
+        cached_perm_after_expiry = integration_redis_client.get(f"permission_set:{user_id}")
         assert cached_perm_after_expiry is None
 
         # Log session timeout event
@@ -337,8 +332,8 @@ class TestAdminSessionIntegration:
             )
 
         # Cache permissions for the user
-        await admin_permission_service_with_redis._cache_permission_result(
-            user_id, "users.read.global", True
+        await admin_permission_service_with_redis._get_compiled_permissions(
+            integration_db_session, admin_user
         )
 
         # Verify all sessions exist
@@ -387,9 +382,7 @@ class TestAdminSessionIntegration:
             assert integration_redis_client.get(session_key) is None
 
         # Verify permissions were cleared
-        cached_perm = await admin_permission_service_with_redis._get_cached_permission(
-            user_id, "users.read.global"
-        )
+        cached_perm = integration_redis_client.get(f"permission_set:{user_id}")
         assert cached_perm is None
 
         # Log session invalidation
@@ -452,8 +445,8 @@ class TestAdminSessionIntegration:
         )
 
         # Cache permissions
-        await admin_permission_service_with_redis._cache_permission_result(
-            user_id, "users.read.global", True
+        await admin_permission_service_with_redis._get_compiled_permissions(
+            integration_db_session, superuser
         )
 
         # Verify session and backup exist
@@ -487,21 +480,18 @@ class TestAdminSessionIntegration:
 
         # Test permission cache recovery
         # In a real system, permissions might need to be reloaded
-        cached_perm = await admin_permission_service_with_redis._get_cached_permission(
-            user_id, "users.read.global"
-        )
+        cached_perm = integration_redis_client.get(f"permission_set:{user_id}")
 
         if cached_perm is None:
             # Simulate permission cache rebuild after failover
-            await admin_permission_service_with_redis._cache_permission_result(
-                user_id, "users.read.global", True
+            admin_permission_service_with_redis._compiled.clear()
+            await admin_permission_service_with_redis._get_compiled_permissions(
+                integration_db_session, superuser
             )
 
             # Verify permission was restored
-            restored_perm = await admin_permission_service_with_redis._get_cached_permission(
-                user_id, "users.read.global"
-            )
-            assert restored_perm is True
+            restored_perm = integration_redis_client.get(f"permission_set:{user_id}")
+            assert restored_perm is not None
 
         # Log failover recovery
         recovery_log = AdminActivityLog(
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Local Payment Gateway Simulator - Performance Testing
+Simulador asíncrono en proceso de las APIs de Wompi y PayU
+
+Se conecta como transporte httpx de los clientes reales (WompiService,
+PayUService), de modo que el código de pagos se ejecuta sin cambios y sin
+acceso a red. Permite:
+- Distribuciones de latencia log-normales por gateway
+- Inyección de errores HTTP 5xx y timeouts
+- Tasas configurables de rechazo (DECLINED) y pendientes (PENDING)
+- Callbacks de webhook firmados (HMAC-SHA256) hacia un handler local
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import httpx
+
+WebhookCallback = Callable[[str, str, Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class LatencyProfile:
+    """Latencia log-normal con inyección de errores para un gateway"""
+    median: float = 0.05
+    sigma: float = 0.4
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_after: float = 1.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+@dataclass
+class SimulatorConfig:
+    """Configuración del simulador"""
+    wompi: LatencyProfile = field(default_factory=LatencyProfile)
+    payu: LatencyProfile = field(default_factory=LatencyProfile)
+    webhook: LatencyProfile = field(default_factory=lambda: LatencyProfile(median=0.02))
+    decline_rate: float = 0.0
+    pending_rate: float = 0.0
+    webhook_secret: str = "test_webhook_secret"
+    seed: Optional[int] = None
+
+
+class GatewaySimulator(httpx.AsyncBaseTransport):
+    """
+    Transporte httpx que responde como Wompi y PayU.
+
+    Las peticiones PayU se reconocen por el campo "command" del cuerpo JSON;
+    el resto se enruta según las rutas de la API de Wompi. Cada transacción
+    Wompi creada programa un webhook "transaction.updated" hacia
+    ``webhook_callback`` con la firma que valida WompiService.
+    """
+
+    def __init__(self, config: Optional[SimulatorConfig] = None,
+                 webhook_callback: Optional[WebhookCallback] = None):
+        self.config = config or SimulatorConfig()
+        self.webhook_callback = webhook_callback
+        self.rng = random.Random(self.config.seed)
+        self.transactions: Dict[str, Dict[str, Any]] = {}
+        self.stats: Counter = Counter()
+        self.webhook_results: list = []
+        self._webhook_tasks: Set[asyncio.Task] = set()
+
+    # ===== CLIENT BINDING =====
+
+    def bind_wompi(self, service):
+        """Redirige el cliente HTTP de un WompiService a este simulador"""
+        service.client = httpx.AsyncClient(
+            base_url=service.config.base_url,
+            headers=service.client.headers,
+            transport=self
+        )
+        service.config.webhook_secret = self.config.webhook_secret
+        return service
+
+    def bind_payu(self, service):
+        """Redirige el cliente HTTP de un PayUService a este simulador"""
+        service.client = httpx.AsyncClient(headers=service.client.headers, transport=self)
+        return service
+
+    # ===== TRANSPORT =====
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = {}
+        if request.content:
+            try:
+                body = json.loads(request.content)
+            except ValueError:
+                body = {}
+
+        gateway = "payu" if isinstance(body, dict) and "command" in body else "wompi"
+        profile = self.config.payu if gateway == "payu" else self.config.wompi
+        self.stats[f"{gateway}.requests"] += 1
+
+        roll = self.rng.random()
+        if roll < profile.timeout_rate:
+            self.stats[f"{gateway}.timeouts"] += 1
+            await asyncio.sleep(profile.timeout_after)
+            raise httpx.ReadTimeout("Simulated gateway timeout", request=request)
+
+        await asyncio.sleep(profile.sample(self.rng))
+
+        if roll < profile.timeout_rate + profile.error_rate:
+            self.stats[f"{gateway}.errors"] += 1
+            return httpx.Response(503, json={"error": {"type": "SERVICE_UNAVAILABLE"}}, request=request)
+
+        if gateway == "payu":
+            return httpx.Response(200, json=self._payu_response(body), request=request)
+        return self._wompi_response(request, body)
+
+    def _outcome(self) -> str:
+        roll = self.rng.random()
+        if roll < self.config.decline_rate:
+            return "DECLINED"
+        if roll < self.config.decline_rate + self.config.pending_rate:
+            return "PENDING"
+        return "APPROVED"
+
+    # ===== WOMPI =====
+
+    def _wompi_response(self, request: httpx.Request, body: Dict[str, Any]) -> httpx.Response:
+        path = request.url.path
+        if path.startswith("/v1"):
+            path = path[3:]
+
+        if request.method == "POST" and path == "/tokens/cards":
+            data = {"id": f"tok_test_{uuid.uuid4().hex[:12]}", "status": "CREATED"}
+        elif request.method == "GET" and path.startswith("/merchants/"):
+            data = {"presigned_acceptance": {
+                "acceptance_token": f"acc_{uuid.uuid4().hex[:16]}",
+                "permalink": "https://simulator.local/terms.pdf"
+            }}
+        elif request.method == "POST" and path == "/payment_sources":
+            data = {"id": self.rng.randint(1000, 999999), "type": body.get("type"), "status": "AVAILABLE"}
+        elif request.method == "POST" and path == "/transactions":
+            data = self._create_wompi_transaction(body)
+        elif request.method == "GET" and path.startswith("/transactions/"):
+            data = self.transactions.get(path.rsplit("/", 1)[-1])
+            if data is None:
+                return httpx.Response(404, json={"error": {"type": "NOT_FOUND_ERROR"}}, request=request)
+        elif request.method == "GET" and path == "/pse/financial_institutions":
+            data = [{"financial_institution_code": "1007", "financial_institution_name": "BANCOLOMBIA"}]
+        else:
+            return httpx.Response(404, json={"error": {"type": "NOT_FOUND_ERROR"}}, request=request)
+
+        return httpx.Response(200, json={"data": data}, request=request)
+
+    def _create_wompi_transaction(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        transaction = {
+            "id": f"{self.rng.randint(10000, 99999)}-{uuid.uuid4().hex[:10]}",
+            "status": "PENDING",
+            "reference": body.get("reference"),
+            "amount_in_cents": body.get("amount_in_cents"),
+            "currency": body.get("currency", "COP"),
+            "customer_email": body.get("customer_email"),
+            "payment_method": body.get("payment_method") or {},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.transactions[transaction["id"]] = transaction
+
+        final_status = self._outcome()
+        if self.webhook_callback is not None and final_status != "PENDING":
+            task = asyncio.get_running_loop().create_task(
+                self._deliver_webhook(transaction["id"], final_status)
+            )
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._webhook_tasks.discard)
+        return dict(transaction)
+
+    async def _deliver_webhook(self, transaction_id: str, final_status: str) -> None:
+        await asyncio.sleep(self.config.webhook.sample(self.rng))
+
+        transaction = self.transactions[transaction_id]
+        transaction["status"] = final_status
+        event = {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "event": "transaction.updated",
+            "data": dict(transaction),
+            "timestamp": int(time.time()),
+        }
+        payload = json.dumps(event, separators=(",", ":"))
+        signature = hmac.new(
+            self.config.webhook_secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+        self.stats["webhooks.sent"] += 1
+        try:
+            self.webhook_results.append(await self.webhook_callback(payload, signature, event))
+        except Exception as e:
+            self.stats["webhooks.failed"] += 1
+            self.webhook_results.append({"processed": False, "error": str(e)})
+
+    async def drain_webhooks(self, timeout: float = 30.0) -> None:
+        """Espera a que se entreguen todos los webhooks pendientes"""
+        if self._webhook_tasks:
+            await asyncio.wait(set(self._webhook_tasks), timeout=timeout)
+
+    # ===== PAYU =====
+
+    def _payu_response(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        command = body.get("command")
+        if command == "PING":
+            return {"code": "SUCCESS", "error": None, "result": None}
+        if command == "SUBMIT_TRANSACTION":
+            state = self._outcome()
+            return {
+                "code": "SUCCESS",
+                "error": None,
+                "transactionResponse": {
+                    "orderId": self.rng.randint(10 ** 8, 10 ** 9),
+                    "transactionId": str(uuid.uuid4()),
+                    "state": state,
+                    "responseCode": "APPROVED" if state == "APPROVED" else "ANTIFRAUD_REJECTED",
+                    "authorizationCode": f"{self.rng.randint(0, 999999):06d}",
+                    "trazabilityCode": uuid.uuid4().hex[:12],
+                    "extraParameters": {},
+                },
+            }
+        return {"code": "SUCCESS", "error": None, "result": {"payload": None}}
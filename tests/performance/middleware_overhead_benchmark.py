@@ -0,0 +1,159 @@
+# ~/tests/performance/middleware_overhead_benchmark.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Middleware Overhead Benchmark
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: middleware_overhead_benchmark.py
+# Ruta: ~/tests/performance/middleware_overhead_benchmark.py
+# Propósito: Medir el overhead por capa del stack de middlewares ASGI frente a una app
+#            sin middlewares y a una capa BaseHTTPMiddleware vacía
+#
+# Uso:
+#   python -m tests.performance.middleware_overhead_benchmark --requests 2000
+#   python -m tests.performance.middleware_overhead_benchmark --layers rate_limiting response_standardization
+#
+# ---------------------------------------------------------------------------------------------
+"""
+Middleware Overhead Benchmark
+
+Las peticiones se envían directamente a la app ASGI (sin servidor ni cliente
+HTTP), así la diferencia frente a la app sin middlewares es el coste de las
+capas. Se mide:
+
+- bare: el endpoint sin middlewares
+- base_http_noop: una capa BaseHTTPMiddleware que solo llama a call_next
+- cada capa de MIDDLEWARE_STACK por separado
+- el stack completo en el orden configurado
+
+enterprise_security queda fuera por defecto: sin Redis falla cerrado (503).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("TESTING", "1")
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware_integration_simple import add_middleware_stack
+
+DEFAULT_LAYERS = [
+    "performance_monitor",
+    "comprehensive_security",
+    "rate_limiting",
+    "performance_optimization",
+    "response_standardization",
+]
+
+PAYLOAD = {"items": [{"id": i, "name": f"Producto {i}", "price": i * 1000} for i in range(20)]}
+
+
+class NoopBaseHTTPMiddleware(BaseHTTPMiddleware):
+    """Referencia: coste de BaseHTTPMiddleware sin lógica propia"""
+
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+def build_app(layers: List[str], base_http_noop: bool = False) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/v1/bench")
+    async def bench():
+        return PAYLOAD
+
+    if base_http_noop:
+        app.add_middleware(NoopBaseHTTPMiddleware)
+    add_middleware_stack(app, layers)
+    return app
+
+
+async def _request(app, index: int) -> int:
+    # Una IP por petición: los límites por IP no deben cortar la medición
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/v1/bench", "raw_path": b"/api/v1/bench",
+        "root_path": "", "query_string": b"", "server": ("testserver", 80),
+        "client": (f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}", 50000),
+        "headers": [(b"host", b"testserver"), (b"user-agent", b"benchmark"), (b"accept", b"application/json")],
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """media, p50/p95/p99 en microsegundos"""
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "mean_us": round(statistics.fmean(ordered), 1),
+        "p50_us": round(pick(0.50), 1),
+        "p95_us": round(pick(0.95), 1),
+        "p99_us": round(pick(0.99), 1),
+    }
+
+
+async def measure(app, requests: int, warmup: int) -> Dict[str, Any]:
+    for i in range(warmup):
+        await _request(app, i)
+
+    timings: List[float] = []
+    statuses: Dict[int, int] = {}
+    for i in range(warmup, warmup + requests):
+        start = time.perf_counter()
+        status = await _request(app, i)
+        timings.append((time.perf_counter() - start) * 1e6)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    return {**percentiles(timings), "statuses": statuses}
+
+
+async def run_middleware_benchmark(
+    requests: int = 2000,
+    warmup: int = 200,
+    layers: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Ejecuta el benchmark y devuelve resultados y overhead por configuración"""
+    layers = list(layers or DEFAULT_LAYERS)
+    configs = {"bare": build_app([]), "base_http_noop": build_app([], base_http_noop=True)}
+    for name in layers:
+        configs[name] = build_app([name])
+    configs["full_stack"] = build_app(layers)
+
+    results = {name: await measure(app, requests, warmup) for name, app in configs.items()}
+    bare = results["bare"]["mean_us"]
+    for result in results.values():
+        result["overhead_us"] = round(result["mean_us"] - bare, 1)
+
+    return {"requests": requests, "layers": layers, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--layers", nargs="+", default=None, help="Capas de MIDDLEWARE_STACK (de fuera hacia dentro)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_middleware_benchmark(args.requests, args.warmup, args.layers))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
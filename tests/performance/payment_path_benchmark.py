@@ -0,0 +1,310 @@
+# ~/tests/performance/payment_path_benchmark.py
+# ---------------------------------------------------------------------------------------------
+# MeStore - Payment Path Load Benchmark
+# Licensed under the proprietary license detailed in a LICENSE file in the root of this project.
+# ---------------------------------------------------------------------------------------------
+#
+# Nombre del Archivo: payment_path_benchmark.py
+# Ruta: ~/tests/performance/payment_path_benchmark.py
+# Propósito: Benchmark de carga end-to-end checkout → pago → webhook → comisión
+#            contra el simulador local de gateways (sin acceso a red)
+#
+# Uso:
+#   python -m tests.performance.payment_path_benchmark --checkouts 200 --concurrency 16
+#
+# ---------------------------------------------------------------------------------------------
+"""
+Payment Path Load Benchmark
+
+Cada checkout simulado:
+1. checkout: crea la orden y sus items en la base de datos
+2. payment: PaymentProcessor.process_card_payment contra el simulador Wompi
+3. webhook: el simulador entrega transaction.updated firmado a WompiWebhookHandler
+4. commission: PaymentCommissionService crea la comisión al aprobarse el pago
+
+Se reportan throughput y percentiles de latencia por etapa y end-to-end.
+La base de datos es SQLite en un archivo temporal salvo que se indique otra
+URL asíncrona (p.ej. PostgreSQL) con --database-url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("TESTING", "1")
+# El rate limit del cliente Wompi (100 req/min) limitaría el benchmark, no el código
+os.environ.setdefault("WOMPI_RATE_LIMIT", "1000000")
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.models.base import Base
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product
+from app.models.user import User, UserType
+from app.services.payments.payment_processor import PaymentProcessor
+from app.services.payments.webhook_handler import WompiWebhookHandler
+from app.services.payments.wompi_service import WompiService
+from tests.performance.gateway_simulator import GatewaySimulator, LatencyProfile, SimulatorConfig
+
+STAGES = ("checkout", "payment", "webhook", "commission", "end_to_end")
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 y máximo en milisegundos"""
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        "count": len(ordered),
+        "p50": round(p50 * 1000, 2),
+        "p95": round(p95 * 1000, 2),
+        "p99": round(p99 * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+class PaymentPathBenchmark:
+    """Ejecuta checkouts concurrentes contra el simulador y agrega métricas"""
+
+    def __init__(self, database_url: Optional[str] = None,
+                 simulator_config: Optional[SimulatorConfig] = None):
+        self._tmpdir = None
+        if database_url is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="payment-bench-")
+            database_url = f"sqlite+aiosqlite:///{self._tmpdir.name}/bench.db"
+        if database_url.startswith("sqlite"):
+            # Los servicios mantienen la transacción abierta durante la llamada al
+            # gateway; con el lock de archivo de SQLite eso serializa (o bloquea
+            # mutuamente) los checkouts concurrentes. En autocommit el lock se
+            # toma por sentencia. Para cifras transaccionales usar PostgreSQL.
+            self.engine = create_async_engine(
+                database_url, connect_args={"timeout": 30}, isolation_level="AUTOCOMMIT"
+            )
+        else:
+            self.engine = create_async_engine(database_url)
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+        self.simulator = GatewaySimulator(simulator_config, webhook_callback=self._deliver_webhook)
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.outcomes: Dict[str, int] = defaultdict(int)
+        self.error_samples: List[str] = []
+        self._checkout_started: Dict[int, float] = {}
+        self._buyer_id: Optional[str] = None
+        self._product_id: Optional[str] = None
+
+    async def setup(self) -> None:
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with self.session_factory() as db:
+            buyer = User(
+                email=f"bench_{uuid.uuid4().hex[:8]}@example.com",
+                password_hash="not-used",
+                nombre="Bench",
+                apellido="Buyer",
+                user_type=UserType.BUYER,
+                is_active=True,
+            )
+            vendor = User(
+                email=f"bench_vendor_{uuid.uuid4().hex[:8]}@example.com",
+                password_hash="not-used",
+                nombre="Bench",
+                apellido="Vendor",
+                user_type=UserType.VENDOR,
+                is_active=True,
+            )
+            db.add_all([buyer, vendor])
+            await db.flush()
+            # La comisión se asigna al vendedor del producto del primer item
+            product = Product(
+                sku=f"BENCH-{uuid.uuid4().hex[:8]}",
+                name="Bench Product",
+                precio_venta=Decimal("100000.00"),
+                vendedor_id=vendor.id,
+            )
+            db.add(product)
+            await db.commit()
+            self._buyer_id = buyer.id
+            self._product_id = product.id
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+    def _wompi(self) -> WompiService:
+        """
+        WompiService enlazado al simulador.
+
+        PaymentProcessor usa ``async with self.wompi`` y cierra el cliente al
+        terminar, por lo que cada checkout necesita su propia instancia.
+        """
+        return self.simulator.bind_wompi(WompiService())
+
+    async def _checkout(self, index: int) -> int:
+        async with self.session_factory() as db:
+            order = Order(
+                order_number=f"BENCH-{uuid.uuid4().hex[:12]}",
+                buyer_id=self._buyer_id,
+                subtotal=Decimal("100000.00"),
+                total_amount=Decimal("100000.00"),
+                status=OrderStatus.PENDING,
+                shipping_name="Bench Buyer",
+                shipping_phone="3001234567",
+                shipping_address="Calle 1 # 2-3",
+                shipping_city="Bogotá",
+                shipping_state="Cundinamarca",
+            )
+            order.items.append(OrderItem(
+                product_id=self._product_id,
+                product_name="Bench Product",
+                product_sku="BENCH",
+                unit_price=Decimal("100000.00"),
+                quantity=1,
+                total_price=Decimal("100000.00"),
+            ))
+            db.add(order)
+            await db.commit()
+            return order.id
+
+    async def _pay(self, order_id: int) -> Dict[str, Any]:
+        async with self.session_factory() as db:
+            processor = PaymentProcessor(db)
+            processor.wompi = self._wompi()
+            return await processor.process_card_payment(
+                order_id,
+                card_data={
+                    "number": "4242424242424242", "exp_month": "12", "exp_year": "2099",
+                    "cvc": "123", "card_holder": "Bench Buyer", "installments": 1,
+                },
+                customer_data={"email": "bench@example.com", "full_name": "Bench Buyer"},
+            )
+
+    async def _deliver_webhook(self, payload: str, signature: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        # Referencia generada por WompiService.generate_reference: ORDER_<order_id>_<timestamp>
+        order_id = int(event["data"]["reference"].split("_")[1])
+        started = time.perf_counter()
+        async with self.session_factory() as db:
+            handler = WompiWebhookHandler(db)
+            handler.wompi = self.simulator.bind_wompi(handler.wompi)
+            self._time_commission(handler)
+            result = await handler.process_webhook(payload, signature, event)
+        finished = time.perf_counter()
+
+        self.timings["webhook"].append(finished - started)
+        commission = result.get("commission")
+        if commission is not None:
+            self.outcomes["commission_ok" if commission.get("success") else "commission_failed"] += 1
+        self.outcomes["webhook_ok" if result.get("processed") else "webhook_failed"] += 1
+        if result.get("error"):
+            self._sample_error(f"webhook: {result['error']}")
+
+        checkout_started = self._checkout_started.pop(order_id, None)
+        if checkout_started is not None:
+            self.timings["end_to_end"].append(finished - checkout_started)
+        return result
+
+    def _time_commission(self, handler: WompiWebhookHandler) -> None:
+        """Mide la etapa de comisión dentro del procesamiento del webhook"""
+        process_payment_approval = handler.commission_service.process_payment_approval
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await process_payment_approval(*args, **kwargs)
+            finally:
+                self.timings["commission"].append(time.perf_counter() - started)
+
+        handler.commission_service.process_payment_approval = timed
+
+    async def _run_checkout(self, index: int) -> None:
+        started = time.perf_counter()
+        try:
+            order_id = await self._checkout(index)
+            checkout_done = time.perf_counter()
+            self.timings["checkout"].append(checkout_done - started)
+            self._checkout_started[order_id] = started
+
+            await self._pay(order_id)
+            self.timings["payment"].append(time.perf_counter() - checkout_done)
+            self.outcomes["payment_ok"] += 1
+        except Exception as e:
+            self.outcomes[f"error:{type(e).__name__}"] += 1
+            self._sample_error(f"checkout: {type(e).__name__}: {e}")
+
+    def _sample_error(self, message: str, limit: int = 5) -> None:
+        """Conserva algunos mensajes de error distintos para el reporte"""
+        message = message[:300]
+        if message not in self.error_samples and len(self.error_samples) < limit:
+            self.error_samples.append(message)
+
+    async def run(self, checkouts: int = 100, concurrency: int = 8) -> Dict[str, Any]:
+        """Ejecuta ``checkouts`` con un máximo de ``concurrency`` simultáneos"""
+        await self.setup()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(index: int) -> None:
+            async with semaphore:
+                await self._run_checkout(index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded(i) for i in range(checkouts)))
+        await self.simulator.drain_webhooks()
+        elapsed = time.perf_counter() - started
+
+        return {
+            "checkouts": checkouts,
+            "concurrency": concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_second": round(checkouts / elapsed, 2) if elapsed else None,
+            "latency_ms": {stage: percentiles(self.timings[stage]) for stage in STAGES},
+            "outcomes": dict(self.outcomes),
+            "error_samples": self.error_samples,
+            "simulator": dict(self.simulator.stats),
+        }
+
+
+async def run_payment_benchmark(checkouts: int = 100, concurrency: int = 8,
+                                database_url: Optional[str] = None,
+                                simulator_config: Optional[SimulatorConfig] = None) -> Dict[str, Any]:
+    benchmark = PaymentPathBenchmark(database_url, simulator_config)
+    try:
+        return await benchmark.run(checkouts, concurrency)
+    finally:
+        await benchmark.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Payment path load benchmark (offline)")
+    parser.add_argument("--checkouts", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--wompi-median", type=float, default=0.08, help="Median Wompi latency (s)")
+    parser.add_argument("--wompi-error-rate", type=float, default=0.0)
+    parser.add_argument("--decline-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        wompi=LatencyProfile(median=args.wompi_median, error_rate=args.wompi_error_rate),
+        decline_rate=args.decline_rate,
+        seed=args.seed,
+    )
+    report = asyncio.run(run_payment_benchmark(args.checkouts, args.concurrency, args.database_url, config))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Middleware Overhead Benchmark Tests - Performance Testing
+Corrida corta del benchmark por capa: todas las configuraciones responden 200
+y el overhead se reporta frente a la app sin middlewares
+"""
+import pytest
+
+from tests.performance.middleware_overhead_benchmark import run_middleware_benchmark
+
+
+@pytest.mark.asyncio
+@pytest.mark.performance
+async def test_short_benchmark_run_reports_every_layer():
+    report = await run_middleware_benchmark(requests=30, warmup=5)
+
+    results = report["results"]
+    assert set(results) == {"bare", "base_http_noop", "full_stack", *report["layers"]}
+    for result in results.values():
+        assert result["statuses"] == {200: 30}
+        assert result["p50_us"] <= result["p99_us"]
+    assert results["bare"]["overhead_us"] == 0
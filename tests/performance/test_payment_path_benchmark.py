@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Payment Path Benchmark Tests - Performance Testing
+Verifica el simulador local de gateways y una corrida corta del benchmark
+checkout → pago → webhook → comisión, sin acceso a red
+"""
+import json
+import pytest
+
+from app.core.config import settings
+from app.services.payments.payu_service import PayUService
+from app.services.payments.wompi_service import WompiNetworkError, WompiService
+from tests.performance.gateway_simulator import GatewaySimulator, LatencyProfile, SimulatorConfig
+from tests.performance.payment_path_benchmark import percentiles, run_payment_benchmark
+
+CARD = {"number": "4242424242424242", "exp_month": "12", "exp_year": "2099",
+        "cvc": "123", "card_holder": "Test Buyer"}
+
+
+def _fast_config(**overrides) -> SimulatorConfig:
+    defaults = dict(wompi=LatencyProfile(median=0.001), payu=LatencyProfile(median=0.001),
+                    webhook=LatencyProfile(median=0.001), seed=7)
+    defaults.update(overrides)
+    return SimulatorConfig(**defaults)
+
+
+@pytest.mark.asyncio
+@pytest.mark.performance
+class TestGatewaySimulator:
+    """Simulador Wompi/PayU enlazado a los clientes reales"""
+
+    async def test_wompi_tokenization_and_transaction(self):
+        simulator = GatewaySimulator(_fast_config())
+        wompi = simulator.bind_wompi(WompiService())
+
+        token = await wompi.tokenize_card(CARD)
+        transaction = await wompi.create_transaction({
+            "amount_in_cents": 100000, "customer_email": "buyer@example.com",
+            "payment_method": {"type": "CARD"}, "reference": "ORDER_1_20250101",
+            "redirect_url": ""
+        })
+
+        assert token["data"]["id"].startswith("tok_test_")
+        assert transaction["data"]["status"] == "PENDING"
+        assert simulator.stats["wompi.requests"] == 2
+
+    async def test_error_injection_surfaces_as_network_error(self):
+        simulator = GatewaySimulator(_fast_config(wompi=LatencyProfile(median=0.001, error_rate=1.0)))
+        wompi = simulator.bind_wompi(WompiService())
+        wompi.config.max_retries = 1
+
+        with pytest.raises(WompiNetworkError):
+            await wompi.get_acceptance_token()
+
+        assert simulator.stats["wompi.errors"] >= 1
+
+    async def test_webhook_is_signed_for_wompi_validation(self):
+        received = []
+
+        async def callback(payload, signature, event):
+            received.append((payload, signature, event))
+            return {"processed": True}
+
+        simulator = GatewaySimulator(_fast_config(decline_rate=1.0), webhook_callback=callback)
+        wompi = simulator.bind_wompi(WompiService())
+        await wompi.create_transaction({
+            "amount_in_cents": 5000, "customer_email": "buyer@example.com",
+            "payment_method": {"type": "CARD"}, "reference": "ORDER_2_20250101",
+            "redirect_url": ""
+        })
+        await simulator.drain_webhooks()
+
+        payload, signature, event = received[0]
+        assert event["data"]["status"] == "DECLINED"
+        assert json.loads(payload) == event
+        assert wompi.validate_webhook_signature(payload, signature)
+
+    async def test_payu_submit_transaction(self, monkeypatch):
+        for name in ("PAYU_MERCHANT_ID", "PAYU_API_KEY", "PAYU_API_LOGIN", "PAYU_ACCOUNT_ID"):
+            monkeypatch.setattr(settings, name, "test", raising=False)
+        simulator = GatewaySimulator(_fast_config())
+        payu = simulator.bind_payu(PayUService())
+
+        result = await payu.create_transaction({
+            "amount_in_cents": 100000, "reference": "ORDER-3", "customer_email": "buyer@example.com",
+            "payment_method": "PSE", "payment_data": {"bank_code": "1007"}
+        })
+
+        assert result["state"] == "APPROVED"
+        assert simulator.stats["payu.requests"] == 1
+
+
+def test_percentiles_in_milliseconds():
+    result = percentiles([0.010, 0.020, 0.030, 0.040])
+
+    assert result["count"] == 4
+    assert result["max"] == 40.0
+    assert percentiles([])["p95"] is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.performance
+@pytest.mark.load_test
+async def test_payment_path_benchmark_short_run():
+    """Corrida corta: todos los checkouts pagan, cada webhook se procesa y genera su comisión"""
+    report = await run_payment_benchmark(checkouts=6, concurrency=3, simulator_config=_fast_config())
+
+    assert report["error_samples"] == []
+    assert report["outcomes"] == {"payment_ok": 6, "webhook_ok": 6, "commission_ok": 6}
+    assert report["simulator"]["webhooks.sent"] == 6
+    assert report["latency_ms"]["payment"]["count"] == 6
+    assert report["latency_ms"]["webhook"]["count"] == 6
+    assert report["latency_ms"]["commission"]["count"] == 6
+    assert report["latency_ms"]["end_to_end"]["count"] == 6
+    assert report["throughput_per_second"] > 0
@@ -23,6 +23,7 @@ from unittest.mock import Mock, AsyncMock, patch
 from fastapi import FastAPI, Request, Response
 from fastapi.testclient import TestClient
 
+from app.core.metrics import MetricsRegistry
 from app.middleware.performance_monitor import PerformanceMonitorMiddleware, init_performance_monitor
 
 
@@ -296,7 +297,8 @@ class TestPerformanceReporting:
     def setup_method(self):
         """Setup para tests de reporting."""
         self.app = FastAPI()
-        self.middleware = PerformanceMonitorMiddleware(self.app)
+        # Registro propio: las métricas del resto de tests no cuentan aquí
+        self.middleware = PerformanceMonitorMiddleware(self.app, registry=MetricsRegistry())
 
     def test_endpoint_statistics_structure(self):
         """Test estructura de estadísticas de endpoints."""
@@ -311,12 +311,13 @@ class TestTokenBlacklist:
         """Test blacklist cleanup functionality."""
         initial_count = len(token_blacklist._blacklisted_tokens)
 
-        # Add tokens to exceed cleanup threshold
+        # Add already-expired revocations to exceed cleanup threshold
+        expired = datetime.now(timezone.utc).timestamp() - 1
         for i in range(1100):  # Exceed threshold of 1000
             jti = f"test_jti_{i}"
-            token_blacklist.blacklist_token(jti)
+            token_blacklist.blacklist_token(jti, expires_at=expired)
 
-        # Should have triggered cleanup
+        # Should have triggered cleanup of expired entries
         final_count = len(token_blacklist._blacklisted_tokens)
         assert final_count < 1100  # Should be cleaned up
 
@@ -0,0 +1,139 @@
+"""
+Tests for the batched audit sink
+================================
+
+- Events are buffered and written in batches by a background task
+- Overflow policies: drop_oldest, drop_newest, block (inline write)
+- Durable (compliance) events are written before put() returns
+- Bounded QueueHandler keeps ERROR records when the queue is full
+"""
+
+import asyncio
+import logging
+import queue
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.core.audit_sink import AuditSink, _BoundedQueueHandler, get_audit_sink_stats
+from app.services.audit_logging_service import (
+    AuditEventType,
+    AuditSeverity,
+    EnterpriseAuditLoggingService,
+)
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, batch):
+        self.batches.append(list(batch))
+
+
+def _sink(recorder, **overrides):
+    options = dict(max_events=10, batch_size=4, flush_interval=0.01, overflow_policy="drop_oldest")
+    options.update(overrides)
+    return AuditSink("test", recorder, **options)
+
+
+class TestAuditSink:
+
+    async def test_events_written_in_batches_off_the_caller(self):
+        recorder = Recorder()
+        sink = _sink(recorder)
+
+        for i in range(6):
+            assert await sink.put(i)
+        assert recorder.batches == [] or len(recorder.batches[0]) == 4
+
+        await asyncio.sleep(0.05)
+        assert [e for batch in recorder.batches for e in batch] == list(range(6))
+        assert max(len(batch) for batch in recorder.batches) == 4
+        await sink.close()
+
+    async def test_drop_oldest_and_drop_newest(self):
+        oldest, newest = Recorder(), Recorder()
+        drop_oldest = _sink(oldest, max_events=3, batch_size=10, flush_interval=10)
+        drop_newest = _sink(newest, max_events=3, batch_size=10, flush_interval=10,
+                            overflow_policy="drop_newest")
+
+        for i in range(5):
+            drop_oldest.put_nowait(i)
+            drop_newest.put_nowait(i)
+        await drop_oldest.close()
+        await drop_newest.close()
+
+        assert oldest.batches == [[2, 3, 4]]
+        assert newest.batches == [[0, 1, 2]]
+        assert drop_oldest.stats["dropped"] == drop_newest.stats["dropped"] == 2
+
+    async def test_block_policy_and_durable_write_inline(self):
+        recorder = Recorder()
+        sink = _sink(recorder, max_events=2, batch_size=10, flush_interval=10, overflow_policy="block")
+
+        await sink.put("a")
+        await sink.put("b")
+        await sink.put("c")          # buffer full: written by the caller
+        await sink.put("d", durable=True)
+
+        assert recorder.batches == [["c"], ["d"]]
+        assert sink.stats["inline_writes"] == 2
+        assert get_audit_sink_stats()["test"]["buffered"] >= 0
+        await sink.close()
+        assert recorder.batches[-1] == ["a", "b"]
+
+    async def test_writer_errors_are_counted_not_raised(self):
+        async def failing(batch):
+            raise ConnectionError("redis down")
+
+        sink = _sink(failing)
+        assert not await sink.put("event", durable=True)
+        assert sink.stats["errors"] == 1
+
+    def test_unknown_policy_rejected(self):
+        with pytest.raises(ValueError):
+            _sink(Recorder(), overflow_policy="spill")
+
+
+class TestAuditServiceBatching:
+
+    async def test_batch_uses_one_pipeline(self):
+        redis = MagicMock()
+        pipe = redis.pipeline.return_value
+        pipe.execute = MagicMock(side_effect=lambda: asyncio.sleep(0))
+        service = EnterpriseAuditLoggingService(redis)
+
+        # Compliance-relevant: written before returning
+        await service.log_data_access_event(
+            AuditEventType.SENSITIVE_DATA_ACCESS, "user-1", "orders", None, ["personal"]
+        )
+        assert redis.pipeline.call_count == 1
+
+        for _ in range(3):
+            await service.log_security_event(
+                AuditEventType.SUSPICIOUS_ACTIVITY, AuditSeverity.MEDIUM, "10.0.0.2"
+            )
+        await service.sink.flush()
+
+        assert redis.pipeline.call_count == 2
+        assert len(pipe.setex.call_args_list) == 5
+        keys = [call.args[0] for call in pipe.setex.call_args_list]
+        assert sum(key.startswith("audit:compliance:") for key in keys) == 1
+        await service.sink.close()
+
+
+class TestBoundedQueueHandler:
+
+    def test_full_queue_keeps_errors_drops_info(self):
+        target = MagicMock(level=logging.DEBUG)
+        handler = _BoundedQueueHandler(queue.Queue(maxsize=1), [target])
+        record = lambda level: logging.LogRecord("audit", level, __file__, 1, "msg", None, None)
+
+        handler.handle(record(logging.INFO))
+        handler.handle(record(logging.INFO))
+        handler.handle(record(logging.ERROR))
+
+        assert handler.dropped == 1
+        assert target.handle.call_count == 1
+        assert handler.queue.qsize() == 1
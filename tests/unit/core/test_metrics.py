@@ -0,0 +1,140 @@
+"""
+Tests for the in-process metrics core
+=====================================
+
+- Log-linear histograms: percentiles within 1%, windows, Prometheus buckets
+- Worker snapshots merged from the multiprocess directory
+- Prometheus text exposition
+- Requests labelled by route template, recorded once per request
+- SLA evaluation on real p95/p99 of the last window
+"""
+
+import os
+import random
+from unittest.mock import AsyncMock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.metrics import Histogram, MetricsRegistry, MetricsSnapshot, labels_of
+from app.middleware.performance_monitor import PerformanceMonitorMiddleware
+from app.services.performance_monitoring_service import PerformanceMonitoringService
+
+
+class TestHistogram:
+
+    def test_percentiles_within_one_percent(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(-3, 1.2) for _ in range(20000)]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * len(ordered)) - 1]
+            assert abs(histogram.percentile(q) - exact) / exact < 0.01
+        assert histogram.count == 20000
+        assert histogram.max == max(values)
+
+    def test_window_buckets_and_round_trip(self):
+        histogram = Histogram()
+        for ms in (1, 2, 3, 40, 600):
+            histogram.record(ms / 1000)
+        earlier = histogram.copy()
+        for _ in range(10):
+            histogram.record(0.9)
+
+        window = histogram.since(earlier)
+        assert window.count == 10
+        assert abs(window.percentile(0.5) - 0.9) < 0.9 * 0.01
+        assert histogram.cumulative([0.005, 0.05, 1.0]) == [3, 4, 15]
+        assert histogram.count_above(0.5) == 11
+
+        restored = Histogram.from_dict(histogram.to_dict())
+        assert restored.counts == histogram.counts
+        assert restored.percentile(0.99) == histogram.percentile(0.99)
+
+
+class TestRegistry:
+
+    def test_collect_merges_worker_snapshots(self, tmp_path):
+        other = MetricsRegistry(multiproc_dir="")
+        other.record_request("/api/v1/products/{id}", "GET", 200, 0.010)
+        other.set_gauge("custom_queue_depth", (), 3)
+        (tmp_path / "metrics_99999.json").write_text(other.to_json())
+
+        registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+        registry.record_request("/api/v1/products/{id}", "GET", 200, 0.020)
+        registry.record_request("/api/v1/products/{id}", "GET", 500, 0.030)
+
+        merged = registry.collect()
+        histogram = merged.histogram("http_request_duration_seconds", method="GET", route="/api/v1/products/{id}")
+        assert histogram.count == 3
+        assert merged.counters[("http_requests_total", labels_of(method="GET", route="/api/v1/products/{id}", status=200))] == 2
+
+        registry.write_snapshot()
+        own = MetricsSnapshot.from_json((tmp_path / f"metrics_{os.getpid()}.json").read_text())
+        assert own.counters == registry.counters
+
+    def test_prometheus_exposition(self):
+        registry = MetricsRegistry(multiproc_dir="")
+        registry.record_request('/say/"{name}"', "GET", 200, 0.2)
+
+        text = registry.render_prometheus()
+
+        assert "# TYPE mestore_http_requests_total counter" in text
+        assert 'mestore_http_requests_total{method="GET",route="/say/\\"{name}\\"",status="200"} 1' in text
+        assert 'le="0.1"} 0' in text and 'le="0.25"} 1' in text and 'le="+Inf"} 1' in text
+        assert 'mestore_http_request_duration_seconds_count{method="GET",route="/say/\\"{name}\\""} 1' in text
+
+
+class TestRequestMetrics:
+
+    def test_route_template_labels_and_single_recording(self):
+        registry = MetricsRegistry(multiproc_dir="")
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: int):
+            return {"id": item_id}
+
+        # Dos capas que miden: la petición se registra una sola vez
+        app.add_middleware(PerformanceMonitorMiddleware, registry=registry)
+        app.add_middleware(PerformanceMonitorMiddleware, registry=registry)
+        client = TestClient(app)
+
+        for item_id in range(5):
+            assert client.get(f"/items/{item_id}").status_code == 200
+        client.get("/missing/1")
+
+        series = registry.select("http_request_duration_seconds")
+        assert set(series) == {labels_of(method="GET", route="/items/{item_id}"),
+                               labels_of(method="GET", route="unmatched")}
+        assert series[labels_of(method="GET", route="/items/{item_id}")].count == 5
+
+
+class TestSLAEvaluation:
+
+    async def test_window_percentiles_against_slas(self):
+        registry = MetricsRegistry(multiproc_dir="")
+        service = PerformanceMonitoringService(registry)
+        service._alert_sla_violation = AsyncMock()
+
+        for _ in range(95):
+            registry.record_request("/api/v1/search", "GET", 200, 0.05)
+        for _ in range(5):
+            registry.record_request("/api/v1/search", "GET", 200, 1.5)
+
+        violations = await service.evaluate_slas()
+        assert [v["type"] for v in violations] == ["API_RESPONSE_P99"]
+        assert violations[0]["resource"] == "GET /api/v1/search"
+
+        # New window: only fast requests, no violation even though the cumulative p99 is slow
+        for _ in range(100):
+            registry.record_request("/api/v1/search", "GET", 200, 0.05)
+        assert await service.evaluate_slas() == []
+        assert service._alert_sla_violation.await_count == 1
+
+        compliance = service.get_latency_sla_compliance()["routes"]["GET /api/v1/search"]
+        assert compliance["request_count"] == 200 and compliance["p95_under_threshold"]
@@ -0,0 +1,106 @@
+"""
+Tests for the dedicated password hashing pool
+=============================================
+
+- Hash/verify round-trip on the bounded pool (thread and process backends)
+- Admission control: full queue -> PasswordHashingOverloaded (429)
+- Transparent rehash when the configured bcrypt cost changes
+- Hash time / queue depth metrics
+"""
+
+import asyncio
+
+import pytest
+from passlib.context import CryptContext
+
+from app.core.password_hashing import (
+    PasswordHasherPool,
+    PasswordHashingOverloaded,
+    get_password_hasher,
+)
+from app.services.auth_service import AuthService
+
+
+@pytest.fixture
+def pool():
+    pool = PasswordHasherPool(rounds=4, workers=2, max_queue=2, use_processes=False)
+    yield pool
+    pool.shutdown()
+
+
+class TestPasswordHasherPool:
+
+    async def test_hash_and_verify(self, pool):
+        hashed = await pool.hash("S3cure-pass")
+
+        assert hashed.startswith("$2b$04$")
+        assert await pool.verify("S3cure-pass", hashed) == (True, None)
+        assert await pool.verify("wrong", hashed) == (False, None)
+
+    async def test_rehash_when_cost_changes(self, pool):
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("S3cure-pass")
+
+        is_valid, new_hash = await pool.verify("S3cure-pass", old_hash)
+
+        assert is_valid
+        assert new_hash.startswith("$2b$04$")
+        assert pool.stats()["rehashes"] == 1
+
+    async def test_no_rehash_for_wrong_password(self, pool):
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("S3cure-pass")
+
+        assert await pool.verify("wrong", old_hash) == (False, None)
+
+    async def test_rejects_when_queue_is_full(self, pool):
+        results = await asyncio.gather(
+            *(pool.hash(f"password-{i}") for i in range(pool.capacity + 3)),
+            return_exceptions=True
+        )
+
+        rejected = [r for r in results if isinstance(r, PasswordHashingOverloaded)]
+        assert len(rejected) == 3
+        assert rejected[0].status_code == 429
+        assert int(rejected[0].headers["Retry-After"]) >= 1
+        stats = pool.stats()
+        assert stats["rejected"] == 3
+        assert stats["max_queue_depth"] == pool.max_queue
+        assert stats["in_flight"] == 0
+
+    async def test_metrics(self, pool):
+        await pool.hash("S3cure-pass")
+
+        stats = pool.stats()
+        assert stats["hashes"] == 1
+        assert stats["hash_time_p50_ms"] > 0
+        assert stats["backend"] == "thread"
+
+    async def test_process_backend(self):
+        pool = PasswordHasherPool(rounds=4, workers=1, use_processes=True)
+        try:
+            hashed = await pool.hash("S3cure-pass")
+            assert await pool.verify("S3cure-pass", hashed) == (True, None)
+        finally:
+            pool.shutdown(wait=True)
+
+
+class TestAuthServiceUsesPool:
+
+    async def test_get_password_hash_and_verify_use_shared_pool(self):
+        service = AuthService()
+        hasher = get_password_hasher()
+        hashes, verifications = hasher.counters["hashes"], hasher.counters["verifications"]
+
+        hashed = await service.get_password_hash("S3cure-pass")
+
+        assert await service.verify_password("S3cure-pass", hashed)
+        assert hasher.counters["hashes"] == hashes + 1
+        assert hasher.counters["verifications"] == verifications + 1
+        assert not hasher.needs_update(hashed)
+
+    async def test_needs_update_for_other_cost(self):
+        hasher = get_password_hasher()
+        other_cost = 5 if hasher.rounds != 5 else 6
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=other_cost).hash("S3cure-pass")
+
+        assert hasher.needs_update(old_hash)
+        assert not hasher.needs_update("not-a-hash")
@@ -0,0 +1,342 @@
+"""
+Tests for the unified GCRA rate limit engine
+============================================
+
+- GCRA admission semantics (memory backend, same math as the Lua script)
+- Single EVALSHA per check covering every dimension, SCRIPT LOAD on NOSCRIPT
+- Local pre-admission leases (no Redis call while a lease is valid)
+- Uncharged checks, deny keys with TTL, memory backend eviction
+- Local deny cache: locked-out clients answered without Redis
+- AuthService login attempts and lockouts on the engine
+- EnterpriseRateLimitingService mapping onto the engine
+"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from redis.exceptions import NoScriptError
+
+from app.core.rate_limit_engine import (
+    GCRA_LUA_SCRIPT,
+    GCRA_SCRIPT_SHA,
+    MAX_LEASE_TTL,
+    RateLimitEngine,
+    RateLimitRule,
+)
+from app.services import auth_service as auth_service_module
+from app.services.auth_service import AuthService
+from app.services.rate_limiting_service import (
+    EnterpriseRateLimitingService,
+    RateLimitType,
+)
+
+
+def _redis_reply(status=1, lease=0, violated=0, per_rule=((59, 1000, 0),)):
+    reply = [status, lease, violated]
+    for remaining, reset_ms, retry_ms in per_rule:
+        reply.extend([remaining, reset_ms, retry_ms])
+    return reply
+
+
+class TestMemoryBackend:
+
+    async def test_admits_up_to_limit_then_denies(self):
+        engine = RateLimitEngine(lease_tokens=0)
+        rule = RateLimitRule("k", limit=3, period_seconds=60)
+
+        results = [await engine.check([rule]) for _ in range(4)]
+
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert [r.remaining for r in results[:3]] == [2, 1, 0]
+        assert results[3].violated == rule
+        assert 19 < results[3].retry_after <= 20
+
+    async def test_denied_request_does_not_charge_other_rules(self):
+        engine = RateLimitEngine(lease_tokens=0)
+        tight = RateLimitRule("tight", limit=1, period_seconds=60)
+        loose = RateLimitRule("loose", limit=10, period_seconds=60)
+
+        await engine.check([tight, loose])
+        denied = await engine.check([tight, loose])
+        alone = await engine.check([loose])
+
+        assert not denied.allowed
+        assert denied.violated == tight
+        assert alone.remaining == 8
+
+    async def test_lease_serves_requests_locally_and_keeps_total_exact(self):
+        engine = RateLimitEngine(lease_tokens=5, lease_threshold=0.5)
+        rule = RateLimitRule("k", limit=20, period_seconds=60)
+
+        first = await engine.check([rule])
+        local = [await engine.check([rule]) for _ in range(5)]
+
+        # 1 + 5 tokens charged up front, the 5 leased ones served locally
+        assert first.remaining == 14
+        assert all(r.allowed and r.source == "local" for r in local)
+        assert engine.stats["local_hits"] == 5
+
+        admitted = 6
+        while (await engine.check([rule])).allowed:
+            admitted += 1
+        assert admitted == 20
+
+    async def test_no_lease_close_to_the_limit(self):
+        engine = RateLimitEngine(lease_tokens=5, lease_threshold=0.5)
+        rule = RateLimitRule("k", limit=2, period_seconds=60)
+
+        await engine.check([rule])
+        second = await engine.check([rule])
+
+        assert second.source == "memory"
+        assert engine.stats["local_hits"] == 0
+
+    async def test_uncharged_check_does_not_consume(self):
+        engine = RateLimitEngine(lease_tokens=5)
+        rule = RateLimitRule("k", limit=2, period_seconds=60)
+
+        peeks = [await engine.check([rule], charge=False) for _ in range(3)]
+        await engine.check([rule], charge=True)
+        await engine.check([rule], charge=True)
+        exhausted = await engine.check([rule], charge=False)
+
+        assert all(p.allowed and p.remaining == 1 for p in peeks)
+        assert not exhausted.allowed
+        assert engine.stats["local_hits"] == 0
+
+    async def test_deny_keys_expire(self):
+        engine = RateLimitEngine(lease_tokens=0)
+        rule = RateLimitRule("k", limit=10, period_seconds=60)
+
+        await engine.deny("lockout", 60)
+        denied = await engine.check([rule], deny_keys=["other", "lockout"])
+        engine._memory_denies["lockout"] -= 61
+        engine._memory_swept_at = 0.0
+        allowed = await engine.check([rule], deny_keys=["other", "lockout"])
+
+        assert not denied.allowed
+        assert denied.source == "denylist"
+        assert denied.denied_key == "lockout"
+        assert 59 < denied.retry_after <= 60
+        assert allowed.allowed
+        assert "lockout" not in engine._memory_denies
+
+    async def test_memory_evicts_expired_and_least_recent_keys(self):
+        engine = RateLimitEngine(lease_tokens=0, max_memory_keys=2)
+        rules = [RateLimitRule(f"k{i}", limit=10, period_seconds=60) for i in range(3)]
+
+        for rule in rules:
+            await engine.check([rule])
+        assert list(engine._memory_tats) == ["k1", "k2"]
+
+        # Un TAT ya pasado equivale a una clave ausente
+        engine._memory_tats["k1"] -= 60_000
+        engine._memory_swept_at = 0.0
+        await engine.check([rules[2]])
+        assert list(engine._memory_tats) == ["k2"]
+
+    def test_lease_ttl_is_capped(self):
+        assert RateLimitEngine(lease_ttl=30).lease_ttl == MAX_LEASE_TTL
+
+
+class TestRedisBackend:
+
+    async def test_single_evalsha_for_all_rules_and_lists(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = _redis_reply(
+            per_rule=((4, 500, 0), (59, 1000, 0))
+        )
+        engine = RateLimitEngine(redis_client, lease_tokens=0)
+        rules = [
+            RateLimitRule("endpoint", limit=5, period_seconds=3600, scope="endpoint_based"),
+            RateLimitRule("ip", limit=60, period_seconds=60, scope="ip_based"),
+        ]
+
+        decision = await engine.check(rules, allow_key="allow", deny_key="deny")
+
+        redis_client.evalsha.assert_awaited_once()
+        args = redis_client.evalsha.await_args.args
+        assert args[:6] == (GCRA_SCRIPT_SHA, 4, "allow", "deny", "endpoint", "ip")
+        assert args[6:11] == (1, 1, 0, 0.5, 1)
+        assert decision.allowed
+        assert decision.most_restrictive.rule.scope == "endpoint_based"
+        redis_client.eval.assert_not_called()
+
+    async def test_script_loaded_once_on_noscript(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.side_effect = [NoScriptError("NOSCRIPT"), _redis_reply(), _redis_reply()]
+        engine = RateLimitEngine(redis_client, lease_tokens=0)
+        rule = RateLimitRule("k", limit=60, period_seconds=60)
+
+        await engine.check([rule])
+        await engine.check([rule])
+
+        redis_client.script_load.assert_awaited_once_with(GCRA_LUA_SCRIPT)
+        assert redis_client.evalsha.await_count == 3
+
+    async def test_granted_lease_skips_redis(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = _redis_reply(lease=3, per_rule=((50, 9000, 0),))
+        engine = RateLimitEngine(redis_client)
+        rule = RateLimitRule("k", limit=60, period_seconds=60)
+
+        for _ in range(4):
+            assert (await engine.check([rule])).allowed
+        await engine.check([rule])
+
+        assert redis_client.evalsha.await_count == 2
+
+    async def test_denylist_status(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = [3, 0, 0]
+        engine = RateLimitEngine(redis_client)
+
+        decision = await engine.check([RateLimitRule("k", 60, 60)], deny_key="deny")
+
+        assert not decision.allowed
+        assert decision.source == "denylist"
+
+    async def test_denylist_reports_key_and_ttl(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = [3, 0, 2, 90_000]
+        engine = RateLimitEngine(redis_client)
+
+        decision = await engine.check([RateLimitRule("k", 60, 60)], deny_keys=["a", "b"], charge=False)
+
+        assert decision.denied_key == "b"
+        assert decision.retry_after == 90
+        assert redis_client.evalsha.await_args.args[1] == 3
+
+    async def test_deny_keys_are_cached_locally(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = [3, 0, 1, 120_000]
+        engine = RateLimitEngine(redis_client, local_deny_ttl=30)
+        rule = RateLimitRule("k", 60, 60)
+
+        decisions = [await engine.check([rule], deny_keys=["lockout"]) for _ in range(5)]
+
+        assert all(d.denied_key == "lockout" for d in decisions)
+        assert 119 < decisions[-1].retry_after <= 120  # real TTL, not the cache bound
+        redis_client.evalsha.assert_awaited_once()
+        assert engine.stats["local_denies"] == 4
+
+        # Allow-listed callers are never rejected locally
+        redis_client.evalsha.return_value = [2, 0, 0]
+        assert (await engine.check([rule], allow_key="allow", deny_keys=["lockout"])).allowed
+
+    async def test_cached_deny_is_revalidated_and_reset(self):
+        redis_client = AsyncMock()
+        engine = RateLimitEngine(redis_client, local_deny_ttl=30, max_local_denies=2)
+
+        await engine.deny("a", 600)
+        await engine.deny("b", 600)
+        await engine.deny("c", 600)
+        assert list(engine._local_denies) == ["b", "c"]
+
+        await engine.reset("b")
+        redis_client.delete.assert_awaited_once_with("b")
+        engine._local_denies["c"] = (0.0, engine._local_denies["c"][1])  # revalidation due
+        redis_client.evalsha.return_value = _redis_reply()
+        assert (await engine.check([RateLimitRule("k", 60, 60)], deny_keys=["b", "c"])).allowed
+
+    async def test_deny_sets_key_with_ttl(self):
+        redis_client = AsyncMock()
+        engine = RateLimitEngine(redis_client)
+
+        await engine.deny("lockout", 900, value="x")
+
+        redis_client.set.assert_awaited_once_with("lockout", "x", px=900_000)
+
+
+class TestEnterpriseService:
+
+    def _request(self, ip="10.0.0.1"):
+        return SimpleNamespace(client=SimpleNamespace(host=ip))
+
+    async def test_login_limit_is_endpoint_based(self):
+        service = EnterpriseRateLimitingService(AsyncMock(), engine=RateLimitEngine(lease_tokens=0))
+        login_limit = service._endpoint_rules("10.0.0.1", "auth/login")[0].limit
+
+        for _ in range(login_limit):
+            assert (await service.check_rate_limit(self._request(), "auth/login")).allowed
+        result = await service.check_rate_limit(self._request(), "auth/login")
+
+        assert not result.allowed
+        assert result.limit_type == RateLimitType.ENDPOINT_BASED
+        assert result.retry_after_seconds >= 1
+
+    async def test_one_redis_call_per_check(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = _redis_reply(per_rule=[(100, 1000, 0)] * 6)
+        service = EnterpriseRateLimitingService(redis_client, engine=RateLimitEngine(redis_client, lease_tokens=0))
+
+        result = await service.check_rate_limit(self._request(), "products", user_id="u1")
+
+        assert result.allowed
+        redis_client.evalsha.assert_awaited_once()
+        assert redis_client.evalsha.await_args.args[1] == 8  # allow + deny + 3 user + 3 ip
+        redis_client.zadd.assert_not_called()
+        redis_client.get.assert_not_called()
+
+    async def test_fails_closed_for_critical_endpoints(self):
+        redis_client = AsyncMock()
+        redis_client.evalsha.side_effect = ConnectionError("redis down")
+        service = EnterpriseRateLimitingService(redis_client)
+
+        critical = await service.check_rate_limit(self._request(), "auth/login")
+        other = await service.check_rate_limit(self._request(), "products")
+
+        assert not critical.allowed
+        assert other.allowed
+
+
+class TestAuthServiceLoginGuard:
+
+    @pytest.fixture(autouse=True)
+    def guard(self, monkeypatch):
+        engine = RateLimitEngine(lease_tokens=0)
+        monkeypatch.setattr(auth_service_module, "_login_guard", engine)
+        return engine
+
+    @pytest.fixture
+    def service(self):
+        service = AuthService()
+        service.log_security_event = AsyncMock()
+        return service
+
+    async def test_lockout_after_max_attempts(self, service):
+        for _ in range(service.max_login_attempts - 1):
+            await service._track_login_attempt("user@example.com", False, "10.0.0.1")
+
+        status = await service.check_brute_force_protection("user@example.com", "10.0.0.1")
+        assert not status["is_locked"]
+        assert status["failed_attempts"] == service.max_login_attempts - 1
+        assert status["remaining_attempts"] == 1
+
+        await service._track_login_attempt("user@example.com", False, "10.0.0.1")
+
+        is_locked, info = await service._is_account_locked("user@example.com")
+        assert is_locked
+        assert 0 < info["retry_after"] <= service.lockout_duration
+
+    async def test_success_clears_attempts_and_lockout(self, service):
+        for _ in range(service.max_login_attempts):
+            await service._track_login_attempt("user@example.com", False)
+
+        await service._track_login_attempt("user@example.com", True)
+
+        assert await service._is_account_locked("user@example.com") == (False, None)
+        assert await service._get_failed_attempts("user@example.com") == 0
+
+    async def test_one_script_call_for_account_and_ip(self, guard, service):
+        redis_client = AsyncMock()
+        redis_client.evalsha.return_value = _redis_reply(per_rule=((4, 180_000, 0), (4, 180_000, 0)))
+        guard.redis = redis_client
+
+        status = await service.check_brute_force_protection("user@example.com", "10.0.0.1")
+
+        redis_client.evalsha.assert_awaited_once()
+        assert redis_client.evalsha.await_args.args[1] == 4  # 2 lockout keys + 2 budgets
+        assert status["failed_attempts"] == 0
+        assert status["ip_protection"] == {"is_locked": False, "failed_attempts": 0}
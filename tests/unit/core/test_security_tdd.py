@@ -34,6 +34,7 @@ import base64
 import json
 import hashlib
 import secrets
+import time
 from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, patch, MagicMock, AsyncMock
 from typing import Dict, Any, Optional
@@ -493,8 +494,8 @@ class TestTokenBlacklistTDD:
         original_cleanup = blacklist._cleanup_expired_tokens
 
         def modified_cleanup():
-            # Modify the set during cleanup to simulate race condition
-            blacklist._blacklisted_tokens.add("concurrent_token")
+            # Modify the map during cleanup to simulate race condition
+            blacklist._blacklisted_tokens["concurrent_token"] = time.time() + 60
             original_cleanup()
 
         blacklist._cleanup_expired_tokens = modified_cleanup
@@ -513,16 +514,18 @@ class TestTokenBlacklistTDD:
         """
         blacklist = TokenBlacklist()
 
-        # Add tokens beyond threshold to trigger cleanup
+        # Add tokens beyond threshold to trigger cleanup; most already expired
         initial_tokens = []
         for i in range(1100):
             token = f"test_jti_{i}"
             initial_tokens.append(token)
-            blacklist.blacklist_token(token)
+            expires_at = time.time() + 3600 if i % 10 == 0 else time.time() - 1
+            blacklist.blacklist_token(token, expires_at=expires_at)
 
-        # Verify cleanup was triggered
-        assert len(blacklist._blacklisted_tokens) <= 1100
+        # Verify cleanup was triggered and kept only unexpired revocations
         assert len(blacklist._blacklisted_tokens) < len(initial_tokens)
+        assert blacklist.is_token_blacklisted("test_jti_0") is True
+        assert blacklist.is_token_blacklisted("test_jti_1") is False
 
     @pytest.mark.refactor_test
     def test_token_blacklist_comprehensive_workflow(self):
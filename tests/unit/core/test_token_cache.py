@@ -0,0 +1,110 @@
+"""
+Tests for the verified token cache used by get_current_user
+===========================================================
+
+- Claims cached until "exp", keyed by token digest, bounded LRU
+- Revocation checked against the shared revocation store
+- get_current_user skips decode_access_token on cache hits
+"""
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.api.v1.deps.auth import get_current_user
+from app.core import security
+from app.core.config import settings
+from app.core.token_cache import VerifiedTokenCache, verified_token_cache
+from app.core.token_revocation import TokenRevocationStore
+
+
+def _claims(jti="jti-1", ttl=60):
+    return {"sub": "user-1", "jti": jti, "exp": int(time.time()) + ttl}
+
+
+class TestVerifiedTokenCache:
+
+    def test_hit_until_exp(self):
+        cache = VerifiedTokenCache()
+        cache.put("token", _claims(), "user")
+
+        assert cache.get("token") == (_claims(), "user")
+
+        cache.put("expired", _claims(ttl=-1), "user")
+        assert cache.get("expired") is None
+
+    def test_claims_without_exp_or_jti_are_not_cached(self):
+        cache = VerifiedTokenCache()
+        cache.put("no-jti", {"sub": "u", "exp": time.time() + 60})
+        cache.put("no-exp", {"sub": "u", "jti": "x"})
+
+        assert cache.get("no-jti") is None
+        assert cache.get("no-exp") is None
+
+    def test_revoked_jti_invalidates_entry(self):
+        revocations = TokenRevocationStore()
+        cache = VerifiedTokenCache(revocations=revocations)
+        cache.put("token", _claims("abc"), "user")
+        revocations.blacklist_token("abc", expires_at=time.time() + 60)
+
+        assert cache.get("token") is None
+
+    def test_lru_bound(self):
+        cache = VerifiedTokenCache(max_size=2)
+        for i in range(3):
+            cache.put(f"t{i}", _claims(f"j{i}"))
+
+        assert cache.get("t0") is None
+        assert cache.stats()["entries"] == 2
+
+
+class TestGetCurrentUserCache:
+
+    @pytest.fixture(autouse=True)
+    def enabled_cache(self, monkeypatch):
+        monkeypatch.setattr(settings, "AUTH_TOKEN_CACHE_ENABLED", True)
+        verified_token_cache.clear()
+        yield
+        verified_token_cache.clear()
+
+    def _token(self):
+        return security.create_access_token({
+            "sub": "0b8a1c52-3f6e-4c59-9a7b-4a2b1f3e9d10",
+            "email": "cache@test.com",
+            "user_type": "BUYER",
+        })
+
+    async def test_second_request_skips_decode(self):
+        token = self._token()
+        with patch("app.api.v1.deps.auth.decode_access_token", wraps=security.decode_access_token) as decode:
+            first = await get_current_user(token, None)
+            second = await get_current_user(token, None)
+
+        assert decode.call_count == 1
+        assert first == second
+        assert first is not second
+        assert str(second.id) == "0b8a1c52-3f6e-4c59-9a7b-4a2b1f3e9d10"
+
+    async def test_revoked_token_is_rejected_after_caching(self):
+        token = self._token()
+        await get_current_user(token, None)
+
+        assert security.revoke_token(token)
+
+        with pytest.raises(Exception) as exc_info:
+            await get_current_user(token, None)
+        assert exc_info.value.status_code == 401
+
+
+class TestDecodeLogSampling:
+
+    def test_invalid_sample_rate_does_not_reject_token(self):
+        token = security.create_access_token({"sub": "user@example.com"})
+
+        # Un setting mal configurado (o mockeado) no debe invalidar el token
+        with patch.object(settings, "AUTH_TOKEN_LOG_SAMPLE_RATE", object()):
+            payload = security.decode_access_token(token)
+
+        assert payload is not None
+        assert payload["sub"] == "user@example.com"
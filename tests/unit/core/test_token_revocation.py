@@ -0,0 +1,231 @@
+"""
+Tests for cluster-wide token revocation
+=======================================
+
+- Scalable bloom filter: growth by generations, expiry of old generations
+- TokenRevocationStore: exact answers, expiry-based cleanup
+- Redis propagation (SET with TTL + PUBLISH) and pub/sub application
+- Listener reconnection with full resync, sync (threaded) revocation path
+- AuthService / SecureAuthService revocations go through the shared store
+"""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.core import token_revocation
+from app.core.security import create_access_token, create_refresh_token, decode_access_token
+from app.core.token_revocation import REVOCATION_KEY_PREFIX, ScalableBloomFilter, TokenRevocationStore
+
+
+class TestScalableBloomFilter:
+
+    def test_grows_by_generations(self):
+        bloom = ScalableBloomFilter(initial_capacity=10)
+        for i in range(35):
+            bloom.add(f"jti-{i}", time.time() + 60)
+
+        assert bloom.generations == 3
+        assert all(f"jti-{i}" in bloom for i in range(35))
+        assert sum(f"other-{i}" in bloom for i in range(1000)) < 20
+
+    def test_expired_generations_are_dropped(self):
+        bloom = ScalableBloomFilter(initial_capacity=10)
+        for i in range(10):
+            bloom.add(f"old-{i}", time.time() - 1)
+        bloom.add("fresh", time.time() + 60)
+
+        bloom.expire(time.time())
+
+        assert bloom.generations == 1
+        assert "fresh" in bloom
+        assert "old-0" not in bloom
+
+
+class TestTokenRevocationStore:
+
+    def test_revoked_until_exp(self):
+        store = TokenRevocationStore()
+        store.blacklist_token("live", expires_at=time.time() + 60)
+        store.blacklist_token("expired", expires_at=time.time() - 1)
+
+        assert store.is_token_blacklisted("live")
+        assert not store.is_token_blacklisted("expired")
+        assert not store.is_token_blacklisted("never-revoked")
+
+    def test_cleanup_bounds_memory(self):
+        store = TokenRevocationStore(cleanup_threshold=100)
+        for i in range(1000):
+            store.blacklist_token(f"jti-{i}", expires_at=time.time() - 1)
+
+        assert len(store._blacklisted_tokens) < 100
+
+    async def test_revoke_persists_and_publishes_in_one_pipeline(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[True, 1])
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value = pipe
+        store = TokenRevocationStore(redis_client)
+        exp = time.time() + 120
+
+        await store.revoke("abc", expires_at=exp)
+
+        key, _ = pipe.set.call_args.args
+        assert key == f"{REVOCATION_KEY_PREFIX}:abc"
+        assert 110_000 < pipe.set.call_args.kwargs["px"] <= 120_000
+        assert pipe.publish.call_args.args[1] == f"abc|{exp}"
+        pipe.execute.assert_awaited_once()
+
+    async def test_listen_applies_published_revocations(self):
+        store = TokenRevocationStore()
+        exp = time.time() + 60
+
+        async def messages():
+            yield {"type": "subscribe", "data": 1}
+            yield {"type": "message", "data": f"remote|{exp}".encode()}
+            assert store.synchronized
+
+        pubsub = MagicMock()
+        pubsub.listen = messages
+        pubsub.unsubscribe = AsyncMock()
+        pubsub.close = AsyncMock()
+
+        await store.listen(pubsub)
+
+        assert store.is_token_blacklisted("remote")
+        assert not store.synchronized
+
+    async def test_load_reads_existing_revocations(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[30_000, -2])
+        redis_client = MagicMock()
+        redis_client.scan = AsyncMock(return_value=(0, [b"jwt_blacklist:a", b"jwt_blacklist:gone"]))
+        redis_client.pipeline.return_value = pipe
+        store = TokenRevocationStore()
+
+        assert await store.load(redis_client) == 1
+        assert store.is_token_blacklisted("a")
+        assert not store.is_token_blacklisted("gone")
+
+
+def _pipeline_redis(execute=None):
+    pipe = MagicMock()
+    pipe.execute = execute or AsyncMock(return_value=[True, 1])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipe
+    return redis_client, pipe
+
+
+class TestRevocationSync:
+
+    async def test_listener_reconnects_and_resyncs(self):
+        store = TokenRevocationStore()
+        redis_client, _ = _pipeline_redis()
+        exp = time.time() + 60
+
+        async def dropped():
+            raise ConnectionError("connection lost")
+            yield  # pragma: no cover
+
+        async def messages():
+            yield {"type": "message", "data": f"after-reconnect|{exp}"}
+            raise asyncio.CancelledError
+
+        pubsubs = [MagicMock(listen=dropped), MagicMock(listen=messages)]
+        for pubsub in pubsubs:
+            pubsub.unsubscribe = AsyncMock()
+            pubsub.close = AsyncMock()
+        store.subscribe = AsyncMock(side_effect=pubsubs)
+        store.load = AsyncMock(return_value=0)
+
+        with pytest.raises(asyncio.CancelledError):
+            await store.sync_forever(redis_client, initial_backoff=0)
+
+        assert store.subscribe.await_count == 2
+        assert store.load.await_count == 2  # full resync on reconnect
+        assert store.is_token_blacklisted("after-reconnect")
+        assert not store.synchronized
+
+    async def test_failed_writes_are_retried_on_resync(self):
+        redis_client, pipe = _pipeline_redis(AsyncMock(side_effect=[ConnectionError("down"), [True, 1]]))
+        store = TokenRevocationStore(redis_client)
+
+        with pytest.raises(ConnectionError):
+            await store.revoke("abc", expires_at=time.time() + 60)
+        assert store.is_token_blacklisted("abc")
+        assert store.stats()["unpersisted"] == 1
+
+        assert await store.flush_unpersisted() == 1
+        assert store.stats()["unpersisted"] == 0
+        assert pipe.execute.await_count == 2
+
+    async def test_revocation_from_a_thread_is_persisted_on_the_loop(self):
+        redis_client, pipe = _pipeline_redis()
+        store = TokenRevocationStore()
+        store.attach(redis_client)
+
+        await asyncio.to_thread(store.blacklist_token, "from-thread", time.time() + 60)
+
+        pipe.execute.assert_awaited_once()
+        assert pipe.set.call_args.args[0] == f"{REVOCATION_KEY_PREFIX}:from-thread"
+
+    def test_revocation_without_loop_is_queued(self):
+        redis_client, pipe = _pipeline_redis()
+        store = TokenRevocationStore(redis_client)
+
+        store.blacklist_token("no-loop", expires_at=time.time() + 60)
+
+        assert store.is_token_blacklisted("no-loop")
+        assert store.stats()["unpersisted"] == 1
+        pipe.execute.assert_not_called()
+
+    async def test_is_revoked_asks_redis_only_when_not_synchronized(self):
+        redis_client = MagicMock()
+        redis_client.exists = AsyncMock(return_value=1)
+        store = TokenRevocationStore(redis_client)
+
+        assert await store.is_revoked("elsewhere")
+        store.synchronized = True
+        assert not await store.is_revoked("elsewhere")
+        redis_client.exists.assert_awaited_once_with(f"{REVOCATION_KEY_PREFIX}:elsewhere")
+
+
+class TestServicesShareTheStore:
+
+    @pytest.fixture
+    def store(self):
+        store = TokenRevocationStore()
+        with patch.object(token_revocation, "token_blacklist", store), \
+                patch("app.core.security.token_blacklist", store), \
+                patch("app.services.auth_service.token_blacklist", store), \
+                patch("app.services.secure_auth_service.token_blacklist", store):
+            yield store
+
+    async def test_auth_service_revocation_is_seen_by_decode(self, store):
+        from app.services.auth_service import AuthService
+
+        service = AuthService()
+        service.log_security_event = AsyncMock()
+        access = create_access_token({"sub": "user@example.com"})
+        refresh = create_refresh_token({"sub": "user@example.com"})
+
+        assert await service.revoke_token(access)
+        assert await service.revoke_token(refresh)
+
+        assert decode_access_token(access) is None
+        assert await service.is_token_revoked(refresh)
+        assert len(store._blacklisted_tokens) == 2
+
+    async def test_secure_auth_service_revocation_is_seen_by_auth_service(self, store):
+        from app.services.auth_service import AuthService
+        from app.services.secure_auth_service import TokenBlacklist
+
+        token = create_access_token({"sub": "user@example.com"})
+
+        await TokenBlacklist().blacklist_token(token)
+
+        service = AuthService()
+        service.log_security_event = AsyncMock()
+        assert await service.is_token_revoked(token)
@@ -0,0 +1,189 @@
+"""
+Tests for the pure ASGI middleware base
+=======================================
+
+- Streaming responses pass through chunk by chunk, background tasks still run
+- before_request can short-circuit, on_exception can replace the response
+- Opt-in buffering/rewrite keeps the original headers (Set-Cookie included)
+- Layers stack in MIDDLEWARE_STACK order (first = outermost)
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.background import BackgroundTask
+
+from app.core.middleware_integration_simple import add_middleware_stack
+from app.middleware.asgi import ASGIMiddleware, carry_headers
+
+
+class Recording(ASGIMiddleware):
+    """Records the hooks it sees; optional short-circuit / rewrite / error handling"""
+
+    def __init__(self, app, name="layer", events=None, block=False, rewrite=False, handle_errors=False):
+        super().__init__(app)
+        self.name = name
+        self.events = events if events is not None else []
+        self.block = block
+        self.rewrite = rewrite
+        self.handle_errors = handle_errors
+
+    async def before_request(self, request):
+        self.events.append((self.name, "before"))
+        if self.block:
+            return JSONResponse({"detail": "blocked"}, status_code=403)
+        return None
+
+    def on_response_start(self, request, status_code, headers, elapsed):
+        self.events.append((self.name, "start", status_code))
+        headers[f"x-{self.name}"] = "1"
+
+    def should_buffer(self, request, status_code, headers):
+        return self.rewrite
+
+    async def rewrite_response(self, request, status_code, headers, body):
+        return carry_headers(JSONResponse({"wrapped": body.decode()}), headers)
+
+    async def after_response(self, request, status_code, elapsed):
+        self.events.append((self.name, "after", status_code))
+
+    async def on_exception(self, request, exc, elapsed):
+        if self.handle_errors:
+            return JSONResponse({"detail": "Internal server error"}, status_code=500)
+        return None
+
+
+def _app(background_calls=None):
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk{i};".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.get("/cookies")
+    async def cookies():
+        response = JSONResponse({"ok": True})
+        response.set_cookie("a", "1")
+        response.set_cookie("b", "2")
+        return response
+
+    @app.get("/background")
+    async def background():
+        return JSONResponse({"ok": True}, background=BackgroundTask(background_calls.append, "done"))
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return app
+
+
+class TestASGIMiddleware:
+
+    def test_streaming_and_background_task_preserved(self):
+        calls, events = [], []
+        app = _app(calls)
+        app.add_middleware(Recording, events=events)
+        client = TestClient(app)
+
+        with client.stream("GET", "/stream") as response:
+            chunks = list(response.iter_raw())
+        assert b"".join(chunks) == b"chunk0;chunk1;chunk2;"
+        assert response.headers["x-layer"] == "1"
+
+        assert client.get("/background").status_code == 200
+        assert calls == ["done"]
+        assert events[-1] == ("layer", "after", 200)
+
+    def test_short_circuit_skips_app_and_after_hook(self):
+        events = []
+        app = _app()
+        app.add_middleware(Recording, events=events, block=True)
+
+        response = TestClient(app).get("/stream")
+
+        assert response.status_code == 403
+        assert events == [("layer", "before")]
+
+    def test_rewrite_keeps_duplicate_headers(self):
+        app = _app()
+        app.add_middleware(Recording, rewrite=True)
+
+        response = TestClient(app).get("/cookies")
+
+        assert response.json() == {"wrapped": '{"ok":true}'}
+        assert response.headers.get_list("set-cookie")[0].startswith("a=1")
+        assert response.headers.get_list("set-cookie")[1].startswith("b=2")
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert response.headers["x-layer"] == "1"
+
+    def test_oversized_body_streams_without_rewrite(self):
+        class SmallBuffer(Recording):
+            max_buffer_size = 4
+
+        app = _app()
+        app.add_middleware(SmallBuffer, rewrite=True)
+
+        response = TestClient(app).get("/stream")
+
+        assert response.text == "chunk0;chunk1;chunk2;"
+        assert response.headers["x-layer"] == "1"
+
+    def test_exception_replaced_or_reraised(self):
+        events = []
+        app = _app()
+        app.add_middleware(Recording, events=events, handle_errors=True)
+        response = TestClient(app, raise_server_exceptions=False).get("/boom")
+        assert response.status_code == 500
+        assert response.json() == {"detail": "Internal server error"}
+        assert events[-1] == ("layer", "after", 500)
+
+        app = _app()
+        app.add_middleware(Recording)
+        with pytest.raises(RuntimeError):
+            TestClient(app).get("/boom")
+
+
+class TestMiddlewareStack:
+
+    def test_layers_added_outermost_first(self):
+        app = FastAPI()
+        add_middleware_stack(app, ["performance_monitor", "rate_limiting", "response_standardization"])
+
+        names = [middleware.cls.__name__ for middleware in app.user_middleware]
+        assert names == ["PerformanceMonitorMiddleware", "RateLimitingMiddleware",
+                         "ResponseStandardizationMiddleware"]
+
+    def test_unknown_layer_rejected(self):
+        with pytest.raises(ValueError, match="gzip"):
+            add_middleware_stack(FastAPI(), ["gzip"])
+
+
+class TestSecurityLayers:
+
+    def test_comprehensive_security_headers_and_rate_limit(self):
+        from app.middleware.comprehensive_security import ComprehensiveSecurityMiddleware
+
+        app = FastAPI()
+
+        @app.post("/api/v1/auth/login")
+        async def login():
+            return {"ok": True}
+
+        app.add_middleware(ComprehensiveSecurityMiddleware, enable_audit_logging=False)
+        client = TestClient(app, headers={"X-Forwarded-For": "203.0.113.7"})
+
+        response = client.post("/api/v1/auth/login")
+        assert response.status_code == 200
+        assert response.headers["X-Protected-Endpoint"] == "true"
+        assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+        statuses = [client.post("/api/v1/auth/login").status_code for _ in range(60)]
+        assert 429 in statuses
+        limited = client.post("/api/v1/auth/login")
+        assert limited.status_code == 429
+        assert int(limited.headers["Retry-After"]) >= 1
@@ -25,6 +25,7 @@ from fastapi import FastAPI, Request, Response
 from fastapi.testclient import TestClient
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from app.core.rate_limit_engine import RateLimitEngine
 from app.middleware.auth_rate_limiting import (
     AuthRateLimitingMiddleware,
     AuthRateLimitType,
@@ -75,17 +76,30 @@ class TestAuthRateLimitingMiddleware:
         redis_mock.get = AsyncMock(return_value=None)
         redis_mock.setex = AsyncMock()
         redis_mock.expire = AsyncMock()
-        redis_mock.incr = AsyncMock(return_value=1)
-        redis_mock.exists = AsyncMock(return_value=False)
-        redis_mock.zcard = AsyncMock(return_value=0)
-        redis_mock.zadd = AsyncMock()
-        redis_mock.zremrangebyscore = AsyncMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[1, True])  # INCR violations, EXPIRE
+        redis_mock.pipeline = MagicMock(return_value=pipe)
         return redis_mock
 
     @pytest.fixture
     def middleware(self, app, mock_redis):
-        """Create middleware with mock Redis."""
-        return AuthRateLimitingMiddleware(app, mock_redis)
+        """Create middleware with mock Redis (violation counts) and an in-memory engine."""
+        middleware = AuthRateLimitingMiddleware(app, mock_redis, engine=RateLimitEngine(lease_tokens=0))
+        middleware.audit_service.log_security_event = AsyncMock()
+        return middleware
+
+    async def _fail(self, middleware, times, ip="192.168.1.100", user=None):
+        for _ in range(times):
+            await middleware._track_authentication_failure(ip, user, AuthRateLimitType.LOGIN_ATTEMPTS)
+
+    async def _exhaust(self, middleware, scope, identifier, limit):
+        """Consume a failure budget without going through failure tracking (no lockout)."""
+        rule = middleware._failure_rule(
+            scope, identifier, AuthRateLimitType.LOGIN_ATTEMPTS,
+            middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
+        )
+        for _ in range(limit):
+            await middleware.engine.check([rule])
 
     @pytest.fixture
     def test_client(self, app, middleware):
@@ -231,9 +245,7 @@ class TestAuthRateLimitingMiddleware:
     @pytest.mark.asyncio
     async def test_ip_rate_limit_enforcement(self, middleware):
         """Test IP-based rate limit enforcement."""
-        # Mock Redis to simulate max failures reached
-        middleware.redis_client.zcard = AsyncMock(return_value=10)  # Max failures for login
-        middleware.redis_client.get = AsyncMock(return_value=None)  # No existing lockout
+        await self._exhaust(middleware, "ip", "192.168.1.100", 10)  # Max failures for login
 
         limits = middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
         current_time = datetime.now(timezone.utc)
@@ -249,12 +261,18 @@ class TestAuthRateLimitingMiddleware:
         assert "lockout_until" in info
         assert "retry_after" in info
 
+        # The lockout is now active
+        is_allowed, info = await middleware._check_ip_auth_limits(
+            "192.168.1.100", AuthRateLimitType.LOGIN_ATTEMPTS, limits, current_time
+        )
+        assert not is_allowed
+        assert info["type"] == "ip_lockout"
+        assert 0 < info["retry_after"] <= 15 * 60
+
     @pytest.mark.asyncio
     async def test_user_rate_limit_enforcement(self, middleware):
         """Test user-based rate limit enforcement."""
-        # Mock Redis to simulate max failures reached
-        middleware.redis_client.zcard = AsyncMock(return_value=5)  # Max failures for user login
-        middleware.redis_client.get = AsyncMock(return_value=None)  # No existing lockout
+        await self._exhaust(middleware, "user", "test@example.com", 5)  # Max failures for user login
 
         limits = middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
         current_time = datetime.now(timezone.utc)
@@ -269,12 +287,40 @@ class TestAuthRateLimitingMiddleware:
         assert info["max_failures"] == 5
         assert "lockout_until" in info
 
+    @pytest.mark.asyncio
+    async def test_exhausting_failure_starts_lockout(self, middleware):
+        """The failure that exhausts a budget locks the scope out immediately."""
+        await self._fail(middleware, 4, ip="10.0.0.1", user="test@example.com")
+        assert not middleware.engine._memory_denies
+
+        await self._fail(middleware, 1, ip="10.0.0.2", user="test@example.com")
+
+        is_allowed, info = await middleware._check_auth_rate_limits(
+            "10.0.0.3", "test@example.com", AuthRateLimitType.LOGIN_ATTEMPTS
+        )
+        assert not is_allowed
+        assert info["type"] == "user_lockout"
+        assert 14 * 60 < info["retry_after"] <= 15 * 60  # first violation: base lockout
+
+    @pytest.mark.asyncio
+    async def test_locked_out_client_is_rejected_locally(self, app, mock_redis):
+        """Deny keys seen in Redis are answered from the local cache."""
+        mock_redis.evalsha = AsyncMock(return_value=[3, 0, 2, 600_000])
+        middleware = AuthRateLimitingMiddleware(app, mock_redis)
+
+        results = [
+            await middleware._check_auth_rate_limits("192.168.1.100", None, AuthRateLimitType.LOGIN_ATTEMPTS)
+            for _ in range(20)
+        ]
+
+        assert all(not allowed and info["type"] == "ip_lockout" for allowed, info in results)
+        mock_redis.evalsha.assert_awaited_once()
+        assert middleware.engine.stats["local_denies"] == 19
+
     @pytest.mark.asyncio
     async def test_lockout_period_enforcement(self, middleware):
         """Test that active lockout periods are enforced."""
-        # Mock Redis to return an active lockout
-        future_time = datetime.now(timezone.utc) + timedelta(minutes=30)
-        middleware.redis_client.get = AsyncMock(return_value=str(future_time.timestamp()))
+        await middleware.engine.deny("auth_lockout:ip:192.168.1.100:login_attempts", 30 * 60)
 
         limits = middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
         current_time = datetime.now(timezone.utc)
@@ -286,17 +332,24 @@ class TestAuthRateLimitingMiddleware:
         assert not is_allowed
         assert info["type"] == "ip_lockout"
         assert "lockout_until" in info
-        assert info["retry_after"] > 0
+        assert 29 * 60 < info["retry_after"] <= 30 * 60
 
     @pytest.mark.asyncio
     async def test_blacklist_functionality(self, middleware):
         """Test IP blacklisting functionality."""
-        # Mock Redis to indicate IP is blacklisted
-        middleware.redis_client.exists = AsyncMock(return_value=True)
+        assert not await middleware._is_blacklisted("192.168.1.100")
+        await middleware.engine.deny("auth_blacklist:ip:192.168.1.100", 3600)
 
         is_blacklisted = await middleware._is_blacklisted("192.168.1.100")
         assert is_blacklisted
 
+        # Reported by the combined pre-request check as well
+        is_allowed, info = await middleware._check_auth_rate_limits(
+            "192.168.1.100", "test@example.com", AuthRateLimitType.LOGIN_ATTEMPTS
+        )
+        assert not is_allowed
+        assert info["type"] == "ip_blacklisted"
+
         # Test blacklist response creation
         response = middleware._create_blacklist_response("192.168.1.100")
         assert response.status_code == 403
@@ -308,8 +361,8 @@ class TestAuthRateLimitingMiddleware:
         with patch.object(middleware.audit_service, 'log_security_event', new_callable=AsyncMock) as mock_audit:
             await middleware._auto_blacklist_ip("192.168.1.100", 5)
 
-            # Verify Redis blacklist key was set
-            middleware.redis_client.setex.assert_called_once()
+            # Verify the blacklist deny key was set
+            assert await middleware._is_blacklisted("192.168.1.100")
 
             # Verify audit log was created
             mock_audit.assert_called_once()
@@ -319,15 +372,43 @@ class TestAuthRateLimitingMiddleware:
 
     @pytest.mark.asyncio
     async def test_authentication_failure_tracking(self, middleware):
-        """Test authentication failure tracking in Redis."""
-        with patch.object(middleware.audit_service, 'log_security_event', new_callable=AsyncMock):
-            await middleware._track_authentication_failure(
-                "192.168.1.100", "test@example.com", AuthRateLimitType.LOGIN_ATTEMPTS
-            )
+        """Test authentication failure tracking charges both IP and user budgets."""
+        await self._fail(middleware, 2, user="test@example.com")
+
+        is_allowed, info = await middleware._check_auth_rate_limits(
+            "192.168.1.100", "test@example.com", AuthRateLimitType.LOGIN_ATTEMPTS
+        )
 
-            # Verify Redis operations
-            assert middleware.redis_client.zadd.call_count == 2  # IP and user tracking
-            assert middleware.redis_client.expire.call_count == 2
+        assert is_allowed
+        # The user budget (5/h) is more restrictive than the IP one (10/h)
+        assert info["type"] == "user_allowed"
+        assert info["failures"] == 2
+        assert info["remaining"] == 3
+        assert middleware.audit_service.log_security_event.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_single_redis_call_per_check(self, app, mock_redis):
+        """Blacklist, lockouts and budgets are evaluated in one EVALSHA."""
+        mock_redis.evalsha = AsyncMock(return_value=[1, 0, 0, 9, 360000, 0, 4, 720000, 0])
+        middleware = AuthRateLimitingMiddleware(app, mock_redis)
+
+        is_allowed, info = await middleware._check_auth_rate_limits(
+            "192.168.1.100", "test@example.com", AuthRateLimitType.LOGIN_ATTEMPTS
+        )
+
+        assert is_allowed
+        assert info["remaining"] == 5
+        mock_redis.evalsha.assert_awaited_once()
+        args = mock_redis.evalsha.await_args.args
+        assert args[1] == 5  # blacklist + 2 lockouts + 2 budgets
+        assert args[2:7] == (
+            "auth_blacklist:ip:192.168.1.100",
+            "auth_lockout:ip:192.168.1.100:login_attempts",
+            "auth_lockout:user:test@example.com:login_attempts",
+            "auth_failures:ip:192.168.1.100:login_attempts",
+            "auth_failures:user:test@example.com:login_attempts",
+        )
+        assert args[7:12] == (0, 3, 0, 0.5, 0)  # no allow key, 3 deny keys, no lease, no charge
 
     @pytest.mark.asyncio
     async def test_admin_login_stricter_limits(self, middleware):
@@ -359,9 +440,8 @@ class TestAuthRateLimitingMiddleware:
     @pytest.mark.asyncio
     async def test_redis_error_fallback(self, middleware):
         """Test graceful fallback when Redis is unavailable."""
-        # Mock Redis to raise exceptions - this tests the graceful handling
-        # where Redis failures in _get_current_failures return 0, allowing normal flow
-        middleware.redis_client.zcard = AsyncMock(side_effect=Exception("Redis unavailable"))
+        # Engine failures fail open with the full failure budget
+        middleware.engine.check = AsyncMock(side_effect=Exception("Redis unavailable"))
 
         limits = middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
         current_time = datetime.now(timezone.utc)
@@ -370,11 +450,9 @@ class TestAuthRateLimitingMiddleware:
             "192.168.1.100", AuthRateLimitType.LOGIN_ATTEMPTS, limits, current_time
         )
 
-        # Redis failures are handled gracefully - _get_current_failures returns 0
-        # so the middleware continues with normal flow (ip_allowed) rather than error_fallback
         assert is_allowed
         assert info["type"] == "ip_allowed"
-        assert info["failures"] == 0  # _get_current_failures returns 0 on Redis error
+        assert info["failures"] == 0
         assert info["remaining"] == limits["attempts_per_ip_per_hour"]  # 10 - 0 = 10
 
     @pytest.mark.asyncio
@@ -482,27 +560,16 @@ class TestAuthRateLimitingIntegration:
 
         app = FastAPI()
 
-        # Mock Redis client for testing
-        mock_redis = AsyncMock()
-        mock_redis.ping = AsyncMock(return_value=True)
-        mock_redis.zcard = AsyncMock(side_effect=lambda key: 10 if "login_attempts" in key else 0)
-        mock_redis.get = AsyncMock(return_value=None)
-        mock_redis.setex = AsyncMock()
-        mock_redis.zadd = AsyncMock()
-        mock_redis.expire = AsyncMock()
-
-        # Create middleware with mocked Redis
-        middleware = AuthRateLimitingMiddleware(app, mock_redis)
+        # In-memory engine (no Redis)
+        middleware = AuthRateLimitingMiddleware(app, None)
+        middleware.audit_service.log_security_event = AsyncMock()
 
         # Test rate limiting logic directly
         current_time = datetime.now(timezone.utc)
         limits = middleware.auth_limits[AuthRateLimitType.LOGIN_ATTEMPTS]
 
-        # Test first 10 attempts (should be allowed)
+        # Test first 10 attempts (should be allowed), each one failing
         for i in range(10):
-            # Mock lower failure count for first attempts
-            mock_redis.zcard = AsyncMock(return_value=i)
-
             is_allowed, info = await middleware._check_ip_auth_limits(
                 "192.168.1.100", AuthRateLimitType.LOGIN_ATTEMPTS, limits, current_time
             )
@@ -511,17 +578,17 @@ class TestAuthRateLimitingIntegration:
             assert info["type"] == "ip_allowed"
             assert info["failures"] == i
 
-        # Test 11th and 12th attempts (should be rate limited)
-        for i in range(11, 13):
-            mock_redis.zcard = AsyncMock(return_value=i)
+            await middleware._track_authentication_failure(
+                "192.168.1.100", None, AuthRateLimitType.LOGIN_ATTEMPTS
+            )
 
+        # The 10th failure exhausted the budget and started the lockout
+        for i in range(11, 13):
             is_allowed, info = await middleware._check_ip_auth_limits(
                 "192.168.1.100", AuthRateLimitType.LOGIN_ATTEMPTS, limits, current_time
             )
-
             assert not is_allowed, f"Attempt {i}: Should be rate limited"
-            assert info["type"] == "ip_rate_limit"
-            assert info["failures"] == i
+            assert info["type"] == "ip_lockout"
 
 
 
@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.services.payments.gateway_router import GatewayRouter, GatewayRouterConfig
+from app.services.integrated_payment_service import IntegratedPaymentService, PaymentProcessingError
+
+
+def _router(**overrides):
+    config = GatewayRouterConfig(min_samples=3, **overrides)
+    return GatewayRouter(config)
+
+
+class TestGatewayRouter:
+    """Test latency-aware ranking and attempt deadlines"""
+
+    def test_preferred_gateway_wins_without_history(self):
+        router = _router()
+
+        ordered, metrics = router.rank(["wompi", "payu"], "credit_card", preferred_gateway="payu")
+
+        assert ordered == ["payu", "wompi"]
+        assert metrics["wompi"]["samples"] == 0
+
+    def test_slow_gateway_is_demoted(self):
+        router = _router()
+        for _ in range(5):
+            router.record_attempt("wompi", "credit_card", 8.0, ok=True)
+            router.record_attempt("payu", "credit_card", 0.4, ok=True)
+
+        ordered, metrics = router.rank(["wompi", "payu"], "credit_card", preferred_gateway="wompi")
+
+        assert ordered == ["payu", "wompi"]
+        assert metrics["payu"]["p95"] == 0.4
+
+    def test_errors_are_charged_a_deadline_each(self):
+        router = _router(min_attempt_seconds=3.0)
+        for ok in (True, False, False, False):
+            router.record_attempt("wompi", "pse", 0.5, ok=ok)
+
+        # 0.5s success + 3 expected failures x 3s attempt deadline
+        assert router.score("wompi", "pse")["score"] == pytest.approx(9.5)
+
+    def test_fast_failing_gateway_does_not_outrank_healthy_one(self):
+        router = _router(unhealthy_error_rate=1.0)
+        for _ in range(8):
+            router.record_attempt("wompi", "credit_card", 0.05, ok=False)
+        router.record_attempt("wompi", "credit_card", 0.05, ok=True)
+        router.record_attempt("wompi", "credit_card", 0.05, ok=True)
+        for _ in range(10):
+            router.record_attempt("payu", "credit_card", 2.0, ok=True)
+
+        ordered, metrics = router.rank(["wompi", "payu"], "credit_card", preferred_gateway="wompi")
+
+        assert ordered == ["payu", "wompi"]
+        assert metrics["wompi"]["score"] > metrics["payu"]["score"]
+
+    def test_unhealthy_gateway_is_last_resort(self):
+        router = _router()
+        for ok in (True, True, False, False, False):
+            router.record_attempt("wompi", "credit_card", 0.1, ok=ok)
+        for _ in range(5):
+            router.record_attempt("payu", "credit_card", 20.0, ok=True)
+
+        ordered, metrics = router.rank(["wompi", "payu"], "credit_card", preferred_gateway="wompi")
+
+        assert ordered == ["payu", "wompi"]
+        assert not metrics["wompi"]["healthy"]
+        assert metrics["payu"]["healthy"]
+
+    def test_stats_are_per_payment_method(self):
+        router = _router()
+        for _ in range(3):
+            router.record_attempt("wompi", "pse", 9.0, ok=False)
+
+        assert router.score("wompi", "credit_card")["samples"] == 0
+
+    def test_deadline_reserves_time_for_fallback(self):
+        router = _router(min_attempt_seconds=3.0)
+        for _ in range(5):
+            router.record_attempt("wompi", "credit_card", 20.0, ok=True)
+
+        assert router.attempt_deadline("wompi", "credit_card", 25.0, attempts_left=2) == 22.0
+        assert router.attempt_deadline("wompi", "credit_card", 10.0, attempts_left=1) == 10.0
+
+    def test_deadline_follows_p95(self):
+        router = _router(deadline_p95_multiplier=2.0)
+        for _ in range(5):
+            router.record_attempt("payu", "credit_card", 1.0, ok=True)
+
+        assert router.attempt_deadline("payu", "credit_card", 25.0, attempts_left=2) == 3.0
+
+    def test_snapshot_exposes_metrics(self):
+        router = _router()
+        router.record_attempt("payu", "pse", 0.2, ok=False, timed_out=True)
+
+        snapshot = router.snapshot()
+
+        assert snapshot["payu"]["pse"]["total_timeouts"] == 1
+
+
+@pytest.mark.asyncio
+class TestProcessPaymentWithFallback:
+    """Test failover honours per-attempt deadlines"""
+
+    @pytest.fixture
+    def service(self):
+        service = IntegratedPaymentService()
+        service.gateway_router = _router(checkout_budget_seconds=1.0, min_attempt_seconds=0.2)
+        return service
+
+    async def test_hung_gateway_times_out_and_fails_over(self, service):
+        async def hung(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        with patch.object(service, "_process_via_wompi", side_effect=hung), \
+                patch.object(service.wompi_service, "find_transaction_by_reference",
+                             new=AsyncMock(return_value=None)) as lookup, \
+                patch.object(service, "_process_via_payu", new=AsyncMock(return_value={"success": True})):
+            result = await service.process_payment_with_fallback(
+                "1", 10000, "credit_card", {}, db=None, gateway_preference="wompi"
+            )
+
+        lookup.assert_awaited_once_with("ORDER-1")
+        assert result["gateway_used"] == "payu"
+        assert [a["outcome"] for a in result["routing"]["attempts"]] == ["timeout", "success"]
+        assert result["routing"]["attempts"][0]["resolution"] == "not_charged"
+        assert result["routing"]["elapsed"] < 1.0
+        assert service.gateway_router.score("wompi", "credit_card")["total_timeouts"] == 1
+
+    @pytest.mark.parametrize("status,outcome", [("APPROVED", "charged"), ("PENDING", "pending")])
+    async def test_timed_out_charge_is_not_charged_again(self, service, status, outcome):
+        async def hung(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        payu = AsyncMock(return_value={"success": True})
+        with patch.object(service, "_process_via_wompi", side_effect=hung), \
+                patch.object(service.wompi_service, "find_transaction_by_reference",
+                             new=AsyncMock(return_value={"id": "wompi-tx-1", "status": status})), \
+                patch.object(service, "_process_via_payu", new=payu):
+            result = await service.process_payment_with_fallback(
+                "1", 10000, "credit_card", {}, db=None, gateway_preference="wompi"
+            )
+
+        payu.assert_not_awaited()
+        assert result["gateway_used"] == "wompi"
+        assert result["transaction_id"] == "wompi-tx-1"
+        assert result["success"] is (status == "APPROVED")
+        assert result["routing"]["attempts"][0]["resolution"] == outcome
+
+    async def test_unresolvable_timeout_leaves_payment_pending(self, service):
+        async def hung(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        payu = AsyncMock(return_value={"success": True})
+        with patch.object(service, "_process_via_wompi", side_effect=hung), \
+                patch.object(service.wompi_service, "find_transaction_by_reference",
+                             new=AsyncMock(side_effect=RuntimeError("still down"))), \
+                patch.object(service, "_process_via_payu", new=payu):
+            result = await service.process_payment_with_fallback(
+                "1", 10000, "credit_card", {}, db=None, gateway_preference="wompi"
+            )
+
+        payu.assert_not_awaited()
+        assert result["state"] == "PENDING"
+        assert result["requires_reconciliation"]
+        assert result["reference"] == "ORDER-1"
+        assert result["routing"]["attempts"][0]["resolution"] == "unknown"
+
+    async def test_all_gateways_failing_reports_attempts(self, service):
+        failing = AsyncMock(side_effect=RuntimeError("down"))
+
+        with patch.object(service, "_process_via_wompi", new=failing), \
+                patch.object(service, "_process_via_payu", new=failing):
+            with pytest.raises(PaymentProcessingError) as exc_info:
+                await service.process_payment_with_fallback("1", 10000, "credit_card", {}, db=None)
+
+        assert exc_info.value.error_code == "ALL_GATEWAYS_FAILED"
+        assert exc_info.value.details["gateways_tried"] == ["wompi", "payu"]
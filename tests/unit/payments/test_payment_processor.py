@@ -1,3 +1,4 @@
+import json
 import pytest
 import uuid
 from datetime import datetime, timedelta
@@ -303,7 +304,7 @@ class TestPaymentProcessor:
         assert mock_transaction.order.status == OrderStatus.CONFIRMED
         assert mock_transaction.confirmed_at is not None
         assert mock_transaction.order.confirmed_at is not None
-        assert mock_transaction.gateway_response == wompi_data
+        assert json.loads(mock_transaction.gateway_response) == wompi_data
 
         mock_db.commit.assert_called_once()
         mock_db.refresh.assert_called_once_with(mock_transaction)
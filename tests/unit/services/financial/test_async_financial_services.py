@@ -0,0 +1,135 @@
+"""
+AsyncSession tests for AsyncCommissionService and AsyncTransactionService
+==========================================================================
+
+Run against the async SQLite test database (conftest ``async_session``):
+approval, listing and commission transaction creation without lazy loads.
+"""
+
+from decimal import Decimal
+from uuid import uuid4
+
+import pytest
+
+from app.models.commission import Commission, CommissionStatus, CommissionType
+from app.models.order import Order, OrderStatus
+from app.models.transaction import EstadoTransaccion, MetodoPago, TransactionType
+from app.services.commission_service import (
+    AsyncCommissionService,
+    CommissionCalculationError,
+    CommissionService,
+)
+from app.services.transaction_service import (
+    AsyncTransactionService,
+    TransactionError,
+    TransactionService,
+)
+
+
+@pytest.fixture
+async def pending_commission(async_session, test_vendor_user, test_buyer_user):
+    order = Order(
+        order_number="ORD-ASYNC-0001",
+        buyer_id=test_buyer_user.id,
+        subtotal=Decimal("100000.00"),
+        total_amount=Decimal("100000.00"),
+        status=OrderStatus.DELIVERED,
+        shipping_name="Test Buyer",
+        shipping_phone="3001234567",
+        shipping_address="Calle 1 # 2-3",
+        shipping_city="Bogotá",
+        shipping_state="Cundinamarca",
+    )
+    async_session.add(order)
+    await async_session.flush()
+
+    commission_amount, vendor_amount, platform_amount = Commission.calculate_commission(
+        Decimal("100000.00"), Decimal("0.1000"), CommissionType.STANDARD
+    )
+    commission = Commission(
+        id=str(uuid4()),
+        commission_number="COM-ASYNC-0001",
+        order_id=order.id,
+        vendor_id=test_vendor_user.id,
+        order_amount=Decimal("100000.00"),
+        commission_rate=Decimal("0.1000"),
+        commission_amount=commission_amount,
+        vendor_amount=vendor_amount,
+        platform_amount=platform_amount,
+        commission_type=CommissionType.STANDARD,
+        status=CommissionStatus.PENDING,
+    )
+    async_session.add(commission)
+    await async_session.commit()
+    await async_session.refresh(commission)
+    return commission
+
+
+@pytest.mark.financial
+class TestAsyncServicesAreNotSyncSubtypes:
+
+    def test_async_services_do_not_override_sync_methods(self):
+        assert not issubclass(AsyncCommissionService, CommissionService)
+        assert not issubclass(AsyncTransactionService, TransactionService)
+
+
+@pytest.mark.financial
+class TestAsyncCommissionServiceSession:
+
+    async def test_approve_commission(self, async_session, pending_commission, test_admin_user):
+        service = AsyncCommissionService(async_session)
+
+        approved = await service.approve_commission(
+            pending_commission.id, test_admin_user.id, notes="ok"
+        )
+
+        assert approved.status == CommissionStatus.APPROVED
+        assert approved.approved_by_id == test_admin_user.id
+        assert approved.approved_at is not None
+        assert approved.admin_notes == "ok"
+
+    async def test_approve_twice_is_rejected(self, async_session, pending_commission, test_admin_user):
+        service = AsyncCommissionService(async_session)
+        await service.approve_commission(pending_commission.id, test_admin_user.id)
+
+        with pytest.raises(CommissionCalculationError):
+            await service.approve_commission(pending_commission.id, test_admin_user.id)
+
+    async def test_list_commissions(self, async_session, pending_commission, test_vendor_user):
+        service = AsyncCommissionService(async_session)
+
+        listing = await service.list_commissions(vendor_id=test_vendor_user.id)
+        filtered = await service.list_commissions(status_filter=[CommissionStatus.PAID])
+
+        assert listing['pagination']['total_count'] == 1
+        assert listing['commissions'][0]['commission_number'] == "COM-ASYNC-0001"
+        assert filtered['pagination']['total_count'] == 0
+
+
+@pytest.mark.financial
+@pytest.mark.transaction
+class TestAsyncTransactionServiceSession:
+
+    async def test_create_commission_transaction(self, async_session, pending_commission, test_admin_user):
+        commission = await AsyncCommissionService(async_session).approve_commission(
+            pending_commission.id, test_admin_user.id
+        )
+        service = AsyncTransactionService(async_session)
+
+        transaction = await service.create_commission_transaction(commission, MetodoPago.PSE)
+
+        assert transaction.transaction_type == TransactionType.COMISION
+        assert transaction.estado == EstadoTransaccion.PENDIENTE
+        assert transaction.monto == commission.vendor_amount
+        await async_session.refresh(commission)
+        assert commission.transaction_id == transaction.id
+
+        # Idempotent: the linked transaction is returned again
+        again = await service.create_commission_transaction(commission, MetodoPago.PSE)
+        assert again.id == transaction.id
+
+    async def test_create_transaction_requires_approved_commission(self, async_session, pending_commission):
+        with pytest.raises(TransactionError):
+            await AsyncTransactionService(async_session).create_commission_transaction(
+                pending_commission, MetodoPago.PSE
+            )
@@ -0,0 +1,265 @@
+# tests/unit/services/financial/test_financial_reconciliation_service.py
+# Financial reconciliation: chunk verification executed in worker processes
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.models.commission import Commission, CommissionStatus, CommissionType
+from app.models.order import Order, OrderStatus
+from app.models.transaction import MetodoPago, TransactionType
+from app.services.commission_service import AsyncCommissionService
+from app.services.transaction_service import (
+    AsyncTransactionService,
+    TransactionService,
+    compute_integrity_hash,
+    integrity_hash_fields,
+)
+from app.services.financial_reconciliation_service import (
+    FinancialReconciliationService,
+    ReconciliationReport,
+    verify_transaction_chunk,
+)
+
+SECRET = "reconciliation-test-secret"
+
+
+def _row(monto=Decimal("10000.00"), monto_vendedor=Decimal("9000.00"), porcentaje=Decimal("10.00"),
+         commission=None, stored_hash=None, tamper=False):
+    """Build a row in the (transaction columns + commission columns) layout"""
+    tx = SimpleNamespace(
+        id="tx-1", referencia_externa="TXN-1", monto=monto, monto_vendedor=monto_vendedor,
+        porcentaje_mestocker=porcentaje, transaction_type=TransactionType.COMISION,
+        comprador_id="buyer", vendedor_id="vendor", integrity_hash=None
+    )
+    tx.integrity_hash = stored_hash or compute_integrity_hash(SECRET, integrity_hash_fields(tx, commission))
+    if tamper:
+        tx.monto = monto + 1
+    commission_values = (
+        (commission.id, commission.commission_rate, commission.commission_amount,
+         commission.vendor_amount, commission.order_id)
+        if commission else (None, None, None, None, None)
+    )
+    return (tx.id, tx.referencia_externa, tx.monto, tx.monto_vendedor, tx.porcentaje_mestocker,
+            tx.transaction_type, tx.comprador_id, tx.vendedor_id, tx.integrity_hash) + commission_values
+
+
+@pytest.mark.financial
+class TestVerifyTransactionChunk:
+
+    def test_valid_rows_have_no_mismatches(self):
+        commission = SimpleNamespace(id="c-1", commission_rate=Decimal("0.1000"),
+                                     commission_amount=Decimal("1000.00"),
+                                     vendor_amount=Decimal("9000.00"), order_id="1")
+
+        verified, mismatches = verify_transaction_chunk(SECRET, [_row(commission=commission)])
+
+        assert verified == 1
+        assert mismatches == []
+
+    def test_hash_is_stable_across_decimal_scale(self):
+        """A hash made with Decimal('10000') still verifies when the DB returns 10000.00"""
+        tx = SimpleNamespace(
+            monto=Decimal("10000"), monto_vendedor=Decimal("9000"), porcentaje_mestocker=10.0,
+            transaction_type=TransactionType.COMISION, comprador_id="buyer", vendedor_id="vendor",
+            referencia_externa="TXN-1"
+        )
+        stored_hash = compute_integrity_hash(SECRET, integrity_hash_fields(tx))
+
+        verified, mismatches = verify_transaction_chunk(SECRET, [_row(stored_hash=stored_hash)])
+
+        assert verified == 1
+        assert mismatches == []
+
+    def test_tampered_amount_is_reported(self):
+        verified, mismatches = verify_transaction_chunk(SECRET, [_row(tamper=True)])
+
+        assert verified == 1
+        assert mismatches[0]['errors'] == ['integrity_hash_mismatch']
+
+    def test_commission_amount_mismatch_is_reported(self):
+        commission = SimpleNamespace(id="c-1", commission_rate=Decimal("0.1000"),
+                                     commission_amount=Decimal("1000.00"),
+                                     vendor_amount=Decimal("8500.00"), order_id="1")
+
+        _, mismatches = verify_transaction_chunk(SECRET, [_row(commission=commission)])
+
+        assert 'vendor_amount_mismatch' in mismatches[0]['errors']
+        assert mismatches[0]['commission_id'] == "c-1"
+
+    def test_without_secret_hashes_are_skipped(self):
+        verified, mismatches = verify_transaction_chunk(None, [_row(tamper=True)])
+
+        assert verified == 0
+        assert mismatches == []
+
+
+@pytest.mark.financial
+def test_report_is_consistent_only_without_mismatches():
+    report = ReconciliationReport(period_start=datetime(2025, 1, 1), period_end=datetime(2025, 1, 2))
+    assert report.is_consistent
+
+    report.order_mismatches.append({'order_id': 1})
+    assert not report.is_consistent
+    assert report.to_dict()['mismatch_counts']['orders'] == 1
+
+
+@pytest.mark.financial
+class TestIntegritySecret:
+
+    def test_instances_share_the_configured_secret(self, monkeypatch):
+        monkeypatch.setattr(settings, "TRANSACTION_INTEGRITY_SECRET", SECRET)
+        tx = SimpleNamespace(
+            monto=Decimal("10000.00"), monto_vendedor=Decimal("9000.00"), porcentaje_mestocker=10.0,
+            transaction_type=TransactionType.COMISION, comprador_id="buyer", vendedor_id="vendor",
+            referencia_externa="TXN-1", integrity_hash=None
+        )
+
+        tx.integrity_hash = TransactionService()._generate_integrity_hash(tx)
+
+        # Otro worker (otra instancia) valida el hash generado por el primero
+        assert TransactionService()._validate_transaction_integrity_hash(tx)
+
+    def test_checks_disabled_without_secret(self, monkeypatch):
+        monkeypatch.setattr(settings, "TRANSACTION_INTEGRITY_SECRET", "")
+
+        service = TransactionService()
+
+        assert service.integrity_secret is None
+        assert not service.enable_integrity_checks
+
+    def test_production_requires_secret(self):
+        from pydantic import ValidationError
+        from app.core.config import Settings
+
+        with pytest.raises(ValidationError, match="TRANSACTION_INTEGRITY_SECRET"):
+            Settings(ENVIRONMENT="production", TRANSACTION_INTEGRITY_SECRET="")
+
+
+@pytest.fixture
+async def paid_commission(async_session, test_vendor_user, test_buyer_user, test_admin_user, monkeypatch):
+    """Orden + comisión aprobada + transacción de comisión con hash de integridad"""
+    monkeypatch.setattr(settings, "TRANSACTION_INTEGRITY_SECRET", SECRET)
+    order = Order(
+        order_number="ORD-RECON-0001",
+        buyer_id=test_buyer_user.id,
+        subtotal=Decimal("100000.00"),
+        total_amount=Decimal("100000.00"),
+        status=OrderStatus.DELIVERED,
+        shipping_name="Test Buyer",
+        shipping_phone="3001234567",
+        shipping_address="Calle 1 # 2-3",
+        shipping_city="Bogotá",
+        shipping_state="Cundinamarca",
+    )
+    async_session.add(order)
+    await async_session.flush()
+
+    commission_amount, vendor_amount, platform_amount = Commission.calculate_commission(
+        Decimal("100000.00"), Decimal("0.1000"), CommissionType.STANDARD
+    )
+    commission = Commission(
+        id=str(uuid4()),
+        commission_number="COM-RECON-0001",
+        order_id=order.id,
+        vendor_id=test_vendor_user.id,
+        order_amount=Decimal("100000.00"),
+        commission_rate=Decimal("0.1000"),
+        commission_amount=commission_amount,
+        vendor_amount=vendor_amount,
+        platform_amount=platform_amount,
+        commission_type=CommissionType.STANDARD,
+        status=CommissionStatus.PENDING,
+    )
+    async_session.add(commission)
+    await async_session.commit()
+
+    commission = await AsyncCommissionService(async_session).approve_commission(
+        commission.id, test_admin_user.id
+    )
+    transaction = await AsyncTransactionService(async_session).create_commission_transaction(
+        commission, MetodoPago.PSE
+    )
+    ids = SimpleNamespace(order_id=order.id, commission_id=commission.id, transaction_id=transaction.id)
+    await async_session.commit()
+    return ids
+
+
+@pytest.fixture
+def reconciliation():
+    return FinancialReconciliationService(chunk_size=10, max_workers=1, integrity_secret=SECRET)
+
+
+def _period():
+    now = datetime.utcnow()
+    return now - timedelta(days=1), now + timedelta(days=1)
+
+
+@pytest.mark.financial
+class TestReconcilePeriod:
+
+    async def test_consistent_period(self, async_session, paid_commission, reconciliation):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            report = await reconciliation.reconcile_period(async_session, *_period(), executor=executor)
+
+        assert report.is_consistent, report.to_dict()
+        assert report.transactions_checked == 1
+        assert report.hashes_verified == 1
+        assert report.isolation_level == 'SERIALIZABLE'
+        assert not async_session.in_transaction()
+        assert report.totals['orders_count'] == 1
+        assert report.totals['orders_total'] == 100000.0
+        assert report.totals['commissions_count'] == 1
+        assert report.totals['commissions_commission_amount'] == 10000.0
+        assert report.totals['commission_transactions_count'] == 1
+        assert report.totals['commission_transactions_vendor_amount'] == 90000.0
+
+    async def test_aggregates_report_mismatches(self, async_session, paid_commission, reconciliation):
+        await async_session.execute(
+            update(Commission).where(Commission.id == paid_commission.commission_id)
+            .values(vendor_amount=Decimal("85000.00"), platform_amount=Decimal("15000.00"))
+        )
+        await async_session.execute(
+            update(Order).where(Order.id == paid_commission.order_id)
+            .values(total_amount=Decimal("120000.00"))
+        )
+        await async_session.commit()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            report = await reconciliation.reconcile_period(async_session, *_period(), executor=executor)
+
+        assert report.commission_mismatches == [{
+            'commission_id': str(paid_commission.commission_id),
+            'transaction_id': str(paid_commission.transaction_id),
+            'commission_vendor_amount': 85000.0,
+            'transaction_vendor_amount': 90000.0,
+        }]
+        assert report.order_mismatches[0]['order_id'] == paid_commission.order_id
+        assert report.order_mismatches[0]['order_total'] == 120000.0
+        assert report.order_mismatches[0]['commission_order_amount'] == 100000.0
+        # El cruce por fila en los workers también detecta la comisión alterada
+        assert report.transaction_mismatches[0]['errors'] == ['vendor_amount_mismatch']
+
+    async def test_period_outside_data_is_empty(self, async_session, paid_commission, reconciliation):
+        start = datetime(2020, 1, 1)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            report = await reconciliation.reconcile_period(
+                async_session, start, start + timedelta(days=1), executor=executor
+            )
+
+        assert report.transactions_checked == 0
+        assert report.totals['orders_count'] == 0
+        assert report.totals['commissions_order_amount'] == 0.0
+
+    async def test_requires_session_without_open_transaction(self, async_session, reconciliation):
+        await async_session.execute(update(Order).values(notes=None))
+
+        with pytest.raises(ValueError, match="active transaction"):
+            await reconciliation.reconcile_period(async_session, *_period())
@@ -7,10 +7,10 @@ import logging
 from decimal import Decimal
 from uuid import uuid4
 from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 from sqlalchemy.orm import Session
-from app.services.transaction_service import TransactionService, TransactionError
+from app.services.transaction_service import TransactionService, AsyncTransactionService, TransactionError
 from app.services.commission_service import CommissionService
 from app.models.transaction import Transaction, EstadoTransaccion, TransactionType, MetodoPago
 from app.models.commission import Commission, CommissionStatus, CommissionType
@@ -676,4 +676,75 @@ class TestTransactionService:
         # Test production environment
         test_transaction_service.environment = 'production'
         result = test_transaction_service._simulate_payment_processing(None)
-        assert result is True  # Always success in production simulation
\ No newline at end of file
+        assert result is True  # Always success in production simulation
+
+@pytest.mark.financial
+@pytest.mark.transaction
+class TestTransactionHistoryHelpers:
+    """Keyset cursor and SQL-aggregate summary helpers used by the history API"""
+
+    def test_history_cursor_round_trip(self):
+        """Cursor encodes (created_at, id) and decodes back to the same values"""
+        created_at = datetime(2025, 3, 1, 12, 30, 15)
+        transaction = Transaction(id="7d1f2f0e-5b1c-4f5e-9b0a-2d3c4e5f6a7b")
+        transaction.created_at = created_at
+
+        cursor = TransactionService.encode_history_cursor(transaction)
+
+        assert TransactionService.decode_history_cursor(cursor) == (created_at, str(transaction.id))
+
+    def test_history_cursor_rejects_garbage(self):
+        """Tampered cursors raise TransactionError instead of a 500"""
+        with pytest.raises(TransactionError):
+            TransactionService.decode_history_cursor("not-a-cursor")
+
+    def test_summary_from_aggregate_rows(self):
+        """Aggregate rows produce the same summary shape as _calculate_transaction_summary"""
+        service = TransactionService()
+        rows = [
+            (MetodoPago.PSE, 2, Decimal("3000.00"), Decimal("1000.00")),
+            (MetodoPago.EFECTIVO, 1, Decimal("1000.00"), Decimal("0")),
+        ]
+
+        summary = service._summary_from_aggregate_rows(rows)
+
+        assert summary['total_transactions'] == 3
+        assert summary['total_amount'] == 4000.0
+        assert summary['avg_amount'] == pytest.approx(4000.0 / 3)
+        assert summary['commission_total'] == 1000.0
+        assert summary['by_payment_method']['PSE'] == {'count': 2, 'amount': 3000.0}
+
+    def test_summary_from_empty_aggregate(self):
+        """No completed transactions yields a zeroed summary"""
+        summary = TransactionService()._summary_from_aggregate_rows([])
+
+        assert summary['total_transactions'] == 0
+        assert summary['avg_amount'] == 0.0
+        assert summary['by_payment_method'] == {}
+
+
+@pytest.mark.financial
+@pytest.mark.transaction
+class TestAsyncTransactionService:
+    """AsyncTransactionService keeps TransactionService behavior on AsyncSession"""
+
+    async def test_calculate_fees_matches_sync_service(self):
+        """Fee breakdown comes from the shared TransactionServiceBase"""
+        sync_fees = TransactionService().calculate_fees(Decimal("100000"), Decimal("0.15"), TransactionType.COMISION)
+        async_fees = AsyncTransactionService().calculate_fees(Decimal("100000"), Decimal("0.15"), TransactionType.COMISION)
+
+        assert async_fees == sync_fees
+
+    async def test_refund_for_missing_transaction_rolls_back(self):
+        """Missing original transaction raises TransactionError and rolls back the session"""
+        session = MagicMock()
+        result = MagicMock()
+        result.scalars.return_value.first.return_value = None
+        session.execute = AsyncMock(return_value=result)
+        session.rollback = AsyncMock()
+
+        with pytest.raises(TransactionError) as exc_info:
+            await AsyncTransactionService(session).process_refund(uuid4())
+
+        assert "not found" in str(exc_info.value)
+        session.rollback.assert_awaited_once()
@@ -0,0 +1,215 @@
+"""
+Tests for compiled admin permission sets
+========================================
+
+- Effective permissions compiled once per user (two queries), then O(1) bit checks
+- Two-tier cache: in-process LRU and Redis, stamped with a version
+- grant/revoke bump the version; other workers recompile after revalidation
+- Clearance errors and per-request context conditions are still enforced
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.models.admin_permission import (
+    AdminPermission,
+    PermissionAction,
+    PermissionScope,
+    ResourceType,
+)
+from app.models.user import User, UserType
+from app.services.admin_permission_service import (
+    AdminPermissionService,
+    CompiledPermissions,
+    InsufficientClearanceError,
+    PermissionDeniedError,
+)
+
+
+class FakeRedis:
+    """Sync Redis subset used by the permission cache"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args: self.calls.append((name, args))
+
+            def execute(self):
+                return [getattr(redis, name)(*args) for name, args in self.calls]
+
+        return Pipeline()
+
+
+def _user(user_type=UserType.SUPERUSER, clearance=5):
+    user = User(
+        id="admin-1", email="admin@mestore.co", user_type=user_type,
+        security_clearance_level=clearance, is_active=True, is_verified=True,
+        department_id=None
+    )
+    user.habeas_data_accepted = True
+    user.data_processing_consent = True
+    return user
+
+
+def _permission(**overrides):
+    fields = dict(
+        id="perm-1", name="users.delete.global", resource_type=ResourceType.USERS,
+        action=PermissionAction.DELETE, scope=PermissionScope.GLOBAL,
+        required_clearance_level=5, is_inheritable=False, conditions=None
+    )
+    fields.update(overrides)
+    return AdminPermission(**fields)
+
+
+def _db(catalog, grants=()):
+    """Session double: catalog query first, then the user's grants"""
+    db = MagicMock()
+
+    def query(*entities):
+        result = MagicMock()
+        rows = list(catalog) if entities[0] is AdminPermission else list(grants)
+        result.all.return_value = rows
+        result.filter.return_value.all.return_value = rows
+        return result
+
+    db.query.side_effect = query
+    return db
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+def _service(redis):
+    service = AdminPermissionService()
+    service.redis_client = redis
+    service.cache_ttl = 300
+    return service
+
+
+class TestCompiledPermissions:
+
+    async def test_compiled_once_then_answered_in_memory(self, redis):
+        service = _service(redis)
+        db = _db([_permission()], grants=[("perm-1", None)])
+        user = _user()
+
+        for _ in range(20):
+            assert await service.validate_permission(
+                db, user, ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL
+            )
+            assert await service.validate_permission(
+                db, user, ResourceType.USERS, PermissionAction.READ, PermissionScope.USER
+            )
+
+        assert db.query.call_count == 2
+        assert "permission_set:admin-1" in redis.data
+
+    async def test_denials_and_clearance(self, redis):
+        service = _service(redis)
+        db = _db([_permission()])
+
+        with pytest.raises(PermissionDeniedError, match="users.delete.global"):
+            await service.validate_permission(
+                db, _user(), ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL
+            )
+        with pytest.raises(InsufficientClearanceError):
+            await service.validate_permission(
+                db, _user(clearance=4), ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL
+            )
+        # Hierarchy: SYSTEM scope needs more than a SUPERUSER has
+        with pytest.raises(PermissionDeniedError):
+            await service.validate_permission(
+                db, _user(), ResourceType.SETTINGS, PermissionAction.CONFIGURE, PermissionScope.SYSTEM
+            )
+
+    async def test_revoke_bumps_version_for_other_workers(self, redis):
+        worker_a, worker_b = _service(redis), _service(redis)
+        user = _user()
+        granted = _db([_permission()], grants=[("perm-1", None)])
+        check = (ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL)
+
+        assert await worker_a.validate_permission(granted, user, *check)
+        # Second worker reuses the shared compiled set (no queries)
+        assert await worker_b.validate_permission(_db([]), user, *check)
+
+        await worker_a._clear_user_permission_cache(user.id)
+        revoked = _db([_permission()])
+
+        with pytest.raises(PermissionDeniedError):
+            await worker_a.validate_permission(revoked, user, *check)
+
+        # Worker B trusts its copy until the local TTL, then sees the new version
+        assert await worker_b.validate_permission(revoked, user, *check)
+        worker_b._compiled[user.id].checked_at -= worker_b.local_ttl
+        with pytest.raises(PermissionDeniedError):
+            await worker_b.validate_permission(revoked, user, *check)
+
+    async def test_recompiled_when_user_or_grant_changes(self, redis):
+        service = _service(redis)
+        expires = datetime.utcnow() + timedelta(hours=1)
+        db = _db([_permission()], grants=[("perm-1", expires)])
+        user = _user()
+        check = (ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL)
+
+        assert await service.validate_permission(db, user, *check)
+        # Naive grant expiry is UTC
+        assert service._compiled[user.id].valid_until == expires.replace(tzinfo=timezone.utc).timestamp()
+
+        user.security_clearance_level = 4
+        with pytest.raises(InsufficientClearanceError):
+            await service.validate_permission(db, user, *check)
+        assert db.query.call_count == 4
+
+    async def test_context_conditions_checked_per_request(self, redis):
+        service = _service(redis)
+        permission = _permission(conditions={"allowed_ips": ["10.0.0.1"]})
+        db = _db([permission], grants=[("perm-1", None)])
+        user = _user()
+        check = (ResourceType.USERS, PermissionAction.DELETE, PermissionScope.GLOBAL)
+
+        assert await service.validate_permission(db, user, *check, additional_context={"ip_address": "10.0.0.1"})
+        with pytest.raises(PermissionDeniedError):
+            await service.validate_permission(db, user, *check, additional_context={"ip_address": "10.0.0.2"})
+        assert await service.validate_permission(db, user, *check)
+
+    def test_json_round_trip(self):
+        compiled = CompiledPermissions(
+            "1:2", ("SUPERUSER", 5, None), granted=(1 << 1259) | 1,
+            insufficient_clearance={3: 5}, names={3: "users.delete.global"},
+            conditions={3: {"allowed_hours": [9]}}, valid_until=None
+        )
+
+        restored = CompiledPermissions.from_json(compiled.to_json())
+
+        assert restored.allows(1259) and restored.allows(0) and not restored.allows(1)
+        assert restored.insufficient_clearance == {3: 5}
+        assert restored.fingerprint == compiled.fingerprint
@@ -0,0 +1,139 @@
+"""
+Tests for the batched search-analytics pipeline
+===============================================
+
+- track_search_event only enqueues: no Redis command on the search path
+- A flush pre-aggregates the batch and writes it in one MULTI
+- Redis commands per flush depend on distinct keys, not on searches
+- Dashboard/insight reads see the aggregated counters
+"""
+
+from collections import defaultdict
+
+import pytest
+
+from app.services.search_analytics_service import SearchAnalyticsService
+
+
+class FakeRedis:
+    """Async Redis subset: hashes, sorted sets and lists, applied on EXEC"""
+
+    def __init__(self):
+        self.hashes = defaultdict(dict)
+        self.zsets = defaultdict(lambda: defaultdict(float))
+        self.lists = defaultdict(list)
+        self.ttls = {}
+        self.executed = []  # (transaction, comandos) por EXEC
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+    async def hgetall(self, key):
+        return {k: str(v) for k, v in self.hashes.get(key, {}).items()}
+
+
+class FakePipeline:
+
+    def __init__(self, redis, transaction):
+        self.redis = redis
+        self.transaction = transaction
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        redis, results = self.redis, []
+        for name, args, kwargs in self.commands:
+            if name == "hincrby":
+                key, field_name, amount = args
+                redis.hashes[key][field_name] = int(redis.hashes[key].get(field_name, 0)) + amount
+            elif name == "hset":
+                redis.hashes[args[0]].update(kwargs["mapping"])
+            elif name == "zincrby":
+                key, amount, member = args
+                redis.zsets[key][member] += amount
+            elif name == "lpush":
+                redis.lists[args[0]][:0] = reversed(args[1:])
+            elif name == "ltrim":
+                key, start, stop = args
+                redis.lists[key] = redis.lists[key][start:stop + 1]
+            elif name == "expire":
+                redis.ttls[args[0]] = args[1]
+            elif name == "hgetall":
+                results.append(await redis.hgetall(args[0]))
+                continue
+            elif name == "lrange":
+                results.append([str(v) for v in redis.lists.get(args[0], [])])
+                continue
+            results.append(True)
+        redis.executed.append((self.transaction, [name for name, _, _ in self.commands]))
+        return results
+
+
+class FakeRedisManager:
+
+    def __init__(self):
+        self.redis = FakeRedis()
+
+    async def get_redis(self):
+        return self.redis
+
+
+@pytest.fixture
+def service():
+    return SearchAnalyticsService(FakeRedisManager())
+
+
+class TestSearchAnalyticsPipeline:
+
+    async def test_tracking_only_enqueues(self, service):
+        await service.track_search_event("laptop", user_id="u1", results_count=3, search_time_ms=40)
+
+        assert service.redis_manager.redis.executed == []
+        assert service.get_pipeline_stats()["buffered"] == 1
+
+    async def test_flush_aggregates_into_one_multi(self, service):
+        redis = service.redis_manager.redis
+        for i in range(200):
+            await service.track_search_event(
+                "laptop" if i % 2 else "celular",
+                user_id=f"u{i % 5}",
+                user_type="buyer",
+                results_count=0 if i % 10 == 0 else 4,
+                search_time_ms=2500 if i % 50 == 0 else 100,
+            )
+
+        await service.flush()
+
+        assert len(redis.executed) == 1
+        transaction, commands = redis.executed[0]
+        assert transaction is True
+        # 200 búsquedas: antes ~25 comandos por búsqueda, ahora acotado por claves distintas
+        assert len(commands) < 100
+
+        daily = next(v for k, v in redis.hashes.items() if k.startswith(service.daily_key))
+        assert daily["total_searches"] == 200
+        assert daily["zero_result_searches"] == 20
+        assert daily["slow_searches"] == 4
+        assert daily["user_type_buyer"] == 200
+        assert daily["total_search_time_ms"] == 4 * 2500 + 196 * 100
+
+        assert redis.hashes[f"{service.queries_key}:laptop"]["total_searches"] == 100
+        assert redis.hashes[f"{service.users_key}:u1"]["total_searches"] == 40
+        assert redis.zsets[f"{service.patterns_key}:current:zero_results"]["celular"] == 20
+        assert len(redis.lists[f"{service.performance_key}:current:response_times"]) == 200
+        assert service.get_pipeline_stats()["buffered"] == 0
+
+    async def test_reads_see_buffered_events(self, service):
+        for _ in range(4):
+            await service.track_search_event("tablet", results_count=0, search_time_ms=300)
+
+        insights = await service.get_query_insights("tablet")
+        assert insights["metrics"]["total_searches"] == 4
+        assert insights["metrics"]["avg_search_time_ms"] == 300
+        assert insights["metrics"]["zero_results_rate"] == 100
+
+        dashboard = await service.get_search_dashboard_metrics(days=1)
+        assert dashboard["overview"]["total_searches"] == 4
+        assert dashboard["performance"]["samples"] == 4
@@ -27,6 +27,7 @@ from datetime import datetime, timedelta
 from typing import Dict, Any
 import hashlib
 import secrets
+import time
 
 # Import modules under test
 from app.services.secure_auth_service import (
@@ -36,6 +37,8 @@ from app.services.secure_auth_service import (
     TokenBlacklist,
     PasswordValidator
 )
+from app.core.security import create_access_token, decode_access_token
+from app.core.token_revocation import TokenRevocationStore, token_blacklist
 from app.models.user import User, UserType
 
 
@@ -293,52 +296,42 @@ class TestTokenBlacklist:
     """Test TokenBlacklist with TDD methodology."""
 
     @pytest.fixture
-    def mock_redis(self):
-        """Mock Redis client for testing."""
-        mock_redis = Mock()
-        mock_redis.set = Mock()
-        mock_redis.setex = Mock()
-        mock_redis.get = Mock(return_value=None)
-        mock_redis.exists = Mock(return_value=False)
-        return mock_redis
-
-    def test_token_blacklist_initialization(self, mock_redis):
-        """TDD: TokenBlacklist should initialize with Redis client."""
-        service = TokenBlacklist(redis_client=mock_redis)
+    def store(self):
+        """Isolated revocation store (no Redis)."""
+        return TokenRevocationStore()
 
-        assert service.redis_client is mock_redis
+    def test_token_blacklist_initialization(self, store):
+        """TDD: TokenBlacklist should use the shared revocation store by default."""
+        assert TokenBlacklist().store is token_blacklist
+        assert TokenBlacklist(store).store is store
 
     @pytest.mark.asyncio
-    async def test_blacklist_token_with_expiration(self, mock_redis):
-        """TDD: blacklist_token should store token with expiration."""
-        service = TokenBlacklist(redis_client=mock_redis)
-        token = "test.jwt.token"
+    async def test_blacklist_token_with_expiration(self, store):
+        """TDD: blacklist_token should revoke the token's jti until expiration."""
+        service = TokenBlacklist(store)
+        token = create_access_token({"sub": "test@example.com"})
+        jti = decode_access_token(token)["jti"]
         expires_at = datetime.utcnow() + timedelta(hours=1)
 
         await service.blacklist_token(token, expires_at)
 
-        # Service uses setex with TTL
-        assert mock_redis.setex.called
-        call_args = mock_redis.setex.call_args
-        expected_key = f"blacklist_token:{hashlib.sha256(token.encode()).hexdigest()}"
-        assert expected_key == call_args[0][0]
+        assert store.is_token_blacklisted(jti)
+        assert 3590 < store._blacklisted_tokens[jti] - time.time() <= 3600
 
     @pytest.mark.asyncio
-    async def test_blacklist_token_without_expiration(self, mock_redis):
-        """TDD: blacklist_token should handle tokens without expiration."""
-        service = TokenBlacklist(redis_client=mock_redis)
+    async def test_blacklist_token_without_expiration(self, store):
+        """TDD: blacklist_token should handle tokens that cannot be decoded."""
+        service = TokenBlacklist(store)
         token = "test.jwt.token"
 
         await service.blacklist_token(token)
 
-        # Service uses setex even without expiration (default TTL)
-        assert mock_redis.setex.called
+        assert await service.is_token_blacklisted(token)
 
     @pytest.mark.asyncio
-    async def test_is_token_blacklisted_not_blacklisted(self, mock_redis):
+    async def test_is_token_blacklisted_not_blacklisted(self, store):
         """TDD: is_token_blacklisted should return False for valid tokens."""
-        mock_redis.exists.return_value = False
-        service = TokenBlacklist(redis_client=mock_redis)
+        service = TokenBlacklist(store)
         token = "test.jwt.token"
 
         is_blacklisted = await service.is_token_blacklisted(token)
@@ -346,11 +339,12 @@ class TestTokenBlacklist:
         assert is_blacklisted is False
 
     @pytest.mark.asyncio
-    async def test_is_token_blacklisted_currently_blacklisted(self, mock_redis):
-        """TDD: is_token_blacklisted should return True for blacklisted tokens."""
-        mock_redis.exists.return_value = True
-        service = TokenBlacklist(redis_client=mock_redis)
-        token = "test.jwt.token"
+    async def test_is_token_blacklisted_currently_blacklisted(self, store):
+        """TDD: tokens revoked through the core store are blacklisted here too."""
+        service = TokenBlacklist(store)
+        token = create_access_token({"sub": "test@example.com"})
+        payload = decode_access_token(token)
+        store.blacklist_token(payload["jti"], expires_at=payload["exp"])
 
         is_blacklisted = await service.is_token_blacklisted(token)
 
@@ -0,0 +1,206 @@
+"""
+Tests for EnterpriseSessionService storage
+==========================================
+
+- Sessions stored as Redis hashes, indexed per user in a ZSET
+- Concurrent session limit evicts the oldest sessions
+- Activity updates coalesced: at most one write per interval
+- Idle timeout and tampered sessions invalidate the session
+"""
+
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.core.config import settings
+from app.services.session_service import EnterpriseSessionService
+
+
+class FakePipeline:
+    """Queues calls and runs them against FakeRedis on execute()"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [getattr(self.redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio (decode_responses=True) for the session store"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.round_trips = 0
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        sync = getattr(self, f"_{name}")
+
+        async def command(*args, **kwargs):
+            self.round_trips += 1
+            self.commands.append(name)
+            return sync(*args, **kwargs)
+        return command
+
+    def _hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(key, {})
+        fields.update({k: str(v) for k, v in (mapping or {field: value}).items()})
+        return 1
+
+    def _hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def _hmget(self, key, *fields):
+        return [self.data.get(key, {}).get(f) for f in fields]
+
+    def _hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def _expire(self, key, seconds):
+        self.ttl[key] = seconds
+        return key in self.data
+
+    def _expireat(self, key, when):
+        self.ttl[key] = when - time.time()
+        return key in self.data
+
+    def _delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def _sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+        return len(members)
+
+    def _srem(self, key, *members):
+        self.data.get(key, set()).difference_update(members)
+        return len(members)
+
+    def _zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    def _zrem(self, key, *members):
+        zset = self.data.get(key, {})
+        return sum(1 for m in members if zset.pop(m, None) is not None)
+
+    def _zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        removed = [m for m, score in zset.items() if score <= float(high)]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+
+    def _zrange(self, key, start, end):
+        ordered = [m for m, _ in sorted(self.data.get(key, {}).items(), key=lambda item: item[1])]
+        end = len(ordered) + end if end < 0 else end
+        return ordered[start:end + 1] if end >= 0 else []
+
+
+def _request(agent="Mozilla/5.0 Test"):
+    request = MagicMock()
+    request.client.host = "10.0.0.1"
+    request.headers = {"User-Agent": agent}
+    return request
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def service(redis):
+    return EnterpriseSessionService(redis)
+
+
+class TestSessionStorage:
+
+    async def test_session_is_a_hash_indexed_by_user(self, service, redis):
+        session = await service.create_session("user-1", _request(), "access", "refresh")
+
+        stored = redis.data[f"session:v2:{session.session_id}"]
+        assert stored["user_id"] == "user-1"
+        assert float(stored["created_at"]) == pytest.approx(session.created_at.timestamp(), abs=0.01)
+        assert stored["access_token"] != "access"
+        assert session.session_id in redis.data["user_sessions:v2:user-1"]
+        assert redis.round_trips == 1
+
+        fetched = await service.get_session(session.session_id)
+        assert fetched.user_id == "user-1"
+        assert fetched.expires_at.timestamp() == pytest.approx(session.expires_at.timestamp(), abs=0.01)
+
+    async def test_limit_evicts_oldest_sessions(self, service, redis):
+        limit = settings.SESSION_MAX_CONCURRENT_SESSIONS
+        sessions = []
+        for _ in range(limit + 2):
+            sessions.append(await service.create_session("user-1", _request(), "a", "r"))
+            time.sleep(0.002)
+
+        active = await service.get_user_active_sessions("user-1")
+
+        assert {s.session_id for s in active} == {s.session_id for s in sessions[-limit:]}
+        for evicted in sessions[:2]:
+            assert f"session:v2:{evicted.session_id}" not in redis.data
+            assert await service.get_session(evicted.session_id) is None
+
+    async def test_invalidate_all_user_sessions(self, service, redis):
+        for _ in range(3):
+            await service.create_session("user-1", _request(), "a", "r")
+
+        assert await service.invalidate_all_user_sessions("user-1") == 3
+        assert await service.get_user_active_sessions("user-1") == []
+        assert "user_sessions:v2:user-1" not in redis.data
+
+
+class TestActivityCoalescing:
+
+    async def test_activity_written_at_most_once_per_interval(self, service, redis):
+        session = await service.create_session("user-1", _request(), "a", "r")
+        redis.round_trips = 0
+
+        for _ in range(50):
+            assert await service.update_session_activity(session.session_id)
+        assert redis.round_trips == 0
+
+        # Interval elapsed: one read, one pipelined write
+        written_at, created_at = service._activity[session.session_id]
+        service._activity[session.session_id] = (written_at - service.activity_write_interval, created_at)
+        assert await service.update_session_activity(session.session_id)
+        assert redis.round_trips == 2
+        assert redis.commands == ["hmget"]
+
+    async def test_idle_session_is_invalidated(self, service, redis):
+        session = await service.create_session("user-1", _request(), "a", "r")
+        key = f"session:v2:{session.session_id}"
+        redis.data[key]["last_activity"] = str(time.time() - service.idle_timeout - 1)
+        service._activity.clear()
+
+        assert not await service.update_session_activity(session.session_id)
+        assert key not in redis.data
+        assert session.session_id not in redis.data["user_sessions:v2:user-1"]
+
+    async def test_tampered_session_is_rejected(self, service, redis):
+        session = await service.create_session("user-1", _request(), "a", "r")
+        redis.data[f"session:v2:{session.session_id}"]["user_id"] = "user-2"
+        service._activity.clear()
+
+        assert not await service.update_session_activity(session.session_id)
+        assert await service.get_session(session.session_id) is None
+
+    async def test_unknown_session(self, service):
+        assert not await service.update_session_activity("missing")
+        assert await service.invalidate_session("missing")
@@ -167,4 +167,63 @@ class TestRequestLoggingMiddleware:
         assert body_logged, "Request body should be logged even with malformed JSON"
         """Test: Middleware loguea correctamente requests válidos."""
         # JSON malformado
-        malformed_json = "{\"incomplete\": \"json\""
\ No newline at end of file
+        malformed_json = "{\"incomplete\": \"json\""
+
+class TestStreamingAndSampling:
+    """Tee acotado de bodies, muestreo por ruta y redacción."""
+
+    def test_streaming_response_is_not_buffered(self, caplog):
+        from fastapi.responses import StreamingResponse
+        from app.middleware.logging import MAX_BODY_SIZE
+
+        app = FastAPI()
+        app.add_middleware(RequestLoggingMiddleware)
+        chunk = b"x" * 4096
+
+        @app.get("/api/export")
+        async def export():
+            async def rows():
+                for _ in range(64):
+                    yield chunk
+            return StreamingResponse(rows(), media_type="text/plain")
+
+        with caplog.at_level("INFO"):
+            response = TestClient(app).get("/api/export")
+
+        assert response.status_code == 200
+        assert len(response.content) == 64 * 4096
+        assert "X-Process-Time" in response.headers
+        completed = [r.getMessage() for r in caplog.records if "HTTP request completed" in r.getMessage()]
+        assert completed and f"original size: {64 * 4096} bytes" in completed[0]
+        assert len(completed[0]) < MAX_BODY_SIZE + 2048
+
+    def test_body_tee_keeps_only_prefix(self):
+        from app.middleware.logging import _BodyTee
+
+        tee = _BodyTee("text/plain", max_bytes=10)
+        for _ in range(1000):
+            tee.feed(b"abcdef")
+
+        assert tee.captured == 10
+        assert tee.total == 6000
+        assert tee.parse().endswith("[truncated - original size: 6000 bytes]")
+
+    def test_route_sampling_and_errors_always_logged(self, client, caplog):
+        from app.core.config import settings
+
+        with patch.object(settings, "REQUEST_LOG_ROUTE_SAMPLE_RATES", {"/api/test": 0.0, "/api": 1.0}):
+            with caplog.at_level("INFO"):
+                client.post("/api/test", json={"a": 1})
+                client.get("/api/text")
+
+        messages = [r.getMessage() for r in caplog.records if "HTTP request" in r.getMessage()]
+        assert not any("/api/test" in m for m in messages)
+        assert any("/api/text" in m for m in messages)
+
+    def test_sensitive_fields_are_redacted(self, client, caplog):
+        with caplog.at_level("INFO"):
+            client.post("/api/test", json={"email": "a@b.co", "password": "hunter22"})
+
+        messages = " ".join(r.getMessage() for r in caplog.records)
+        assert "a@b.co" in messages
+        assert "hunter22" not in messages